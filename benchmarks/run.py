@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+核心流水线基准测试
+
+用确定性的合成星轨序列（见 synthetic.py）测量各阶段耗时：
+  decode     RawProcessor 解码（DNG / TIFF）
+  stack      StackingEngine 各堆栈模式
+  gapfill    GapFiller 各填充方法
+  satellite  SatelliteFilter 各检测模式
+  timelapse  TimelapseGenerator 帧准备 + 编码
+  export     ImageExporter 各输出格式
+
+每个 (尺寸, 阶段, 变体) 在独立子进程中运行，峰值内存 (RSS) 互不干扰。
+结果写成 JSON（耗时、吞吐量、峰值 RSS、运行环境），可用 --baseline 与旧结果对比，
+超过阈值的退化会列出并以非零状态退出。
+
+用法:
+    python benchmarks/run.py --sizes 12 24 --frames 6 -o results.json
+    python benchmarks/run.py --sizes 12 --stages stack export --baseline old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from synthetic import parse_size, write_sequence  # noqa: E402
+
+SCHEMA_VERSION = 1
+
+
+# ─────────────────────────────────────────────
+# 峰值内存
+# ─────────────────────────────────────────────
+
+def peak_rss_mb() -> Optional[float]:
+    """当前进程的峰值常驻内存 (MB)；平台不支持时返回 None"""
+    if os.name == "nt":
+        import ctypes
+        from ctypes import wintypes
+
+        class _Counters(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = _Counters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        psapi = ctypes.windll.psapi
+        if not psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize / 1024 / 1024
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+# ─────────────────────────────────────────────
+# 各阶段
+# ─────────────────────────────────────────────
+
+def _load_tiff(path: Path) -> np.ndarray:
+    import tifffile
+    return tifffile.imread(str(path))
+
+
+def _stacked(paths: List[Path]) -> np.ndarray:
+    """不计时：用 lighten 模式堆栈出结果，作为填充和导出阶段的输入"""
+    from core.stacking_engine import StackingEngine, StackMode
+
+    engine = StackingEngine(StackMode.LIGHTEN)
+    for path in paths:
+        engine.add_image(_load_tiff(path))
+    return engine.get_result()
+
+
+def bench_decode(paths: Dict[str, List[Path]], variant: str, workdir: Path) -> Dict:
+    from core.raw_processor import RawProcessor
+
+    processor = RawProcessor()
+    seconds = 0.0
+    for path in paths[variant]:
+        start = time.perf_counter()
+        processor.process(path)
+        seconds += time.perf_counter() - start
+    return {"seconds": seconds, "frames": len(paths[variant])}
+
+
+def bench_stack(paths: Dict[str, List[Path]], variant: str, workdir: Path) -> Dict:
+    from core.stacking_engine import StackingEngine, StackMode
+
+    engine = StackingEngine(StackMode(variant))
+    seconds = 0.0
+    for path in paths["tiff"]:
+        image = _load_tiff(path)
+        start = time.perf_counter()
+        engine.add_image(image)
+        seconds += time.perf_counter() - start
+    start = time.perf_counter()
+    engine.get_result()
+    seconds += time.perf_counter() - start
+    return {"seconds": seconds, "frames": len(paths["tiff"])}
+
+
+def bench_gapfill(paths: Dict[str, List[Path]], variant: str, workdir: Path) -> Dict:
+    from core.gap_filler import GapFiller
+
+    result = _stacked(paths["tiff"])
+    filler = GapFiller(method=variant)
+    start = time.perf_counter()
+    filler.fill_gaps(result, gap_size=3)
+    return {"seconds": time.perf_counter() - start, "frames": 1}
+
+
+def bench_satellite(paths: Dict[str, List[Path]], variant: str, workdir: Path) -> Dict:
+    from core.satellite_filter import SatelliteFilter
+
+    detector = SatelliteFilter(mode=variant)
+    seconds = 0.0
+    detected = 0
+    for path in paths["tiff"]:
+        image = _load_tiff(path)
+        start = time.perf_counter()
+        streaks = detector.detect_streaks(image)
+        seconds += time.perf_counter() - start
+        detected += int(streaks.any())
+    return {"seconds": seconds, "frames": len(paths["tiff"]), "extra": {"detected": detected}}
+
+
+def bench_timelapse(paths: Dict[str, List[Path]], variant: str, workdir: Path) -> Dict:
+    from core.timelapse_generator import TimelapseGenerator
+
+    generator = TimelapseGenerator(output_path=workdir / "timelapse.mp4", quality=variant)
+    prepare = 0.0
+    for path in paths["tiff"]:
+        image = _load_tiff(path)
+        start = time.perf_counter()
+        generator.add_frame(image)
+        prepare += time.perf_counter() - start
+    start = time.perf_counter()
+    generator.flush()
+    prepare += time.perf_counter() - start
+
+    start = time.perf_counter()
+    ok = generator.generate_video(cleanup=True)
+    encode = time.perf_counter() - start
+    output = workdir / "timelapse.mp4"
+    return {
+        "seconds": prepare + encode,
+        "frames": len(paths["tiff"]),
+        "extra": {
+            "ok": ok,
+            "prepare_seconds": prepare,
+            "encode_seconds": encode,
+            "resolution": list(generator.resolution or ()),
+            "output_bytes": output.stat().st_size if output.exists() else 0,
+        },
+    }
+
+
+def bench_export(paths: Dict[str, List[Path]], variant: str, workdir: Path) -> Dict:
+    from core.exporter import ImageExporter
+
+    result = _stacked(paths["tiff"])
+    exporter = ImageExporter()
+    fmt, _, option = variant.partition("-")
+    output = workdir / f"export.{'jpg' if fmt == 'jpeg' else fmt}"
+    start = time.perf_counter()
+    if fmt == "tiff":
+        ok = exporter.save_tiff(result, output, compression=option)
+    elif fmt == "png":
+        ok = exporter.save_png(result, output)
+    else:
+        ok = exporter.save_jpeg(result, output)
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "frames": 1,
+        "extra": {"ok": ok, "output_bytes": output.stat().st_size if output.exists() else 0},
+    }
+
+
+# 阶段 → (函数, 变体列表)
+STAGES: Dict[str, Tuple[Callable, List[str]]] = {
+    "decode": (bench_decode, ["dng", "tiff"]),
+    "stack": (bench_stack, ["lighten", "average", "comet"]),
+    "gapfill": (bench_gapfill, ["linear", "morphological", "motion_blur", "directional"]),
+    "satellite": (bench_satellite, ["spatial", "temporal"]),
+    "timelapse": (bench_timelapse, ["high", "low"]),
+    "export": (bench_export, ["tiff-none", "tiff-deflate", "tiff-zstd", "png", "jpeg"]),
+}
+
+
+# ─────────────────────────────────────────────
+# 执行
+# ─────────────────────────────────────────────
+
+def run_case(paths: Dict[str, List[Path]], stage: str, variant: str) -> Dict:
+    """在当前进程中执行一个用例，返回计时结果（含峰值 RSS）"""
+    func, _ = STAGES[stage]
+    with tempfile.TemporaryDirectory(prefix="sst-bench-") as workdir:
+        measured = func(paths, variant, Path(workdir))
+    measured["peak_rss_mb"] = peak_rss_mb()
+    return measured
+
+
+def _run_isolated(paths: Dict[str, List[Path]], stage: str, variant: str) -> Dict:
+    """在独立子进程中执行一个用例，峰值 RSS 只反映该用例"""
+    with tempfile.TemporaryDirectory(prefix="sst-bench-") as tmp:
+        job = Path(tmp) / "job.json"
+        out = Path(tmp) / "result.json"
+        job.write_text(json.dumps({
+            "paths": {key: [str(p) for p in value] for key, value in paths.items()},
+            "stage": stage,
+            "variant": variant,
+        }), encoding="utf-8")
+        completed = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--worker", str(job), str(out)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        if completed.returncode != 0 or not out.exists():
+            error = completed.stderr.decode("utf-8", errors="replace").strip().splitlines()
+            return {"error": error[-1] if error else f"退出码 {completed.returncode}"}
+        return json.loads(out.read_text(encoding="utf-8"))
+
+
+def _worker(job_path: str, out_path: str) -> int:
+    job = json.loads(Path(job_path).read_text(encoding="utf-8"))
+    paths = {key: [Path(p) for p in value] for key, value in job["paths"].items()}
+    measured = run_case(paths, job["stage"], job["variant"])
+    Path(out_path).write_text(json.dumps(measured), encoding="utf-8")
+    return 0
+
+
+def _record(size: str, shape: Tuple[int, int], stage: str, variant: str, measured: Dict) -> Dict:
+    megapixels = shape[0] * shape[1] / 1e6
+    record = {
+        "size": size,
+        "shape": list(shape),
+        "megapixels": round(megapixels, 2),
+        "stage": stage,
+        "variant": variant,
+    }
+    if "error" in measured:
+        record["error"] = measured["error"]
+        return record
+
+    seconds = measured["seconds"]
+    frames = measured["frames"]
+    record.update({
+        "frames": frames,
+        "seconds": round(seconds, 4),
+        "ms_per_frame": round(seconds / frames * 1000, 2) if frames else None,
+        "frames_per_s": round(frames / seconds, 3) if seconds > 0 else None,
+        "megapixels_per_s": round(megapixels * frames / seconds, 2) if seconds > 0 else None,
+        "peak_rss_mb": round(measured["peak_rss_mb"], 1) if measured.get("peak_rss_mb") else None,
+    })
+    if measured.get("extra"):
+        record["extra"] = measured["extra"]
+    return record
+
+
+def environment() -> Dict:
+    """运行环境信息，随结果一起保存以便解读对比"""
+    import cv2
+
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+    try:
+        env["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        env["commit"] = None
+    return env
+
+
+def run_benchmarks(
+    sizes: List[str],
+    stages: List[str],
+    frames: int = 6,
+    seed: int = 0,
+    data_dir: Optional[Path] = None,
+    isolate: bool = True,
+    variants: Optional[List[str]] = None,
+    log: Callable[[str], None] = print,
+) -> Dict:
+    """
+    执行基准测试
+
+    Args:
+        sizes: 尺寸列表（12 / 24mp / 3000x4000 ...）
+        stages: 阶段列表（STAGES 的键）
+        frames: 每个尺寸的帧数
+        seed: 合成数据的随机种子
+        data_dir: 合成数据缓存目录（默认系统临时目录下的 sst-bench-data）
+        isolate: 每个用例是否在独立子进程中运行
+        variants: 只运行这些变体（默认全部）
+        log: 进度输出函数
+
+    Returns:
+        可直接写成 JSON 的结果字典
+    """
+    data_dir = Path(data_dir) if data_dir else Path(tempfile.gettempdir()) / "sst-bench-data"
+    results = []
+    for size_arg in sizes:
+        size, shape = parse_size(size_arg)
+        start = time.perf_counter()
+        paths = write_sequence(data_dir, shape, frames, seed)
+        log(f"[{size}] 合成数据就绪 ({frames} 帧, {time.perf_counter() - start:.1f}s)")
+
+        for stage in stages:
+            _, stage_variants = STAGES[stage]
+            for variant in stage_variants:
+                if variants and variant not in variants:
+                    continue
+                if isolate:
+                    measured = _run_isolated(paths, stage, variant)
+                else:
+                    measured = run_case(paths, stage, variant)
+                record = _record(size, shape, stage, variant, measured)
+                results.append(record)
+                if "error" in record:
+                    log(f"[{size}] {stage:<9} {variant:<14} 失败: {record['error']}")
+                else:
+                    rss = f"{record['peak_rss_mb']:.0f} MB" if record["peak_rss_mb"] else "-"
+                    log(
+                        f"[{size}] {stage:<9} {variant:<14} {record['seconds']:8.3f}s  "
+                        f"{record['megapixels_per_s'] or 0:8.1f} MP/s  峰值 {rss}"
+                    )
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": {"sizes": sizes, "stages": stages, "frames": frames, "seed": seed},
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.10) -> List[str]:
+    """
+    与基线结果对比
+
+    Args:
+        current: 本次结果
+        baseline: 基线结果
+        threshold: 允许的耗时增幅（0.10 = 10%）
+
+    Returns:
+        超过阈值的退化描述列表
+    """
+    def key(record):
+        return record["size"], record["stage"], record["variant"]
+
+    old = {key(r): r for r in baseline.get("results", []) if "seconds" in r}
+    regressions = []
+    for record in current["results"]:
+        before = old.get(key(record))
+        if before is None or "seconds" not in record or before["seconds"] <= 0:
+            continue
+        ratio = record["seconds"] / before["seconds"]
+        line = (
+            f"{record['size']:<6} {record['stage']:<9} {record['variant']:<14} "
+            f"{before['seconds']:8.3f}s → {record['seconds']:8.3f}s  ({ratio - 1:+.1%})"
+        )
+        print(line)
+        if ratio > 1 + threshold:
+            regressions.append(line)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="SuperStarTrail 核心流水线基准测试")
+    parser.add_argument("--sizes", nargs="+", default=["12", "24"],
+                        help="尺寸：12 / 24 / 45 / 100（MP）或 高x宽（默认: 12 24）")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES),
+                        help="要测试的阶段（默认: 全部）")
+    parser.add_argument("--variants", nargs="+", default=None,
+                        help="只运行指定变体（如 lighten tiff-deflate）")
+    parser.add_argument("--frames", type=int, default=6, help="每个尺寸的帧数（默认: 6）")
+    parser.add_argument("--seed", type=int, default=0, help="合成数据随机种子（默认: 0）")
+    parser.add_argument("--data-dir", default=None, help="合成数据缓存目录")
+    parser.add_argument("-o", "--output", default=None, help="结果 JSON 路径（默认只打印）")
+    parser.add_argument("--baseline", default=None, help="与该 JSON 结果对比")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="判定为退化的耗时增幅（默认: 0.10）")
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="所有用例在同一进程中运行（峰值 RSS 不再按用例区分）")
+    parser.add_argument("--worker", nargs=2, metavar=("JOB", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return _worker(*args.worker)
+
+    report = run_benchmarks(
+        args.sizes, args.stages, frames=args.frames, seed=args.seed,
+        data_dir=args.data_dir, isolate=not args.no_isolate, variants=args.variants,
+    )
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+        print(f"结果已写入: {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        print("-" * 60)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"⚠️  {len(regressions)} 项耗时增幅超过 {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"    {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
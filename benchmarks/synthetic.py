@@ -0,0 +1,170 @@
+"""
+确定性的合成星轨序列
+
+按固定随机种子生成绕天极旋转的星场：每帧把每颗星画成一段短弧（曝光期间的运动），
+帧与帧之间留有间隔，部分帧带一条卫星划痕，底部是暗色地景。
+同一组参数总是生成完全相同的像素，便于不同版本之间对比耗时。
+
+每帧同时写出 16-bit RGB TIFF 和 RGGB 马赛克的最小 DNG（可由 rawpy/LibRaw 解码），
+分别用于测试 TIFF 读取和 RAW 解码路径。
+"""
+
+import math
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+import tifffile
+
+# 尺寸名称 → (高, 宽)，与常见机身的像素数相当
+SIZES: Dict[str, Tuple[int, int]] = {
+    "12mp": (3000, 4000),
+    "24mp": (4000, 6000),
+    "45mp": (5504, 8256),
+    "100mp": (8736, 11648),
+}
+
+# 每帧的角位移（弧度）和曝光占空比：占空比 < 1 时星轨之间留有间隔
+_STEP = math.radians(0.05)
+_DUTY = 0.8
+
+# 最小 DNG 所需的标签：Make/Model、CFA 排列 (RGGB)、DNG 版本、白点、单位色彩矩阵、中性白平衡
+_DNG_TAGS = [
+    (271, "s", 0, "SuperStarTrail", True),
+    (272, "s", 0, "Synthetic", True),
+    (33421, "H", 2, (2, 2), True),
+    (33422, "B", 4, (0, 1, 1, 2), True),
+    (50706, "B", 4, (1, 4, 0, 0), True),
+    (50708, "s", 0, "SuperStarTrail Synthetic", True),
+    (50717, "I", 1, (65535,), True),
+    (50721, "2i", 9, (1, 1, 0, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 0, 1, 1, 1), True),
+    (50728, "2I", 3, (1, 1, 1, 1, 1, 1), True),
+]
+
+
+def parse_size(name: str) -> Tuple[str, Tuple[int, int]]:
+    """
+    解析尺寸参数：预设名称（12 / 12mp）或 "高x宽"
+
+    Returns:
+        (规范名称, (高, 宽))
+    """
+    key = name.lower()
+    if not key.endswith("mp") and f"{key}mp" in SIZES:
+        key = f"{key}mp"
+    if key in SIZES:
+        return key, SIZES[key]
+    try:
+        h, w = (int(part) for part in key.split("x"))
+    except ValueError:
+        raise ValueError(f"无法识别的尺寸: {name}（可选 {', '.join(SIZES)} 或 高x宽）") from None
+    return f"{h}x{w}", (h, w)
+
+
+def _stars(shape: Tuple[int, int], seed: int) -> np.ndarray:
+    """星表：(半径, 初始角度, 亮度, 粗细)，半径以天极为原点"""
+    h, w = shape
+    rng = np.random.default_rng(seed)
+    count = max(int(h * w / 20000), 50)  # 约每 2 万像素一颗
+    max_radius = math.hypot(w, h * 1.3)
+    radius = np.sqrt(rng.uniform(0, 1, count)) * max_radius
+    angle = rng.uniform(0, 2 * math.pi, count)
+    brightness = np.clip(rng.lognormal(9.2, 0.7, count), 3000, 62000)
+    thickness = np.where(brightness > 30000, 3, np.where(brightness > 12000, 2, 1))
+    return np.stack([radius, angle, brightness, thickness], axis=1)
+
+
+def render_frame(shape: Tuple[int, int], index: int, seed: int = 0) -> np.ndarray:
+    """
+    渲染第 index 帧
+
+    Args:
+        shape: (高, 宽)
+        index: 帧序号
+        seed: 随机种子（决定星表、噪声和划痕）
+
+    Returns:
+        RGB uint16 图像 (H, W, 3)
+    """
+    h, w = shape
+    pole = (w * 0.5, -h * 0.3)  # 天极在画面上方之外，星轨呈弧形
+    rng = np.random.default_rng(seed * 100003 + index)
+
+    # 天空背景：竖直渐变 + 噪声
+    gradient = np.linspace(900, 2400, h, dtype=np.float32)[:, None]
+    noise = rng.normal(0, 180, (h, w)).astype(np.float32)
+    sky = np.clip(gradient + noise, 0, 65535).astype(np.uint16)
+    frame = np.repeat(sky[:, :, None], 3, axis=2)
+    frame[:, :, 2] = np.clip(sky.astype(np.int32) + 300, 0, 65535)  # 偏蓝的夜空
+
+    start = index * _STEP
+    end = start + _STEP * _DUTY
+    for radius, angle, brightness, thickness in _stars(shape, seed):
+        x0 = pole[0] + radius * math.cos(angle + start)
+        y0 = pole[1] + radius * math.sin(angle + start)
+        x1 = pole[0] + radius * math.cos(angle + end)
+        y1 = pole[1] + radius * math.sin(angle + end)
+        if not (-50 < x0 < w + 50 and -50 < y0 < h + 50):
+            continue
+        value = int(brightness)
+        cv2.line(
+            frame, (int(x0), int(y0)), (int(x1), int(y1)),
+            (value, value, value), int(thickness), cv2.LINE_AA,
+        )
+
+    # 每 4 帧一条卫星划痕
+    if index % 4 == 3:
+        y_start = int(rng.uniform(0.1, 0.4) * h)
+        y_end = int(rng.uniform(0.2, 0.6) * h)
+        cv2.line(frame, (0, y_start), (w - 1, y_end), (50000, 50000, 50000), max(w // 1500, 2))
+
+    # 地景：底部 15% 暗且几乎不变
+    ground = int(h * 0.85)
+    frame[ground:] = (frame[ground:] // 8).astype(np.uint16)
+    return frame
+
+
+def mosaic_rggb(rgb: np.ndarray) -> np.ndarray:
+    """把 RGB 图像采样成 RGGB 拜耳马赛克 (H, W) uint16"""
+    h, w = rgb.shape[:2]
+    cfa = np.empty((h - h % 2, w - w % 2), dtype=np.uint16)
+    cfa[0::2, 0::2] = rgb[0:cfa.shape[0]:2, 0:cfa.shape[1]:2, 0]
+    cfa[0::2, 1::2] = rgb[0:cfa.shape[0]:2, 1:cfa.shape[1]:2, 1]
+    cfa[1::2, 0::2] = rgb[1:cfa.shape[0]:2, 0:cfa.shape[1]:2, 1]
+    cfa[1::2, 1::2] = rgb[1:cfa.shape[0]:2, 1:cfa.shape[1]:2, 2]
+    return cfa
+
+
+def write_sequence(
+    directory: Path, shape: Tuple[int, int], frames: int, seed: int = 0
+) -> Dict[str, List[Path]]:
+    """
+    生成（或复用已生成的）序列：每帧一个 TIFF 和一个 DNG
+
+    目录中已有完整的同参数序列时直接返回，不重新渲染。
+
+    Args:
+        directory: 输出目录
+        shape: (高, 宽)
+        frames: 帧数
+        seed: 随机种子
+
+    Returns:
+        {"tiff": [...], "dng": [...]}
+    """
+    directory = Path(directory) / f"{shape[0]}x{shape[1]}_n{frames}_s{seed}"
+    directory.mkdir(parents=True, exist_ok=True)
+    paths: Dict[str, List[Path]] = {"tiff": [], "dng": []}
+    for index in range(frames):
+        tiff_path = directory / f"SYN_{index:04d}.tif"
+        dng_path = directory / f"SYN_{index:04d}.dng"
+        if not (tiff_path.exists() and dng_path.exists()):
+            rgb = render_frame(shape, index, seed)
+            tifffile.imwrite(str(tiff_path), rgb, photometric="rgb")
+            tifffile.imwrite(
+                str(dng_path), mosaic_rggb(rgb), photometric=32803, extratags=_DNG_TAGS
+            )
+        paths["tiff"].append(tiff_path)
+        paths["dng"].append(dng_path)
+    return paths
@@ -8,11 +8,21 @@ SuperStarTrail CLI
   sst stack <dir> --timelapse   生成星轨延时视频
   sst stack <dir> --milkyway    生成银河延时视频
   sst stack <dir> --remove-satellites  去除卫星划痕
+  sst stack <dir> --remove-satellites --satellite-mode temporal  帧间差分检测划痕
+  sst stack <dir> --stream-tiff  边生成边写出 BigTIFF（超大结果）
+  sst stack <dir> --mode average --float32  输出 32-bit 浮点线性 TIFF
+  sst stack <dir> --profile     输出各阶段耗时分位数报告（--profile cprofile 另存函数级剖析）
+  sst batch <root>              批量堆栈：每个子目录一个序列，多进程并发
+  sst batch <root> --split gap --jobs 2  按拍摄时间间隔拆分序列，两个任务并发
+  sst stack <dir> --sequence longest    目录混有多段拍摄时只堆栈最长的一段
+  sst stack <dir> --dark <darks> --flat <flats>  暗场/平场校准（主帧自动合成并缓存）
+  sst stack <dir> --hot-pixels  从序列检测并修正热像素（按机身缓存）
   sst info <file>               查看 RAW 文件元数据
   sst export <file>             转换/导出图像
 """
 
 import argparse
+import os
 import sys
 import time
 from pathlib import Path
@@ -33,65 +43,134 @@ _setup_path()
 # ─────────────────────────────────────────────
 
 def cmd_info(args):
-    """显示 RAW 文件的元数据（从内嵌缩略图读取 EXIF）"""
-    import io
-    import rawpy
-    from PIL import Image
-    from PIL.ExifTags import TAGS
-    from core.raw_processor import RawProcessor
+    """显示图片文件或整个目录的元数据（只读文件头 EXIF，结果缓存在元数据索引中）"""
+    from core.metadata_service import get_metadata_service
 
-    file_path = Path(args.file)
-    if not file_path.exists():
-        print(f"错误: 文件不存在 - {file_path}")
+    target = Path(args.file)
+    if not target.exists():
+        print(f"错误: 文件不存在 - {target}")
         return 1
 
+    service = get_metadata_service()
+    try:
+        if target.is_dir():
+            return _info_directory(target, service)
+        return _info_file(target, service)
+    finally:
+        service.save()
+
+
+def _format_time(timestamp) -> str:
+    from datetime import datetime
+
+    if timestamp is None:
+        return "-"
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _info_file(file_path: Path, service) -> int:
+    """单个文件：尺寸 + EXIF"""
+    import rawpy
+    from core.exif_scanner import format_exposure
+    from core.raw_processor import RawProcessor
+
     print(f"\n文件: {file_path.name}")
     print(f"大小: {file_path.stat().st_size / 1024 / 1024:.1f} MB")
     print("-" * 40)
 
-    try:
-        with rawpy.imread(str(file_path)) as raw:
-            # 分辨率来自 rawpy
-            s = raw.sizes
-            print(f"  {'分辨率':<10}: {s.width} x {s.height}  (裁剪后 {s.crop_width} x {s.crop_height})")
-
-            # EXIF 从内嵌缩略图中读取
-            try:
-                thumb = raw.extract_thumb()
-                img = Image.open(io.BytesIO(thumb.data))
-                exif = img._getexif() or {}
-                tag_map = {TAGS.get(k, k): v for k, v in exif.items()}
-
-                fields = [
-                    ("品牌",   "Make"),
-                    ("型号",   "Model"),
-                    ("ISO",    "ISOSpeedRatings"),
-                    ("快门",   "ExposureTime"),
-                    ("光圈",   "FNumber"),
-                    ("焦距",   "FocalLength"),
-                    ("拍摄时间", "DateTimeOriginal"),
-                    ("镜头型号", "LensModel"),
-                ]
-                for label, key in fields:
-                    val = tag_map.get(key)
-                    if val is None:
-                        continue
-                    if key == "ExposureTime":
-                        val = f"{val}s" if val >= 1 else f"1/{round(1/val)}s"
-                    elif key == "FNumber":
-                        val = f"f/{val}"
-                    elif key == "FocalLength":
-                        val = f"{val}mm"
-                    print(f"  {label:<10}: {val}")
-            except Exception:
-                print("  (EXIF 读取失败，仅显示分辨率)")
-    except Exception as e:
-        if RawProcessor.is_unsupported_raw_exception(e):
-            print(f"错误: {file_path.name}: {RawProcessor.UNSUPPORTED_COMPRESSED_RAW_MESSAGE}")
+    if RawProcessor.is_raw_file(file_path):
+        try:
+            # rawpy.imread 只打开文件读取尺寸，不解包
+            with rawpy.imread(str(file_path)) as raw:
+                s = raw.sizes
+                print(
+                    f"  {'分辨率':<10}: {s.width} x {s.height}  "
+                    f"(裁剪后 {s.crop_width} x {s.crop_height})"
+                )
+        except Exception as e:
+            if RawProcessor.is_unsupported_raw_exception(e):
+                print(f"错误: {file_path.name}: {RawProcessor.UNSUPPORTED_COMPRESSED_RAW_MESSAGE}")
+                return 1
+            print(f"错误: 无法读取文件 - {e}")
             return 1
-        print(f"错误: 无法读取文件 - {e}")
+    else:
+        size = RawProcessor.get_image_size(file_path)
+        if size is not None:
+            print(f"  {'分辨率':<10}: {size[0]} x {size[1]}")
+
+    info = service.get(file_path)
+    fields = [
+        ("品牌", info.make),
+        ("型号", info.model),
+        ("ISO", info.iso),
+        ("快门", format_exposure(info.exposure) if info.exposure else None),
+        ("光圈", f"f/{info.aperture:g}" if info.aperture else None),
+        ("焦距", f"{info.focal_length:g}mm" if info.focal_length else None),
+        ("拍摄时间", _format_time(info.captured) if info.captured is not None else None),
+        ("镜头型号", info.lens),
+    ]
+    shown = [(label, val) for label, val in fields if val is not None]
+    for label, val in shown:
+        print(f"  {label:<10}: {val}")
+    if not shown:
+        print("  (未读取到 EXIF)")
+
+    print()
+    return 0
+
+
+def _info_directory(directory: Path, service) -> int:
+    """整个目录：逐文件一行 + 汇总（机身、时间范围、序列）"""
+    import time
+    from core.exif_scanner import format_exposure, group_sequences
+    from core.metadata_service import summarize
+    from core.raw_processor import RawProcessor
+
+    files = RawProcessor.scan_directory(directory)
+    if not files:
+        print(f"错误: 目录中没有支持的图片文件 - {directory}")
         return 1
 
+    hits_before = service.hits
+    t0 = time.time()
+    frames = service.get_many(files)
+    elapsed = time.time() - t0
+    hits = service.hits - hits_before
+
+    name_width = min(max(len(f.name) for f in files), 32)
+    print(f"\n目录: {directory}")
+    print("-" * (name_width + 56))
+    print(f"  {'文件':<{name_width - 2}}  {'拍摄时间':<15}  {'快门':<6}  {'ISO':>6}  {'光圈':<4}  {'焦距':>4}")
+    for frame in frames:
+        aperture = f"f/{frame.aperture:g}" if frame.aperture else "-"
+        focal = f"{frame.focal_length:g}mm" if frame.focal_length else "-"
+        print(
+            f"  {frame.path.name:<{name_width}}  {_format_time(frame.captured):<19}  "
+            f"{format_exposure(frame.exposure):<8}  {frame.iso or '-':>6}  "
+            f"{aperture:<6}  {focal:>6}"
+        )
+
+    summary = summarize(frames)
+    print("-" * (name_width + 56))
+    print(f"  {'文件数量':<8}: {summary['count']}  ({summary['total_bytes'] / 1024 / 1024:.1f} MB)")
+    if summary["cameras"]:
+        print(f"  {'机身':<10}: {', '.join(summary['cameras'])}")
+    if summary["start"] is not None:
+        minutes = (summary["end"] - summary["start"]) / 60
+        print(
+            f"  {'时间范围':<8}: {_format_time(summary['start'])} → "
+            f"{_format_time(summary['end'])}  ({minutes:.1f} 分钟)"
+        )
+    if summary["exposures"]:
+        print(f"  {'快门':<10}: {', '.join(format_exposure(e) for e in summary['exposures'])}")
+    if summary["isos"]:
+        print(f"  {'ISO':<10}: {', '.join(str(iso) for iso in summary['isos'])}")
+    sequences = group_sequences(frames)
+    print(f"  {'序列':<10}: {len(sequences)} 段")
+    if len(sequences) > 1:
+        for index, sequence in enumerate(sequences, 1):
+            print(f"    {index}. {sequence.describe()}")
+    print(f"  {'元数据':<9}: {hits} 张来自索引，{len(frames) - hits} 张读取文件头，耗时 {elapsed:.2f}s")
     print()
     return 0
 
@@ -100,60 +179,194 @@ def cmd_info(args):
 # 子命令: stack
 # ─────────────────────────────────────────────
 
-def cmd_stack(args):
-    """星轨合成主流程"""
+def _build_calibrator(args, processor, lights=None):
+    """
+    按 --dark / --flat 合成（或从缓存读取）主帧
+
+    Args:
+        args: 命令行参数
+        processor: RawProcessor，用与亮场相同的旋转解码校准帧
+        lights: 亮场文件（可选），用于检查暗场的 ISO/曝光是否一致
+
+    Returns:
+        (Calibrator 或 None, 说明文字)
+    """
+    from core.calibration import Calibrator, MasterLibrary, collect_frames
+    from core.metadata_service import get_metadata_service
+
+    if not (args.dark or args.flat):
+        return None, "禁用"
+
+    library = MasterLibrary(workers=args.workers)
+    tag = f"rotation={args.rotation}"
+
+    def load(path):
+        return processor.process(path, rotation=args.rotation, white_balance="camera")
+
+    masters = {}
+    notes = []
+    for kind, label, source in (("dark", "暗场", args.dark), ("flat", "平场", args.flat)):
+        if not source:
+            continue
+        frames = collect_frames(Path(source))
+        cached = library.cached
+        start = time.time()
+        masters[kind] = library.master(kind, frames, load, method=args.master_method, tag=tag)
+        if library.cached > cached:
+            how = "缓存"
+        else:
+            how = f"{args.master_method} 合成 {time.time() - start:.1f}s"
+        notes.append(f"{label} {len(frames)} 张（{how}）")
+
+        if kind == "dark" and lights:
+            service = get_metadata_service()
+            dark, light = service.get(frames[0]), service.get(lights[0])
+            mismatch = (dark.iso, dark.exposure) != (light.iso, light.exposure)
+            if mismatch and None not in (dark.iso, light.iso):
+                print(
+                    f"⚠️  暗场 ISO{dark.iso} {dark.exposure}s 与亮场 ISO{light.iso} "
+                    f"{light.exposure}s 不一致，热噪声可能无法完全消除"
+                )
+
+    return Calibrator(masters.get("dark"), masters.get("flat")), "，".join(notes)
+
+
+def _build_hot_pixel_map(args, decode, files):
+    """
+    按 --hot-pixels 获取热像素图：auto 优先使用该机身缓存的图，detect 总是从序列重新检测
+
+    Args:
+        args: 命令行参数
+        decode: 解码单个文件的函数（不做暗场/平场校准：缓存的图只按机身区分，
+                在减过暗场的帧上检测会得到几乎为空的图）
+        files: 序列文件，检测用前 DEFAULT_FRAMES 帧
+
+    Returns:
+        (HotPixelMap, 说明文字)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from itertools import chain
+    from core.hot_pixels import DEFAULT_FRAMES, HotPixelMap, cache_path, detect_hot_pixels
+    from core.metadata_service import get_metadata_service
+    from core.raw_processor import RawProcessor
+
+    start = time.time()
+    first = decode(files[0])
+    height, width = first.shape[:2]
+    info = get_metadata_service().get(files[0])
+    path = cache_path(
+        info.camera, info.serial, (width, height), args.rotation,
+        orientation=RawProcessor.get_orientation(files[0]),
+    )
+    if path is not None and args.hot_pixels == "auto":
+        hot_map = HotPixelMap.load(path)
+        if hot_map is not None and hot_map.shape == (height, width):
+            return hot_map, f"{len(hot_map)} 个（机身 {info.serial} 缓存）"
+        if hot_map is not None:
+            print(f"⚠️  缓存的热像素图尺寸 {hot_map.shape} 与图像 {(height, width)} 不符，重新检测")
+
+    sample = files[:DEFAULT_FRAMES]
+    workers = max(args.workers, 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sst-hot") as pool:
+        hot_map = detect_hot_pixels(chain([first], pool.map(decode, sample[1:])))
+    if path is not None:
+        hot_map.save(path)
+    return hot_map, f"{len(hot_map)} 个（前 {len(sample)} 帧检测 {time.time() - start:.1f}s）"
+
+
+def cmd_stack(args, files=None):
+    """
+    星轨合成主流程
+
+    Args:
+        args: 命令行参数
+        files: 指定要堆栈的文件列表（batch 子命令按序列传入）；None 表示扫描 args.dir
+    """
+    from core.batch import select_sequence_files
     from core.raw_processor import RawProcessor
     from core.stacking_engine import StackingEngine, StackMode
     from core.exporter import ImageExporter
+    from core.frame_pipeline import FramePipeline
+    from core.timelapse_outputs import TimelapseOutputs
+    from core.video_encoder import find_ffmpeg
     from utils.file_naming import FileNamingService
+    from utils.logger import enable_file_logging
+    from utils import profiling
 
     source_dir = Path(args.dir)
     if not source_dir.exists():
         print(f"错误: 目录不存在 - {source_dir}")
         return 1
 
-    # 扫描文件
     processor = RawProcessor()
-    raw_exts = RawProcessor.SUPPORTED_RAW_FORMATS
-    jpg_exts = {".jpg", ".jpeg"}
-
-    candidate_files = RawProcessor.scan_directory(source_dir)
-    raw_files = sorted([f for f in candidate_files if f.suffix.lower() in raw_exts])
-    jpg_files = sorted([f for f in candidate_files if f.suffix.lower() in jpg_exts])
-    other_files = sorted([
-        f for f in candidate_files
-        if f.suffix.lower() not in raw_exts and f.suffix.lower() not in jpg_exts
-    ])
-
-    # 同名 RAW+JPG 配对时，按 --jpg 参数决定使用哪种格式
-    raw_stems = {f.stem for f in raw_files}
-    jpg_stems = {f.stem for f in jpg_files}
-    common_stems = raw_stems & jpg_stems
-
-    if common_stems:
-        if args.jpg:
-            # 去掉与 JPG 同名的 RAW
-            raw_files = [f for f in raw_files if f.stem not in common_stems]
-        else:
-            # 默认：去掉与 RAW 同名的 JPG
-            jpg_files = [f for f in jpg_files if f.stem not in common_stems]
-        if common_stems:
+    if files is None:
+        # 扫描文件；同名 RAW+JPG 配对时，按 --jpg 参数决定使用哪种格式
+        all_files, pairs = select_sequence_files(RawProcessor.scan_directory(source_dir), args.jpg)
+        if pairs:
             fmt = "JPG" if args.jpg else "NEF/RAW"
-            print(f"检测到 {len(common_stems)} 对同名 RAW+JPG，自动选择 {fmt}（可用 --jpg 切换）")
-
-    all_files = sorted(raw_files + jpg_files + other_files, key=lambda f: f.name)
+            print(f"检测到 {pairs} 对同名 RAW+JPG，自动选择 {fmt}（可用 --jpg 切换）")
+    else:
+        all_files = list(files)
 
     if not all_files:
         print(f"错误: 目录中没有支持的图片文件 - {source_dir}")
         return 1
 
+    # 混合了多段拍摄的目录：只读文件头 EXIF，按拍摄间隔拆分后选一段
+    if getattr(args, "sequence", None):
+        from core.exif_scanner import pick_sequence, scan_sequences
+
+        scan_start = time.time()
+        gap_seconds = args.split_gap * 60 if args.split_gap else None
+        sequences = scan_sequences(all_files, gap_seconds=gap_seconds)
+        print(
+            f"按拍摄时间分为 {len(sequences)} 段"
+            f"（扫描 {len(all_files)} 个文件 {time.time() - scan_start:.2f}s）:"
+        )
+        for number, sequence in enumerate(sequences, start=1):
+            print(f"  {number:3d}. {sequence.describe()}")
+        if args.sequence == "list":
+            return 0
+        try:
+            number, sequence = pick_sequence(sequences, args.sequence)
+        except ValueError as e:
+            print(f"错误: {e}")
+            return 1
+        print(f"堆栈第 {number} 段")
+        all_files = sequence.paths
+
     # 限制处理数量（--limit）
     if args.limit and args.limit > 0:
         all_files = all_files[:args.limit]
 
+    # 质量预检：在缩略图上评估每帧，剔除云、车灯、结露等离群帧
+    n_rejected = 0
+    if args.auto_reject:
+        from core.frame_quality import QualityScorer
+
+        check_start = time.time()
+        scorer = QualityScorer()
+        scores = scorer.evaluate(all_files, sigma=args.reject_sigma)
+        n_rejected = sum(score.rejected for score in scores)
+        print(
+            f"质量预检 {len(scores)} 张（{scorer.hits} 张来自缓存）"
+            f"{time.time() - check_start:.1f}s，剔除 {n_rejected} 张"
+        )
+        for score in scores:
+            if score.flags:
+                action = "剔除" if score.rejected else "提示"
+                print(f"  {action}  {score.path.name}: {score.describe_flags()}")
+        all_files = [score.path for score in scores if not score.rejected]
+        if not all_files:
+            print("错误: 所有文件都被质量预检剔除")
+            return 1
+
     # 确定输出目录
     output_dir = Path(args.output) if args.output else source_dir / "SuperStarTrail"
     output_dir.mkdir(parents=True, exist_ok=True)
+    if args.profile:
+        # 剖析报告写在日志文件旁边
+        enable_file_logging(output_dir)
 
     # 确定堆栈模式
     mode_map = {
@@ -174,167 +387,448 @@ def cmd_stack(args):
         )
         timelapse_output_path = output_dir / video_filename
 
-    # 银河延时生成器
-    milkyway_generator = None
+    # 延时视频输出：多路共享降采样、帧准备线程池，最后并发编码
+    outputs = TimelapseOutputs(
+        fps=args.fps,
+        quality=args.video_quality,
+        codec=args.video_codec,
+        target_duration=args.duration,
+        expected_frames=len(all_files),
+        interpolate=args.interpolate,
+        comet_fade=args.fade,
+        temp_budget_mb=args.temp_budget,
+    )
+    video_paths = {}
+    trail_generator = None
+    span = f"{all_files[0].stem}-{all_files[-1].stem}"
+    if args.timelapse:
+        video_paths["startrail"] = timelapse_output_path
+        trail_generator = outputs.add_stream("startrail", timelapse_output_path, source="trail")
     if args.milkyway:
-        from core.timelapse_generator import TimelapseGenerator
-        milkyway_path = output_dir / f"MilkyWayTimelapse_{all_files[0].stem}-{all_files[-1].stem}_{args.fps}FPS.mp4"
-        milkyway_generator = TimelapseGenerator(
-            output_path=milkyway_path,
-            fps=args.fps,
+        video_paths["milkyway"] = output_dir / f"MilkyWayTimelapse_{span}_{args.fps}FPS.mp4"
+        outputs.add_stream("milkyway", video_paths["milkyway"], source="frame")
+    if args.comet_timelapse:
+        video_paths["comet"] = output_dir / f"CometTimelapse_{span}_{args.fps}FPS.mp4"
+        outputs.add_stream("comet", video_paths["comet"], source="comet")
+
+    # 取消（Ctrl+C）、出错或提前返回时也删除各路的临时帧；finish 成功后由它自己清理
+    videos_done = False
+    try:
+        # 蒙版功能已临时禁用
+        sky_mask = None
+        _first = None
+        if args.mask:
+            print("⚠️  蒙版功能已临时禁用，忽略 --mask / --fg-mode 参数")
+
+        # 初始化引擎
+        comet_fg = getattr(args, 'fg_mode', 'average') == 'comet'
+        fg_mode = StackMode.COMET if comet_fg else StackMode.AVERAGE
+        engine = StackingEngine(
+            stack_mode,
+            enable_gap_filling=args.fill_gaps,
+            gap_fill_method=args.gap_method,
+            gap_size=args.gap_size,
+            sky_mask=sky_mask,
+            fg_mode=fg_mode,
+            timelapse_generator=trail_generator,
         )
 
-    # 蒙版功能已临时禁用
-    sky_mask = None
-    _first = None
-    if args.mask:
-        print("⚠️  蒙版功能已临时禁用，忽略 --mask / --fg-mode 参数")
-
-    # 初始化引擎
-    fg_mode = StackMode.COMET if getattr(args, 'fg_mode', 'average') == 'comet' else StackMode.AVERAGE
-    engine = StackingEngine(
-        stack_mode,
-        enable_gap_filling=args.fill_gaps,
-        gap_fill_method=args.gap_method,
-        gap_size=args.gap_size,
-        enable_timelapse=args.timelapse,
-        timelapse_output_path=timelapse_output_path,
-        video_fps=args.fps,
-        sky_mask=sky_mask,
-        fg_mode=fg_mode,
-    )
+        if stack_mode == StackMode.COMET:
+            engine.set_comet_fade_factor(args.fade)
 
-    if stack_mode == StackMode.COMET:
-        engine.set_comet_fade_factor(args.fade)
+        # 划痕检测器
+        sat_filter = None
+        if args.remove_satellites:
+            from core.satellite_filter import SatelliteFilter
+            sat_filter = SatelliteFilter(mode=args.satellite_mode)
 
-    # 划痕检测器
-    sat_filter = None
-    if args.remove_satellites:
-        from core.satellite_filter import SatelliteFilter
-        sat_filter = SatelliteFilter()
+        # 暗场 / 平场校准：主帧合成一次并缓存，逐帧在解码线程中原地校准
+        try:
+            calibrator, calibration_text = _build_calibrator(args, processor, all_files)
+        except (OSError, ValueError) as e:
+            print(f"错误: 校准帧无法使用 - {e}")
+            return 1
 
-    total = len(all_files)
-    raw_params = {"white_balance": "camera"}
+        def _develop(path):
+            return processor.process(path, rotation=args.rotation, white_balance="camera")
 
-    print("=" * 60)
-    print("SuperStarTrail CLI - 星轨合成")
-    print("=" * 60)
-    print(f"  文件数量  : {total}")
-    print(f"  堆栈模式  : {stack_mode.value}")
-    print(f"  输出目录  : {output_dir}")
-    print(f"  间隔填充  : {'启用 (' + args.gap_method + ')' if args.fill_gaps else '禁用'}")
-    print(f"  去卫星划痕: {'启用' if args.remove_satellites else '禁用'}")
-    print(f"  星轨延时  : {'启用 (' + str(args.fps) + 'FPS)' if args.timelapse else '禁用'}")
-    print(f"  银河延时  : {'启用 (' + str(args.fps) + 'FPS)' if args.milkyway else '禁用'}")
-    print("=" * 60)
+        def _decode(path):
+            image = _develop(path)
+            return calibrator.apply(image) if calibrator else image
 
-    start_time = time.time()
-    failed_files = []
-    satellite_removed_count = 0
+        # 热像素：稀疏坐标表，逐帧只修正这些像素
+        hot_map = None
+        hot_pixel_text = "禁用"
+        if args.hot_pixels:
+            try:
+                hot_map, hot_pixel_text = _build_hot_pixel_map(args, _develop, all_files)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  热像素检测失败，跳过 - {e}")
+
+        # 帧配准（修正三脚架漂移）
+        registrar = None
+        if args.align:
+            from core.registration import FrameRegistrar
+            registrar = FrameRegistrar(mode=args.align, cache_tag=f"rotation={args.rotation}")
+
+        total = len(all_files)
+
+        print("=" * 60)
+        print("SuperStarTrail CLI - 星轨合成")
+        print("=" * 60)
+        print(f"  文件数量  : {total}")
+        print(f"  堆栈模式  : {stack_mode.value}")
+        print(f"  输出目录  : {output_dir}")
+        print(f"  间隔填充  : {'启用 (' + args.gap_method + ')' if args.fill_gaps else '禁用'}")
+        print(f"  去卫星划痕: {'启用 (' + args.satellite_mode + ')' if args.remove_satellites else '禁用'}")
+        if args.auto_reject:
+            print(f"  质量预检  : 剔除 {n_rejected} 张 (σ={args.reject_sigma:g})")
+        print(f"  暗场平场  : {calibration_text}")
+        print(f"  热像素    : {hot_pixel_text}")
+        print(f"  图像对齐  : {'启用 (' + args.align + ')' if args.align else '禁用'}")
+        print(f"  星轨延时  : {'启用 (' + str(args.fps) + 'FPS)' if args.timelapse else '禁用'}")
+        print(f"  银河延时  : {'启用 (' + str(args.fps) + 'FPS)' if args.milkyway else '禁用'}")
+        if args.comet_timelapse:
+            print(f"  彗星延时  : 启用 ({args.fps}FPS, 衰减 {args.fade})")
+        if outputs:
+            encoder = f"ffmpeg {args.video_codec}" if find_ffmpeg() else "OpenCV mp4v"
+            print(f"  视频编码  : {encoder}  画质 {args.video_quality}")
+            if args.duration:
+                print(f"  目标时长  : {args.duration:g}s{'（交叉淡化插帧）' if args.interpolate else ''}")
+        print("=" * 60)
+
+        start_time = time.time()
+        failed_files = []
+        satellite_removed_count = 0
+
+        _cached_first_img = _first if sky_mask is not None else None
+
+        def _load(index, path):
+            if index == 0 and _cached_first_img is not None:
+                return _cached_first_img
+            image = _decode(path)
+            return hot_map.apply(image) if hot_map else image
+
+        # 解码 + 划痕检测在工作线程中预取，与堆栈重叠执行；
+        # 延时视频所需的降采样也在预取线程中完成，结果缓存在每帧的金字塔中，各路输出共用
+        pipeline = FramePipeline(
+            all_files, _load, detector=sat_filter, workers=args.workers,
+            prepare=outputs.warm if outputs else None,
+            profiler=profiling.get_profiler(),
+            registrar=registrar,
+        )
 
-    _cached_first_img = _first if sky_mask is not None else None
+        last_done = time.time()
+        for frame in pipeline:
+            i, path = frame.index, frame.path
+            try:
+                if frame.error is not None:
+                    raise frame.error
+                img = frame.image
 
-    for i, path in enumerate(all_files):
-        file_start = time.time()
-        try:
-            if i == 0 and _cached_first_img is not None:
-                img = _cached_first_img
-            else:
-                img = processor.process(path, rotation=args.rotation, **raw_params)
-
-            if milkyway_generator:
-                milkyway_generator.add_frame(img)
-
-            satellite_mask = None
-            if sat_filter is not None:
-                satellite_mask = sat_filter.detect_streaks(img)
-                if satellite_mask.any():
+                if outputs:
+                    with pipeline.timed("timelapse"):
+                        outputs.add_frame(img, pyramid=frame.pyramid)
+
+                satellite_mask = frame.streaks
+                if satellite_mask is not None and satellite_mask.any():
                     satellite_removed_count += 1
                     print(f"  [{i+1:3d}/{total}] 🛸 检测到划痕 ({satellite_mask.sum():,} px)")
 
-            engine.add_image(img, satellite_mask=satellite_mask)
+                with pipeline.timed("stack"):
+                    engine.add_image(img, satellite_mask=satellite_mask, pyramid=frame.pyramid)
+
+                elapsed = time.time() - start_time
+                avg = elapsed / (i + 1)
+                remaining = avg * (total - i - 1)
+                if remaining >= 60:
+                    rem_str = f"{int(remaining//60)}m{int(remaining%60)}s"
+                else:
+                    rem_str = f"{int(remaining)}s"
+                print(f"[{i+1:3d}/{total}] {path.name}  {time.time()-last_done:.1f}s  剩余≈{rem_str}")
+
+            except Exception as e:
+                print(f"[{i+1:3d}/{total}] ⚠️  跳过: {path.name} ({e})")
+                failed_files.append((path.name, str(e)))
+            finally:
+                frame.image = frame.pyramid = None  # 尽早释放预取帧内存
+                last_done = time.time()
+
+        total_duration = time.time() - start_time
+        print("-" * 60)
+        print(f"堆栈完成  总耗时: {total_duration:.1f}s  平均: {total_duration/total:.1f}s/张")
+        if args.remove_satellites:
+            print(f"卫星划痕  检测到: {satellite_removed_count}/{total} 张")
+        if registrar is not None:
+            registrar.close()
+            reference = registrar.reference_path.name if registrar.reference_path else "-"
+            print(
+                f"图像对齐  参考帧: {reference}  缓存命中: {registrar.cache_hits}  "
+                f"不可靠（未变换）: {registrar.unreliable}"
+            )
+        print(f"阶段耗时  ({args.workers} 个预取线程)")
+        for line in pipeline.summary_lines():
+            print(f"    {line}")
+
+        success_count = total - len(failed_files)
+        if success_count == 0:
+            print("错误: 没有成功读取任何图像，请检查 RAW/TIFF 格式是否受支持，或文件是否已损坏")
+            return 1
+
+        # 应用间隔填充 + 获取最终结果（流式导出时按行带边填充边写盘）
+        result = None
+        if not (args.stream_tiff or args.float32):
+            if args.fill_gaps:
+                print("应用间隔填充...")
+                gap_start = time.time()
+
+            result = engine.get_result(apply_gap_filling=True)
+
+            if args.fill_gaps:
+                print(f"间隔填充完成  耗时: {time.time()-gap_start:.1f}s")
+
+        # 并发编码各路延时视频
+        if outputs:
+            labels = {"startrail": "星轨延时视频", "milkyway": "银河延时视频", "comet": "彗星延时视频"}
+            print(f"生成延时视频 ({len(outputs)} 路并发编码)...")
+            tl_start = time.time()
+            video_results = outputs.finish(cleanup=True)
+            videos_done = True
+            print(f"延时视频  耗时: {time.time()-tl_start:.1f}s")
+            for name, line in zip(outputs.streams, outputs.throughput_lines()):
+                if video_results[name]:
+                    print(f"✅ {labels[name]}  => {video_paths[name].name}")
+                    print(f"    {line}")
+                else:
+                    print(f"❌ {labels[name]}生成失败")
+
+        # 导出结果
+        exporter = ImageExporter()
+        output_filename = FileNamingService.generate_output_filename(
+            file_paths=all_files,
+            stack_mode=stack_mode,
+            enable_gap_filling=args.fill_gaps,
+            comet_fade_factor=args.fade if stack_mode == StackMode.COMET else None,
+            has_mask=False,
+            fg_mode=None,
+        )
+        tiff_path = output_dir / output_filename
+        if args.float32:
+            tiff_path = tiff_path.with_name(f"{tiff_path.stem}_float32{tiff_path.suffix}")
+        if (args.stream_tiff or args.float32) and (args.pyramid_levels or args.preview):
+            print("提示: --stream-tiff / --float32 模式不写多分辨率子层和预览图")
+        print(f"保存 TIFF: {tiff_path.name} ...")
+        export_start = time.time()
+        if args.float32:
+            # 直接按行带写出 float32 累加器：不拉伸、不裁剪，保留完整动态范围
+            saved = exporter.save_tiff_linear(
+                None,
+                tiff_path,
+                bands=engine.iter_linear_bands(apply_gap_filling=True),
+                shape=engine.result_shape,
+                compression=args.compression,
+            )
+        elif args.stream_tiff:
+            # 先逐行带统计直方图求拉伸范围（取填充前数据，省去一次填充），
+            # 再逐行带生成（含间隔填充）并写出 BigTIFF
+            stretch = exporter.stretch_limits_from_bands(
+                engine.iter_result_bands(apply_gap_filling=False)
+            )
+            saved = exporter.save_tiff_stream(
+                engine.iter_result_bands(apply_gap_filling=True),
+                tiff_path,
+                engine.result_shape,
+                compression=args.compression,
+                stretch=stretch,
+            )
+        else:
+            saved = exporter.save_tiff(
+                result,
+                tiff_path,
+                compression=args.compression,
+                pyramid_levels=args.pyramid_levels,
+                preview_path=exporter.preview_path_for(tiff_path) if args.preview else None,
+            )
+        if saved:
+            export_duration = time.time() - export_start
+            size_mb = tiff_path.stat().st_size / 1024 / 1024
+            print(f"✅ 已保存  {size_mb:.1f} MB  耗时: {export_duration:.1f}s  => {tiff_path}")
+        else:
+            print(f"❌ TIFF 保存失败")
+            return 1
+
+        # 汇总
+        print("=" * 60)
+        print(f"堆栈 {total_duration:.1f}s  |  导出 TIFF {export_duration:.1f}s ({args.compression})")
+        if failed_files:
+            print(f"⚠️  成功 {total - len(failed_files)}/{total}，失败 {len(failed_files)} 个文件:")
+            for name, err in failed_files:
+                print(f"    • {name}: {err}")
+        else:
+            print(f"✅ 全部 {total} 个文件处理成功")
+        print("=" * 60)
+        return 0
+    finally:
+        if not videos_done:
+            outputs.cleanup()
 
-            elapsed = time.time() - start_time
-            avg = elapsed / (i + 1)
-            remaining = avg * (total - i - 1)
-            rem_str = f"{int(remaining//60)}m{int(remaining%60)}s" if remaining >= 60 else f"{int(remaining)}s"
-            print(f"[{i+1:3d}/{total}] {path.name}  {time.time()-file_start:.1f}s  剩余≈{rem_str}")
 
-        except Exception as e:
-            print(f"[{i+1:3d}/{total}] ⚠️  跳过: {path.name} ({e})")
-            failed_files.append((path.name, str(e)))
-
-    total_duration = time.time() - start_time
-    print("-" * 60)
-    print(f"堆栈完成  总耗时: {total_duration:.1f}s  平均: {total_duration/total:.1f}s/张")
-    if args.remove_satellites:
-        print(f"卫星划痕  检测到: {satellite_removed_count}/{total} 张")
-
-    success_count = total - len(failed_files)
-    if success_count == 0:
-        print("错误: 没有成功读取任何图像，请检查 RAW/TIFF 格式是否受支持，或文件是否已损坏")
-        return 1
+# ─────────────────────────────────────────────
+# 子命令: batch
+# ─────────────────────────────────────────────
 
-    # 应用间隔填充 + 获取最终结果
-    if args.fill_gaps:
-        print("应用间隔填充...")
-        gap_start = time.time()
+# batch 专用参数，不传给每个堆栈任务
+_BATCH_ONLY_OPTIONS = ("command", "root", "split", "min_frames", "jobs",
+                       "memory_budget", "summary", "dry_run")
 
-    result = engine.get_result(apply_gap_filling=True)
 
-    if args.fill_gaps:
-        print(f"间隔填充完成  耗时: {time.time()-gap_start:.1f}s")
+def _quiet_worker_console():
+    """
+    工作进程的控制台只保留警告和错误，详细日志写到各任务的日志文件
+
+    先导入堆栈用到的模块：日志处理器在模块导入时绑定 sys.stdout，
+    必须在重定向输出之前创建，否则会绑定到第一个任务的输出缓冲。
+    """
+    import logging
+    import core.exporter, core.frame_pipeline, core.satellite_filter  # noqa: F401
+    import core.stacking_engine, core.timelapse_outputs, core.video_encoder  # noqa: F401
+
+    for item in list(logging.Logger.manager.loggerDict.values()):
+        for handler in getattr(item, "handlers", []):
+            if type(handler) is logging.StreamHandler:
+                handler.setLevel(logging.WARNING)
 
-    # 生成星轨延时视频
-    if args.timelapse:
-        print("生成星轨延时视频...")
-        tl_start = time.time()
-        if engine.finalize_timelapse(cleanup=True):
-            print(f"✅ 星轨延时视频  耗时: {time.time()-tl_start:.1f}s  => {timelapse_output_path.name}")
-        else:
-            print("❌ 星轨延时视频生成失败")
 
-    # 生成银河延时视频
-    if args.milkyway and milkyway_generator:
-        print("生成银河延时视频...")
-        mw_start = time.time()
+def _run_batch_job(job, options):
+    """
+    工作进程：堆栈一个序列
+
+    进程在任务之间复用，模块导入、numba 编译结果和进程内缓存只初始化一次。
+    堆栈过程的输出写到该序列输出目录下的 batch.log。
+    """
+    import contextlib
+    import io
+    from utils.logger import enable_file_logging
+
+    output = Path(job["output"])
+    output.mkdir(parents=True, exist_ok=True)
+    args = argparse.Namespace(**options)
+    args.dir = job["source"]
+    args.output = str(output)
+    args.profile = None
+    args.sequence = None
+
+    _quiet_worker_console()
+    start = time.time()
+    error = None
+    log = io.StringIO()
+    enable_file_logging(output)
+    with contextlib.redirect_stdout(log):
         try:
-            if milkyway_generator.generate_video(cleanup=True):
-                print(f"✅ 银河延时视频  耗时: {time.time()-mw_start:.1f}s  => {milkyway_path.name}")
-            else:
-                print("❌ 银河延时视频生成失败")
+            returncode = cmd_stack(args, files=[Path(p) for p in job["files"]])
         except Exception as e:
-            print(f"❌ 银河延时视频生成失败: {e}")
+            returncode = 1
+            error = f"{type(e).__name__}: {e}"
+    (output / "batch.log").write_text(log.getvalue(), encoding="utf-8")
+
+    if returncode != 0 and error is None:
+        # cmd_stack 的错误信息打印在输出中，取最后一条
+        lines = [line for line in log.getvalue().splitlines() if "错误" in line or "❌" in line]
+        error = lines[-1].strip() if lines else f"退出码 {returncode}"
+
+    result = {
+        "returncode": returncode,
+        "seconds": round(time.time() - start, 2),
+        "outputs": sorted(
+            p.name for p in output.iterdir()
+            if p.is_file() and p.suffix.lower() in (".tif", ".tiff", ".mp4", ".jpg")
+        ),
+        "worker_pid": os.getpid(),
+    }
+    if error:
+        result["error"] = error
+    return result
 
-    # 导出结果
-    exporter = ImageExporter()
-    output_filename = FileNamingService.generate_output_filename(
-        file_paths=all_files,
-        stack_mode=stack_mode,
-        enable_gap_filling=args.fill_gaps,
-        comet_fade_factor=args.fade if stack_mode == StackMode.COMET else None,
-        has_mask=False,
-        fg_mode=None,
+
+def cmd_batch(args):
+    """批量堆栈：发现序列，在内存预算内多进程处理，写出 JSON 汇总"""
+    from core.batch import BatchRunner, discover_sequences, estimate_job_memory_mb, frame_shape
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print(f"错误: 目录不存在 - {root}")
+        return 1
+    output_root = Path(args.output) if args.output else root / "SuperStarTrail_batch"
+    summary_path = Path(args.summary) if args.summary else output_root / "batch_summary.json"
+
+    jobs = discover_sequences(
+        root, output_root,
+        split=args.split,
+        gap_minutes=args.split_gap,
+        min_frames=args.min_frames,
+        prefer_jpg=args.jpg,
     )
-    tiff_path = output_dir / output_filename
-    print(f"保存 TIFF: {tiff_path.name} ...")
-    if exporter.save_tiff(result, tiff_path):
-        size_mb = tiff_path.stat().st_size / 1024 / 1024
-        print(f"✅ 已保存  {size_mb:.1f} MB  => {tiff_path}")
-    else:
-        print(f"❌ TIFF 保存失败")
+    if not jobs:
+        print(f"错误: 没有找到至少 {args.min_frames} 张图片的序列 - {root}")
         return 1
 
-    # 汇总
+    for job in jobs:
+        if args.limit and args.limit > 0:
+            job.files = job.files[:args.limit]
+        job.memory_mb = estimate_job_memory_mb(frame_shape(job.files[0]), workers=args.workers)
+
+    options = {k: v for k, v in vars(args).items() if k not in _BATCH_ONLY_OPTIONS}
+    runner = BatchRunner(
+        _run_batch_job, options,
+        concurrency=args.jobs,
+        memory_budget_mb=args.memory_budget,
+        summary_path=summary_path,
+    )
+
     print("=" * 60)
-    if failed_files:
-        print(f"⚠️  成功 {total - len(failed_files)}/{total}，失败 {len(failed_files)} 个文件:")
-        for name, err in failed_files:
-            print(f"    • {name}: {err}")
+    print("SuperStarTrail CLI - 批量堆栈")
+    print("=" * 60)
+    if args.split == "folder":
+        split_text = "按子目录"
+    elif args.split_gap:
+        split_text = f"按 {args.split_gap:g} 分钟间隔拆分"
     else:
-        print(f"✅ 全部 {total} 个文件处理成功")
+        split_text = "按拍摄间隔自动拆分"
+    print(f"  序列数量  : {len(jobs)}  ({split_text})")
+    print(f"  并发任务  : {runner.concurrency}  内存预算 {runner.memory_budget_mb:.0f} MB")
+    print(f"  输出目录  : {output_root}")
+    for job in jobs:
+        print(f"    • {job.name:<24} {len(job.files):4d} 张  ≈{job.memory_mb:.0f} MB  {job.source}")
     print("=" * 60)
-    return 0
+    if args.dry_run:
+        return 0
+
+    if args.dark or args.flat:
+        # 先合成主帧写入缓存，各任务直接读取，避免并发任务重复合成
+        from core.raw_processor import RawProcessor
+        try:
+            _, calibration_text = _build_calibrator(args, RawProcessor())
+        except (OSError, ValueError) as e:
+            print(f"错误: 校准帧无法使用 - {e}")
+            return 1
+        print(f"暗场平场  {calibration_text}")
+
+    def on_done(result):
+        mark = "✅" if result["status"] == "ok" else "❌"
+        if result["status"] == "ok":
+            detail = f"{result.get('seconds', 0):.1f}s"
+        else:
+            detail = result.get("error", "")
+        print(f"{mark} [{len(runner.results)}/{len(jobs)}] {result['name']}  {detail}")
+
+    runner.run(jobs, on_done=on_done)
+    summary = runner.summary()
+    print("=" * 60)
+    print(f"完成 {summary['succeeded']}/{len(jobs)}  总耗时 {summary['seconds']:.1f}s  "
+          f"最多并发 {summary['peak_concurrency']}")
+    print(f"汇总: {summary_path}")
+    print("=" * 60)
+    return 0 if summary["failed"] == 0 else 1
 
 
 # ─────────────────────────────────────────────
@@ -361,7 +855,7 @@ def cmd_export(args):
 
     print(f"导出: {out_path} ...")
     if fmt in ("tif", "tiff"):
-        ok = exporter.save_tiff(img, out_path, bits=args.bits)
+        ok = exporter.save_tiff(img, out_path, bits=args.bits, compression=args.compression)
     elif fmt in ("jpg", "jpeg"):
         ok = exporter.save_jpeg(img, out_path, quality=args.quality)
     elif fmt == "png":
@@ -392,45 +886,119 @@ def build_parser():
     sub.required = True
 
     # ── info ──────────────────────────────────
-    p_info = sub.add_parser("info", help="查看 RAW 文件元数据")
-    p_info.add_argument("file", help="RAW 文件路径")
+    p_info = sub.add_parser("info", help="查看图片文件或整个目录的元数据")
+    p_info.add_argument("file", help="图片文件或目录路径")
 
     # ── stack ─────────────────────────────────
-    p_stack = sub.add_parser("stack", help="星轨合成")
+    # 堆栈参数由 stack 和 batch 共用
+    stack_opts = argparse.ArgumentParser(add_help=False)
+    stack_opts.add_argument("--mode", default="lighten",
+                            choices=["lighten", "comet", "average"],
+                            help="堆栈模式（默认: lighten）")
+    stack_opts.add_argument("--fade", type=float, default=0.97,
+                            help="彗星模式衰减因子（默认: 0.97）")
+    stack_opts.add_argument("--fill-gaps", action="store_true",
+                            help="启用间隔填充")
+    stack_opts.add_argument("--gap-method", default="morphological",
+                            choices=["morphological", "linear", "motion_blur", "directional"],
+                            help="间隔填充方法（默认: morphological）")
+    stack_opts.add_argument("--gap-size", type=int, default=3,
+                            help="间隔大小像素（默认: 3）")
+    stack_opts.add_argument("--remove-satellites", action="store_true",
+                            help="启用卫星/飞机划痕去除")
+    stack_opts.add_argument("--satellite-mode", default="spatial",
+                            choices=["spatial", "temporal"],
+                            help="划痕检测模式：spatial 单帧检测，temporal 与前几帧差分检测（默认: spatial）")
+    stack_opts.add_argument("--auto-reject", action="store_true",
+                            help="堆栈前在缩略图上评估每帧质量，自动剔除云、车灯、结露等离群帧（评分会缓存）")
+    stack_opts.add_argument("--reject-sigma", type=float, default=3.5,
+                            help="质量预检的离群阈值（中值 ± N 倍 MAD 标准差，默认: 3.5）")
+    stack_opts.add_argument("--dark", default=None, metavar="PATH",
+                            help="暗场目录（或已合成的主暗场文件），与亮场相同 ISO/曝光/温度拍摄")
+    stack_opts.add_argument("--flat", default=None, metavar="PATH",
+                            help="平场目录（或已合成的主平场文件），用于校正暗角和灰尘")
+    stack_opts.add_argument("--master-method", default="median", choices=["median", "mean"],
+                            help="主暗场/主平场合成方法（默认: median）")
+    stack_opts.add_argument("--hot-pixels", nargs="?", const="auto", default=None,
+                            choices=["auto", "detect"],
+                            help="修正热像素：auto 优先使用该机身缓存的热像素图（默认），"
+                                 "detect 从序列前几帧重新检测")
+    stack_opts.add_argument("--align", nargs="?", const="translation", default=None,
+                            choices=["translation", "rigid"],
+                            help="对齐到第一帧，修正三脚架漂移：translation 仅平移（默认），rigid 平移 + 小角度旋转")
+    stack_opts.add_argument("--timelapse", action="store_true",
+                            help="生成星轨延时视频")
+    stack_opts.add_argument("--milkyway", action="store_true",
+                            help="生成银河延时视频")
+    stack_opts.add_argument("--comet-timelapse", action="store_true",
+                            help="生成彗星尾迹延时视频（衰减因子取 --fade）")
+    stack_opts.add_argument("--fps", type=int, default=30,
+                            help="延时视频帧率（默认: 30）")
+    stack_opts.add_argument("--video-quality", default="high", choices=["high", "medium", "low"],
+                            help="延时视频画质，对应 ffmpeg CRF 18/23/28（默认: high）")
+    stack_opts.add_argument("--video-codec", default="h264", choices=["h264", "h265"],
+                            help="延时视频编码，需要 ffmpeg；未安装时回退 OpenCV mp4v（默认: h264）")
+    stack_opts.add_argument("--duration", type=float, default=None,
+                            help="延时视频目标时长（秒）；输入过多时按间隔抽帧，不足时配合 --interpolate 插帧")
+    stack_opts.add_argument("--interpolate", action="store_true",
+                            help="帧数不足目标时长时，在相邻帧之间插入交叉淡化帧")
+    stack_opts.add_argument("--temp-budget", type=float, default=4096,
+                            help="延时临时帧磁盘预算（MB），超出时分段编码再拼接；0 表示不限制（默认: 4096）")
+    stack_opts.add_argument("--workers", type=int, default=2,
+                            help="解码/划痕检测预取线程数（默认: 2）")
+    stack_opts.add_argument("--split-gap", type=float, default=None,
+                            help="按拍摄时间拆分序列的间隔（分钟）；默认按拍摄节奏自动确定")
+    stack_opts.add_argument("--limit", type=int, default=0,
+                            help="只处理前 N 张（0 = 全部）")
+    stack_opts.add_argument("--jpg", action="store_true",
+                            help="同名 RAW+JPG 时优先使用 JPG（默认优先 RAW）")
+    stack_opts.add_argument("--rotation", type=int, default=0,
+                            choices=[0, 90, 180, 270],
+                            help="顺时针旋转角度，竖拍素材用 90 或 270（默认: 0）")
+    stack_opts.add_argument("--compression", default="deflate",
+                            choices=["none", "lzw", "deflate", "zstd"],
+                            help="TIFF 压缩方式，分块并行压缩（默认: deflate）")
+    stack_opts.add_argument("--stream-tiff", action="store_true",
+                            help="按行带边生成边写出 BigTIFF，不在内存中拼出整幅结果（适合超大图）")
+    stack_opts.add_argument("--float32", action="store_true",
+                            help="输出 32-bit 浮点线性 TIFF（不拉伸，保留完整动态范围，供后期软件处理）")
+    stack_opts.add_argument("--pyramid-levels", type=int, default=0,
+                            help="在 TIFF 中写入的多分辨率子层数（默认: 0，不写）")
+    stack_opts.add_argument("--preview", action="store_true",
+                            help="同时输出 <文件名>_preview.jpg 预览图")
+    stack_opts.add_argument("--mask", default=None,
+                            help="天空蒙版 PNG 路径（功能已临时禁用）")
+    stack_opts.add_argument("--fg-mode", default="average",
+                            choices=["average", "comet"],
+                            help="蒙版地景区域的堆栈模式（功能已临时禁用）")
+
+    p_stack = sub.add_parser("stack", parents=[stack_opts], help="星轨合成")
     p_stack.add_argument("dir", help="图片目录")
     p_stack.add_argument("-o", "--output", help="输出目录（默认: <dir>/SuperStarTrail）")
-    p_stack.add_argument("--mode", default="lighten",
-                         choices=["lighten", "comet", "average"],
-                         help="堆栈模式（默认: lighten）")
-    p_stack.add_argument("--fade", type=float, default=0.97,
-                         help="彗星模式衰减因子（默认: 0.97）")
-    p_stack.add_argument("--fill-gaps", action="store_true",
-                         help="启用间隔填充")
-    p_stack.add_argument("--gap-method", default="morphological",
-                         choices=["morphological", "linear", "motion_blur", "directional"],
-                         help="间隔填充方法（默认: morphological）")
-    p_stack.add_argument("--gap-size", type=int, default=3,
-                         help="间隔大小像素（默认: 3）")
-    p_stack.add_argument("--remove-satellites", action="store_true",
-                         help="启用卫星/飞机划痕去除")
-    p_stack.add_argument("--timelapse", action="store_true",
-                         help="生成星轨延时视频")
-    p_stack.add_argument("--milkyway", action="store_true",
-                         help="生成银河延时视频")
-    p_stack.add_argument("--fps", type=int, default=30,
-                         help="延时视频帧率（默认: 30）")
-    p_stack.add_argument("--limit", type=int, default=0,
-                         help="只处理前 N 张（0 = 全部）")
-    p_stack.add_argument("--jpg", action="store_true",
-                         help="同名 RAW+JPG 时优先使用 JPG（默认优先 RAW）")
-    p_stack.add_argument("--rotation", type=int, default=0,
-                         choices=[0, 90, 180, 270],
-                         help="顺时针旋转角度，竖拍素材用 90 或 270（默认: 0）")
-    p_stack.add_argument("--mask", default=None,
-                         help="天空蒙版 PNG 路径（功能已临时禁用）")
-    p_stack.add_argument("--fg-mode", default="average",
-                         choices=["average", "comet"],
-                         help="蒙版地景区域的堆栈模式（功能已临时禁用）")
+    p_stack.add_argument("--sequence", default=None,
+                         help="目录中混有多段拍摄时，按拍摄时间间隔拆分后只堆栈其中一段："
+                              "序号（从 1 开始）、longest（张数最多）或 list（只列出各段）")
+    p_stack.add_argument("--profile", nargs="?", const="stages", default=None,
+                         choices=["stages", "cprofile", "pyinstrument"],
+                         help="输出各阶段耗时分位数报告，写在日志文件旁边；"
+                              "cprofile/pyinstrument 另存函数级剖析结果")
+
+    # ── batch ─────────────────────────────────
+    p_batch = sub.add_parser("batch", parents=[stack_opts], help="批量堆栈多个序列")
+    p_batch.add_argument("root", help="素材根目录")
+    p_batch.add_argument("-o", "--output", help="输出根目录（默认: <root>/SuperStarTrail_batch）")
+    p_batch.add_argument("--split", default="folder", choices=["folder", "gap"],
+                         help="序列划分：folder 每个子目录一个序列，gap 目录内再按拍摄时间间隔拆分（默认: folder）")
+    p_batch.add_argument("--min-frames", type=int, default=2,
+                         help="少于该张数的序列跳过（默认: 2）")
+    p_batch.add_argument("--jobs", type=int, default=1,
+                         help="同时运行的任务数（进程数，默认: 1）")
+    p_batch.add_argument("--memory-budget", type=float, default=None,
+                         help="所有并发任务的内存预算（MB，默认: 物理内存的 60%%）")
+    p_batch.add_argument("--summary", default=None,
+                         help="JSON 汇总路径（默认: <输出根目录>/batch_summary.json）")
+    p_batch.add_argument("--dry-run", action="store_true",
+                         help="只列出发现的序列和内存估算，不处理")
 
     # ── export ────────────────────────────────
     p_export = sub.add_parser("export", help="转换/导出图像")
@@ -441,12 +1009,45 @@ def build_parser():
                           help="输出格式（默认: tiff）")
     p_export.add_argument("--bits", type=int, default=16, choices=[8, 16, 32],
                           help="TIFF 位深度（默认: 16）")
+    p_export.add_argument("--compression", default="deflate",
+                          choices=["none", "lzw", "deflate", "zstd"],
+                          help="TIFF 压缩方式（默认: deflate）")
     p_export.add_argument("--quality", type=int, default=95,
                           help="JPEG 质量 1-100（默认: 95）")
 
     return parser
 
 
+def _run_profiled(handler, args) -> int:
+    """带阶段剖析运行子命令，结束后打印分位数报告并写到日志文件旁边"""
+    from utils import profiling
+
+    profiler = profiling.activate()
+    function_profiler = None
+    if args.profile != "stages":
+        function_profiler = profiling.FunctionProfiler(args.profile)
+        function_profiler.start()
+    try:
+        return handler(args)
+    finally:
+        if function_profiler is not None:
+            function_profiler.stop()
+        profiling.deactivate()
+
+        print("=" * 60)
+        print("性能剖析（时间单位 ms；带点号的阶段是其上级阶段内部的细分）")
+        for line in profiler.report_lines():
+            print(f"  {line}")
+        paths = profiling.write_report_next_to_log(profiler)
+        if paths:
+            print(f"报告: {paths[0]}")
+            print(f"      {paths[1]}")
+            if function_profiler is not None:
+                dump = function_profiler.dump(profiling.report_stem())
+                print(f"函数级剖析 ({function_profiler.kind}): {dump}")
+        print("=" * 60)
+
+
 def main():
     parser = build_parser()
     args = parser.parse_args()
@@ -454,9 +1055,13 @@ def main():
     handlers = {
         "info":   cmd_info,
         "stack":  cmd_stack,
+        "batch":  cmd_batch,
         "export": cmd_export,
     }
-    sys.exit(handlers[args.command](args))
+    handler = handlers[args.command]
+    if getattr(args, "profile", None):
+        sys.exit(_run_profiled(handler, args))
+    sys.exit(handler(args))
 
 
 if __name__ == "__main__":
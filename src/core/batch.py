@@ -0,0 +1,362 @@
+"""
+批量处理模块
+
+一次处理多个夜晚的素材：
+- 发现序列：每个含图片的子目录一个序列，或在目录内按拍摄时间间隔拆分（见 exif_scanner）
+- 估算每个任务的峰值内存，在全局内存预算内安排多进程并发
+- 工作进程在任务之间复用（numba 编译结果、拉伸查找表等进程内缓存随之复用）
+- 每完成一个任务就更新 JSON 汇总，中途中断也保留已完成的结果
+"""
+
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+from .exif_scanner import group_sequences, scan_files
+from .raw_processor import RawProcessor
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 批处理输出目录名；发现序列时跳过，避免把上次的结果当成输入
+OUTPUT_DIR_NAMES = ("SuperStarTrail", "SuperStarTrail_batch")
+
+# 进程本身的常驻内存（解释器、numpy/OpenCV/rawpy 等库）
+_PROCESS_BASE_MB = 300
+
+
+def select_sequence_files(
+    files: Iterable[Path], prefer_jpg: bool = False
+) -> Tuple[List[Path], int]:
+    """
+    同名 RAW+JPG 只保留一种，按文件名排序
+
+    Args:
+        files: 候选文件
+        prefer_jpg: True 时保留 JPG，默认保留 RAW
+
+    Returns:
+        (选中的文件, 同名 RAW+JPG 的对数)
+    """
+    raw_exts = RawProcessor.SUPPORTED_RAW_FORMATS
+    jpg_exts = {".jpg", ".jpeg"}
+    files = list(files)
+    raw_files = [f for f in files if f.suffix.lower() in raw_exts]
+    jpg_files = [f for f in files if f.suffix.lower() in jpg_exts]
+    other_files = [f for f in files if f.suffix.lower() not in raw_exts | jpg_exts]
+
+    common_stems = {f.stem for f in raw_files} & {f.stem for f in jpg_files}
+    if common_stems:
+        if prefer_jpg:
+            raw_files = [f for f in raw_files if f.stem not in common_stems]
+        else:
+            jpg_files = [f for f in jpg_files if f.stem not in common_stems]
+
+    selected = sorted(raw_files + jpg_files + other_files, key=lambda f: f.name)
+    return selected, len(common_stems)
+
+
+def frame_shape(path: Path) -> Optional[Tuple[int, int]]:
+    """读取单帧尺寸 (高, 宽)，不解码像素；读取失败返回 None"""
+    try:
+        if RawProcessor.is_raw_file(path):
+            import rawpy
+
+            with rawpy.imread(str(path)) as raw:
+                return raw.sizes.height, raw.sizes.width
+        with Image.open(path) as img:
+            return img.height, img.width
+    except Exception as e:
+        logger.info(f"无法读取尺寸: {path.name} ({e})")
+        return None
+
+
+def estimate_job_memory_mb(
+    shape: Optional[Tuple[int, int]], workers: int = 2, prefetch: int = 3
+) -> float:
+    """
+    估算单个堆栈任务的峰值内存（MB）
+
+    按像素数计：float32 累加器及合并时的临时数组约 48 字节/像素，
+    每张在途帧（预取队列 + 正在解码）含 16-bit 图像和金字塔约 8 字节/像素。
+
+    Args:
+        shape: 单帧 (高, 宽)；未知时按 24MP 估算
+        workers: 预取线程数
+        prefetch: 预取深度
+    """
+    height, width = shape or (4000, 6000)
+    pixels = height * width
+    in_flight = max(prefetch, 1) + max(workers, 1)
+    return _PROCESS_BASE_MB + pixels * (48 + 8 * in_flight) / 1024 / 1024
+
+
+def total_memory_mb() -> Optional[float]:
+    """物理内存总量（MB）；平台不支持时返回 None"""
+    if os.name == "nt":
+        import ctypes
+
+        class _MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = _MemoryStatus()
+        status.dwLength = ctypes.sizeof(status)
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return None
+        return status.ullTotalPhys / 1024 / 1024
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 / 1024
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class BatchJob:
+    """一个待堆栈的序列"""
+
+    def __init__(self, name: str, source: Path, files: List[Path], output: Path):
+        self.name = name
+        self.source = source
+        self.files = files
+        self.output = output
+        self.memory_mb = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "source": str(self.source),
+            "output": str(self.output),
+            "frames": len(self.files),
+            "first": self.files[0].name if self.files else None,
+            "last": self.files[-1].name if self.files else None,
+            "memory_estimate_mb": round(self.memory_mb),
+        }
+
+
+def _is_output_dir(path: Path) -> bool:
+    return any(path.name.startswith(name) for name in OUTPUT_DIR_NAMES)
+
+
+def discover_sequences(
+    root: Path,
+    output_root: Path,
+    split: str = "folder",
+    gap_minutes: Optional[float] = None,
+    min_frames: int = 2,
+    prefer_jpg: bool = False,
+    workers: int = 16,
+) -> List[BatchJob]:
+    """
+    在 root 下发现待堆栈的序列
+
+    Args:
+        root: 素材根目录
+        output_root: 输出根目录，每个序列输出到其下的同名子目录
+        split: 'folder' 每个含图片的目录一个序列；'gap' 目录内再按拍摄时间间隔拆分
+        gap_minutes: split='gap' 时的拆分间隔（分钟）；None 表示按拍摄节奏自动确定
+        min_frames: 少于该张数的序列忽略
+        prefer_jpg: 同名 RAW+JPG 时保留 JPG
+        workers: 扫描 EXIF 的线程数
+
+    Returns:
+        按目录和时间排序的任务列表
+    """
+    if split not in ("folder", "gap"):
+        raise ValueError(f"不支持的序列拆分方式: {split}")
+    root = Path(root)
+
+    folders: List[Tuple[Path, List[Path]]] = []
+    for directory, subdirs, _ in os.walk(root):
+        directory = Path(directory)
+        subdirs[:] = sorted(
+            d for d in subdirs
+            if not d.startswith(".") and not _is_output_dir(directory / d)
+            and (directory / d).resolve() != Path(output_root).resolve()
+        )
+        files, _ = select_sequence_files(RawProcessor.scan_directory(directory), prefer_jpg)
+        if len(files) >= min_frames:
+            folders.append((directory, files))
+
+    jobs: List[BatchJob] = []
+    gap_seconds = gap_minutes * 60 if gap_minutes else None
+    for directory, files in folders:
+        relative = directory.relative_to(root)
+        base = "_".join(relative.parts) if relative.parts else root.name
+
+        if split == "gap":
+            groups = [seq.paths for seq in group_sequences(scan_files(files, workers), gap_seconds)]
+        else:
+            groups = [files]
+
+        groups = [group for group in groups if len(group) >= min_frames]
+        for index, group in enumerate(groups, start=1):
+            name = base if len(groups) == 1 else f"{base}_{index:02d}"
+            jobs.append(BatchJob(name, directory, group, Path(output_root) / name))
+    return jobs
+
+
+class BatchRunner:
+    """
+    在内存预算内多进程执行批量任务
+
+    任务按顺序出队：正在运行的任务估算内存之和加上队首任务不超过预算时才启动队首任务；
+    单个任务超过预算时等其他任务都结束后单独运行。
+    """
+
+    def __init__(
+        self,
+        worker: Callable[[Dict, Dict], Dict],
+        options: Dict,
+        concurrency: int = 1,
+        memory_budget_mb: Optional[float] = None,
+        summary_path: Optional[Path] = None,
+        executor_factory: Optional[Callable[[int], object]] = None,
+    ):
+        """
+        Args:
+            worker: 在工作进程中执行单个任务的函数（模块级，可序列化），
+                    接收 (任务字典, 选项字典)，返回结果字典（含 "returncode"）
+            options: 传给每个任务的公共选项
+            concurrency: 最多同时运行的任务数（进程数）
+            memory_budget_mb: 全局内存预算（MB）；None 表示物理内存的 60%
+            summary_path: JSON 汇总路径（可选）
+            executor_factory: 创建执行器的函数（测试时可换成线程池）
+        """
+        self.worker = worker
+        self.options = options
+        self.concurrency = max(int(concurrency), 1)
+        if memory_budget_mb is None:
+            total = total_memory_mb()
+            memory_budget_mb = total * 0.6 if total else 8192
+        self.memory_budget_mb = memory_budget_mb
+        self.summary_path = summary_path
+        self.executor_factory = executor_factory or (lambda n: ProcessPoolExecutor(max_workers=n))
+        self.results: List[Dict] = []
+        self.peak_memory_mb = 0.0
+        self.peak_concurrency = 0
+
+    def run(
+        self, jobs: List[BatchJob], on_done: Optional[Callable[[Dict], None]] = None
+    ) -> List[Dict]:
+        """
+        执行所有任务
+
+        Args:
+            jobs: 任务列表（memory_mb 应已估算）
+            on_done: 每个任务结束时在主进程中回调
+
+        Returns:
+            按完成顺序排列的结果列表
+        """
+        self.results = []
+        self._started = time.time()
+        pending = list(jobs)
+        # future → (任务, 提交时的执行器代数)
+        running: Dict[Future, Tuple[BatchJob, int]] = {}
+        used = 0.0
+        generation = 0
+        executor = self.executor_factory(self.concurrency)
+
+        try:
+            while pending or running:
+                while pending and len(running) < self.concurrency:
+                    job = pending[0]
+                    if running and used + job.memory_mb > self.memory_budget_mb:
+                        break
+                    if job.memory_mb > self.memory_budget_mb:
+                        logger.warning(
+                            f"{job.name}: 预计内存 {job.memory_mb:.0f} MB 超出预算 "
+                            f"{self.memory_budget_mb:.0f} MB，单独运行"
+                        )
+                    try:
+                        future = executor.submit(self.worker, self._job_payload(job), self.options)
+                    except BrokenProcessPool:
+                        # 进程池已损坏（有工作进程崩溃）：队首任务尚未启动，重建后重新提交
+                        executor, generation = self._rebuild(executor, generation)
+                        continue
+                    pending.pop(0)
+                    logger.info(f"开始任务 {job.name} ({len(job.files)} 张)")
+                    running[future] = (job, generation)
+                    used += job.memory_mb
+                    self.peak_memory_mb = max(self.peak_memory_mb, used)
+                    self.peak_concurrency = max(self.peak_concurrency, len(running))
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, submitted_in = running.pop(future)
+                    used -= job.memory_mb
+                    result = job.to_dict()
+                    try:
+                        result.update(future.result())
+                    except BrokenProcessPool as e:
+                        # 工作进程被强制终止（内存不足、段错误、os._exit）时整个进程池失效，
+                        # 当时在运行的任务全部失败；重建进程池后继续处理队列
+                        result.update({"returncode": 1, "error": f"工作进程异常退出: {e}"})
+                        if submitted_in == generation:
+                            executor, generation = self._rebuild(executor, generation)
+                    except Exception as e:
+                        # 任务内部抛出的异常只影响这一个任务
+                        result.update({"returncode": 1, "error": f"{type(e).__name__}: {e}"})
+                    result["status"] = "ok" if result.get("returncode") == 0 else "failed"
+                    self.results.append(result)
+                    self.write_summary()
+                    if on_done is not None:
+                        on_done(result)
+        finally:
+            executor.shutdown(wait=True)
+        return self.results
+
+    def _rebuild(self, executor, generation: int) -> Tuple[object, int]:
+        """丢弃已损坏的执行器，创建新的（返回新执行器和代数）"""
+        logger.warning("工作进程异常退出，重建进程池")
+        executor.shutdown(wait=False)
+        return self.executor_factory(self.concurrency), generation + 1
+
+    @staticmethod
+    def _job_payload(job: BatchJob) -> Dict:
+        return {
+            "name": job.name,
+            "source": str(job.source),
+            "output": str(job.output),
+            "files": [str(path) for path in job.files],
+        }
+
+    def summary(self) -> Dict:
+        """批处理汇总（JSON 可序列化）"""
+        succeeded = sum(1 for result in self.results if result["status"] == "ok")
+        return {
+            "started": datetime.fromtimestamp(self._started).isoformat(timespec="seconds"),
+            "seconds": round(time.time() - self._started, 2),
+            "concurrency": self.concurrency,
+            "memory_budget_mb": round(self.memory_budget_mb),
+            "peak_memory_estimate_mb": round(self.peak_memory_mb),
+            "peak_concurrency": self.peak_concurrency,
+            "succeeded": succeeded,
+            "failed": len(self.results) - succeeded,
+            "jobs": self.results,
+        }
+
+    def write_summary(self) -> None:
+        """写出（覆盖）JSON 汇总"""
+        if self.summary_path is None:
+            return
+        self.summary_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.summary_path.with_name(self.summary_path.name + ".tmp")
+        tmp.write_text(json.dumps(self.summary(), ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.summary_path)
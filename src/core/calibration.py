@@ -0,0 +1,291 @@
+"""
+暗场 / 平场校准模块
+
+- 主暗场、主平场由多张校准帧合成（median 或 mean），流式处理：
+  mean 只保留一个累加器；median 把解码结果写入临时磁盘数组，再按行带求中值，
+  内存占用与帧数无关
+- 合成结果按 类型 + 相机/ISO/曝光 + 源文件（路径、修改时间、大小）缓存在
+  ~/.superstartrail/calibration/，同一组校准帧再次使用时直接读取
+- 逐帧校准在解码线程中原地完成：暗场用饱和减法（cv2.subtract），
+  平场乘以预先算好的增益图（cv2.multiply），不产生浮点中间图像
+
+RAW 经 rawpy 解码时已减去黑电平，平场不再单独减偏置帧。
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from .metadata_service import get_metadata_service
+from .raw_processor import RawProcessor
+from utils import profiling
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+METHODS = ("median", "mean")
+
+# 平场增益上限：暗角最严重处最多提亮 8 倍，避免坏点/灰尘中心被放大成亮斑
+MAX_FLAT_GAIN = 8.0
+
+
+def collect_frames(path: Path) -> List[Path]:
+    """
+    校准帧来源：目录（扫描其中所有支持的图片）或单个文件（如已合成好的主暗场 TIFF）
+
+    Raises:
+        FileNotFoundError: 路径不存在或目录中没有图片
+    """
+    path = Path(path)
+    if path.is_dir():
+        frames = RawProcessor.scan_directory(path)
+        if not frames:
+            raise FileNotFoundError(f"目录中没有支持的图片文件: {path}")
+        return frames
+    if not path.exists():
+        raise FileNotFoundError(f"文件不存在: {path}")
+    return [path]
+
+
+def build_master(
+    paths: Sequence[Path],
+    loader: Callable[[Path], np.ndarray],
+    method: str = "median",
+    workers: int = 4,
+    band_rows: int = 64,
+) -> np.ndarray:
+    """
+    由多张校准帧合成主帧
+
+    Args:
+        paths: 校准帧文件
+        loader: 解码函数，返回 RGB uint16 图像（应与亮场使用相同的旋转）
+        method: 'median'（抗宇宙射线、热噪点跳变）或 'mean'
+        workers: 并行解码线程数
+        band_rows: median 每次读取的行数
+
+    Returns:
+        float32 主帧
+    """
+    if method not in METHODS:
+        raise ValueError(f"不支持的合成方法: {method}，有效值为 {', '.join(METHODS)}")
+    paths = list(paths)
+    if not paths:
+        raise ValueError("没有校准帧")
+
+    first = loader(paths[0])
+    if len(paths) == 1:
+        return first.astype(np.float32)
+    shape = first.shape
+
+    def decode(path: Path) -> np.ndarray:
+        image = loader(path)
+        if image.shape != shape:
+            raise ValueError(f"校准帧尺寸不一致: {path.name} {image.shape[:2]} ≠ {shape[:2]}")
+        return image
+
+    pool = ThreadPoolExecutor(max_workers=max(int(workers), 1), thread_name_prefix="sst-master")
+    try:
+        if method == "mean":
+            total = first.astype(np.float32)
+            for image in pool.map(decode, paths[1:]):
+                total += image
+            total /= len(paths)
+            return total
+
+        with tempfile.TemporaryDirectory(prefix="sst-master-") as tmp:
+            stack = np.lib.format.open_memmap(
+                os.path.join(tmp, "frames.npy"), mode="w+", dtype=first.dtype, shape=(len(paths),) + first.shape
+            )
+            stack[0] = first
+            del first
+            for i, image in enumerate(pool.map(decode, paths[1:]), start=1):
+                stack[i] = image
+            stack.flush()
+
+            height = stack.shape[1]
+            master = np.empty(stack.shape[1:], np.float32)
+            for y0 in range(0, height, band_rows):
+                master[y0:y0 + band_rows] = np.median(stack[:, y0:y0 + band_rows], axis=0)
+            del stack
+            return master
+    finally:
+        pool.shutdown(wait=True)
+
+
+def flat_gain(master_flat: np.ndarray) -> np.ndarray:
+    """
+    主平场 → 增益图：每个通道的中值 / 像素值
+
+    中心接近 1，暗角处大于 1；无效像素（≤0）增益为 1。
+    """
+    master_flat = master_flat.astype(np.float32, copy=False)
+    gain = np.ones_like(master_flat)
+    for c in range(master_flat.shape[2]):
+        channel = master_flat[..., c]
+        valid = channel > 0
+        if not valid.any():
+            continue
+        level = float(np.median(channel[valid]))
+        np.divide(level, channel, out=gain[..., c], where=valid)
+    np.clip(gain, 0.0, MAX_FLAT_GAIN, out=gain)
+    return gain
+
+
+class Calibrator:
+    """逐帧校准：原地减暗场、乘平场增益"""
+
+    def __init__(self, dark: Optional[np.ndarray] = None, gain: Optional[np.ndarray] = None):
+        """
+        Args:
+            dark: 主暗场（转为 uint16 保存，减法饱和到 0）
+            gain: 平场增益图（float32，见 flat_gain）
+        """
+        self.dark = None if dark is None else np.clip(np.rint(dark), 0, 65535).astype(np.uint16)
+        self.gain = None if gain is None else np.ascontiguousarray(gain, dtype=np.float32)
+
+    def __bool__(self) -> bool:
+        return self.dark is not None or self.gain is not None
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        """
+        校准一帧（尽量原地，rot90 视图等不可原地写的输入先复制一次）
+
+        Args:
+            image: RGB uint16 图像
+
+        Returns:
+            校准后的图像
+
+        Raises:
+            ValueError: 主帧尺寸与图像不符
+        """
+        for name, master in (("暗场", self.dark), ("平场", self.gain)):
+            if master is not None and master.shape != image.shape:
+                raise ValueError(f"主{name}尺寸 {master.shape[:2]} 与图像 {image.shape[:2]} 不符")
+        if not self:
+            return image
+        if not (image.flags.c_contiguous and image.flags.writeable):
+            image = image.copy()
+        with profiling.stage("calibrate"):
+            if self.dark is not None:
+                cv2.subtract(image, self.dark, dst=image)
+            if self.gain is not None:
+                cv2.multiply(image, self.gain, dst=image, dtype=cv2.CV_16U)
+        return image
+
+
+class DarkFrameSubtractor(Calibrator):
+    """暗帧减除器（仅暗场的 Calibrator，保留旧接口）"""
+
+    def __init__(self, dark_frame: np.ndarray):
+        super().__init__(dark=dark_frame)
+
+    @property
+    def dark_frame(self) -> np.ndarray:
+        return self.dark
+
+    def subtract(self, image: np.ndarray, in_place: bool = False) -> np.ndarray:
+        """
+        从图像中减除暗帧
+
+        Args:
+            image: 输入图像（uint16）
+            in_place: 是否直接修改输入
+
+        Returns:
+            减除暗帧后的 uint16 图像
+        """
+        return self.apply(image if in_place else image.copy())
+
+
+class MasterLibrary:
+    """主暗场 / 主平场的合成与磁盘缓存"""
+
+    KINDS = ("dark", "flat")
+
+    def __init__(self, cache_dir: Optional[Path] = None, workers: int = 4):
+        """
+        Args:
+            cache_dir: 缓存目录，None 时使用 ~/.superstartrail/calibration
+            workers: 合成时的并行解码线程数
+        """
+        if cache_dir is None:
+            cache_dir = Path.home() / ".superstartrail" / "calibration"
+        self.cache_dir = Path(cache_dir)
+        self.workers = workers
+        self.cached = 0  # 本次从缓存读取的主帧数
+
+    @staticmethod
+    def describe(paths: Sequence[Path]) -> str:
+        """相机/ISO/曝光 标签，如 NIKON_Z_6_ISO3200_20s"""
+        info = get_metadata_service().get(Path(paths[0]))
+        parts = [info.camera or "unknown"]
+        if info.iso:
+            parts.append(f"ISO{info.iso}")
+        if info.exposure:
+            parts.append(f"{info.exposure:g}s")
+        return re.sub(r"[^0-9A-Za-z.]+", "_", "_".join(parts)).strip("_")
+
+    def _cache_path(self, kind: str, paths: Sequence[Path], method: str, tag: str) -> Path:
+        digest = hashlib.sha1(f"{kind}|{method}|{tag}".encode("utf-8"))
+        for path in sorted(os.path.abspath(path) for path in paths):
+            stat = os.stat(path)
+            digest.update(f"|{path}|{stat.st_mtime}|{stat.st_size}".encode("utf-8"))
+        return self.cache_dir / f"{kind}_{self.describe(paths)}_{digest.hexdigest()[:12]}.npy"
+
+    def master(
+        self,
+        kind: str,
+        paths: Sequence[Path],
+        loader: Callable[[Path], np.ndarray],
+        method: str = "median",
+        tag: str = "",
+    ) -> np.ndarray:
+        """
+        获取主帧：缓存命中时直接读取，否则合成并写入缓存
+
+        Args:
+            kind: 'dark'（返回主暗场）或 'flat'（返回平场增益图）
+            paths: 校准帧文件
+            loader: 解码函数
+            method: 合成方法
+            tag: 影响解码结果的额外参数（如旋转角度），不同取值的缓存互不复用
+
+        Returns:
+            主暗场（uint16）或平场增益图（float32）
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"不支持的校准类型: {kind}")
+        cache_path = self._cache_path(kind, paths, method, tag)
+        if cache_path.exists():
+            try:
+                master = np.load(cache_path)
+                self.cached += 1
+                logger.info(f"使用缓存的主{'暗场' if kind == 'dark' else '平场'}: {cache_path.name}")
+                return master
+            except (OSError, ValueError) as e:
+                logger.warning(f"主帧缓存无法读取，将重新合成: {cache_path.name} ({e})")
+
+        master = build_master(paths, loader, method, self.workers)
+        if kind == "dark":
+            master = np.clip(np.rint(master), 0, 65535).astype(np.uint16)
+        else:
+            master = flat_gain(master)
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = cache_path.with_name(cache_path.name + ".tmp")
+            with open(tmp, "wb") as fh:
+                np.save(fh, master)
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            logger.warning(f"主帧缓存保存失败: {cache_path.name} ({e})")
+        return master
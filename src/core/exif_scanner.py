@@ -0,0 +1,476 @@
+"""
+EXIF 快速扫描模块
+
+只读取文件头中的 TIFF/EXIF 结构，不经过 LibRaw 解包，得到拍摄时间、曝光等信息：
+- TIFF 结构的 RAW（NEF/NRW/CR2/ARW/SR2/DNG/PEF/ORF/RW2/ERF/3FR/IIQ …）和 TIFF：直接解析 IFD
+- JPEG：解析 APP1 Exif 段
+- RAF：解析文件头指向的内嵌 JPEG
+- CR3：解析 ISO BMFF 容器中的 CMT1/CMT2 盒子
+每个文件只有几次 seek + 小块读取，多线程并行扫描；读不到 EXIF 的文件退回文件修改时间。
+
+扫描结果可按拍摄间隔（和曝光变化）分组成序列，用于把一张存储卡上的多段星轨、
+试拍和平场分开。
+"""
+
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# IFD0 标签
+_MAKE = 0x010F
+_MODEL = 0x0110
+_DATETIME = 0x0132
+_EXIF_IFD = 0x8769
+# Exif IFD 标签
+_EXPOSURE_TIME = 0x829A
+_F_NUMBER = 0x829D
+_ISO = 0x8827
+_DATETIME_ORIGINAL = 0x9003
+_FOCAL_LENGTH = 0x920A
+_SUBSEC_ORIGINAL = 0x9291
+_BODY_SERIAL = 0xA431
+_LENS_MODEL = 0xA434
+
+_IFD0_TAGS = {_MAKE, _MODEL, _DATETIME, _EXIF_IFD}
+_EXIF_TAGS = {
+    _EXPOSURE_TIME, _F_NUMBER, _ISO, _DATETIME_ORIGINAL, _FOCAL_LENGTH, _SUBSEC_ORIGINAL, _BODY_SERIAL, _LENS_MODEL,
+}
+
+# TIFF 数据类型 → (struct 格式, 字节数)
+_TYPES = {
+    1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8),
+    6: ("b", 1), 7: ("s", 1), 8: ("h", 2), 9: ("i", 4), 10: ("ii", 8),
+    11: ("f", 4), 12: ("d", 8),
+}
+
+# TIFF 魔数：标准 42，ORF 使用 "RO"/"RS"，RW2 使用 0x55
+_TIFF_MAGIC = {42, 0x4F52, 0x5352, 0x55}
+
+# 单个 IFD 最多解析的条目数，防止损坏文件导致超长读取
+_MAX_ENTRIES = 1024
+
+
+class FrameInfo:
+    """单个文件的头部元数据"""
+
+    __slots__ = (
+        "path", "captured", "exposure", "iso", "aperture", "focal_length",
+        "make", "model", "serial", "lens", "size", "mtime",
+    )
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.captured: Optional[float] = None  # 拍摄时间（Unix 时间戳，含亚秒）
+        self.exposure: Optional[float] = None  # 曝光时间（秒）
+        self.iso: Optional[int] = None
+        self.aperture: Optional[float] = None
+        self.focal_length: Optional[float] = None
+        self.make: Optional[str] = None
+        self.model: Optional[str] = None
+        self.serial: Optional[str] = None  # 机身序列号（BodySerialNumber）
+        self.lens: Optional[str] = None
+        self.size = 0
+        self.mtime = 0.0
+
+    @property
+    def time(self) -> float:
+        """用于排序和分组的时间：优先拍摄时间，缺失时用文件修改时间"""
+        return self.captured if self.captured is not None else self.mtime
+
+    @property
+    def end_time(self) -> float:
+        """曝光结束时间"""
+        return self.time + (self.exposure or 0.0)
+
+    @property
+    def camera(self) -> Optional[str]:
+        """机身名称（型号通常已含品牌时不重复）"""
+        if self.model and self.make and not self.model.startswith(self.make.split()[0]):
+            return f"{self.make} {self.model}"
+        return self.model or self.make
+
+    def to_dict(self) -> Dict:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["path"] = str(self.path)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "FrameInfo":
+        info = cls(Path(data["path"]))
+        for name in cls.__slots__:
+            if name != "path" and name in data:
+                setattr(info, name, data[name])
+        return info
+
+
+# ── TIFF/EXIF 解析 ─────────────────────────────────────────────────────────
+
+class _TiffReader:
+    """在文件中 base 偏移处开始的 TIFF 结构上读取 IFD"""
+
+    def __init__(self, fh: BinaryIO, base: int = 0):
+        self.fh = fh
+        self.base = base
+        fh.seek(base)
+        header = fh.read(8)
+        if len(header) < 8 or header[:2] not in (b"II", b"MM"):
+            raise ValueError("不是 TIFF 结构")
+        self.endian = "<" if header[:2] == b"II" else ">"
+        magic, self.first_ifd = struct.unpack(self.endian + "HI", header[2:8])
+        if magic not in _TIFF_MAGIC:
+            raise ValueError("不是 TIFF 结构")
+
+    def read_ifd(self, offset: int, wanted: set) -> Dict[int, object]:
+        """读取一个 IFD 中需要的标签"""
+        fh, e = self.fh, self.endian
+        fh.seek(self.base + offset)
+        raw = fh.read(2)
+        if len(raw) < 2:
+            return {}
+        count = min(struct.unpack(e + "H", raw)[0], _MAX_ENTRIES)
+        entries = fh.read(12 * count)
+
+        values = {}
+        for i in range(len(entries) // 12):
+            tag, typ, n = struct.unpack_from(e + "HHI", entries, i * 12)
+            if tag not in wanted or typ not in _TYPES:
+                continue
+            fmt, width = _TYPES[typ]
+            length = width * n
+            if length <= 4:
+                data = entries[i * 12 + 8:i * 12 + 8 + length]
+            else:
+                (pointer,) = struct.unpack_from(e + "I", entries, i * 12 + 8)
+                fh.seek(self.base + pointer)
+                data = fh.read(min(length, 256))
+                n = len(data) // width
+            values[tag] = self._decode(typ, fmt, data, n)
+        return values
+
+    def _decode(self, typ: int, fmt: str, data: bytes, n: int):
+        if typ in (2, 7):
+            return data.split(b"\x00", 1)[0].decode("ascii", errors="replace").strip()
+        numbers = struct.unpack(self.endian + fmt * n, data[:struct.calcsize(self.endian + fmt * n)])
+        if typ in (5, 10):
+            numbers = [num / den if den else 0.0 for num, den in zip(numbers[0::2], numbers[1::2])]
+        return numbers[0] if len(numbers) == 1 else list(numbers)
+
+
+def _parse_datetime(value, subsec=None) -> Optional[float]:
+    """EXIF 日期 "YYYY:MM:DD HH:MM:SS"（相机本地时间）→ 时间戳"""
+    if not isinstance(value, str):
+        return None
+    try:
+        stamp = datetime.strptime(value[:19], "%Y:%m:%d %H:%M:%S").timestamp()
+    except ValueError:
+        return None
+    if subsec is not None:
+        digits = "".join(ch for ch in str(subsec) if ch.isdigit())
+        if digits:
+            stamp += int(digits) / 10 ** len(digits)
+    return stamp
+
+
+def _apply(info: FrameInfo, ifd0: Dict[int, object], exif: Dict[int, object]) -> None:
+    """把解析出的标签写入 FrameInfo（已有值不覆盖）"""
+    def first(value):
+        return value[0] if isinstance(value, list) else value
+
+    if info.make is None and isinstance(ifd0.get(_MAKE), str):
+        info.make = ifd0[_MAKE] or None
+    if info.model is None and isinstance(ifd0.get(_MODEL), str):
+        info.model = ifd0[_MODEL] or None
+    if info.captured is None:
+        info.captured = (
+            _parse_datetime(exif.get(_DATETIME_ORIGINAL), exif.get(_SUBSEC_ORIGINAL))
+            or _parse_datetime(ifd0.get(_DATETIME))
+        )
+    if info.exposure is None and exif.get(_EXPOSURE_TIME):
+        info.exposure = float(first(exif[_EXPOSURE_TIME]))
+    if info.aperture is None and exif.get(_F_NUMBER):
+        info.aperture = float(first(exif[_F_NUMBER]))
+    if info.iso is None and exif.get(_ISO):
+        info.iso = int(first(exif[_ISO]))
+    if info.focal_length is None and exif.get(_FOCAL_LENGTH):
+        info.focal_length = float(first(exif[_FOCAL_LENGTH]))
+    if info.serial is None and isinstance(exif.get(_BODY_SERIAL), str):
+        info.serial = exif[_BODY_SERIAL].strip() or None
+    if info.lens is None and isinstance(exif.get(_LENS_MODEL), str):
+        info.lens = exif[_LENS_MODEL] or None
+
+
+def _scan_tiff(fh: BinaryIO, info: FrameInfo, base: int = 0) -> None:
+    reader = _TiffReader(fh, base)
+    ifd0 = reader.read_ifd(reader.first_ifd, _IFD0_TAGS)
+    exif = {}
+    pointer = ifd0.get(_EXIF_IFD)
+    if isinstance(pointer, int) and pointer:
+        exif = reader.read_ifd(pointer, _EXIF_TAGS)
+    _apply(info, ifd0, exif)
+
+
+def _scan_jpeg(fh: BinaryIO, info: FrameInfo, base: int = 0) -> None:
+    """在 JPEG 标记段中找 APP1 Exif"""
+    fh.seek(base + 2)
+    while True:
+        marker = fh.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return
+        kind, length = marker[1], struct.unpack(">H", marker[2:])[0]
+        if kind == 0xE1:
+            start = fh.tell()
+            if fh.read(6) == b"Exif\x00\x00":
+                _scan_tiff(fh, info, start + 6)
+                return
+            fh.seek(start)
+        if kind in (0xDA, 0xD9):  # 图像数据开始：之后不会再有 EXIF
+            return
+        fh.seek(length - 2, os.SEEK_CUR)
+
+
+def _scan_raf(fh: BinaryIO, info: FrameInfo) -> None:
+    """RAF：文件头偏移 84 处是内嵌 JPEG 的位置，EXIF 在其中"""
+    fh.seek(84)
+    (jpeg_offset,) = struct.unpack(">I", fh.read(4))
+    _scan_jpeg(fh, info, jpeg_offset)
+
+
+# CR3 的 Canon 元数据 uuid 盒子
+_CANON_UUID = bytes.fromhex("85c0b687820f11e08111f4ce462b6a48")
+
+
+def _iter_boxes(fh: BinaryIO, start: int, end: int):
+    """遍历 ISO BMFF 盒子，产出 (类型, 数据起点, 盒子终点)"""
+    offset = start
+    while offset + 8 <= end:
+        fh.seek(offset)
+        header = fh.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header)
+        data = offset + 8
+        if size == 1:
+            size = struct.unpack(">Q", fh.read(8))[0]
+            data += 8
+        elif size == 0:
+            size = end - offset
+        if size < 8:
+            return
+        yield kind, data, offset + size
+        offset += size
+
+
+def _scan_cr3(fh: BinaryIO, info: FrameInfo) -> None:
+    """CR3：moov → uuid(Canon) → CMT1（IFD0）、CMT2（Exif IFD）"""
+    fh.seek(0, os.SEEK_END)
+    file_end = fh.tell()
+    for kind, data, end in _iter_boxes(fh, 0, file_end):
+        if kind != b"moov":
+            continue
+        for sub_kind, sub_data, sub_end in _iter_boxes(fh, data, end):
+            if sub_kind != b"uuid":
+                continue
+            fh.seek(sub_data)
+            if fh.read(16) != _CANON_UUID:
+                continue
+            ifd0, exif = {}, {}
+            for cmt_kind, cmt_data, _ in _iter_boxes(fh, sub_data + 16, sub_end):
+                if cmt_kind == b"CMT1":
+                    reader = _TiffReader(fh, cmt_data)
+                    ifd0 = reader.read_ifd(reader.first_ifd, _IFD0_TAGS)
+                elif cmt_kind == b"CMT2":
+                    reader = _TiffReader(fh, cmt_data)
+                    exif = reader.read_ifd(reader.first_ifd, _EXIF_TAGS)
+            _apply(info, ifd0, exif)
+            return
+        return
+
+
+def scan_file(path: Path) -> FrameInfo:
+    """
+    读取单个文件头部的 EXIF
+
+    Args:
+        path: 图片路径
+
+    Returns:
+        FrameInfo；无法解析的字段为 None（时间退回文件修改时间）
+    """
+    path = Path(path)
+    info = FrameInfo(path)
+    try:
+        stat = path.stat()
+        info.size, info.mtime = stat.st_size, stat.st_mtime
+        with open(path, "rb") as fh:
+            head = fh.read(16)
+            if head[:2] in (b"II", b"MM"):
+                _scan_tiff(fh, info)
+            elif head[:2] == b"\xff\xd8":
+                _scan_jpeg(fh, info)
+            elif head.startswith(b"FUJIFILMCCD-RAW"):
+                _scan_raf(fh, info)
+            elif head[4:8] == b"ftyp":
+                _scan_cr3(fh, info)
+    except (OSError, ValueError, struct.error) as e:
+        logger.debug(f"EXIF 读取失败: {path.name} ({e})")
+    return info
+
+
+def scan_files(paths: Iterable[Path], workers: int = 16) -> List[FrameInfo]:
+    """
+    多线程扫描一批文件（I/O 受限，线程数可以远多于 CPU 核数）
+
+    Returns:
+        与输入顺序一致的 FrameInfo 列表
+    """
+    paths = list(paths)
+    if len(paths) <= 1 or workers <= 1:
+        return [scan_file(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=min(workers, len(paths)), thread_name_prefix="sst-exif") as pool:
+        return list(pool.map(scan_file, paths))
+
+
+def format_exposure(seconds: Optional[float]) -> str:
+    """曝光时间的常用写法：1 秒以上写秒数，以下写 1/N"""
+    if not seconds:
+        return "-"
+    return f"{seconds:g}s" if seconds >= 1 else f"1/{round(1 / seconds)}s"
+
+
+# ── 序列分组 ───────────────────────────────────────────────────────────────
+
+class FrameSequence:
+    """按拍摄时间连续的一组帧"""
+
+    def __init__(self, frames: List[FrameInfo]):
+        self.frames = frames
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def paths(self) -> List[Path]:
+        return [frame.path for frame in self.frames]
+
+    @property
+    def start(self) -> float:
+        return self.frames[0].time
+
+    @property
+    def end(self) -> float:
+        return self.frames[-1].end_time
+
+    @property
+    def exposure(self) -> Optional[float]:
+        """序列中最常见的曝光时间"""
+        values = [frame.exposure for frame in self.frames if frame.exposure]
+        return max(set(values), key=values.count) if values else None
+
+    @property
+    def interval(self) -> Optional[float]:
+        """相邻帧拍摄间隔的中位数（秒）"""
+        if len(self.frames) < 2:
+            return None
+        return median(b.time - a.time for a, b in zip(self.frames, self.frames[1:]))
+
+    def describe(self) -> str:
+        """一行摘要：时间范围、张数、曝光"""
+        start = datetime.fromtimestamp(self.start).strftime("%Y-%m-%d %H:%M:%S")
+        minutes = (self.end - self.start) / 60
+        exposure_text = f"  {format_exposure(self.exposure)}" if self.exposure else ""
+        return (
+            f"{start}  {len(self)} 张  {minutes:.1f} 分钟{exposure_text}  "
+            f"{self.frames[0].path.name} … {self.frames[-1].path.name}"
+        )
+
+
+def default_gap(frames: List[FrameInfo], factor: float = 5.0, minimum: float = 60.0) -> float:
+    """
+    自动拆分间隔：相邻帧空档（上一张曝光结束到下一张开始）中位数的 factor 倍，至少 minimum 秒
+
+    间隔拍摄的空档通常只有一两秒，换场地、拍平场或试拍会留下远大于此的空档。
+    """
+    ordered = sorted(frames, key=lambda frame: frame.time)
+    idle = [max(b.time - a.end_time, 0.0) for a, b in zip(ordered, ordered[1:])]
+    if not idle:
+        return minimum
+    return max(median(idle) * factor, minimum)
+
+
+def group_sequences(
+    frames: List[FrameInfo],
+    gap_seconds: Optional[float] = None,
+    split_on_exposure: bool = True,
+    exposure_ratio: float = 2.0,
+) -> List[FrameSequence]:
+    """
+    按拍摄时间分组成序列
+
+    Args:
+        frames: 扫描结果
+        gap_seconds: 上一张曝光结束到下一张开始超过该秒数时拆开；None 时按 default_gap 自动确定
+        split_on_exposure: 曝光时间变化超过 exposure_ratio 倍时也拆开（平场、试拍通常曝光不同）
+        exposure_ratio: 曝光变化倍数阈值
+
+    Returns:
+        按时间排序的序列列表
+    """
+    ordered = sorted(frames, key=lambda frame: (frame.time, frame.path.name))
+    if gap_seconds is None:
+        gap_seconds = default_gap(ordered)
+
+    groups: List[List[FrameInfo]] = []
+    previous: Optional[FrameInfo] = None
+    for frame in ordered:
+        split = previous is None or frame.time - previous.end_time > gap_seconds
+        if not split and split_on_exposure and frame.exposure and previous.exposure:
+            ratio = frame.exposure / previous.exposure
+            split = ratio > exposure_ratio or ratio < 1 / exposure_ratio
+        if split:
+            groups.append([])
+        groups[-1].append(frame)
+        previous = frame
+    return [FrameSequence(group) for group in groups]
+
+
+def scan_sequences(
+    paths: Iterable[Path],
+    gap_seconds: Optional[float] = None,
+    workers: int = 16,
+    split_on_exposure: bool = True,
+) -> List[FrameSequence]:
+    """扫描并分组：scan_files + group_sequences"""
+    return group_sequences(scan_files(paths, workers), gap_seconds, split_on_exposure)
+
+
+def pick_sequence(sequences: List[FrameSequence], choice: str) -> Tuple[int, FrameSequence]:
+    """
+    按用户选择取出一个序列
+
+    Args:
+        sequences: group_sequences 的结果
+        choice: 'longest'（张数最多）或从 1 开始的序号
+
+    Returns:
+        (序号（从 1 开始）, 序列)
+    """
+    if not sequences:
+        raise ValueError("没有可选的序列")
+    if choice == "longest":
+        index = max(range(len(sequences)), key=lambda i: len(sequences[i]))
+    else:
+        try:
+            index = int(choice) - 1
+        except ValueError:
+            raise ValueError(f"无法识别的序列选择: {choice}（可用 longest 或序号）") from None
+        if not 0 <= index < len(sequences):
+            raise ValueError(f"序列序号超出范围: {choice}（共 {len(sequences)} 段）")
+    return index + 1, sequences[index]
@@ -4,12 +4,17 @@
 负责将处理后的图像保存为各种格式
 """
 
+import os
 from pathlib import Path
-from typing import Optional
+from io import BytesIO
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 import numpy as np
+import cv2
 from PIL import Image
 import tifffile
+from .pyramid import ImagePyramid
 from utils.logger import setup_logger
+from utils import profiling
 
 logger = setup_logger(__name__)
 
@@ -17,6 +22,82 @@ logger = setup_logger(__name__)
 class ImageExporter:
     """图像导出器"""
 
+    # 压缩方式别名 → tifffile 名称；None 表示不压缩
+    _COMPRESSION_ALIASES = {
+        "none": None,
+        "lzw": "lzw",
+        "deflate": "zlib",
+        "zlib": "zlib",
+        "zstd": "zstd",
+        "jpeg": "jpeg",
+    }
+
+    # 分块（tile）尺寸：每个 tile 独立压缩，可由多个线程并行完成
+    TIFF_TILE = (256, 256)
+
+    @staticmethod
+    def histogram(image: np.ndarray) -> np.ndarray:
+        """统计 uint16 图像（或分块）的 65536 级直方图，可逐块累加"""
+        flat = np.ascontiguousarray(image).reshape(-1, 1)
+        return cv2.calcHist([flat], [0], None, [65536], [0, 65536]).ravel().astype(np.float64)
+
+    @staticmethod
+    def limits_from_histogram(
+        hist: np.ndarray, p_low: float = 1.0, p_high: float = 99.5
+    ) -> Tuple[float, float]:
+        """由 65536 级直方图求百分位数对应的像素值"""
+        cdf = np.cumsum(hist, dtype=np.float64)
+        total = cdf[-1]
+        low_val = int(np.searchsorted(cdf, total * p_low / 100.0, side="left"))
+        high_val = int(np.searchsorted(cdf, total * p_high / 100.0, side="left"))
+        return float(low_val), float(min(high_val, 65535))
+
+    @staticmethod
+    def stretch_limits(
+        image: np.ndarray, p_low: float = 1.0, p_high: float = 99.5
+    ) -> Tuple[float, float]:
+        """
+        单次遍历计算 uint16 图像的百分位数
+
+        用 65536 级直方图代替两次全图 np.percentile（每次都要排序/拷贝整幅图）。
+        结果取对应秩次的像素值，与 np.percentile 的线性插值最多相差一个灰度级。
+
+        Args:
+            image: uint16 图像
+            p_low: 低百分位数
+            p_high: 高百分位数
+
+        Returns:
+            (低值, 高值)
+        """
+        return ImageExporter.limits_from_histogram(ImageExporter.histogram(image), p_low, p_high)
+
+    @staticmethod
+    def stretch_limits_from_bands(
+        bands: Iterable[np.ndarray], p_low: float = 1.0, p_high: float = 99.5
+    ) -> Tuple[float, float]:
+        """
+        逐块累加直方图求百分位数，无需拼出整幅图像
+
+        Args:
+            bands: uint16 行带/分块迭代器
+            p_low: 低百分位数
+            p_high: 高百分位数
+
+        Returns:
+            (低值, 高值)
+        """
+        hist = np.zeros(65536, dtype=np.float64)
+        for band in bands:
+            hist += ImageExporter.histogram(band)
+        return ImageExporter.limits_from_histogram(hist, p_low, p_high)
+
+    @staticmethod
+    def stretch_lut(low_val: float, high_val: float) -> np.ndarray:
+        """把线性拉伸预先计算成 65536 项查找表"""
+        levels = np.arange(65536, dtype=np.float32)
+        return np.clip((levels - low_val) / (high_val - low_val) * 65535, 0, 65535).astype(np.uint16)
+
     @staticmethod
     def apply_stretch(image: np.ndarray, p_low: float = 1.0, p_high: float = 99.5) -> np.ndarray:
         """
@@ -33,88 +114,392 @@ class ImageExporter:
         if image.dtype != np.uint16:
             return image
 
-        # 计算百分位数
-        low_val = np.percentile(image, p_low)
-        high_val = np.percentile(image, p_high)
+        # 一次直方图统计得到两个百分位数
+        low_val, high_val = ImageExporter.stretch_limits(image, p_low, p_high)
 
         # 平坦图像（如暗帧）无需拉伸
         if high_val <= low_val:
             return image
 
-        # 拉伸到 0-65535
-        stretched = np.clip((image - low_val) / (high_val - low_val) * 65535, 0, 65535)
+        # 查表拉伸到 0-65535：直接输出 uint16，不产生 float 中间数组
+        return ImageExporter.stretch_lut(low_val, high_val)[image]
+
+    @staticmethod
+    def pyramid_factors(shape: Sequence[int], levels: int, min_size: int = 64) -> List[int]:
+        """
+        金字塔子层的缩放倍数（2, 4, 8 …），短边小于 min_size 时停止
+
+        Args:
+            shape: 原图形状
+            levels: 最多层数
+            min_size: 子层短边下限
 
-        return stretched.astype(np.uint16)
+        Returns:
+            缩放倍数列表
+        """
+        factors = []
+        factor = 2
+        while len(factors) < levels and min(shape[:2]) // factor >= min_size:
+            factors.append(factor)
+            factor *= 2
+        return factors
+
+    @staticmethod
+    def preview_path_for(output_path: Path) -> Path:
+        """结果文件对应的 JPEG 预览图路径：<文件名>_preview.jpg"""
+        output_path = Path(output_path)
+        return output_path.with_name(f"{output_path.stem}_preview.jpg")
 
     @staticmethod
     def save_tiff(
         image: np.ndarray,
         output_path: Path,
         bits: int = 16,
-        compression: str = "lzw",
+        compression: str = "deflate",
         apply_stretch: bool = True,
+        predictor: bool = True,
+        maxworkers: Optional[int] = None,
+        pyramid_levels: int = 0,
+        preview_path: Optional[Path] = None,
+        preview_size: int = 1024,
+        pyramid: Optional[ImagePyramid] = None,
     ) -> bool:
         """
         保存为 TIFF 格式
 
+        以 256×256 分块写出，各分块由多个线程并行压缩。
+        可选同时写出 SubIFD 多分辨率子层和 JPEG 预览图，看图软件无需解码全图即可显示缩略图。
+
         Args:
             image: 图像数组
             output_path: 输出路径
-            bits: 位深度 (8, 16, 32)
-            compression: 压缩方式 ('none', 'lzw', 'jpeg', 'deflate')
-            apply_stretch: 是否应用百分位数拉伸（默认 True）
+            bits: 位深度 (8, 16, 32)；32 为线性浮点输出，不要子层和预览图时
+                  按行带写出（见 save_tiff_linear），否则整幅换算后写出
+            compression: 压缩方式 ('none', 'lzw', 'deflate', 'zstd', 'jpeg')
+            apply_stretch: 是否应用百分位数拉伸（默认 True；32-bit 输出只对预览图拉伸）
+            predictor: 是否对无损压缩启用水平差分预测（默认 True，通常能显著减小文件）
+            maxworkers: 并行压缩线程数（默认 CPU 核数）
+            pyramid_levels: 写入的 SubIFD 子层数（1/2、1/4 …），0 表示不写
+            preview_path: JPEG 预览图路径，None 表示不生成
+            preview_size: 预览图长边像素
+            pyramid: 该图像已有的 ImagePyramid（如界面预览时算好的），
+                     子层和预览图直接复用其降采样结果
 
         Returns:
             保存是否成功
         """
+        linear = bits == 32
+        if linear and pyramid_levels <= 0 and preview_path is None:
+            # 32-bit 输出线性数据：不拉伸、不裁剪，按行带归一化写出
+            return ImageExporter.save_tiff_linear(
+                image,
+                output_path,
+                compression=compression,
+                predictor=predictor,
+                maxworkers=maxworkers,
+            )
+
         try:
-            # 如果需要，先应用拉伸
-            if apply_stretch and image.dtype == np.uint16:
+            # 如果需要，先应用拉伸；拉伸做成查找表，子层和预览图可直接复用
+            lut = None
+            if apply_stretch and image.dtype == np.uint16 and not linear:
                 logger.warning("应用亮度拉伸 (1%-99.5%)...")
-                image = ImageExporter.apply_stretch(image)
-
-            if bits == 8:
-                # 转换为 8-bit
-                if image.dtype == np.uint16:
-                    img_to_save = (image / 256).astype(np.uint8)
-                else:
-                    img_to_save = image.astype(np.uint8)
-            elif bits == 16:
-                img_to_save = image.astype(np.uint16)
-            elif bits == 32:
-                # 32-bit 浮点
-                img_to_save = image.astype(np.float32) / 65535.0
-            else:
-                raise ValueError(f"不支持的位深度: {bits}")
-
-            # 使用 tifffile 保存（支持更好的元数据）
-            # 如果 LZW 压缩失败，尝试无压缩
-            try:
-                tifffile.imwrite(
-                    str(output_path),
+                with profiling.stage("export.stretch"):
+                    low_val, high_val = ImageExporter.stretch_limits(image)
+                    if high_val > low_val:
+                        lut = ImageExporter.stretch_lut(low_val, high_val)
+
+            def stretched(data: np.ndarray) -> np.ndarray:
+                return lut[data] if lut is not None else data
+
+            img_to_save = ImageExporter._convert_bits(stretched(image), bits)
+
+            levels = []
+            if pyramid_levels > 0 or preview_path is not None:
+                if pyramid is None:
+                    pyramid = ImagePyramid(image)
+                levels = [
+                    ImageExporter._convert_bits(stretched(pyramid.level(factor)), bits)
+                    for factor in ImageExporter.pyramid_factors(image.shape, pyramid_levels)
+                ]
+
+            with profiling.stage("export.tiff"):
+                ImageExporter._write_tiff(
+                    output_path,
                     img_to_save,
                     compression=compression,
-                    photometric="rgb" if image.ndim == 3 else "minisblack",
+                    predictor=predictor,
+                    maxworkers=maxworkers,
+                    levels=levels,
                 )
-            except Exception as e:
-                if "imagecodecs" in str(e):
-                    # 降级到无压缩
-                    logger.warning(f"{compression} 压缩需要 imagecodecs 包，使用无压缩模式")
-                    tifffile.imwrite(
-                        str(output_path),
-                        img_to_save,
-                        compression=None,
-                        photometric="rgb" if image.ndim == 3 else "minisblack",
-                    )
-                else:
-                    raise
 
+            if preview_path is not None:
+                with profiling.stage("export.preview"):
+                    preview = pyramid.fit(preview_size)
+                    if linear:
+                        # 线性数据（可能超出 65535）按预览图自身的百分位数拉伸
+                        preview = np.clip(preview, 0, 65535).astype(np.uint16)
+                        if apply_stretch:
+                            preview = ImageExporter.apply_stretch(preview)
+                    else:
+                        preview = stretched(preview)
+                    ImageExporter.save_jpeg(preview, preview_path, quality=85)
             return True
 
         except Exception as e:
             logger.info(f"保存 TIFF 失败: {e}")
             return False
 
+    @staticmethod
+    def _resolve_codec(compression: str) -> Optional[str]:
+        """
+        返回实际可用的 tifffile 压缩名
+
+        所选压缩需要 imagecodecs 而未安装时，依次降级为 deflate（zlib 为内置模块）
+        和无压缩。先用小图试写确定，流式写出时迭代器只能消费一次，不能失败后重来。
+        """
+        if compression not in ImageExporter._COMPRESSION_ALIASES:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+
+        codec = ImageExporter._COMPRESSION_ALIASES[compression]
+        fallbacks = [codec] + [c for c in ("zlib", None) if c != codec]
+        probe = np.zeros((16, 16), dtype=np.uint8)
+        for attempt in fallbacks:
+            if attempt is None:
+                return None
+            try:
+                tifffile.imwrite(BytesIO(), probe, compression=attempt, tile=(16, 16))
+                return attempt
+            except (ImportError, ValueError, KeyError, RuntimeError) as e:
+                next_codec = fallbacks[fallbacks.index(attempt) + 1]
+                logger.warning(
+                    f"{attempt} 压缩不可用（{e}），改用 {next_codec or '无压缩'}"
+                )
+        return None
+
+    @staticmethod
+    def _resolve_predictor(codec: Optional[str], dtype) -> Optional[int]:
+        """
+        选择差分预测方式
+
+        只用于无损压缩：整数用水平差分（内置），浮点用浮点预测（需要 imagecodecs，
+        不可用时不加预测）。
+        """
+        if codec not in ("lzw", "zlib", "zstd"):
+            return None
+        if not np.issubdtype(np.dtype(dtype), np.floating):
+            return 2  # PREDICTOR.HORIZONTAL
+        try:
+            probe = np.zeros((16, 16), dtype=np.float32)
+            tifffile.imwrite(BytesIO(), probe, compression="zlib", predictor=3, tile=(16, 16))
+            return 3  # PREDICTOR.FLOATINGPOINT
+        except (ImportError, ValueError, KeyError, RuntimeError):
+            return None
+
+    @staticmethod
+    def _tiff_options(
+        compression: str, predictor: bool, maxworkers: Optional[int], samples: int, dtype
+    ) -> dict:
+        """分块写出 TIFF 的公共参数"""
+        codec = ImageExporter._resolve_codec(compression)
+        return {
+            "compression": codec,
+            "predictor": ImageExporter._resolve_predictor(codec, dtype) if predictor else None,
+            "tile": ImageExporter.TIFF_TILE,
+            "maxworkers": maxworkers or os.cpu_count() or 1,
+            "photometric": "rgb" if samples == 3 else "minisblack",
+        }
+
+    @staticmethod
+    def _write_tiff(
+        output_path: Path,
+        data: np.ndarray,
+        compression: str = "deflate",
+        predictor: bool = True,
+        maxworkers: Optional[int] = None,
+        levels: Sequence[np.ndarray] = (),
+    ) -> None:
+        """分块、多线程压缩写出 TIFF，levels 非空时作为主图的 SubIFD 子层写入"""
+        samples = data.shape[2] if data.ndim == 3 else 1
+        options = ImageExporter._tiff_options(
+            compression, predictor, maxworkers, samples, data.dtype
+        )
+        if not levels:
+            tifffile.imwrite(str(output_path), data, **options)
+            return
+
+        total_bytes = data.nbytes + sum(level.nbytes for level in levels)
+        with tifffile.TiffWriter(str(output_path), bigtiff=total_bytes > 2 ** 32 - 2 ** 25) as tif:
+            tif.write(data, subifds=len(levels), **options)
+            for level in levels:
+                tif.write(level, subfiletype=1, **options)
+
+    @staticmethod
+    def _convert_bits(image: np.ndarray, bits: int) -> np.ndarray:
+        """按目标位深转换（8-bit 取高字节，32-bit 归一化到 0-1 浮点）"""
+        if bits == 8:
+            if image.dtype == np.uint16:
+                return (image >> 8).astype(np.uint8)
+            return image.astype(np.uint8)
+        if bits == 16:
+            return image.astype(np.uint16, copy=False)
+        if bits == 32:
+            # 单次运算直接得到 float32，不产生 astype 中间副本
+            return np.multiply(image, np.float32(1.0 / 65535.0), dtype=np.float32)
+        raise ValueError(f"不支持的位深度: {bits}")
+
+    @staticmethod
+    def _band_tiles(
+        bands: Iterable[np.ndarray], shape: Sequence[int], tile: Tuple[int, int]
+    ) -> Iterator[np.ndarray]:
+        """
+        把任意高度的行带重新切成 TIFF 分块（按行优先顺序）
+
+        只缓存一行分块（tile 高 × 全宽），边缘分块按实际尺寸交付。
+        """
+        height, width = shape[:2]
+        tile_h, tile_w = tile
+        buffer = None
+        filled = 0
+        rows_seen = 0
+
+        def emit(rows: int) -> Iterator[np.ndarray]:
+            for x in range(0, width, tile_w):
+                # 拷贝一份：tifffile 可能在其他线程中延后压缩该分块
+                yield buffer[:rows, x:x + tile_w].copy()
+
+        for band in bands:
+            if band.shape[1] != width:
+                raise ValueError(f"行带宽度 {band.shape[1]} 与图像宽度 {width} 不一致")
+            if buffer is None:
+                buffer = np.empty((tile_h,) + tuple(band.shape[1:]), dtype=band.dtype)
+            rows_seen += band.shape[0]
+            offset = 0
+            while offset < band.shape[0]:
+                take = min(tile_h - filled, band.shape[0] - offset)
+                buffer[filled:filled + take] = band[offset:offset + take]
+                filled += take
+                offset += take
+                if filled == tile_h:
+                    yield from emit(filled)
+                    filled = 0
+
+        if rows_seen != height:
+            raise ValueError(f"行带总行数 {rows_seen} 与图像高度 {height} 不一致")
+        if filled:
+            yield from emit(filled)
+
+    @staticmethod
+    def save_tiff_stream(
+        bands: Iterable[np.ndarray],
+        output_path: Path,
+        shape: Sequence[int],
+        bits: int = 16,
+        compression: str = "deflate",
+        stretch: Optional[Tuple[float, float]] = None,
+        predictor: bool = True,
+        maxworkers: Optional[int] = None,
+    ) -> bool:
+        """
+        边生成边写出 BigTIFF
+
+        行带（或按行优先顺序排列的整行分块）一到达就切成分块压缩写盘，
+        内存中只保留约一行分块的数据，适合超大结果或逐块生成的结果。
+
+        Args:
+            bands: 自上而下的行带迭代器（uint16；32-bit 输出时也可为 float32），每块形状 (h, W[, C])
+            output_path: 输出路径
+            shape: 完整图像形状 (H, W[, C])
+            bits: 位深度 (8, 16, 32)
+            compression: 压缩方式 ('none', 'lzw', 'deflate', 'zstd')
+            stretch: 线性拉伸的 (低值, 高值)，可由 stretch_limits_from_bands 预先计算；
+                None 表示不拉伸
+            predictor: 是否对无损压缩启用水平差分预测
+            maxworkers: 并行压缩线程数（默认 CPU 核数）
+
+        Returns:
+            保存是否成功
+        """
+        try:
+            lut = None
+            if stretch is not None and stretch[1] > stretch[0]:
+                lut = ImageExporter.stretch_lut(*stretch)
+
+            def converted() -> Iterator[np.ndarray]:
+                for band in bands:
+                    if lut is not None and band.dtype == np.uint16:
+                        band = lut[band]
+                    yield ImageExporter._convert_bits(band, bits)
+
+            dtype = {8: np.uint8, 16: np.uint16, 32: np.float32}.get(bits)
+            if dtype is None:
+                raise ValueError(f"不支持的位深度: {bits}")
+
+            samples = shape[2] if len(shape) == 3 else 1
+            options = ImageExporter._tiff_options(
+                compression, predictor, maxworkers, samples, dtype
+            )
+            # 行带在写出过程中才生成，这里的耗时包含结果生成（拉伸、填充等）
+            with profiling.stage("export.tiff_stream"):
+                tifffile.imwrite(
+                    str(output_path),
+                    ImageExporter._band_tiles(converted(), shape, ImageExporter.TIFF_TILE),
+                    shape=tuple(shape),
+                    dtype=dtype,
+                    bigtiff=True,
+                    **options,
+                )
+            return True
+
+        except Exception as e:
+            logger.info(f"流式保存 TIFF 失败: {e}")
+            return False
+
+    @staticmethod
+    def save_tiff_linear(
+        image: Optional[np.ndarray],
+        output_path: Path,
+        bands: Optional[Iterable[np.ndarray]] = None,
+        shape: Optional[Sequence[int]] = None,
+        compression: str = "deflate",
+        predictor: bool = True,
+        maxworkers: Optional[int] = None,
+        band_rows: int = 256,
+    ) -> bool:
+        """
+        保存 32-bit 浮点线性 TIFF（0-65535 映射到 0.0-1.0）
+
+        不拉伸、不裁剪，保留堆栈累加器的完整精度和动态范围（AVERAGE 堆栈的
+        小数部分、超出 65535 的值），供 Siril/PixInsight 等天文后期软件处理。
+        按行带换算写出，每次只分配一个行带大小的 float32 缓冲，不产生整幅副本。
+
+        Args:
+            image: 完整图像（uint16 或 float32 累加器）；传入 bands 时为 None
+            output_path: 输出路径
+            bands: 自上而下的行带迭代器（如 StackingEngine.iter_linear_bands()）
+            shape: 使用 bands 时的完整图像形状
+            compression: 压缩方式 ('none', 'lzw', 'deflate', 'zstd')
+            predictor: 是否启用浮点差分预测（需要 imagecodecs，不可用时自动关闭）
+            maxworkers: 并行压缩线程数（默认 CPU 核数）
+            band_rows: 传入完整图像时每个行带的行数
+
+        Returns:
+            保存是否成功
+        """
+        if bands is None:
+            shape = image.shape
+            bands = (image[y:y + band_rows] for y in range(0, image.shape[0], band_rows))
+
+        return ImageExporter.save_tiff_stream(
+            bands,
+            output_path,
+            shape,
+            bits=32,
+            compression=compression,
+            predictor=predictor,
+            maxworkers=maxworkers,
+        )
+
     @staticmethod
     def save_jpeg(
         image: np.ndarray, output_path: Path, quality: int = 95
@@ -0,0 +1,243 @@
+"""
+帧预取流水线模块
+
+把“解码 → 构建金字塔 →（对齐）→ 划痕检测”放到工作线程中，对后续帧提前处理，
+与主线程的堆栈（add_image）重叠执行。rawpy/OpenCV 在重计算时都会释放 GIL，
+因此多线程可以真正并行。
+
+- 预取深度有上限（有界队列），避免解码过多帧占满内存
+- 结果严格按文件顺序交付
+- 有状态的检测器（如 temporal 划痕检测）在专用单线程中按顺序执行
+- 对齐只与参考帧比较，可以在工作线程中并行估计和变换
+- 记录各阶段耗时（StageProfiler），处理结束后输出到日志；传入激活的全局剖析器时并入整次运行的报告
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from .pyramid import ImagePyramid
+from utils.logger import setup_logger
+from utils.profiling import StageProfiler
+
+logger = setup_logger(__name__)
+
+
+class FrameResult:
+    """流水线交付的单帧结果"""
+
+    __slots__ = ("index", "path", "image", "pyramid", "streaks", "transform", "error", "timings")
+
+    def __init__(self, index: int, path: Path):
+        self.index = index
+        self.path = path
+        self.image: Optional[np.ndarray] = None
+        self.pyramid: Optional[ImagePyramid] = None
+        self.streaks = None  # StreakMask，未启用划痕检测时为 None
+        self.transform = None  # 对齐变换（registration.Transform），未启用对齐时为 None
+        self.error: Optional[Exception] = None
+        self.timings: Dict[str, float] = {}
+
+
+class FramePipeline:
+    """有界、保序的帧预取流水线"""
+
+    # 阶段名称 → 日志显示名
+    STAGE_LABELS = {
+        "decode": "解码",
+        "align": "对齐",
+        "detect": "划痕检测",
+        "wait": "等待预取",
+        "stack": "堆栈",
+        "timelapse": "延时帧",
+        "prepare": "预缩放",
+        "preview": "预览",
+    }
+
+    def __init__(
+        self,
+        paths: Sequence[Path],
+        loader: Callable[[int, Path], np.ndarray],
+        detector=None,
+        workers: int = 2,
+        prefetch: int = 3,
+        prepare: Optional[Callable[[int, ImagePyramid], None]] = None,
+        profiler: Optional[StageProfiler] = None,
+        registrar=None,
+    ):
+        """
+        Args:
+            paths: 按处理顺序排列的文件列表
+            loader: 解码函数，接收 (索引, 路径)，返回 RGB uint16 图像
+            detector: SatelliteFilter（可选）；None 表示不做划痕检测
+            workers: 解码/检测工作线程数
+            prefetch: 最多提前处理的帧数（队列上限），决定额外内存占用
+            prepare: 在工作线程中对每帧金字塔执行的预处理（可选），接收 (状态序号, 金字塔)，
+                     如提前缩放到延时视频分辨率，结果缓存在金字塔中。
+                     状态序号是此前成功解码的帧数（失败的帧不占序号），与延时生成器的状态计数一致
+            profiler: 记录阶段耗时的剖析器（可选）；None 时使用流水线自己的剖析器
+            registrar: FrameRegistrar（可选）；提供时解码后先对齐到参考帧，
+                       后续预处理和划痕检测都在对齐后的图像上进行
+        """
+        self.paths = list(paths)
+        self.loader = loader
+        self.detector = detector
+        self.prepare = prepare
+        self.registrar = registrar
+        self.workers = max(int(workers), 1)
+        self.prefetch = max(int(prefetch), 1)
+        self.profiler = profiler if profiler is not None else StageProfiler()
+
+        # 按输入顺序登记解码结果，给 prepare 分配状态序号
+        self._order = threading.Condition()
+        self._settled = 0
+        self._succeeded = 0
+
+    @property
+    def stage_totals(self) -> Dict[str, float]:
+        """各阶段累计耗时"""
+        return self.profiler.totals()
+
+    @property
+    def stage_counts(self) -> Dict[str, int]:
+        """各阶段记录次数"""
+        return self.profiler.counts()
+
+    def record(self, stage: str, seconds: float) -> None:
+        """记录某个阶段的一次耗时（工作线程耗时随结果一并交付，在主线程记录）"""
+        self.profiler.record(stage, seconds)
+
+    def timed(self, stage: str):
+        """计时上下文，供主线程记录堆栈、延时帧等阶段"""
+        return self.profiler.timed(stage)
+
+    def _prepare(self, index: int, path: Path, detect: bool) -> FrameResult:
+        """工作线程：解码 + 构建金字塔 + 预处理 +（无状态）划痕检测"""
+        frame = FrameResult(index, path)
+        ok = False
+        state = None
+        try:
+            ok = self._decode(frame)
+        finally:
+            if self.prepare is not None:
+                state = self._settle(index, ok)
+        if not ok:
+            return frame
+
+        if self.prepare is not None:
+            start = time.perf_counter()
+            try:
+                self.prepare(state, frame.pyramid)
+            except Exception as e:
+                frame.error = e
+                return frame
+            frame.timings["prepare"] = time.perf_counter() - start
+
+        if detect:
+            self._detect(frame)
+        return frame
+
+    def _decode(self, frame: FrameResult) -> bool:
+        """解码 + 构建金字塔 +（可选）对齐；失败时记录在 frame.error 并返回 False"""
+        start = time.perf_counter()
+        try:
+            frame.image = self.loader(frame.index, frame.path)
+        except Exception as e:
+            frame.error = e
+            if self.registrar is not None:
+                self.registrar.skip(frame.index)
+            return False
+        frame.timings["decode"] = time.perf_counter() - start
+        frame.pyramid = ImagePyramid(frame.image)
+
+        if self.registrar is not None:
+            start = time.perf_counter()
+            try:
+                image, frame.transform = self.registrar.align(frame.index, frame.path, frame.pyramid)
+            except Exception as e:
+                frame.error = e
+                self.registrar.skip(frame.index)
+                return False
+            if image is not frame.image:
+                frame.image = image
+                frame.pyramid = ImagePyramid(image)
+            frame.timings["align"] = time.perf_counter() - start
+        return True
+
+    def _settle(self, index: int, ok: bool) -> int:
+        """
+        按输入顺序登记一帧是否解码成功，返回该帧的状态序号（此前成功的帧数）
+
+        等前面的帧都有结果后才返回；工作线程按提交顺序取任务，前面的帧总已开始处理。
+        """
+        with self._order:
+            self._order.wait_for(lambda: self._settled == index)
+            state = self._succeeded
+            self._succeeded += int(ok)
+            self._settled += 1
+            self._order.notify_all()
+        return state
+
+    def _detect(self, frame: FrameResult) -> None:
+        start = time.perf_counter()
+        try:
+            frame.streaks = self.detector.detect_streaks(frame.image, pyramid=frame.pyramid)
+        except Exception as e:
+            frame.error = e
+        frame.timings["detect"] = time.perf_counter() - start
+
+    def _detect_in_order(self, prepared: Future) -> FrameResult:
+        """单线程执行器：按提交顺序做有状态检测"""
+        frame = prepared.result()
+        if frame.error is None:
+            self._detect(frame)
+        return frame
+
+    def __iter__(self) -> Iterator[FrameResult]:
+        stateful = self.detector is not None and getattr(self.detector, "is_stateful", False)
+        detect_in_worker = self.detector is not None and not stateful
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sst-decode")
+        serial = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sst-detect") if stateful else None
+        pending: deque = deque()
+        upcoming = iter(enumerate(self.paths))
+        self._settled = self._succeeded = 0
+
+        def submit_next() -> None:
+            item = next(upcoming, None)
+            if item is None:
+                return
+            future = pool.submit(self._prepare, item[0], item[1], detect_in_worker)
+            if serial is not None:
+                future = serial.submit(self._detect_in_order, future)
+            pending.append(future)
+
+        try:
+            for _ in range(self.prefetch):
+                submit_next()
+
+            while pending:
+                wait_start = time.perf_counter()
+                frame = pending.popleft().result()
+                self.record("wait", time.perf_counter() - wait_start)
+                for stage, seconds in frame.timings.items():
+                    self.record(stage, seconds)
+                # 先补充队列再交付，让工作线程在主线程堆栈时继续预取
+                submit_next()
+                yield frame
+        finally:
+            # 提前中止（取消/异常）时丢弃尚未开始的任务
+            for future in pending:
+                future.cancel()
+            if serial is not None:
+                serial.shutdown(wait=True, cancel_futures=True)
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def summary_lines(self) -> List[str]:
+        """各阶段累计耗时汇总（按耗时降序）；共享剖析器中的细分阶段不在此列出"""
+        return self.profiler.summary_lines(self.STAGE_LABELS, only_labeled=True)
@@ -67,6 +67,23 @@ class GapFiller:
         else:
             raise ValueError(f"未知的填充方法: {self.method}")
 
+    def band_halo(self, gap_size: int) -> Optional[int]:
+        """
+        按行带分块填充时，每块上下需要额外读取的邻域行数
+
+        Args:
+            gap_size: 间隔大小
+
+        Returns:
+            邻域行数；None 表示该方法依赖全图统计，不能分块处理
+        """
+        if self.method == "linear":
+            return None  # 按整通道最大值归一化
+        if self.method == "motion_blur":
+            return 0  # 仅水平方向卷积
+        # 膨胀 + 腐蚀两次邻域运算，directional 的结构元素半径为 2 * gap_size
+        return 4 * gap_size
+
     @staticmethod
     def _raise_if_cancelled(stop_event) -> None:
         """在耗时阶段切换点检查是否已取消。"""
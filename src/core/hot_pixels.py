@@ -0,0 +1,209 @@
+"""
+热像素检测与修正模块
+
+长时间曝光的热像素在 LIGHTEN 堆栈中会被最大值保留下来，变成一个个固定亮点
+（星轨方向上看像一条条直线的起点）。不需要另拍暗场：
+- 检测：在序列前 N 帧上比较每个像素与 5x5 外圈邻居的最大值，
+  大多数帧中都比整圈邻居明显更亮、且只占几个像素的位置判为热像素。
+  星点随周日运动移动，不会在同一像素上持续偏亮；成片的亮区（灯光、亮云边缘）外圈总有同样亮的邻居
+- 修正：只保存稀疏的像素坐标列表，逐帧用外圈 16 个邻居的中值替换，
+  开销与热像素个数成正比，不做整幅滤波
+- 热像素图按 机身型号 + 序列号 + 尺寸 + 旋转 缓存在 ~/.superstartrail/hot_pixels/，
+  同一台相机之后的序列直接复用
+
+地景中恒定的点光源（远处路灯）也可能被当成热像素，这时可以关闭该功能或改用暗场。
+"""
+
+import math
+import os
+import re
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from utils import profiling
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_FRAMES = 8
+
+# 外圈 5x5 邻居的偏移：热像素经去马赛克后会扩散到相邻像素，避开内圈 3x3
+_RING = np.array(
+    [(dy, dx) for dy in range(-2, 3) for dx in range(-2, 3) if max(abs(dy), abs(dx)) == 2],
+    dtype=np.intp,
+)
+_RING_KERNEL = np.ones((5, 5), np.uint8)
+_RING_KERNEL[1:4, 1:4] = 0
+
+
+class HotPixelMap:
+    """稀疏热像素坐标表"""
+
+    def __init__(self, ys: np.ndarray, xs: np.ndarray, shape: Tuple[int, int]):
+        """
+        Args:
+            ys, xs: 热像素的行、列坐标
+            shape: 检测所用图像的 (高, 宽)
+        """
+        self.ys = np.asarray(ys, dtype=np.intp)
+        self.xs = np.asarray(xs, dtype=np.intp)
+        self.shape = (int(shape[0]), int(shape[1]))
+        h, w = self.shape
+        # 邻居坐标预先算好并夹到画面内，逐帧只做一次 gather
+        self._ring_ys = np.clip(self.ys[:, None] + _RING[:, 0], 0, h - 1)
+        self._ring_xs = np.clip(self.xs[:, None] + _RING[:, 1], 0, w - 1)
+
+    def __len__(self) -> int:
+        return len(self.ys)
+
+    def apply(self, image: np.ndarray) -> np.ndarray:
+        """
+        用邻居中值替换热像素（原地；只读输入先复制一次）
+
+        Args:
+            image: RGB 图像
+
+        Returns:
+            修正后的图像
+
+        Raises:
+            ValueError: 图像尺寸与检测时不符
+        """
+        if image.shape[:2] != self.shape:
+            raise ValueError(f"热像素图尺寸 {self.shape} 与图像 {image.shape[:2]} 不符")
+        if not len(self):
+            return image
+        if not image.flags.writeable:
+            image = image.copy()
+        with profiling.stage("hot_pixels"):
+            # (K, 16, C) → 每个热像素、每个通道取邻居中值
+            neighbours = image[self._ring_ys, self._ring_xs]
+            image[self.ys, self.xs] = np.median(neighbours, axis=1).astype(image.dtype)
+        return image
+
+    def save(self, path: Path) -> bool:
+        """原子写入 .npz（临时文件名唯一，batch 的多个工作进程可同时写同一机身的图）"""
+        tmp = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=path.parent, prefix=path.name + ".", suffix=".tmp", delete=False
+            ) as fh:
+                tmp = fh.name
+                np.savez(
+                    fh,
+                    ys=self.ys.astype(np.int32),
+                    xs=self.xs.astype(np.int32),
+                    shape=np.array(self.shape),
+                )
+            os.replace(tmp, path)
+            return True
+        except OSError as e:
+            logger.warning(f"热像素图保存失败: {path.name} ({e})")
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+            return False
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["HotPixelMap"]:
+        """读取缓存的热像素图，不存在或损坏时返回 None"""
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                return cls(data["ys"], data["xs"], tuple(data["shape"]))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            logger.warning(f"热像素图无法读取，将重新检测: {path.name} ({e})")
+            return None
+
+
+def detect_hot_pixels(
+    frames: Iterable[np.ndarray],
+    sigma: float = 8.0,
+    min_fraction: float = 0.75,
+    floor: int = 512,
+    max_cluster: int = 12,
+) -> HotPixelMap:
+    """
+    从序列帧中检测热像素（逐帧流式统计，只保留一个计数图）
+
+    Args:
+        frames: 序列开头的若干帧（RGB uint16）
+        sigma: 高出外圈邻居最大值的噪声倍数
+        min_fraction: 至少在这一比例的帧中偏亮才算热像素
+        floor: 高出外圈邻居最大值的最小绝对值
+        max_cluster: 连通区域超过该像素数的视为真实光源，不当作热像素
+
+    Returns:
+        HotPixelMap
+    """
+    counts = None
+    n = 0
+    for image in frames:
+        with profiling.stage("hot_pixels.detect"):
+            # 三个通道逐元素取最大（比 max(axis=2) 快一个数量级）
+            peak = np.maximum(np.maximum(image[..., 0], image[..., 1]), image[..., 2])
+            excess = cv2.subtract(peak, cv2.dilate(peak, _RING_KERNEL))
+            # 噪声：|像素 - 邻域中值| 的中值，在 1/4 抽样上估计
+            sample = np.ascontiguousarray(peak[::4, ::4])
+            noise = float(np.median(cv2.absdiff(sample, cv2.medianBlur(sample, 5)))) * 1.4826
+            hot = excess > max(sigma * noise, floor)
+            if counts is None:
+                counts = np.zeros(hot.shape, np.uint8)
+            counts += hot
+            n += 1
+
+    if counts is None:
+        raise ValueError("没有可用于检测热像素的帧")
+    shape = counts.shape
+    if n < 3:
+        logger.warning(f"只有 {n} 帧，无法可靠区分热像素和星点，跳过检测")
+        return HotPixelMap([], [], shape)
+
+    mask = (counts >= math.ceil(min_fraction * n)).astype(np.uint8)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    large = np.flatnonzero(stats[:, cv2.CC_STAT_AREA] > max_cluster)
+    large = large[large > 0]
+    if len(large):
+        mask[np.isin(labels, large)] = 0
+    ys, xs = np.nonzero(mask)
+    logger.info(f"检测到 {len(ys)} 个热像素（{n} 帧，排除 {len(large)} 个较大的亮区）")
+    return HotPixelMap(ys, xs, shape)
+
+
+def cache_path(
+    camera: Optional[str],
+    serial: Optional[str],
+    size: Optional[Tuple[int, int]],
+    rotation: int = 0,
+    cache_dir: Optional[Path] = None,
+    orientation: int = 0,
+) -> Optional[Path]:
+    """
+    某台相机的热像素图缓存路径
+
+    同一机身横拍、竖拍（或倒置）时热像素在解码图像中的位置不同，
+    因此按解码后的尺寸、方向标记和旋转分别缓存。
+
+    Args:
+        camera: 机身型号
+        serial: 机身序列号；缺失时无法区分同型号的不同机身，返回 None（不缓存）
+        size: 解码后图像的 (宽, 高)
+        rotation: 手动旋转角度
+        cache_dir: 缓存目录，None 时使用 ~/.superstartrail/hot_pixels
+        orientation: 文件中的方向标记（见 RawProcessor.get_orientation）
+
+    Returns:
+        .npz 路径或 None
+    """
+    if not serial or size is None:
+        return None
+    if cache_dir is None:
+        cache_dir = Path.home() / ".superstartrail" / "hot_pixels"
+    label = re.sub(r"[^0-9A-Za-z]+", "_", f"{camera or 'camera'}_{serial}").strip("_")
+    return Path(cache_dir) / f"{label}_{size[0]}x{size[1]}_o{orientation}_r{rotation}.npz"
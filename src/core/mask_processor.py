@@ -2,13 +2,14 @@
 蒙版处理模块
 
 负责加载 PNG 蒙版文件，并将其转换为归一化的 float32 数组。
-白色区域（255）= 天空（sky_result），黑色区域（0）= 地景（fg_result）。
+白色区域（255）= 天空（按 mode 堆栈），黑色区域（0）= 地景（按 fg_mode 堆栈）。
 
 蒙版由用户在 PS 中对着 RAW 源文件制作，方向与原始照片一致（未旋转）。
 加载时应用与图像相同的旋转，再 resize 到目标尺寸。
 
 为了避免 PS 导出的软边、以及缩放时产生的宽半透明带导致融合边缘发灰，
-这里会把蒙版稳定化为“硬分区 + 窄羽化”的 matte。
+这里会把蒙版稳定化为“硬分区 + 窄羽化”的 matte；
+堆栈引擎只为窄羽化带中的像素额外保存地景轨道。
 """
 import numpy as np
 from pathlib import Path
@@ -0,0 +1,137 @@
+"""
+元数据服务模块
+
+在 exif_scanner 的头部扫描之上加一层持久化索引：
+- 索引按 路径 + 修改时间 + 文件大小 记录扫描结果，文件未变时直接复用
+- 未命中的文件在线程池中并行扫描，命中的文件只需一次 stat
+- 索引保存为 ~/.superstartrail/metadata_index.json，原子替换写入，条目数有上限
+
+sst info、文件列表统计和 RawProcessor.get_metadata 都通过这里读取 EXIF，
+同一目录第二次打开时几乎不需要读文件内容。
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .exif_scanner import FrameInfo, group_sequences, scan_file
+from utils.file_index import FileIndex
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+INDEX_VERSION = 3
+
+
+class MetadataService:
+    """带持久化索引的 EXIF 读取服务（线程安全）"""
+
+    def __init__(
+        self,
+        index_path: Optional[Path] = None,
+        workers: int = 16,
+        max_entries: int = 200_000,
+    ):
+        """
+        初始化元数据服务
+
+        Args:
+            index_path: 索引文件路径，None 时使用 ~/.superstartrail/metadata_index.json
+            workers: 扫描线程数（I/O 受限，可以远多于 CPU 核数）
+            max_entries: 索引最多保留的条目数，超出时丢弃最久未访问的条目
+        """
+        if index_path is None:
+            index_path = Path.home() / ".superstartrail" / "metadata_index.json"
+        self.index = FileIndex(index_path, INDEX_VERSION, max_entries)
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def save(self) -> bool:
+        """把索引写回磁盘（没有新条目时不写）"""
+        return self.index.save()
+
+    def clear(self) -> None:
+        """清空索引"""
+        self.index.clear()
+
+    def _resolve(self, path: Path) -> FrameInfo:
+        """单个文件：索引命中且 修改时间 + 大小 未变时直接返回，否则扫描头部并更新索引"""
+        key = os.path.abspath(path)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            return scan_file(path)
+
+        cached = self.index.lookup(key, stat)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return FrameInfo.from_dict({**cached, "path": str(path)})
+
+        info = scan_file(path)
+        record = info.to_dict()
+        del record["path"]
+        self.index.store(key, stat, record)
+        with self._lock:
+            self.misses += 1
+        return info
+
+    def get(self, path: Path) -> FrameInfo:
+        """读取单个文件的元数据"""
+        return self._resolve(Path(path))
+
+    def get_many(self, paths: Iterable[Path]) -> List[FrameInfo]:
+        """
+        并行读取一批文件的元数据
+
+        Args:
+            paths: 文件路径
+
+        Returns:
+            与输入顺序一致的 FrameInfo 列表
+        """
+        paths = [Path(path) for path in paths]
+        if len(paths) <= 1 or self.workers <= 1:
+            return [self._resolve(path) for path in paths]
+        with ThreadPoolExecutor(
+            max_workers=min(self.workers, len(paths)), thread_name_prefix="sst-meta"
+        ) as pool:
+            return list(pool.map(self._resolve, paths))
+
+
+def summarize(frames: List[FrameInfo]) -> Dict:
+    """
+    汇总一批帧的元数据，供 sst info 和文件列表统计显示
+
+    Returns:
+        count / start / end（有拍摄时间时）/ exposures / isos / apertures /
+        cameras（去重排序）/ sequences（按拍摄间隔分组的段数）/ total_bytes
+    """
+    captured = [frame.captured for frame in frames if frame.captured is not None]
+    return {
+        "count": len(frames),
+        "start": min(captured) if captured else None,
+        "end": max(frame.end_time for frame in frames if frame.captured is not None) if captured else None,
+        "exposures": sorted({frame.exposure for frame in frames if frame.exposure}),
+        "isos": sorted({frame.iso for frame in frames if frame.iso}),
+        "apertures": sorted({frame.aperture for frame in frames if frame.aperture}),
+        "cameras": sorted({frame.camera for frame in frames if frame.camera}),
+        "sequences": len(group_sequences(frames)) if frames else 0,
+        "total_bytes": sum(frame.size for frame in frames),
+    }
+
+
+# 全局元数据服务实例
+_service_instance = None
+
+
+def get_metadata_service() -> MetadataService:
+    """获取全局元数据服务实例"""
+    global _service_instance
+    if _service_instance is None:
+        _service_instance = MetadataService()
+    return _service_instance
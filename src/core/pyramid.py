@@ -0,0 +1,138 @@
+"""
+单帧图像金字塔模块
+
+每帧解码后只构建一次降采样金字塔，供划痕检测、预览、延时视频等
+下游环节共享读取，避免各自对全分辨率图像重复做缩放和灰度转换。
+
+层级按 2 的幂递减：level(1) 为原图，level(2) 为 1/2，level(4) 为 1/4 ……
+每一层都由上一层 INTER_AREA 缩小得到，且只在首次访问时计算并缓存，
+因此无论有多少消费者，全分辨率数据只会被完整读取一次。
+"""
+
+from typing import Dict, Tuple
+import numpy as np
+import cv2
+
+
+class ImagePyramid:
+    """惰性计算、带缓存的 RGB/亮度金字塔"""
+
+    def __init__(self, image: np.ndarray):
+        """
+        Args:
+            image: 全分辨率图像 (H, W, 3) 或 (H, W)，uint16 / uint8 / float32
+        """
+        self.image = image
+        self._levels: Dict[int, np.ndarray] = {1: image}
+        self._luminance: Dict[int, np.ndarray] = {}
+        self._resized: Dict[Tuple[int, int], np.ndarray] = {}
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """原图形状"""
+        return self.image.shape
+
+    @staticmethod
+    def _check_factor(factor: int) -> int:
+        factor = int(factor)
+        if factor < 1 or factor & (factor - 1):
+            raise ValueError(f"金字塔缩放倍数必须是 2 的幂: {factor}")
+        return factor
+
+    def level(self, factor: int) -> np.ndarray:
+        """
+        获取缩小 factor 倍的层级（与原图同 dtype、同通道数）
+
+        Args:
+            factor: 缩放倍数，必须为 2 的幂
+
+        Returns:
+            降采样后的图像
+        """
+        factor = self._check_factor(factor)
+        cached = self._levels.get(factor)
+        if cached is not None:
+            return cached
+
+        parent = self.level(factor // 2)
+        h, w = parent.shape[:2]
+        small = cv2.resize(
+            parent, (max(w // 2, 1), max(h // 2, 1)), interpolation=cv2.INTER_AREA
+        )
+        self._levels[factor] = small
+        return small
+
+    def luminance8(self, factor: int) -> np.ndarray:
+        """
+        获取缩小 factor 倍的 8-bit 灰度图（划痕检测等使用）
+
+        Args:
+            factor: 缩放倍数，必须为 2 的幂
+
+        Returns:
+            uint8 灰度图 (h, w)
+        """
+        factor = self._check_factor(factor)
+        cached = self._luminance.get(factor)
+        if cached is not None:
+            return cached
+
+        small = self.level(factor)
+        if small.dtype == np.uint16:
+            small_8bit = (small >> 8).astype(np.uint8)
+        elif small.dtype == np.uint8:
+            small_8bit = small
+        else:
+            small_8bit = np.clip(small / 256.0, 0, 255).astype(np.uint8)
+
+        gray = cv2.cvtColor(small_8bit, cv2.COLOR_RGB2GRAY) if small_8bit.ndim == 3 else small_8bit
+        self._luminance[factor] = gray
+        return gray
+
+    def factor_for_size(self, width: int, height: int) -> int:
+        """返回不小于目标尺寸的最小层级对应的缩放倍数"""
+        h, w = self.image.shape[:2]
+        factor = 1
+        while w // (factor * 2) >= width and h // (factor * 2) >= height:
+            factor *= 2
+        return factor
+
+    def resize_to(self, width: int, height: int) -> np.ndarray:
+        """
+        缩放到精确尺寸，从最接近的缓存层级出发，避免重复读取全分辨率数据
+
+        结果按尺寸缓存：预取线程提前算好后，主线程再次请求同一尺寸时直接返回。
+
+        Args:
+            width: 目标宽度
+            height: 目标高度
+
+        Returns:
+            缩放后的图像（可能与缓存层级共享内存，调用方不应原地修改）
+        """
+        cached = self._resized.get((width, height))
+        if cached is not None:
+            return cached
+
+        base = self.level(self.factor_for_size(width, height))
+        if base.shape[1] == width and base.shape[0] == height:
+            return base
+        resized = cv2.resize(base, (width, height), interpolation=cv2.INTER_AREA)
+        self._resized[(width, height)] = resized
+        return resized
+
+    def fit(self, max_size: int) -> np.ndarray:
+        """
+        缩放到长边不超过 max_size（保持比例），原图更小时直接返回原图
+
+        Args:
+            max_size: 长边上限
+
+        Returns:
+            缩放后的图像
+        """
+        h, w = self.image.shape[:2]
+        if max(h, w) <= max_size:
+            return self.image
+        scale = max_size / max(h, w)
+        return self.resize_to(max(int(w * scale), 1), max(int(h * scale), 1))
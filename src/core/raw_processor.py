@@ -5,16 +5,20 @@ RAW 图像处理模块
 """
 
 from utils.logger import setup_logger
+from utils import profiling
 
 logger = setup_logger(__name__)
 
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from pathlib import Path
 import numpy as np
 import rawpy
 import tifffile
 from PIL import Image, ImageOps, UnidentifiedImageError
 
+from .metadata_service import get_metadata_service
+from .pyramid import ImagePyramid
+
 
 class RawProcessor:
     """RAW 文件处理器 - 支持 RAW、TIFF、JPG 格式"""
@@ -161,14 +165,17 @@ class RawProcessor:
 
         # 如果是 RAW 格式，使用 rawpy 处理（始终使用相机白平衡）
         if suffix in self.SUPPORTED_RAW_FORMATS:
-            rgb = self._process_raw(raw_path)
+            with profiling.stage("decode.raw"):
+                rgb = self._process_raw(raw_path)
         elif suffix in self.TIFF_FORMATS:
-            rgb = self._process_tiff(raw_path, apply_exif_rotation=apply_exif_rotation)
+            with profiling.stage("decode.tiff"):
+                rgb = self._process_tiff(raw_path, apply_exif_rotation=apply_exif_rotation)
         else:
-            rgb = self._process_standard_image(
-                raw_path,
-                apply_exif_rotation=apply_exif_rotation,
-            )
+            with profiling.stage("decode.image"):
+                rgb = self._process_standard_image(
+                    raw_path,
+                    apply_exif_rotation=apply_exif_rotation,
+                )
 
         # 应用手动旋转（顺时针，整批统一）
         if rotation:
@@ -305,16 +312,23 @@ class RawProcessor:
         self, raw_path: Path, max_size: int = 512
     ) -> Optional[np.ndarray]:
         """
-        获取 RAW 文件的缩略图
+        获取图片文件的缩略图（8-bit RGB）
+
+        RAW 优先取内嵌 JPEG，没有时半尺寸解码；JPEG 用 draft 模式按比例解码；
+        TIFF 读取后从图像金字塔取缩小层。
 
         Args:
-            raw_path: RAW 文件路径
+            raw_path: 文件路径
             max_size: 缩略图最大尺寸
 
         Returns:
             缩略图数组或 None
         """
+        suffix = raw_path.suffix.lower()
         try:
+            if suffix not in self.SUPPORTED_RAW_FORMATS:
+                return self._image_thumbnail(raw_path, max_size)
+
             with rawpy.imread(str(raw_path)) as raw:
                 # 尝试提取嵌入的 JPEG 缩略图
                 try:
@@ -324,8 +338,9 @@ class RawProcessor:
                         from io import BytesIO
 
                         img = Image.open(BytesIO(thumb.data))
+                        img.draft("RGB", (max_size, max_size))
                         img.thumbnail((max_size, max_size), Image.LANCZOS)
-                        return np.array(img)
+                        return np.array(img.convert("RGB"))
                 except rawpy.LibRawError:
                     pass
 
@@ -343,29 +358,95 @@ class RawProcessor:
             logger.info(f"获取缩略图失败: {e}")
             return None
 
-    def get_metadata(self, raw_path: Path) -> Dict[str, Any]:
+    def _image_thumbnail(self, path: Path, max_size: int) -> np.ndarray:
+        """非 RAW 文件的缩略图"""
+        if path.suffix.lower() in self.TIFF_FORMATS:
+            rgb = ImagePyramid(self._process_tiff(path)).fit(max_size)
+            if rgb.dtype == np.uint16:
+                return (rgb >> 8).astype(np.uint8)
+            return rgb
+        with Image.open(path) as img:
+            # JPEG 在解码时按 1/2、1/4、1/8 缩小，比解码全尺寸再缩放快得多
+            img.draft("RGB", (max_size, max_size))
+            img = img.convert("RGB")
+            img.thumbnail((max_size, max_size), Image.LANCZOS)
+            return np.array(img)
+
+    @staticmethod
+    def get_image_size(file_path: Path) -> Optional[Tuple[int, int]]:
         """
-        获取 RAW 文件的元数据
+        只读文件头获取图像尺寸（RAW 不解包）
 
         Args:
-            raw_path: RAW 文件路径
+            file_path: 文件路径
 
         Returns:
-            包含元数据的字典
+            (宽, 高)，无法读取时返回 None
         """
-        metadata = {}
+        suffix = file_path.suffix.lower()
         try:
-            with rawpy.imread(str(raw_path)) as raw:
-                metadata["camera"] = raw.camera_model
-                metadata["iso"] = raw.camera_iso
-                metadata["shutter_speed"] = raw.camera_shutter_speed
-                metadata["aperture"] = raw.camera_aperture
-                metadata["focal_length"] = raw.camera_focal_length
-                metadata["width"] = raw.sizes.width
-                metadata["height"] = raw.sizes.height
+            if suffix in RawProcessor.SUPPORTED_RAW_FORMATS:
+                with rawpy.imread(str(file_path)) as raw:
+                    return raw.sizes.width, raw.sizes.height
+            if suffix in RawProcessor.TIFF_FORMATS:
+                with tifffile.TiffFile(str(file_path)) as tif:
+                    shape = tif.pages[0].shape
+                    return shape[1], shape[0]
+            with Image.open(file_path) as img:
+                return img.size
+        except Exception as e:
+            logger.debug(f"读取尺寸失败: {file_path.name} ({e})")
+            return None
+
+    @staticmethod
+    def get_orientation(file_path: Path) -> int:
+        """
+        只读文件头获取方向标记（RAW 为 LibRaw 的 flip 值，其他格式为 EXIF Orientation）
+
+        Args:
+            file_path: 文件路径
+
+        Returns:
+            方向标记，没有或无法读取时返回 0
+        """
+        suffix = file_path.suffix.lower()
+        try:
+            if suffix in RawProcessor.SUPPORTED_RAW_FORMATS:
+                with rawpy.imread(str(file_path)) as raw:
+                    return int(raw.sizes.flip)
+            with Image.open(file_path) as img:
+                return int(img.getexif().get(274) or 0)
         except Exception as e:
-            logger.info(f"读取元数据失败: {e}")
+            logger.debug(f"读取方向失败: {file_path.name} ({e})")
+            return 0
 
+    def get_metadata(self, raw_path: Path) -> Dict[str, Any]:
+        """
+        获取图片文件的元数据
+
+        EXIF 字段来自元数据服务（只读文件头，结果按 路径+修改时间+大小 缓存），
+        尺寸从文件头读取，不解码图像。
+
+        Args:
+            raw_path: 文件路径
+
+        Returns:
+            包含元数据的字典
+        """
+        raw_path = Path(raw_path)
+        info = get_metadata_service().get(raw_path)
+        metadata = {
+            "camera": info.camera,
+            "lens": info.lens,
+            "iso": info.iso,
+            "shutter_speed": info.exposure,
+            "aperture": info.aperture,
+            "focal_length": info.focal_length,
+            "captured": info.captured,
+        }
+        size = self.get_image_size(raw_path)
+        if size is not None:
+            metadata["width"], metadata["height"] = size
         return metadata
 
 
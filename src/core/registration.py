@@ -0,0 +1,336 @@
+"""
+帧配准模块
+
+修正三脚架在整夜拍摄中的缓慢漂移（下沉、热胀冷缩、被风推动），
+避免 AVERAGE 模式下地景发虚。
+
+工作原理
+--------
+- 在金字塔 1/4 层的亮度图上做 FFT 相位相关（cv2.phaseCorrelate），估计每帧相对参考帧的亚像素平移。
+  地平线和地景在整夜保持不动；星空相对参考帧随时间绕天极旋转，不会形成一致的相关峰，
+  所以估计的是相机漂移，不会把星空的周日运动“对齐”掉。
+- rigid 模式下左右两半分别做相位相关，由两侧垂直位移之差得到小角度旋转，
+  反向旋转后再对整幅做一次相位相关得到平移。
+- 参考帧为第一张成功解码的帧；各帧只与参考帧比较，可以在预取线程中并行估计。
+- 变换按分块在线程池中 warpAffine，结果按 参考帧 + 文件 缓存在
+  ~/.superstartrail/registration_index.json，重复处理同一批文件时跳过估计。
+- 相关峰响应过低或位移过大时视为不可靠，该帧不做变换。
+"""
+
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+from .pyramid import ImagePyramid
+from utils import profiling
+from utils.file_index import FileIndex
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+INDEX_VERSION = 1
+
+
+def _dft_size(n: int) -> int:
+    """
+    不超过 n 的偶数最优 DFT 尺寸
+
+    phaseCorrelate 会把输入补零到 getOptimalDFTSize，补到奇数尺寸时结果多出半个像素的偏移，
+    所以估计用的平面先裁到偶数的最优尺寸
+    """
+    for size in range(n - n % 2, 1, -2):
+        if cv2.getOptimalDFTSize(size) == size:
+            return size
+    return n
+
+
+class Transform:
+    """单帧相对参考帧的刚体变换（全分辨率像素）"""
+
+    __slots__ = ("dx", "dy", "angle", "response", "reliable")
+
+    def __init__(
+        self,
+        dx: float = 0.0,
+        dy: float = 0.0,
+        angle: float = 0.0,
+        response: float = 1.0,
+        reliable: bool = True,
+    ):
+        self.dx = dx  # 该帧相对参考帧的平移（像素）
+        self.dy = dy
+        self.angle = angle  # 绕画面中心的旋转（度，逆时针为正）
+        self.response = response  # 相位相关峰响应（0-1）
+        self.reliable = reliable
+
+    @property
+    def is_identity(self) -> bool:
+        """位移小于 0.05 像素且几乎无旋转时不需要变换"""
+        if not self.reliable:
+            return True
+        return abs(self.dx) < 0.05 and abs(self.dy) < 0.05 and abs(self.angle) < 1e-3
+
+    def matrix(self, shape: Tuple[int, ...]) -> np.ndarray:
+        """参考帧坐标 → 该帧坐标的 2x3 仿射矩阵"""
+        h, w = shape[:2]
+        matrix = cv2.getRotationMatrix2D(((w - 1) / 2.0, (h - 1) / 2.0), self.angle, 1.0)
+        matrix[0, 2] += self.dx
+        matrix[1, 2] += self.dy
+        return matrix
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Transform":
+        return cls(**{name: data[name] for name in cls.__slots__})
+
+    def __repr__(self) -> str:
+        return (
+            f"Transform(dx={self.dx:.2f}, dy={self.dy:.2f}, "
+            f"angle={self.angle:.4f}°, response={self.response:.2f})"
+        )
+
+
+class FrameRegistrar:
+    """
+    相位相关帧配准器（线程安全，可在多个预取线程中同时调用 align）
+
+    Parameters
+    ----------
+    mode : str
+        'translation'（仅平移）或 'rigid'（平移 + 小角度旋转）
+    factor : int
+        估计所在的金字塔层级（缩小倍数，2 的幂）
+    min_response : float
+        相位相关峰响应下限，低于此值视为不可靠
+    max_shift : float
+        最大可信位移（占画面短边的比例）
+    workers : int
+        分块变换线程数
+    index_path : Path, optional
+        变换缓存路径；None 使用 ~/.superstartrail/registration_index.json
+    cache_tag : str
+        影响几何的额外参数（如手动旋转角度），不同取值的缓存互不复用
+    """
+
+    MODES = ("translation", "rigid")
+
+    def __init__(
+        self,
+        mode: str = "translation",
+        factor: int = 4,
+        min_response: float = 0.05,
+        max_shift: float = 0.1,
+        workers: int = 4,
+        index_path: Optional[Path] = None,
+        cache_tag: str = "",
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的对齐模式: {mode}，有效值为 {', '.join(self.MODES)}")
+        self.mode = mode
+        self.factor = factor
+        self.min_response = min_response
+        self.max_shift = max_shift
+        self.workers = max(int(workers), 1)
+        self.cache_tag = cache_tag
+        if index_path is None:
+            index_path = Path.home() / ".superstartrail" / "registration_index.json"
+        self.index = FileIndex(index_path, INDEX_VERSION)
+
+        self._pool = (
+            ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sst-warp")
+            if self.workers > 1 else None
+        )
+        self._cond = threading.Condition()
+        self._candidate = 0  # 下一个可成为参考帧的索引
+        self._skipped: Set[int] = set()
+        self._reference: Optional[Dict[str, np.ndarray]] = None
+        self._reference_key: Optional[str] = None
+        self.reference_path: Optional[Path] = None
+        self.cache_hits = 0
+        self.unreliable = 0
+
+    # ── 参考帧 ────────────────────────────────────────────────────────────
+
+    def _planes(self, pyramid: ImagePyramid) -> Dict[str, np.ndarray]:
+        """估计用的浮点亮度平面：去掉大尺度渐变（光污染、月光），只保留地景结构"""
+        gray = pyramid.luminance8(self.factor).astype(np.float32)
+        gray -= cv2.GaussianBlur(gray, (0, 0), 8)
+        h, w = gray.shape
+        gray = np.ascontiguousarray(gray[: _dft_size(h), : _dft_size(w)])
+        planes = {"full": gray}
+        if self.mode == "rigid":
+            half = _dft_size(gray.shape[1] // 2)
+            planes["left"] = np.ascontiguousarray(gray[:, :half])
+            planes["right"] = np.ascontiguousarray(gray[:, gray.shape[1] - half:])
+        return planes
+
+    def _wait_reference(self, index: int, path: Path, pyramid: ImagePyramid) -> bool:
+        """
+        等待参考帧就绪；轮到自己时把本帧设为参考帧
+
+        Returns:
+            本帧是否为参考帧
+        """
+        with self._cond:
+            while self._reference is None:
+                if index == self._candidate:
+                    self._reference = self._planes(pyramid)
+                    self.reference_path = path
+                    stat = os.stat(path)
+                    self._reference_key = (
+                        f"{os.path.abspath(path)}|{stat.st_mtime}|{stat.st_size}|"
+                        f"{self.mode}|{self.factor}|{self.cache_tag}"
+                    )
+                    self._cond.notify_all()
+                    return True
+                self._cond.wait()
+            return False
+
+    def skip(self, index: int) -> None:
+        """某帧解码失败：不能作为参考帧，轮到它时交给下一帧"""
+        with self._cond:
+            self._skipped.add(index)
+            while self._candidate in self._skipped:
+                self._candidate += 1
+            self._cond.notify_all()
+
+    # ── 估计 ──────────────────────────────────────────────────────────────
+
+    def _correlate(self, reference: np.ndarray, current: np.ndarray) -> Tuple[float, float, float]:
+        window = cv2.createHanningWindow(current.shape[::-1], cv2.CV_32F)
+        (dx, dy), response = cv2.phaseCorrelate(reference, current, window)
+        return dx, dy, response
+
+    def estimate(self, pyramid: ImagePyramid) -> Transform:
+        """
+        估计一帧相对参考帧的变换（需先确定参考帧）
+
+        Args:
+            pyramid: 该帧的图像金字塔
+
+        Returns:
+            Transform（全分辨率像素）；不可靠时 reliable=False
+        """
+        planes = self._planes(pyramid)
+        current = planes["full"]
+        h, w = current.shape
+        angle = 0.0
+        if self.mode == "rigid":
+            half = _dft_size(w // 2)
+            _, dy_left, response_left = self._correlate(
+                self._reference["left"], np.ascontiguousarray(current[:, :half])
+            )
+            _, dy_right, response_right = self._correlate(
+                self._reference["right"], np.ascontiguousarray(current[:, w - half:])
+            )
+            # 左右两半中心相距半个画面宽；右侧相对左侧上移对应逆时针（正角度）
+            angle = -math.degrees(math.asin(max(-1.0, min(1.0, (dy_right - dy_left) / (w - half)))))
+            # 反向旋转后整幅只剩平移
+            rotation = cv2.getRotationMatrix2D(((w - 1) / 2.0, (h - 1) / 2.0), angle, 1.0)
+            current = cv2.warpAffine(
+                current, rotation, (w, h), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                borderMode=cv2.BORDER_REPLICATE,
+            )
+
+        dx, dy, response = self._correlate(self._reference["full"], current)
+        if self.mode == "rigid":
+            # 测得的是反向旋转坐标系中的平移，转回该帧坐标系
+            dx, dy = rotation[:, :2] @ np.array([dx, dy])
+            response = min(response, response_left, response_right)
+
+        limit = self.max_shift * min(h, w)
+        reliable = response >= self.min_response and abs(dx) <= limit and abs(dy) <= limit
+        return Transform(
+            float(dx) * self.factor, float(dy) * self.factor, angle, float(response), reliable
+        )
+
+    # ── 变换 ──────────────────────────────────────────────────────────────
+
+    def warp(self, image: np.ndarray, transform: Transform) -> np.ndarray:
+        """
+        把一帧变换到参考帧坐标系（分块并行 warpAffine）
+
+        Args:
+            image: 全分辨率图像
+            transform: estimate 的结果
+
+        Returns:
+            对齐后的图像；不需要变换时直接返回原图
+        """
+        if transform.is_identity:
+            return image
+        h, w = image.shape[:2]
+        matrix = transform.matrix(image.shape)
+        flags = cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+        if self._pool is None or h < 256:
+            return cv2.warpAffine(
+                image, matrix, (w, h), flags=flags, borderMode=cv2.BORDER_REPLICATE
+            )
+
+        out = np.empty_like(image)
+        band = -(-h // self.workers)
+
+        def warp_band(y0: int) -> None:
+            y1 = min(y0 + band, h)
+            # 输出第 y 行对应整幅输出的第 y0 + y 行
+            band_matrix = matrix.copy()
+            band_matrix[:, 2] += matrix[:, 1] * y0
+            out[y0:y1] = cv2.warpAffine(
+                image, band_matrix, (w, y1 - y0), flags=flags, borderMode=cv2.BORDER_REPLICATE
+            )
+
+        list(self._pool.map(warp_band, range(0, h, band)))
+        return out
+
+    def align(self, index: int, path: Path, pyramid: ImagePyramid) -> Tuple[np.ndarray, Transform]:
+        """
+        对齐一帧：参考帧原样返回，其余帧估计（或读取缓存的）变换后 warp
+
+        Args:
+            index: 帧在序列中的索引
+            path: 文件路径（缓存键）
+            pyramid: 该帧的图像金字塔（image 为全分辨率图像）
+
+        Returns:
+            (对齐后的图像, 变换)
+        """
+        if self._wait_reference(index, path, pyramid):
+            return pyramid.image, Transform()
+
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        cached = self.index.lookup(key, stat)
+        if cached is not None and cached.get("ref") == self._reference_key:
+            transform = Transform.from_dict(cached["transform"])
+            with self._cond:
+                self.cache_hits += 1
+        else:
+            with profiling.stage("align.estimate"):
+                transform = self.estimate(pyramid)
+            self.index.store(
+                key, stat, {"ref": self._reference_key, "transform": transform.to_dict()}
+            )
+
+        if not transform.reliable:
+            with self._cond:
+                self.unreliable += 1
+            profiling.count("align.unreliable")
+            logger.debug(f"{path.name}: 对齐不可靠（{transform}），保持原样")
+            return pyramid.image, transform
+
+        with profiling.stage("align.warp"):
+            return self.warp(pyramid.image, transform), transform
+
+    def close(self) -> None:
+        """保存变换缓存并关闭线程池"""
+        self.index.save()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
@@ -9,6 +9,13 @@
 对每帧图像单独检测长直亮线（霍夫直线变换），生成像素遮罩后再堆栈，
 被遮罩的像素在 Lighten/Comet 堆栈中跳过更新，从而消除划痕。
 
+检测模式
+--------
+- spatial（默认）：单帧亮度百分位阈值 + 霍夫直线
+- temporal：与前几帧的低分辨率滑动中值参考帧做差，只对残差阈值化后
+  再做霍夫直线。恒星/地景在相邻帧间几乎不变，残差大多为空，
+  因此霍夫变换更快，也能检出被银河背景淹没的暗弱划痕。
+
 适用范围
 --------
 - ✅ 卫星（ISS、各类低轨道卫星）
@@ -18,17 +25,154 @@
 - ❌ 无法去除云层（形状不规则）
 """
 
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Sequence, Tuple
 import numpy as np
 import cv2
+from .pyramid import ImagePyramid
 from utils.logger import setup_logger
+from utils import profiling
 
 logger = setup_logger(__name__)
 
 
+# 线段格式：(x1, y1, x2, y2, thickness)，均为全分辨率像素
+Segment = Tuple[int, int, int, int, int]
+
+
+class StreakMask:
+    """
+    稀疏划痕遮罩
+
+    大多数帧没有划痕或只有一条，用全分辨率 bool 数组表示既浪费内存，
+    又迫使堆栈引擎对整帧做 np.where。这里只保存线段端点和线宽，
+    需要时按图块（tile）栅格化，只触及划痕经过的少量图块。
+
+    Parameters
+    ----------
+    shape : tuple
+        对应图像的 (H, W)
+    segments : sequence of (x1, y1, x2, y2, thickness)
+        全分辨率坐标下的线段及线宽
+    tile_size : int
+        栅格化图块边长（像素），默认 256
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, int],
+        segments: Optional[Sequence[Segment]] = None,
+        tile_size: int = 256,
+    ):
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.segments: List[Segment] = [tuple(int(v) for v in seg) for seg in (segments or [])]
+        self.tile_size = tile_size
+        self._tiles: Optional[List[Tuple[slice, slice, np.ndarray]]] = None
+
+    def any(self) -> bool:
+        """是否存在划痕"""
+        return bool(self.segments)
+
+    def sum(self) -> int:
+        """被遮罩的像素总数"""
+        return int(sum(int(np.count_nonzero(sub)) for _, _, sub in self.tiles()))
+
+    def _candidate_tiles(self) -> np.ndarray:
+        """在图块网格上画粗线，得到可能与划痕相交的图块"""
+        h, w = self.shape
+        ts = self.tile_size
+        grid = np.zeros(((h + ts - 1) // ts, (w + ts - 1) // ts), dtype=np.uint8)
+        for x1, y1, x2, y2, thickness in self.segments:
+            # 线宽换算到网格单位后向上取整，再加 1 格余量覆盖边界
+            grid_thickness = int(np.ceil(thickness / ts)) + 2
+            cv2.line(grid, (x1 // ts, y1 // ts), (x2 // ts, y2 // ts), 1, grid_thickness)
+        return np.argwhere(grid > 0)
+
+    @staticmethod
+    def _segment_coverage(px: np.ndarray, py: np.ndarray, segment: Segment) -> np.ndarray:
+        """像素中心到线段的距离不超过半线宽即视为被覆盖（与图块划分无关）"""
+        x1, y1, x2, y2, thickness = segment
+        dx, dy = float(x2 - x1), float(y2 - y1)
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            t = np.zeros((1, 1), dtype=np.float32)
+        else:
+            t = np.clip(((px - x1) * dx + (py - y1) * dy) / length_sq, 0.0, 1.0)
+        dist_sq = (px - (x1 + t * dx)) ** 2 + (py - (y1 + t * dy)) ** 2
+        return dist_sq <= (thickness / 2.0) ** 2
+
+    def tiles(self) -> Iterator[Tuple[slice, slice, np.ndarray]]:
+        """
+        遍历受划痕影响的图块
+
+        Yields
+        ------
+        (row_slice, col_slice, sub_mask)
+            图块在全图中的位置，以及该图块内的 bool 遮罩
+        """
+        if self._tiles is None:
+            self._tiles = []
+            h, w = self.shape
+            ts = self.tile_size
+            for ty, tx in (self._candidate_tiles() if self.segments else []):
+                y0, x0 = int(ty) * ts, int(tx) * ts
+                y1, x1 = min(y0 + ts, h), min(x0 + ts, w)
+                py = np.arange(y0, y1, dtype=np.float32)[:, np.newaxis]
+                px = np.arange(x0, x1, dtype=np.float32)[np.newaxis, :]
+                sub = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+                for segment in self.segments:
+                    sub |= self._segment_coverage(px, py, segment)
+                if sub.any():
+                    self._tiles.append((slice(y0, y1), slice(x0, x1), sub))
+        return iter(self._tiles)
+
+    def scaled(self, shape: Tuple[int, int]) -> "StreakMask":
+        """
+        换算到另一分辨率（如延时视频累加器）下的划痕遮罩
+
+        像素中心按 (x + 0.5) * s - 0.5 映射，线宽按较大的缩放比换算并向上取整，
+        保证缩小后仍完整覆盖划痕。
+
+        Args:
+            shape: 目标 (H, W)
+
+        Returns:
+            新的 StreakMask
+        """
+        sy = shape[0] / self.shape[0]
+        sx = shape[1] / self.shape[1]
+        scale = max(sx, sy)
+
+        def map_x(x: int) -> int:
+            return int(round((x + 0.5) * sx - 0.5))
+
+        def map_y(y: int) -> int:
+            return int(round((y + 0.5) * sy - 0.5))
+
+        segments = [
+            (map_x(x1), map_y(y1), map_x(x2), map_y(y2), max(int(np.ceil(t * scale)) + 1, 2))
+            for x1, y1, x2, y2, t in self.segments
+        ]
+        return StreakMask(shape, segments, tile_size=self.tile_size)
+
+    def to_dense(self) -> np.ndarray:
+        """展开为全分辨率 bool 遮罩 (H, W)"""
+        dense = np.zeros(self.shape, dtype=bool)
+        for ys, xs, sub in self.tiles():
+            dense[ys, xs] = sub
+        return dense
+
+
 class SatelliteFilter:
     """
     卫星/飞机划痕检测器
 
+    spatial 模式采用两级（多分辨率）检测：
+    1. 在 1/16 分辨率（由 1/4 亮度层最大值池化得到，细线不会被平均掉）
+       上做霍夫直线，得到候选线段；亮像素少，霍夫代价低
+    2. 对每条候选线，只在沿线的窄带内回到 1/4 分辨率细化：
+       校正角度和位置、测量端点和实际线宽，过滤掉粗检测的误报
+
     Parameters
     ----------
     min_streak_fraction : float
@@ -37,21 +181,62 @@ class SatelliteFilter:
     brightness_percentile : float
         亮度阈值百分位数，高于此百分位才参与检测，默认 97.0
         避免把普通背景噪点误检为划痕
-    mask_thickness : int
-        遮罩线宽（全分辨率像素），需覆盖划痕实际宽度，默认 24px
+    mask_thickness : int, optional
+        遮罩线宽下限（全分辨率像素）。默认 None：完全按实测划痕宽度生成遮罩
+    mode : str
+        检测模式，'spatial'（单帧）或 'temporal'（与前几帧差分），默认 'spatial'
+    history : int
+        temporal 模式下参与滑动中值参考帧的历史帧数，默认 3
     """
 
+    MODES = ("spatial", "temporal")
+
+    # temporal 模式残差阈值的绝对下限（8-bit 灰度级）
+    _TEMPORAL_MIN_DELTA = 12.0
+
+    # 细化所在层级（相对全分辨率的缩小倍数）
+    _FINE_SCALE = 4
+    # 细化层 → 粗检测层的最大值池化倍数（1/4 → 1/16）
+    _COARSE_POOL = 4
+    # 粗检测层短边低于此值时，直接在细化层上检测候选线
+    _MIN_COARSE_DIM = 96
+    # 沿线窄带的半宽（细化层像素）：先宽带校正角度，再窄带测量
+    # 窄带需明显宽于划痕本身（逐列中值才能代表背景），可覆盖约 60px 宽的划痕
+    _SEARCH_HALF_BAND = 24
+    _MEASURE_HALF_BAND = 16
+    # 拟合中心线时的列分块宽度（细化层像素）
+    _FIT_BLOCK = 16
+
     def __init__(
         self,
         min_streak_fraction: float = 0.15,
         brightness_percentile: float = 97.0,
-        mask_thickness: int = 24,
+        mask_thickness: Optional[int] = None,
+        mode: str = "spatial",
+        history: int = 3,
     ):
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的划痕检测模式: {mode}，有效值为 {', '.join(self.MODES)}")
         self.min_streak_fraction = min_streak_fraction
         self.brightness_percentile = brightness_percentile
         self.mask_thickness = mask_thickness
+        self.mode = mode
+        self._history: Deque[np.ndarray] = deque(maxlen=max(int(history), 1))
+
+    @property
+    def is_stateful(self) -> bool:
+        """检测结果是否依赖之前的帧（temporal 模式必须按帧顺序调用）"""
+        return self.mode == "temporal"
 
-    def detect_streaks(self, image: np.ndarray) -> np.ndarray:
+    def reset(self) -> None:
+        """清空 temporal 模式的历史参考帧"""
+        self._history.clear()
+
+    def detect_streaks(
+        self,
+        image: np.ndarray,
+        pyramid: Optional[ImagePyramid] = None,
+    ) -> "StreakMask":
         """
         检测单帧中的卫星/飞机划痕，返回像素遮罩
 
@@ -59,41 +244,130 @@ class SatelliteFilter:
         ----------
         image : np.ndarray
             输入图像 (H, W, 3)，uint16 或 uint8
+        pyramid : ImagePyramid, optional
+            该帧共享的图像金字塔；提供时直接读取 1/4 分辨率亮度层，
+            不再对全分辨率图像做位深转换和灰度转换
 
         Returns
         -------
-        np.ndarray
-            bool 类型遮罩 (H, W)，True = 该像素属于划痕
+        StreakMask
+            稀疏划痕遮罩（线段 + 实测线宽），可通过 tiles() 只访问受影响的图块
         """
         h, w = image.shape[:2]
 
-        # ── Step 1: 降采样到 1/4 分辨率，加速后续运算 ──────────────────────
-        scale = 4
-        small_w, small_h = max(w // scale, 1), max(h // scale, 1)
+        # ── Step 1: 从金字塔取 1/4 分辨率 8-bit 灰度图 ────────────────────
+        scale = self._FINE_SCALE
+        if pyramid is None:
+            pyramid = ImagePyramid(image)
+        small = pyramid.luminance8(scale)
 
-        # 转换为 8-bit 灰度
-        if image.dtype == np.uint16:
-            img_8bit = (image >> 8).astype(np.uint8)
-        else:
-            img_8bit = image.astype(np.uint8)
+        # ── Step 2: 候选线段 ────────────────────────────────────────────────
+        with profiling.stage("satellite.candidates"):
+            if self.mode == "temporal" and self._history:
+                # temporal：残差图上直接检测，细化也在残差图上进行
+                signal = self._residual(small)
+                candidates = self._hough_candidates(self._threshold_residual(signal), 1)
+            else:
+                # spatial，或 temporal 模式的第一帧（尚无参考帧）
+                signal = small
+                candidates = self._coarse_candidates(small)
+        if self.mode == "temporal":
+            self._history.append(small)
+
+        # ── Step 3: 沿候选线窄带细化端点与线宽，剔除误报和重复线段 ─────────
+        with profiling.stage("satellite.refine"):
+            refined = [seg for seg in (self._refine_segment(signal, c) for c in candidates) if seg]
+            refined = self._dedupe(refined)
+
+        if not refined:
+            return StreakMask((h, w))
+        profiling.count("satellite.streak_frames")
+
+        # ── Step 4: 映射回全分辨率坐标 ─────────────────────────────────────
+        # 只记录线段端点和线宽，不生成全分辨率 bool 遮罩
+        offset = (scale - 1) / 2.0  # 缩小图像素中心对应的全分辨率位置
+        min_thickness = max(self.mask_thickness or 0, 2 * scale)
+        segments = [
+            (
+                int(round(x1 * scale + offset)),
+                int(round(y1 * scale + offset)),
+                int(round(x2 * scale + offset)),
+                int(round(y2 * scale + offset)),
+                max(int(round(width * scale)), min_thickness),
+            )
+            for x1, y1, x2, y2, width in refined
+        ]
+        streaks = StreakMask((h, w), segments)
+
+        n_masked_pixels = streaks.sum()
+        coverage = n_masked_pixels / (h * w) * 100
+        logger.info(
+            f"🛸 检测到 {len(segments)} 条划痕，遮罩 {n_masked_pixels:,} 像素 ({coverage:.2f}% 画面)"
+        )
 
-        gray = cv2.cvtColor(img_8bit, cv2.COLOR_RGB2GRAY) if img_8bit.ndim == 3 else img_8bit
-        small = cv2.resize(gray, (small_w, small_h), interpolation=cv2.INTER_AREA)
+        return streaks
 
-        # ── Step 2: 亮度阈值，只分析足够亮的区域 ───────────────────────────
+    # ── 阈值化 ──────────────────────────────────────────────────────────────
+    def _threshold_brightness(self, small: np.ndarray) -> np.ndarray:
+        """单帧亮度百分位阈值"""
         thresh_val = float(np.percentile(small, self.brightness_percentile))
         thresh_val = max(thresh_val, 20.0)  # 绝对下限，避免噪点全通过
         _, bright = cv2.threshold(small, thresh_val, 255, cv2.THRESH_BINARY)
+        return bright
 
+    def _residual(self, small: np.ndarray) -> np.ndarray:
+        """与历史帧滑动中值参考帧做差"""
+        if len(self._history) == 1:
+            reference = self._history[0]
+        else:
+            reference = np.median(np.stack(self._history), axis=0).astype(np.uint8)
+
+        # 饱和减法：只关心新出现的亮线，上一帧的划痕（残差为负）自然被截断为 0
+        return cv2.subtract(small, reference)
+
+    def _threshold_residual(self, residual: np.ndarray) -> np.ndarray:
+        """残差阈值化，只保留明显变亮的像素"""
+        # 残差大多为零，用均值 + 4σ 估计噪声上限
+        mean, std = cv2.meanStdDev(residual)
+        thresh_val = max(float(mean[0][0] + 4.0 * std[0][0]), self._TEMPORAL_MIN_DELTA)
+        _, bright = cv2.threshold(residual, thresh_val, 255, cv2.THRESH_BINARY)
+        return bright
+
+    # ── 候选线段 ────────────────────────────────────────────────────────────
+    def _min_length(self, shape: Tuple[int, ...]) -> int:
+        """细化层上的最短有效划痕长度"""
+        return max(int(min(shape[:2]) * self.min_streak_fraction), 25)
+
+    def _coarse_candidates(self, small: np.ndarray) -> List[Tuple[float, float, float, float]]:
+        """在 1/16 分辨率（1/4 亮度层最大值池化）上找候选线段"""
+        pool = self._COARSE_POOL
+        sh, sw = small.shape[:2]
+        ch, cw = sh // pool, sw // pool
+        if min(ch, cw) < self._MIN_COARSE_DIM:
+            return self._hough_candidates(self._threshold_brightness(small), 1)
+
+        # 最大值池化：细划痕在粗层仍保持原亮度，不会像 INTER_AREA 那样被平均掉
+        coarse = small[: ch * pool, : cw * pool].reshape(ch, pool, cw, pool).max(axis=(1, 3))
+        return self._hough_candidates(self._threshold_brightness(coarse), pool)
+
+    def _hough_candidates(
+        self, bright: np.ndarray, factor: int
+    ) -> List[Tuple[float, float, float, float]]:
+        """
+        在二值图上做概率霍夫直线检测，返回细化层坐标下的候选线段
+
+        Args:
+            bright: 二值图（细化层缩小 factor 倍）
+            factor: bright 相对细化层的缩小倍数
+        """
         # 轻度膨胀连接相邻亮点（弥合闪光灯飞机的间隙）
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
         bright = cv2.dilate(bright, kernel, iterations=1)
 
-        # ── Step 3: Hough 概率直线变换 ──────────────────────────────────────
-        min_dim_small = min(small_w, small_h)
-        min_length = max(int(min_dim_small * self.min_streak_fraction), 25)
-        max_gap = max(int(min_length * 0.15), 8)  # 允许一定间隙（闪光灯飞机）
-        hough_threshold = max(int(min_length * 0.6), 20)
+        small_h, small_w = bright.shape[:2]
+        min_length = max(int(min(small_h, small_w) * self.min_streak_fraction), 25 // factor)
+        max_gap = max(int(min_length * 0.15), 8 // factor)  # 允许一定间隙（闪光灯飞机）
+        hough_threshold = max(int(min_length * 0.6), 20 // factor)
 
         lines = cv2.HoughLinesP(
             bright,
@@ -103,26 +377,154 @@ class SatelliteFilter:
             minLineLength=min_length,
             maxLineGap=max_gap,
         )
-
         if lines is None:
-            return np.zeros((h, w), dtype=bool)
+            return []
+
+        # 不同 OpenCV 版本返回 (N, 1, 4) 或 (N, 4)，统一展平
+        offset = (factor - 1) / 2.0
+        return [
+            tuple(float(v) * factor + offset for v in line)
+            for line in lines.reshape(-1, 4)
+        ]
 
-        # ── Step 4: 在缩小图上绘制遮罩 ──────────────────────────────────────
-        mask_small = np.zeros((small_h, small_w), dtype=np.uint8)
-        thickness_small = max(self.mask_thickness // scale, 2)
+    # ── 窄带细化 ────────────────────────────────────────────────────────────
+    @staticmethod
+    def _extract_strip(
+        signal: np.ndarray, origin: np.ndarray, direction: np.ndarray, length: float, half_band: int
+    ) -> np.ndarray:
+        """
+        把沿线窄带重采样为水平条带：条带坐标 (u, v) 对应
+        origin + u * direction + (v - half_band) * normal
+        """
+        normal = np.array([-direction[1], direction[0]])
+        matrix = np.array(
+            [
+                [direction[0], normal[0], origin[0] - half_band * normal[0]],
+                [direction[1], normal[1], origin[1] - half_band * normal[1]],
+            ],
+            dtype=np.float64,
+        )
+        size = (max(int(np.ceil(length)) + 1, 1), 2 * half_band + 1)
+        return cv2.warpAffine(
+            signal, matrix, size,
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
 
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            cv2.line(mask_small, (x1, y1), (x2, y2), 255, thickness_small)
+    @staticmethod
+    def _strip_bright(strip: np.ndarray) -> np.ndarray:
+        """条带内按局部背景 + 噪声阈值提取亮像素"""
+        values = strip.astype(np.float32)
+        # 逐列扣除背景：划痕可能横跨亮度差异很大的区域（银河、地景）
+        values -= np.median(values, axis=0, keepdims=True)
+        mad = float(np.median(np.abs(values)))
+        return values > max(4.0 * 1.4826 * mad, 8.0)
 
-        # ── Step 5: 放大回原始分辨率 ─────────────────────────────────────────
-        mask_full = cv2.resize(mask_small, (w, h), interpolation=cv2.INTER_NEAREST)
+    def _refine_segment(
+        self, signal: np.ndarray, candidate: Tuple[float, float, float, float]
+    ) -> Optional[Tuple[float, float, float, float, float]]:
+        """
+        在候选线附近的窄带内细化线段
 
-        n_streaks = len(lines)
-        n_masked_pixels = int(np.sum(mask_full > 0))
-        coverage = n_masked_pixels / (h * w) * 100
-        logger.info(
-            f"🛸 检测到 {n_streaks} 条划痕，遮罩 {n_masked_pixels:,} 像素 ({coverage:.2f}% 画面)"
-        )
+        Returns:
+            (x1, y1, x2, y2, width)，细化层坐标；不是连续亮线时返回 None
+        """
+        x1, y1, x2, y2 = candidate
+        p1, p2 = np.array([x1, y1]), np.array([x2, y2])
+        length = float(np.hypot(*(p2 - p1)))
+        if length < 2:
+            return None
+        direction = (p2 - p1) / length
+        normal = np.array([-direction[1], direction[0]])
+        min_length = self._min_length(signal.shape)
+
+        # 第一步：宽带内按列分块求亮像素中心，拟合直线以校正角度和横向偏移
+        hb = self._SEARCH_HALF_BAND
+        origin = p1 - hb * direction
+        strip = self._extract_strip(signal, origin, direction, length + 2 * hb, hb)
+        bright = self._strip_bright(strip)
+
+        centers_u, centers_v = [], []
+        for u0 in range(0, bright.shape[1], self._FIT_BLOCK):
+            rows, cols = np.nonzero(bright[:, u0:u0 + self._FIT_BLOCK])
+            if len(rows) >= 3:
+                centers_u.append(u0 + cols.mean())
+                centers_v.append(rows.mean())
+        if len(centers_u) < 3:
+            return None
+
+        us, vs = np.array(centers_u), np.array(centers_v)
+        slope, intercept = np.polyfit(us, vs, 1)
+        inliers = np.abs(vs - (slope * us + intercept)) <= 2.0
+        if inliers.sum() >= 3:
+            slope, intercept = np.polyfit(us[inliers], vs[inliers], 1)
+
+        # 校正后的直线（细化层坐标）
+        q1 = origin + (intercept - hb) * normal
+        q2 = origin + strip.shape[1] * direction + (slope * strip.shape[1] + intercept - hb) * normal
+        fitted_length = float(np.hypot(*(q2 - q1)))
+        direction = (q2 - q1) / fitted_length
+        normal = np.array([-direction[1], direction[0]])
+
+        # 第二步：窄带内按行占比确定线宽，按列确定端点
+        hb = self._MEASURE_HALF_BAND
+        strip = self._extract_strip(signal, q1, direction, fitted_length, hb)
+        bright = self._strip_bright(strip)
+
+        occupancy = bright.mean(axis=1)
+        peak = int(np.argmax(occupancy))
+        if occupancy[peak] < 0.15:
+            return None  # 不是连续亮线（零散星点）
+        lo = hi = peak
+        while lo > 0 and occupancy[lo - 1] >= 0.3 * occupancy[peak]:
+            lo -= 1
+        while hi < len(occupancy) - 1 and occupancy[hi + 1] >= 0.3 * occupancy[peak]:
+            hi += 1
+
+        hits = np.flatnonzero(bright[lo:hi + 1].any(axis=0))
+        if len(hits) == 0:
+            return None
+        # 按允许的最大间隙切分成若干段，取最长一段作为划痕
+        max_gap = max(int(min_length * 0.15), 8)
+        runs = np.split(hits, np.flatnonzero(np.diff(hits) > max_gap) + 1)
+        run = max(runs, key=lambda r: r[-1] - r[0])
+        if run[-1] - run[0] < min_length * 0.5:
+            return None
+
+        shift = (lo + hi) / 2.0 - hb
+        start = q1 + run[0] * direction + shift * normal
+        end = q1 + run[-1] * direction + shift * normal
+        # 实测宽度两侧各留 1 像素余量，覆盖星点扩散的边缘
+        width = float(hi - lo + 1 + 2)
+        return (float(start[0]), float(start[1]), float(end[0]), float(end[1]), width)
+
+    @staticmethod
+    def _dedupe(
+        segments: List[Tuple[float, float, float, float, float]]
+    ) -> List[Tuple[float, float, float, float, float]]:
+        """合并同一条划痕被霍夫检出的多条近似线段（保留最长的）"""
+        def seg_length(seg):
+            return float(np.hypot(seg[2] - seg[0], seg[3] - seg[1]))
 
-        return mask_full > 0
+        kept: List[Tuple[float, float, float, float, float]] = []
+        for seg in sorted(segments, key=seg_length, reverse=True):
+            p1, p2 = np.array(seg[:2]), np.array(seg[2:4])
+            duplicate = False
+            for other in kept:
+                o1, o2 = np.array(other[:2]), np.array(other[2:4])
+                o_len = seg_length(other)
+                o_dir = (o2 - o1) / o_len
+                o_normal = np.array([-o_dir[1], o_dir[0]])
+                tolerance = (seg[4] + other[4]) / 2.0 + 2.0
+                # 两端点都落在已保留线段的线宽带内，且投影在其范围内
+                near = all(
+                    abs(float(np.dot(p - o1, o_normal))) <= tolerance
+                    and -tolerance <= float(np.dot(p - o1, o_dir)) <= o_len + tolerance
+                    for p in (p1, p2)
+                )
+                if near:
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append(seg)
+        return kept
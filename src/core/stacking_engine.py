@@ -5,16 +5,20 @@
 """
 
 from enum import Enum
-from typing import List, Optional, Callable
+from typing import Iterator, List, Optional, Callable, Tuple
 from pathlib import Path
 import numpy as np
+import cv2
 from .cancellation import ProcessingCancelledError
+from .pyramid import ImagePyramid
+from .satellite_filter import StreakMask
 try:
     from numba import jit
 except (ImportError, OSError):
     def jit(*args, **kwargs):  # noqa: E306
         return (lambda f: f) if not args else args[0] if callable(args[0]) else (lambda f: f)
 from utils.logger import setup_logger
+from utils import profiling
 
 logger = setup_logger(__name__)
 
@@ -46,6 +50,9 @@ def _fast_maximum(a: np.ndarray, b: np.ndarray) -> np.ndarray:
 class StackingEngine:
     """图像堆栈引擎"""
 
+    # 双轨模式按行块选择堆栈算子的块高
+    DUAL_BLOCK_ROWS = 64
+
     def __init__(
         self,
         mode: StackMode = StackMode.LIGHTEN,
@@ -55,8 +62,14 @@ class StackingEngine:
         enable_timelapse: bool = False,
         timelapse_output_path: Optional[Path] = None,
         video_fps: int = 30,
+        video_quality: str = "high",
+        video_codec: str = "h264",
+        video_duration: Optional[float] = None,
+        video_interpolate: bool = False,
+        expected_frames: Optional[int] = None,
         sky_mask: Optional[np.ndarray] = None,
         fg_mode: StackMode = StackMode.AVERAGE,
+        timelapse_generator=None,
     ):
         """
         初始化堆栈引擎
@@ -69,32 +82,51 @@ class StackingEngine:
             gap_size: 要填充的最大间隔大小（像素）
             enable_timelapse: 是否生成延时视频
             timelapse_output_path: 延时视频输出路径
+            video_quality: 延时视频画质 ('high', 'medium', 'low')
+            video_codec: 延时视频编码 ('h264', 'h265')
+            video_duration: 延时视频目标时长（秒），None 表示每张输入输出一帧
+            video_interpolate: 帧数不足目标时长时是否插入交叉淡化帧
+            expected_frames: 预计输入张数，用于按目标时长计算抽帧间隔
             sky_mask: float32 蒙版 (H, W)，1.0=天空，0.0=地景；None 表示不使用蒙版
+            timelapse_generator: 外部创建的星轨延时生成器（如 TimelapseOutputs 的一路输出）；
+                                 提供时忽略 timelapse_output_path 等视频参数
         """
         self.mode = mode
         self.result: Optional[np.ndarray] = None
         self.count = 0
         self.comet_fade_factor = 0.98  # 彗星模式的衰减因子
 
-        # 双轨堆栈状态
+        # 双轨堆栈状态：天空和地景共用 result 一个累加器，按行块选用各自的算子
+        # （mask > 0 的像素走天空轨道，mask == 0 的走地景轨道）；
+        # 只有羽化边缘（0 < mask < 1）的像素额外保存一份地景轨道值，结果输出时再融合
         self.sky_mask: Optional[np.ndarray] = sky_mask  # (H, W) float32
-        self.sky_result: Optional[np.ndarray] = None    # 天空轨道
-        self.sky_count = 0                               # 天空/地景轨道独立计数器
         self.fg_mode: StackMode = fg_mode               # 地景堆栈模式
-        self.fg_result: Optional[np.ndarray] = None     # 地景轨道
+        self._dual_blocks: Optional[List[Tuple[int, int, object]]] = None  # (y0, y1, True/False/天空像素 bool)
+        self._edge_ys: Optional[np.ndarray] = None      # 羽化像素坐标（按行排序）
+        self._edge_xs: Optional[np.ndarray] = None
+        self._edge_alpha: Optional[np.ndarray] = None   # (K, 1) 羽化像素的蒙版值
+        self.fg_edge: Optional[np.ndarray] = None       # (K, C) 羽化像素的地景轨道
+        # 延时视频分辨率的累加器：与 result 同一堆栈算子，只用于生成星轨延时帧
+        self.timelapse_result: Optional[np.ndarray] = None
+        self.timelapse_count = 0
         self.enable_gap_filling = enable_gap_filling
         self.gap_filler = None
         self.gap_fill_method = gap_fill_method
         self.gap_size = gap_size
 
         # 延时视频生成器
-        self.enable_timelapse = enable_timelapse
-        self.timelapse_generator = None
-        if enable_timelapse and timelapse_output_path:
+        self.enable_timelapse = enable_timelapse or timelapse_generator is not None
+        self.timelapse_generator = timelapse_generator
+        if timelapse_generator is None and enable_timelapse and timelapse_output_path:
             from .timelapse_generator import TimelapseGenerator
             self.timelapse_generator = TimelapseGenerator(
                 output_path=timelapse_output_path,
                 fps=video_fps,
+                quality=video_quality,
+                codec=video_codec,
+                target_duration=video_duration,
+                expected_frames=expected_frames,
+                interpolate=video_interpolate,
             )
 
         # 如果启用间隔填充，初始化填充器
@@ -110,16 +142,194 @@ class StackingEngine:
     def reset(self):
         """重置引擎状态"""
         self.result = None
-        self.sky_result = None
-        self.fg_result = None
         self.count = 0
-        self.sky_count = 0
+        self._dual_blocks = None
+        self._edge_ys = self._edge_xs = self._edge_alpha = None
+        self.fg_edge = None
+        self.timelapse_result = None
+        self.timelapse_count = 0
+
+    @staticmethod
+    def _mask_regions(satellite_mask) -> List[Tuple[slice, slice, np.ndarray]]:
+        """
+        把划痕遮罩统一为 (行切片, 列切片, 图块内 bool 遮罩) 列表
+
+        StreakMask 只返回划痕经过的图块；稠密 bool 数组视为覆盖全图的单个图块。
+        """
+        if satellite_mask is None:
+            return []
+        if isinstance(satellite_mask, StreakMask):
+            return list(satellite_mask.tiles())
+        return [(slice(None), slice(None), np.asarray(satellite_mask, dtype=bool))]
+
+    @staticmethod
+    def _save_regions(accumulator: np.ndarray, regions) -> List[np.ndarray]:
+        """拷贝遮罩像素的当前值（布尔索引返回副本）"""
+        return [accumulator[ys, xs][sub] for ys, xs, sub in regions]
+
+    @staticmethod
+    def _restore_regions(accumulator: np.ndarray, regions, saved) -> None:
+        """把遮罩像素写回更新前的值"""
+        for (ys, xs, sub), values in zip(regions, saved):
+            accumulator[ys, xs][sub] = values
+
+    @staticmethod
+    def _scale_mask(satellite_mask, shape: Tuple[int, int]):
+        """把划痕遮罩换算到另一分辨率；稠密遮罩缩小后任何覆盖都算作遮罩"""
+        if satellite_mask is None:
+            return None
+        if isinstance(satellite_mask, StreakMask):
+            return satellite_mask.scaled(shape) if satellite_mask.any() else None
+        dense = np.asarray(satellite_mask, dtype=np.uint8)
+        return cv2.resize(dense, (shape[1], shape[0]), interpolation=cv2.INTER_AREA) > 0
+
+    def _combine(
+        self, accumulator: np.ndarray, img_float: np.ndarray, mode: StackMode, count: int
+    ) -> np.ndarray:
+        """
+        按堆栈模式把新图像合入累加器
+
+        Args:
+            accumulator: 当前累加结果
+            img_float: 新图像 (float32)
+            mode: 堆栈模式
+            count: 累加器中已有的图像数（AVERAGE 使用）
+
+        Returns:
+            新的累加结果
+        """
+        if mode == StackMode.LIGHTEN:
+            return _fast_maximum(accumulator, img_float)
+        if mode == StackMode.AVERAGE:
+            # 增量平均：new_avg = (old_avg * count + new_value) / (count + 1)
+            return (accumulator * count + img_float) / (count + 1)
+        # 彗星模式：当前结果衰减，新图像添加
+        return (
+            accumulator * self.comet_fade_factor
+            + img_float * (1 - self.comet_fade_factor)
+        )
+
+    @property
+    def dual(self) -> bool:
+        """是否处于蒙版双轨模式（已添加图像）"""
+        return self.sky_mask is not None and self._dual_blocks is not None
+
+    def _init_dual(self, img_float: np.ndarray) -> None:
+        """
+        第一帧时按蒙版划分行块并取出羽化像素
+
+        行块全部为天空或全部为地景时整块用一个算子；天空和地景算子相同时不需要区分，
+        也不需要保存羽化像素的地景轨道。
+        """
+        mask = self.sky_mask
+        if mask.shape != img_float.shape[:2]:
+            raise ValueError(
+                f"蒙版尺寸 {mask.shape} 与图像尺寸 {img_float.shape[:2]} 不匹配，"
+                f"请确保蒙版与输入图像分辨率一致"
+            )
+        same = self.fg_mode == self.mode
+        height = mask.shape[0]
+        blocks = []
+        for y0 in range(0, height, self.DUAL_BLOCK_ROWS):
+            y1 = min(y0 + self.DUAL_BLOCK_ROWS, height)
+            sky = mask[y0:y1] > 0
+            if same or sky.all():
+                blocks.append((y0, y1, True))
+            elif not sky.any():
+                blocks.append((y0, y1, False))
+            else:
+                blocks.append((y0, y1, sky[:, :, np.newaxis]))
+        self._dual_blocks = blocks
+
+        if same:
+            self._edge_ys = self._edge_xs = np.empty(0, dtype=np.intp)
+        else:
+            self._edge_ys, self._edge_xs = np.nonzero((mask > 0) & (mask < 1))
+        self._edge_alpha = mask[self._edge_ys, self._edge_xs][:, np.newaxis]
+        self.fg_edge = img_float[self._edge_ys, self._edge_xs]
+
+    def _edge_blocked(self, regions) -> np.ndarray:
+        """羽化像素中被划痕遮罩覆盖的部分（bool，长度 K）"""
+        blocked = np.zeros(len(self._edge_ys), dtype=bool)
+        height, width = self.sky_mask.shape
+        for ys, xs, sub in regions:
+            y0, y1, _ = ys.indices(height)
+            x0, x1, _ = xs.indices(width)
+            lo, hi = np.searchsorted(self._edge_ys, [y0, y1])
+            rows, cols = self._edge_ys[lo:hi], self._edge_xs[lo:hi]
+            inside = np.flatnonzero((cols >= x0) & (cols < x1))
+            blocked[lo + inside] |= sub[rows[inside] - y0, cols[inside] - x0]
+        return blocked
+
+    def _combine_dual(self, img_float: np.ndarray, regions) -> None:
+        """双轨更新：逐行块合入 result，再更新羽化像素的地景轨道"""
+        saved = self._save_regions(self.result, regions)
+        for y0, y1, sky in self._dual_blocks:
+            acc, img = self.result[y0:y1], img_float[y0:y1]
+            if sky is True:
+                acc[...] = self._combine(acc, img, self.mode, self.count)
+            elif sky is False:
+                acc[...] = self._combine(acc, img, self.fg_mode, self.count)
+            else:
+                np.copyto(
+                    acc,
+                    np.where(
+                        sky,
+                        self._combine(acc, img, self.mode, self.count),
+                        self._combine(acc, img, self.fg_mode, self.count),
+                    ),
+                )
+        self._restore_regions(self.result, regions, saved)
+
+        if len(self._edge_ys):
+            updated = self._combine(
+                self.fg_edge, img_float[self._edge_ys, self._edge_xs], self.fg_mode, self.count
+            )
+            if regions:
+                blocked = self._edge_blocked(regions)
+                updated[blocked] = self.fg_edge[blocked]
+            self.fg_edge = updated
+
+    def _blend_rows(self, y0: int, y1: int) -> np.ndarray:
+        """双轨结果的 [y0, y1) 行：累加器拷贝，羽化像素按蒙版融合两轨"""
+        band = self.result[y0:y1].copy()
+        lo, hi = np.searchsorted(self._edge_ys, [y0, y1])
+        if hi > lo:
+            rows, cols = self._edge_ys[lo:hi] - y0, self._edge_xs[lo:hi]
+            alpha = self._edge_alpha[lo:hi]
+            band[rows, cols] = band[rows, cols] * alpha + self.fg_edge[lo:hi] * (1.0 - alpha)
+        return band
+
+    def _update_timelapse(self, image: np.ndarray, pyramid, satellite_mask) -> None:
+        """
+        更新延时视频分辨率的累加器并提交一帧
+
+        新帧先缩小到视频分辨率（有金字塔时从最接近的层级缩放），再用与全分辨率
+        相同的算子合入；全分辨率累加器只用于最终成片。
+        """
+        small = self.timelapse_generator.snapshot(image, pyramid).astype(np.float32)
+        regions = self._mask_regions(self._scale_mask(satellite_mask, small.shape[:2]))
+
+        if self.timelapse_result is None:
+            self.timelapse_result = small
+            for ys, xs, sub in regions:
+                self.timelapse_result[ys, xs][sub] = 0.0
+        else:
+            saved = self._save_regions(self.timelapse_result, regions)
+            self.timelapse_result = self._combine(
+                self.timelapse_result, small, self.mode, self.timelapse_count
+            )
+            self._restore_regions(self.timelapse_result, regions, saved)
+        self.timelapse_count += 1
+
+        self.timelapse_generator.add_frame(self.timelapse_result)
 
     def add_image(
         self,
         image: np.ndarray,
         progress_callback: Optional[Callable[[int], None]] = None,
         satellite_mask: Optional[np.ndarray] = None,
+        pyramid: Optional[ImagePyramid] = None,
     ) -> np.ndarray:
         """
         添加一张图像到堆栈
@@ -127,7 +337,9 @@ class StackingEngine:
         Args:
             image: 输入图像数组 (H, W, 3)
             progress_callback: 进度回调函数，接收当前处理的图像数量
-            satellite_mask: 卫星/飞机划痕遮罩 (H, W) bool，True 的像素在堆栈时跳过更新
+            satellite_mask: 卫星/飞机划痕遮罩，StreakMask（稀疏，推荐）或 (H, W) bool 数组，
+                            被遮罩的像素在堆栈时跳过更新
+            pyramid: 该帧共享的图像金字塔（可选），用于生成延时视频帧时复用降采样层
 
         Returns:
             当前堆栈结果的副本
@@ -135,74 +347,37 @@ class StackingEngine:
         # 转换为 float32 以避免溢出
         img_float = image.astype(np.float32)
 
-        # 如果有划痕遮罩，扩展到 3 通道以便广播
-        mask3 = satellite_mask[:, :, np.newaxis] if satellite_mask is not None else None
+        # 划痕遮罩只按受影响的图块处理：无划痕的帧零开销
+        regions = self._mask_regions(satellite_mask)
 
         if self.result is None:
-            # 第一张图像，直接作为初始结果（划痕遮罩区域用0初始化）
-            self.result = img_float.copy()
-            if mask3 is not None:
-                self.result = np.where(mask3, 0.0, self.result)
-            # 双轨初始化
+            # 第一张图像，直接作为初始结果（img_float 是新分配的数组，无需再拷贝）
+            self.result = img_float
             if self.sky_mask is not None:
-                if self.sky_mask.shape != img_float.shape[:2]:
-                    raise ValueError(
-                        f"蒙版尺寸 {self.sky_mask.shape} 与图像尺寸 {img_float.shape[:2]} 不匹配，"
-                        f"请确保蒙版与输入图像分辨率一致"
-                    )
-                self.sky_result = img_float.copy()
-                self.fg_result = img_float.copy()
-                self.sky_count = 1  # 第一帧已写入，计数从 1 开始
+                # 双轨：第一帧原样作为两条轨道的初值
+                self._init_dual(img_float)
+            else:
+                # 划痕遮罩区域用0初始化
+                for ys, xs, sub in regions:
+                    self.result[ys, xs][sub] = 0.0
         elif img_float.shape != self.result.shape:
             raise ValueError(
                 f"图像尺寸不匹配: 已有堆栈为 {self.result.shape[:2]}，"
                 f"新图像为 {img_float.shape[:2]}，所有图片必须分辨率相同"
             )
+        elif self.dual:
+            # 双轨堆栈：天空用 self.mode，地景用 fg_mode，划痕遮罩区域保留旧值
+            with profiling.stage("stack.dual_track"):
+                self._combine_dual(img_float, regions)
         else:
-            # 根据模式进行堆栈
-            if self.mode == StackMode.LIGHTEN:
-                new_val = _fast_maximum(self.result, img_float)
-                self.result = np.where(mask3, self.result, new_val) if mask3 is not None else new_val
-
-            elif self.mode == StackMode.AVERAGE:
-                # 增量平均：new_avg = (old_avg * count + new_value) / (count + 1)
-                new_val = (self.result * self.count + img_float) / (self.count + 1)
-                self.result = np.where(mask3, self.result, new_val) if mask3 is not None else new_val
-
-            elif self.mode == StackMode.COMET:
-                # 彗星模式：当前结果衰减，新图像添加
-                new_val = (
-                    self.result * self.comet_fade_factor
-                    + img_float * (1 - self.comet_fade_factor)
-                )
-                self.result = np.where(mask3, self.result, new_val) if mask3 is not None else new_val
+            with profiling.stage("stack.combine"):
+                # 划痕遮罩区域保留旧值：先记下受影响像素，更新后再写回
+                saved = self._save_regions(self.result, regions)
 
-            # 双轨堆栈：天空用 self.mode，地景用 fg_mode
-            if self.sky_mask is not None:
-                # 天空轨道
-                if self.mode == StackMode.LIGHTEN:
-                    sky_new = _fast_maximum(self.sky_result, img_float)
-                elif self.mode == StackMode.AVERAGE:
-                    sky_new = (self.sky_result * self.sky_count + img_float) / (self.sky_count + 1)
-                else:  # COMET
-                    sky_new = (
-                        self.sky_result * self.comet_fade_factor
-                        + img_float * (1 - self.comet_fade_factor)
-                    )
-                # 划痕遮罩：遮罩区域保留旧值，不更新
-                self.sky_result = np.where(mask3, self.sky_result, sky_new) if mask3 is not None else sky_new
-
-                # 地景轨道：按用户选择的 fg_mode 处理
-                if self.fg_mode == StackMode.COMET:
-                    fg_new = (
-                        self.fg_result * self.comet_fade_factor
-                        + img_float * (1 - self.comet_fade_factor)
-                    )
-                else:  # AVERAGE（默认）
-                    fg_new = (self.fg_result * self.sky_count + img_float) / (self.sky_count + 1)
-                self.fg_result = np.where(mask3, self.fg_result, fg_new) if mask3 is not None else fg_new
-
-                self.sky_count += 1
+                # 根据模式进行堆栈
+                self.result = self._combine(self.result, img_float, self.mode, self.count)
+
+                self._restore_regions(self.result, regions, saved)
 
         self.count += 1
 
@@ -210,13 +385,15 @@ class StackingEngine:
         if progress_callback:
             progress_callback(self.count)
 
-        # 如果启用延时视频，保存当前帧
+        # 如果启用延时视频，更新视频分辨率的累加器并提交一帧（拉伸和编码在工作线程中完成）
         if self.enable_timelapse and self.timelapse_generator is not None:
-            self.timelapse_generator.add_frame(np.clip(self.result, 0, 65535).astype(np.uint16))
+            with profiling.stage("stack.timelapse"):
+                self._update_timelapse(image, pyramid, satellite_mask)
 
         # 返回当前结果的简单副本，不应用填充
         # 填充只应该在最终 get_result() 时应用一次
-        return self.result.astype(np.uint16)
+        with profiling.stage("stack.copy"):
+            return self.result.astype(np.uint16)
 
     def get_result(
         self,
@@ -241,11 +418,9 @@ class StackingEngine:
         if stop_event is not None and stop_event.is_set():
             raise ProcessingCancelledError("用户取消了结果生成")
 
-        # 双轨融合：sky_result × mask + fg_result × (1 - mask)
-        if self.sky_mask is not None and self.sky_result is not None and self.fg_result is not None:
-            mask3 = self.sky_mask[:, :, np.newaxis]  # (H, W, 1) 广播到 3 通道
-            blended = self.sky_result * mask3 + self.fg_result * (1.0 - mask3)
-            result = np.clip(blended, 0, 65535).astype(np.uint16)
+        # 双轨融合：只有羽化像素需要 天空 × mask + 地景 × (1 - mask)
+        if self.dual:
+            result = np.clip(self._blend_rows(0, self.result.shape[0]), 0, 65535).astype(np.uint16)
             # gap_filling 暂不支持双轨模式，直接返回
             return result
 
@@ -267,12 +442,13 @@ class StackingEngine:
             # 确保类型正确
             if result.dtype != np.uint16:
                 result = result.astype(np.uint16)
-            result_filled = self.gap_filler.fill_gaps(
-                result,
-                gap_size=self.gap_size,
-                intensity_threshold=0.1,
-                stop_event=stop_event,
-            )
+            with profiling.stage("gapfill"):
+                result_filled = self.gap_filler.fill_gaps(
+                    result,
+                    gap_size=self.gap_size,
+                    intensity_threshold=0.1,
+                    stop_event=stop_event,
+                )
             # gap_filler 已经返回 uint16，避免重复转换
             return result_filled
 
@@ -282,6 +458,107 @@ class StackingEngine:
         else:
             return result
 
+    @property
+    def result_shape(self) -> Tuple[int, ...]:
+        """堆栈结果形状 (H, W, C)"""
+        if self.result is None:
+            raise ValueError("还没有添加任何图像")
+        return self.result.shape
+
+    def iter_result_bands(
+        self,
+        band_rows: int = 256,
+        apply_gap_filling: bool = True,
+        stop_event=None,
+    ) -> Iterator[np.ndarray]:
+        """
+        自上而下逐行带生成 uint16 结果，不拼出整幅 uint16 图像
+
+        与 get_result() 结果一致，配合 ImageExporter.save_tiff_stream 可边生成边写盘。
+        局部间隔填充方法按行带处理，每块额外读取上下 halo 行作为邻域；
+        需要全图统计的方法（linear）退回整图填充后再切分。
+
+        Args:
+            band_rows: 每个行带的行数
+            apply_gap_filling: 是否应用间隔填充
+            stop_event: threading.Event，置位后中断生成
+
+        Yields:
+            (band_rows, W, C) uint16 行带，最后一块可能更矮
+        """
+        return self._iter_bands(band_rows, apply_gap_filling, stop_event, linear=False)
+
+    def iter_linear_bands(
+        self,
+        band_rows: int = 256,
+        apply_gap_filling: bool = False,
+        stop_event=None,
+    ) -> Iterator[np.ndarray]:
+        """
+        自上而下逐行带读取 float32 累加器，不裁剪、不取整
+
+        保留 AVERAGE 堆栈的小数精度，供 ImageExporter.save_tiff_linear 写出线性浮点 TIFF。
+        单轨且不做间隔填充时行带是累加器的视图，不产生任何拷贝。
+
+        Args:
+            band_rows: 每个行带的行数
+            apply_gap_filling: 是否应用间隔填充（在 float32 数据上进行）
+            stop_event: threading.Event，置位后中断生成
+
+        Yields:
+            (band_rows, W, C) float32 行带，最后一块可能更矮
+        """
+        return self._iter_bands(band_rows, apply_gap_filling, stop_event, linear=True)
+
+    def _iter_bands(
+        self, band_rows: int, apply_gap_filling: bool, stop_event, linear: bool
+    ) -> Iterator[np.ndarray]:
+        if self.result is None:
+            raise ValueError("还没有添加任何图像")
+
+        dual = self.dual
+        fill = (
+            not dual  # gap_filling 暂不支持双轨模式
+            and apply_gap_filling and self.enable_gap_filling and self.gap_filler is not None
+        )
+        halo = self.gap_filler.band_halo(self.gap_size) if fill else 0
+        height = self.result.shape[0]
+
+        if halo is None:
+            if linear:
+                full = self.gap_filler.fill_gaps(
+                    self.result, gap_size=self.gap_size, intensity_threshold=0.1,
+                    stop_event=stop_event,
+                )
+            else:
+                full = self.get_result(apply_gap_filling=True, stop_event=stop_event)
+            for y0 in range(0, height, band_rows):
+                yield full[y0:y0 + band_rows]
+            return
+
+        for y0 in range(0, height, band_rows):
+            if stop_event is not None and stop_event.is_set():
+                raise ProcessingCancelledError("用户取消了结果生成")
+            y1 = min(y0 + band_rows, height)
+
+            if dual:
+                band = self._blend_rows(y0, y1)
+                yield band if linear else np.clip(band, 0, 65535).astype(np.uint16)
+                continue
+
+            top, bottom = max(y0 - halo, 0), min(y1 + halo, height)
+            band = self.result[top:bottom]
+            if not linear:
+                band = np.clip(band, 0, 65535).astype(np.uint16)
+            if fill:
+                band = self.gap_filler.fill_gaps(
+                    band,
+                    gap_size=self.gap_size,
+                    intensity_threshold=0.1,
+                    stop_event=stop_event,
+                )
+            yield band[y0 - top:y0 - top + (y1 - y0)]
+
     def process_batch(
         self,
         images: List[np.ndarray],
@@ -336,33 +613,6 @@ class StackingEngine:
         return self.timelapse_generator.generate_video(cleanup=cleanup, stop_event=stop_event)
 
 
-class DarkFrameSubtractor:
-    """暗帧减除器"""
-
-    def __init__(self, dark_frame: np.ndarray):
-        """
-        初始化暗帧减除器
-
-        Args:
-            dark_frame: 暗帧图像
-        """
-        self.dark_frame = dark_frame.astype(np.float32)
-
-    def subtract(self, image: np.ndarray) -> np.ndarray:
-        """
-        从图像中减除暗帧
-
-        Args:
-            image: 输入图像
-
-        Returns:
-            减除暗帧后的图像
-        """
-        result = image.astype(np.float32) - self.dark_frame
-        result = np.clip(result, 0, 65535)
-        return result.astype(np.uint16)
-
-
 # 示例用法
 if __name__ == "__main__":
     # 创建测试图像
@@ -2,17 +2,105 @@
 延时视频生成器
 
 负责将星轨堆栈的中间过程保存为延时视频
+
+临时帧占用的磁盘空间可以设上限：超出预算时把已写好的帧编码成中间片段并删除，
+最后把所有片段拼接成成片。临时目录中写有属主进程标记，进程崩溃后残留的目录
+在下次启动时自动回收。
 """
 
+import os
+import shutil
+import socket
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
 import cv2
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from PIL import Image
+from .exporter import ImageExporter
+from .pyramid import ImagePyramid
+from .video_encoder import concat_segments, create_encoder
 from utils.logger import setup_logger
+from utils import profiling
 
 logger = setup_logger(__name__)
 
+# 临时帧目录中的属主标记文件：内容为 "主机名 进程号"
+OWNER_MARKER = ".sst_owner"
+
+
+def _pid_alive(pid: int) -> bool:
+    """进程是否仍在运行"""
+    if pid <= 0:
+        return False
+    if os.name == "nt":
+        # Windows 上 os.kill(pid, 0) 会结束进程，改用 OpenProcess 查询
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # 进程存在但属于其他用户
+    return True
+
+
+def reclaim_orphaned_frame_dirs(directory: Path) -> int:
+    """
+    删除 directory 下属主进程已退出的临时帧目录
+
+    只处理带有属主标记的目录；标记来自其他主机（如网络盘）时不处理。
+
+    Args:
+        directory: 要扫描的目录（通常为视频输出目录）
+
+    Returns:
+        回收的目录数
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return 0
+
+    reclaimed = 0
+    for marker in directory.glob(f"*/{OWNER_MARKER}"):
+        try:
+            host, pid = marker.read_text(encoding="utf-8").split()
+            if host != socket.gethostname() or _pid_alive(int(pid)):
+                continue
+        except (OSError, ValueError):
+            continue
+        shutil.rmtree(marker.parent, ignore_errors=True)
+        logger.info(f"已回收残留的临时帧目录: {marker.parent}")
+        reclaimed += 1
+    return reclaimed
+
+
+@lru_cache(maxsize=32)
+def _lut_8bit(p_low: float, p_high: float) -> np.ndarray:
+    """
+    16-bit → 8-bit 线性拉伸查找表（65536 项）
+
+    所有生成器共享缓存：相邻帧的拉伸范围经常不变（尤其是趋于稳定的星轨累加器），
+    命中时省去重新构建查找表。返回的数组只读。
+    """
+    levels = np.arange(65536, dtype=np.float32)
+    lut = np.clip((levels - p_low) / (p_high - p_low) * 255, 0, 255).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
 
 class TimelapseGenerator:
     """延时视频生成器"""
@@ -25,7 +113,17 @@ class TimelapseGenerator:
         output_path: Path,
         fps: int = 25,
         resolution: Optional[Tuple[int, int]] = None,  # None = 自动从第一帧检测
-        temp_dir: Optional[Path] = None
+        temp_dir: Optional[Path] = None,
+        quality: str = "high",
+        codec: str = "h264",
+        threads: int = 0,
+        workers: int = 2,
+        max_pending: int = 4,
+        target_duration: Optional[float] = None,
+        expected_frames: Optional[int] = None,
+        interpolate: bool = False,
+        executor: Optional[ThreadPoolExecutor] = None,
+        temp_budget_mb: float = 0,
     ):
         """
         初始化延时视频生成器
@@ -35,9 +133,24 @@ class TimelapseGenerator:
             fps: 帧率（默认 25 FPS）
             resolution: 视频分辨率 (width, height)；None 表示自动按图像真实比例计算
             temp_dir: 临时帧目录（如果不指定，使用 output_path 同级目录）
+            quality: 视频画质 ('high', 'medium', 'low')，对应 ffmpeg CRF 18/23/28
+            codec: 视频编码 ('h264', 'h265')
+            threads: 编码线程数，0 表示自动
+            workers: 帧准备（拉伸 + JPEG 编码）工作线程数
+            max_pending: 最多排队的帧数，超过时 add_frame 阻塞
+            target_duration: 目标视频时长（秒）；与 expected_frames 一起决定抽帧间隔，
+                             None 表示每个堆栈状态都输出一帧
+            expected_frames: 预计提交的堆栈状态数（通常为输入文件数）
+            interpolate: 帧数不足目标时长时，编码阶段在相邻帧之间插入交叉淡化帧
+            executor: 共享的帧准备线程池（可选，由 TimelapseOutputs 提供）；
+                      None 表示首次 add_frame 时创建自己的线程池
+            temp_budget_mb: 临时帧磁盘预算（MB）；超出时把已有帧编码成中间片段，0 表示不限制
         """
         self.output_path = Path(output_path)
         self.fps = fps
+        self.quality = quality
+        self.codec = codec
+        self.threads = threads
         self.resolution = resolution  # None 直到第一帧进来时确定
 
         # 临时目录
@@ -46,79 +159,288 @@ class TimelapseGenerator:
         else:
             self.temp_dir = Path(temp_dir)
 
+        reclaim_orphaned_frame_dirs(self.temp_dir.parent)
         self.temp_dir.mkdir(parents=True, exist_ok=True)
-
-        self.frame_count = 0
-        self.frame_paths = []
+        (self.temp_dir / OWNER_MARKER).write_text(
+            f"{socket.gethostname()} {os.getpid()}", encoding="utf-8"
+        )
+
+        self.frame_count = 0  # 已写出的总帧数（含已编码进片段的帧）
+        self.frame_paths = []  # 仍在磁盘上、尚未编码的帧
+
+        # 临时磁盘预算：超出时编码中间片段
+        self.temp_budget_bytes = int(temp_budget_mb * 1024 * 1024) if temp_budget_mb else 0
+        self.segments: List[Path] = []
+        self._frame_bytes = 0
+        self._segment_factor: Optional[int] = None
+        self._last_frame: Optional[np.ndarray] = None  # 片段之间交叉淡化的衔接帧
+
+        # 帧准备工作线程（首次 add_frame 时创建）
+        self.workers = max(int(workers), 1)
+        self.max_pending = max(int(max_pending), 1)
+        self._executor: Optional[ThreadPoolExecutor] = executor
+        self._owns_executor = executor is None
+        self._pending: deque = deque()
+        self._next_index = 0
+
+        # 按目标时长抽帧：只输出每第 stride 个堆栈状态，跳过的状态不做任何转换和写盘
+        self.target_duration = target_duration
+        self.expected_frames = expected_frames
+        self.interpolate = interpolate
+        self.stride = self._compute_stride()
+        self._state_index = 0
+
+        # 最近一次编码的统计：写入帧数（含插帧）和耗时
+        self.encode_frames = 0
+        self.encode_seconds = 0.0
 
         logger.info(f"延时视频生成器初始化: {self.fps} FPS, 分辨率={'自动' if self.resolution is None else f'{self.resolution[0]}×{self.resolution[1]}'}")
         logger.info(f"临时帧目录: {self.temp_dir}")
 
-    def add_frame(self, image: np.ndarray) -> None:
+    def _target_frame_count(self) -> Optional[int]:
+        """目标时长对应的视频帧数"""
+        if not self.target_duration or self.target_duration <= 0:
+            return None
+        return max(int(round(self.target_duration * self.fps)), 1)
+
+    def _compute_stride(self) -> int:
+        """抽帧间隔：输入状态数超过目标帧数时，每 stride 个状态输出一帧"""
+        target = self._target_frame_count()
+        if target is None or not self.expected_frames or self.expected_frames <= target:
+            return 1
+        return max(int(round(self.expected_frames / target)), 1)
+
+    def wants_state(self, index: int) -> bool:
         """
-        添加一帧到延时视频
+        第 index 个堆栈状态（从 0 开始）是否输出为视频帧
+
+        每 stride 个状态取最后一个，最后一个状态总是输出，保证视频结尾是完整星轨。
+        """
+        if self.stride <= 1:
+            return True
+        if self.expected_frames and index == self.expected_frames - 1:
+            return True
+        return (index + 1) % self.stride == 0
+
+    def interpolation_factor(self, frame_count: Optional[int] = None) -> int:
+        """
+        交叉淡化倍数：每个真实帧之间共输出多少帧（1 表示不插帧）
+
+        只在启用 interpolate 且实际帧数少于目标帧数时大于 1。
+        已编码过中间片段时沿用片段使用的倍数，保证整段视频节奏一致。
 
         Args:
-            image: 16-bit 图像 (H, W, 3)
+            frame_count: 按该帧数计算（默认为已写出的帧数）
         """
-        # 转换为 8-bit（使用 percentile-based 拉伸，和预览一样）
-        img_8bit = self._convert_to_8bit(image)
+        if self._segment_factor is not None:
+            return self._segment_factor
+        target = self._target_frame_count()
+        frame_count = self.frame_count if frame_count is None else frame_count
+        if not self.interpolate or target is None or frame_count <= 1:
+            return 1
+        return max(int(round((target - 1) / (frame_count - 1))), 1)
+
+    def _planned_frame_count(self) -> int:
+        """按 expected_frames 和抽帧间隔预计的总帧数；未知时返回已写出的帧数"""
+        if not self.expected_frames:
+            return self.frame_count
+        return sum(1 for index in range(self.expected_frames) if self.wants_state(index))
+
+    def target_resolution(self, shape: Tuple[int, ...]) -> Tuple[int, int]:
+        """
+        返回输出分辨率；首次调用时按图像真实比例自动确定（约 4K 总像素量）
 
-        # 第一帧：自动确定输出分辨率（保持真实比例，约 4K 总像素量）
+        Args:
+            shape: 输入图像形状 (H, W[, C])
+
+        Returns:
+            (宽, 高)
+        """
         if self.resolution is None:
-            h, w = img_8bit.shape[:2]
+            h, w = shape[:2]
             self.resolution = self._compute_resolution(w, h)
             logger.info(f"自动检测分辨率: {w}×{h} → 输出 {self.resolution[0]}×{self.resolution[1]}")
+        return self.resolution
+
+    def warm(self, pyramid: ImagePyramid) -> None:
+        """
+        在预取线程中提前把帧缩放到视频分辨率（结果缓存在金字塔中）
+
+        之后主线程的 snapshot / add_frame 直接取用缓存，不再读取全分辨率数据。
+        """
+        pyramid.resize_to(*self.target_resolution(pyramid.shape))
+
+    def snapshot(self, image: np.ndarray, pyramid: Optional[ImagePyramid] = None) -> np.ndarray:
+        """
+        在调用线程中取一份目标分辨率的降采样副本
+
+        这是 add_frame 在调用线程中唯一的工作：一次 INTER_AREA 缩放，
+        之后堆栈累加器可以继续更新，拉伸和 JPEG 编码交给工作线程。
+
+        Args:
+            image: 16-bit 图像或 float32 累加器 (H, W, 3)
+            pyramid: 该帧共享的图像金字塔（可选）
+
+        Returns:
+            与 image 不共享内存的小图
+        """
+        self.target_resolution(image.shape)
+
+        # 先缩放到目标分辨率（无裁切，保持完整画面），再在小图上做拉伸
+        if pyramid is None:
+            pyramid = ImagePyramid(image)
+        small = pyramid.resize_to(*self.resolution)
+        if np.shares_memory(small, image):
+            small = small.copy()  # 尺寸恰好一致时 resize_to 返回原图，需要拷贝以免被后续帧修改
+        return small
+
+    def add_frame(self, image: np.ndarray, pyramid: Optional[ImagePyramid] = None) -> None:
+        """
+        添加一帧到延时视频
+
+        调用线程只做降采样快照；拉伸、8-bit 转换和 JPEG 编码在工作线程中进行，
+        帧文件名按提交顺序分配。排队帧数达到上限时才阻塞调用线程。
+        设置了目标时长时，被抽帧跳过的状态直接返回。
+
+        Args:
+            image: 16-bit 图像或 float32 累加器 (H, W, 3)
+            pyramid: 该帧共享的图像金字塔（可选）；提供时直接从最接近的
+                     降采样层缩放，不再对全分辨率图像做拉伸和缩放
+        """
+        if not self.take_state():
+            return  # 抽帧跳过的状态：不缩放、不转换、不写盘
+
+        self.submit(self.snapshot(image, pyramid))
+
+    def take_state(self) -> bool:
+        """
+        消耗一个堆栈状态序号，返回该状态是否需要输出
+
+        add_frame 内部调用；TimelapseOutputs 共享快照时先调用它，再用 submit 提交。
+        """
+        index = self._state_index
+        self._state_index += 1
+        if not self.wants_state(index):
+            profiling.count("timelapse.skipped_states")
+            return False
+        return True
+
+    def submit(self, small: np.ndarray) -> None:
+        """
+        提交一份目标分辨率的快照，交给工作线程拉伸并写成 JPEG
+
+        Args:
+            small: snapshot() 的结果；调用后不得再修改
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="sst-timelapse"
+            )
+
+        # 队列已满：等待最早的帧写完再提交
+        if len(self._pending) >= self.max_pending:
+            with profiling.stage("timelapse.backpressure"):
+                while len(self._pending) >= self.max_pending:
+                    self._collect(self._pending[0])
+
+        index = self._next_index
+        self._next_index += 1
+        self._pending.append(self._executor.submit(self._write_frame, small, index))
+        self._collect_done()
+
+        if self.temp_budget_bytes and self._frame_bytes >= self.temp_budget_bytes:
+            self.flush()
+            logger.info(f"临时帧达到磁盘预算 ({self.temp_budget_bytes / 1024 / 1024:.0f} MB)")
+            try:
+                self._spill()
+            except Exception as e:
+                # 片段编码失败不影响堆栈：保留帧文件，之后不再受预算限制
+                logger.error(f"中间片段编码失败，取消临时磁盘预算: {e}")
+                self.temp_budget_bytes = 0
+
+    def flush(self) -> None:
+        """等待所有排队帧写完，frame_paths 按帧序更新"""
+        while self._pending:
+            self._collect(self._pending[0])
+
+    def _collect(self, future: Future) -> None:
+        """等待队首帧完成并记录结果（只在调用线程中执行）"""
+        frame_path = future.result()
+        self._pending.popleft()
+        if frame_path is None:
+            return
+        self.frame_paths.append(frame_path)
+        self.frame_count += 1
+        self._frame_bytes += frame_path.stat().st_size
+        if self.frame_count % 10 == 0:
+            logger.info(f"已保存第 {self.frame_count} 帧")
+
+    def _collect_done(self) -> None:
+        """不阻塞地收集队首已完成的帧"""
+        while self._pending and self._pending[0].done():
+            self._collect(self._pending[0])
+
+    def _write_frame(self, small: np.ndarray, index: int) -> Optional[Path]:
+        """
+        工作线程：转换为 8-bit 并保存为 JPEG
+
+        Args:
+            small: 目标分辨率的快照
+            index: 帧序号（决定文件名）
+
+        Returns:
+            帧文件路径；失败时返回 None
+        """
+        if small.dtype != np.uint16 and small.dtype != np.uint8:
+            small = np.clip(small, 0, 65535).astype(np.uint16)
 
-        # 调整尺寸到目标分辨率（无裁切，保持完整画面）
-        img_resized = self._resize_to_target(img_8bit)
+        # 转换为 8-bit（使用 percentile-based 拉伸，和预览一样）
+        with profiling.stage("timelapse.stretch"):
+            img_resized = self._convert_to_8bit(small)
 
         # 保存为 JPEG
-        frame_path = self.temp_dir / f"frame_{self.frame_count:05d}.jpg"
-        
+        frame_path = self.temp_dir / f"frame_{index:05d}.jpg"
+
         # Windows 中文路径兼容：使用 imencode + tofile 替代 imwrite
         import platform
-        import os
-        
+
         try:
             if platform.system() == "Windows":
                 # 转换为 BGR 并编码为 JPEG
                 img_bgr = cv2.cvtColor(img_resized, cv2.COLOR_RGB2BGR)
-                success, encoded = cv2.imencode('.jpg', img_bgr, [cv2.IMWRITE_JPEG_QUALITY, 90])
+                with profiling.stage("timelapse.jpeg"):
+                    success, encoded = cv2.imencode('.jpg', img_bgr, [cv2.IMWRITE_JPEG_QUALITY, 90])
                 if success:
                     encoded.tofile(str(frame_path))
                 else:
-                    logger.error(f"[帧 {self.frame_count}] cv2.imencode 失败")
-                    return
+                    logger.error(f"[帧 {index}] cv2.imencode 失败")
+                    return None
             else:
-                result = cv2.imwrite(str(frame_path), cv2.cvtColor(img_resized, cv2.COLOR_RGB2BGR),
-                            [cv2.IMWRITE_JPEG_QUALITY, 90])
+                with profiling.stage("timelapse.jpeg"):
+                    result = cv2.imwrite(str(frame_path), cv2.cvtColor(img_resized, cv2.COLOR_RGB2BGR),
+                                [cv2.IMWRITE_JPEG_QUALITY, 90])
                 if not result:
-                    logger.error(f"[帧 {self.frame_count}] cv2.imwrite 失败: {frame_path}")
-                    return
-            
+                    logger.error(f"[帧 {index}] cv2.imwrite 失败: {frame_path}")
+                    return None
+
             # 验证帧文件是否成功创建
             if frame_path.exists():
                 frame_size = frame_path.stat().st_size
                 if frame_size == 0:
-                    logger.error(f"[帧 {self.frame_count}] 帧文件为 0 字节: {frame_path}")
-                    return
+                    logger.error(f"[帧 {index}] 帧文件为 0 字节: {frame_path}")
+                    return None
                 # 记录前 3 帧的详细信息，帮助诊断
-                if self.frame_count < 3:
-                    logger.info(f"[帧 {self.frame_count}] 保存成功: {frame_path.name} ({frame_size} 字节)")
+                if index < 3:
+                    logger.info(f"[帧 {index}] 保存成功: {frame_path.name} ({frame_size} 字节)")
             else:
-                logger.error(f"[帧 {self.frame_count}] 帧文件不存在: {frame_path}")
-                return
-                
-        except Exception as e:
-            logger.error(f"[帧 {self.frame_count}] 保存帧时异常: {e}", exc_info=True)
-            return
+                logger.error(f"[帧 {index}] 帧文件不存在: {frame_path}")
+                return None
 
-        self.frame_paths.append(frame_path)
-        self.frame_count += 1
+        except Exception as e:
+            logger.error(f"[帧 {index}] 保存帧时异常: {e}", exc_info=True)
+            return None
 
-        if self.frame_count % 10 == 0:
-            logger.info(f"已保存第 {self.frame_count} 帧")
+        return frame_path
 
     def _convert_to_8bit(self, image: np.ndarray) -> np.ndarray:
         """
@@ -131,17 +453,15 @@ class TimelapseGenerator:
             8-bit 图像
         """
         if image.dtype == np.uint16:
-            # 使用百分位数拉伸，避免过暗或过曝
-            p_low = np.percentile(image, 1)
-            p_high = np.percentile(image, 99.5)
+            # 使用百分位数拉伸，避免过暗或过曝（单次直方图统计）
+            p_low, p_high = ImageExporter.stretch_limits(image, 1, 99.5)
 
             # 拉伸到 0-255（保护除零：极低对比度图像直接用 p_low 填充）
             scale = float(p_high - p_low)
             if scale < 1.0:
-                img_stretched = np.zeros_like(image, dtype=np.float32)
-            else:
-                img_stretched = np.clip((image - p_low) / scale * 255, 0, 255)
-            img_8bit = img_stretched.astype(np.uint8)
+                return np.zeros_like(image, dtype=np.uint8)
+            # 预先算好 65536 项查找表（跨帧、跨生成器缓存），逐像素只做一次查表
+            img_8bit = _lut_8bit(float(p_low), float(p_high))[image]
         else:
             img_8bit = image
 
@@ -162,23 +482,14 @@ class TimelapseGenerator:
         out_h = out_h + (out_h % 2)
         return (out_w, out_h)
 
-    def _resize_to_target(self, image: np.ndarray) -> np.ndarray:
-        """
-        将图像缩放到目标分辨率，保持完整画面（不裁切）。
-
-        Args:
-            image: 8-bit RGB 图像 (H, W, 3)
-
-        Returns:
-            调整后的图像
-        """
-        resized = cv2.resize(image, self.resolution, interpolation=cv2.INTER_AREA)
-        return resized
-
     def generate_video(self, cleanup: bool = True, stop_event=None) -> bool:
         """
         从保存的帧生成视频
 
+        优先通过管道交给 ffmpeg（x264/x265，按画质设置选择 CRF），
+        未安装 ffmpeg 时回退到 OpenCV mp4v。运行中因磁盘预算编码过中间片段时，
+        先把剩余帧编码成最后一个片段，再拼接所有片段。
+
         Args:
             cleanup: 是否删除临时帧文件
             stop_event: threading.Event，置位后中断编码并删除半成品文件
@@ -186,108 +497,48 @@ class TimelapseGenerator:
         Returns:
             是否成功
         """
+        # 等待工作线程写完所有帧
+        self.flush()
+        self.shutdown()
+
         if self.frame_count == 0:
             logger.error("没有帧可以生成视频")
             return False
 
+        factor = self.interpolation_factor()
         logger.info(f"开始生成视频: {self.output_path}")
-        logger.info(f"总帧数: {self.frame_count}, 时长: {self.frame_count / self.fps:.2f} 秒")
-
-        video = None
-        temp_video_path = None
-        
+        logger.info(f"总帧数: {self.frame_count}, 时长: {self.get_duration():.2f} 秒")
+        if self.stride > 1:
+            logger.info(f"按目标时长抽帧: 每 {self.stride} 个堆栈状态输出 1 帧")
+        if factor > 1:
+            logger.info(f"交叉淡化插帧: 相邻帧之间插入 {factor - 1} 帧")
+
+        if not self.segments:
+            self._reset_encode_stats()
         try:
-            import tempfile
-            import shutil
-            import platform
-            
-            # Windows 上 OpenCV 无法处理中文路径，需要先写入临时文件
-            if platform.system() == "Windows":
-                # 创建临时文件（ASCII 路径）
-                temp_fd, temp_video_path = tempfile.mkstemp(suffix='.mp4')
-                import os
-                os.close(temp_fd)  # 关闭文件描述符，让 OpenCV 可以写入
-                video_path_for_opencv = temp_video_path
-                logger.info(f"Windows: 使用临时路径 {temp_video_path}")
+            if self.segments:
+                # 最后一个片段的编码时间已由 _spill 计入，这里只计拼接
+                if self.frame_paths:
+                    if not self._spill(stop_event):
+                        return self._cancelled(cleanup)
+                logger.info(f"拼接 {len(self.segments)} 个中间片段")
+                encode_start = time.perf_counter()
+                finished = concat_segments(self.segments, self.output_path, self.fps, self.resolution)
+                stage = "timelapse.concat"
             else:
-                video_path_for_opencv = str(self.output_path)
-            
-            # 使用 OpenCV 创建视频编码器
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # MP4 编码器
-            video = cv2.VideoWriter(
-                video_path_for_opencv,
-                fourcc,
-                self.fps,
-                self.resolution
-            )
-
-            if not video.isOpened():
-                logger.error(f"无法打开视频编码器, 路径: {video_path_for_opencv}")
-                logger.error(f"编码器: mp4v, FPS: {self.fps}, 分辨率: {self.resolution}")
-                raise RuntimeError("无法打开视频编码器")
-            
-            logger.info(f"视频编码器已打开: {video_path_for_opencv}")
-
-            # 逐帧写入
-            frames_written = 0
-            cancelled = False
-            for i, frame_path in enumerate(self.frame_paths):
-                if stop_event is not None and stop_event.is_set():
-                    logger.info(f"用户取消，已编码 {frames_written}/{self.frame_count} 帧")
-                    cancelled = True
-                    break
-
-                # Windows 中文路径兼容：使用 numpy 读取
-                if platform.system() == "Windows":
-                    # 使用 numpy.fromfile + cv2.imdecode 处理中文路径
-                    frame_data = np.fromfile(str(frame_path), dtype=np.uint8)
-                    frame = cv2.imdecode(frame_data, cv2.IMREAD_COLOR)
-                else:
-                    frame = cv2.imread(str(frame_path))
-
-                if frame is None:
-                    logger.warning(f"无法读取帧: {frame_path}")
-                    continue
-
-                video.write(frame)
-                frames_written += 1
-
-                if (i + 1) % 10 == 0:
-                    logger.info(f"编码进度: {i + 1}/{self.frame_count} 帧")
-
-            # 释放视频资源（必须在移动文件前释放）
-            video.release()
-            video = None
-
-            # 取消时删除半成品文件后直接返回
-            if cancelled:
-                import os
-                target = self.output_path
-                if target.exists():
-                    target.unlink()
-                    logger.info(f"已删除半成品视频: {target}")
-                if cleanup:
-                    self.cleanup_temp_files()
+                encode_start = time.perf_counter()
+                finished = self._encode_to(self.output_path, self.frame_paths, factor, stop_event)
+                if finished is None:
+                    return self._cancelled(cleanup)
+                stage = "timelapse.encode"
+            elapsed = time.perf_counter() - encode_start
+            self.encode_seconds += elapsed
+            profiling.record(stage, elapsed)
+            if not finished:
                 return False
 
-            logger.info(f"成功写入 {frames_written}/{self.frame_count} 帧")
-
-            # Windows: 将临时文件移动到最终位置
-            if platform.system() == "Windows" and temp_video_path:
-                import os
-                # 检查临时文件大小
-                temp_size = os.path.getsize(temp_video_path)
-                logger.info(f"临时视频文件大小: {temp_size} 字节")
-                
-                if temp_size == 0:
-                    logger.error("临时视频文件为 0 字节，编码可能失败")
-                    return False
-                
-                # 移动到最终位置
-                shutil.move(temp_video_path, str(self.output_path))
-                logger.info(f"视频已移动到: {self.output_path}")
-                temp_video_path = None  # 标记已移动，不需要清理
-            
+            logger.info(f"成功写入 {self.encode_frames} 帧")
+
             # 检查最终文件
             if self.output_path.exists():
                 final_size = self.output_path.stat().st_size
@@ -311,30 +562,152 @@ class TimelapseGenerator:
             logger.error(f"视频生成失败: {e}", exc_info=True)
             return False
 
+    def _reset_encode_stats(self) -> None:
+        self.encode_frames = 0
+        self.encode_seconds = 0.0
+        self._last_frame = None
+
+    def _cancelled(self, cleanup: bool) -> bool:
+        """用户取消编码：半成品已由编码器删除，按需清理临时文件"""
+        logger.info(f"已删除半成品视频: {self.output_path}")
+        if cleanup:
+            self.cleanup_temp_files()
+        return False
+
+    def _read_frame(self, frame_path: Path) -> Optional[np.ndarray]:
+        """读取一帧 JPEG（BGR）"""
+        import platform
+
+        # Windows 中文路径兼容：使用 numpy.fromfile + cv2.imdecode 读取
+        if platform.system() == "Windows":
+            frame_data = np.fromfile(str(frame_path), dtype=np.uint8)
+            return cv2.imdecode(frame_data, cv2.IMREAD_COLOR)
+        return cv2.imread(str(frame_path))
+
+    def _encode_to(
+        self, output_path: Path, frame_paths: List[Path], factor: int, stop_event=None
+    ) -> Optional[bool]:
+        """
+        把一组帧编码到 output_path
+
+        与上一组帧之间的交叉淡化通过 _last_frame 衔接，分片段编码与一次编码的输出一致。
+
+        Args:
+            output_path: 视频或片段路径
+            frame_paths: 按顺序排列的帧文件
+            factor: 交叉淡化倍数
+            stop_event: threading.Event，置位后中止
+
+        Returns:
+            是否成功；用户取消时返回 None（半成品已删除）
+        """
+        encoder = create_encoder(
+            output_path,
+            self.fps,
+            self.resolution,
+            quality=self.quality,
+            codec=self.codec,
+            threads=self.threads,
+        )
+        logger.info(f"视频编码器已打开: {encoder.description}")
+        try:
+            previous = self._last_frame
+            for i, frame_path in enumerate(frame_paths):
+                if stop_event is not None and stop_event.is_set():
+                    logger.info(f"用户取消，已编码 {i}/{len(frame_paths)} 帧")
+                    encoder.abort()
+                    encoder = None
+                    return None
+
+                frame = self._read_frame(frame_path)
+                if frame is None:
+                    logger.warning(f"无法读取帧: {frame_path}")
+                    continue
+
+                # 交叉淡化插帧：在编码时混合相邻帧，不产生额外的帧文件
+                if factor > 1 and previous is not None and previous.shape == frame.shape:
+                    for step in range(1, factor):
+                        alpha = step / factor
+                        encoder.write(cv2.addWeighted(previous, 1.0 - alpha, frame, alpha, 0.0))
+                        self.encode_frames += 1
+                previous = frame
+
+                encoder.write(frame)
+                self.encode_frames += 1
+
+                if (i + 1) % 10 == 0:
+                    logger.info(f"编码进度: {i + 1}/{len(frame_paths)} 帧")
+
+            self._last_frame = previous
+            # 完成编码（必须在检查文件前结束）
+            finished = encoder.close()
+            encoder = None
+            return finished
         finally:
-            # 确保视频资源被正确释放
-            if video is not None:
-                video.release()
-                logger.debug("VideoWriter 资源已释放")
-            
-            # 清理临时视频文件（如果存在且未移动）
-            if temp_video_path:
-                try:
-                    import os
-                    if os.path.exists(temp_video_path):
-                        os.remove(temp_video_path)
-                        logger.debug(f"已清理临时视频文件: {temp_video_path}")
-                except Exception as e:
-                    logger.warning(f"清理临时视频文件失败: {e}")
+            # 异常退出时确保编码器被释放、半成品被删除
+            if encoder is not None:
+                encoder.abort()
+                logger.debug("视频编码器已中止")
+
+    def _spill(self, stop_event=None) -> bool:
+        """
+        把磁盘上的帧编码成一个中间片段并删除这些帧
+
+        首次编码片段时按预计总帧数确定交叉淡化倍数，之后所有片段沿用。
+
+        Returns:
+            是否完成；用户取消时返回 False
+        """
+        if self._segment_factor is None:
+            self._segment_factor = self.interpolation_factor(self._planned_frame_count())
+        if not self.segments:
+            self._reset_encode_stats()
+
+        segment = self.temp_dir / f"segment_{len(self.segments):03d}.mp4"
+        logger.info(
+            f"编码中间片段: {segment.name} ({len(self.frame_paths)} 帧, "
+            f"{self._frame_bytes / 1024 / 1024:.0f} MB)"
+        )
+        start = time.perf_counter()
+        finished = self._encode_to(segment, self.frame_paths, self._segment_factor, stop_event)
+        elapsed = time.perf_counter() - start
+        self.encode_seconds += elapsed
+        profiling.record("timelapse.segment", elapsed)
+        if finished is None:
+            return False
+        if not finished:
+            raise RuntimeError(f"中间片段编码失败: {segment}")
+
+        for frame_path in self.frame_paths:
+            frame_path.unlink(missing_ok=True)
+        self.frame_paths = []
+        self._frame_bytes = 0
+        self.segments.append(segment)
+        return True
+
+    def shutdown(self) -> None:
+        """停止帧准备工作线程（已排队的帧会先写完）；共享线程池只等待本生成器的帧"""
+        if not self._owns_executor:
+            self.flush()
+            return
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._collect_done()
 
     def cleanup_temp_files(self) -> None:
         """删除临时帧文件"""
         logger.info(f"清理临时文件: {self.temp_dir}")
+        self.shutdown()
+        self.flush()
 
         try:
             for frame_path in self.frame_paths:
                 if frame_path.exists():
                     frame_path.unlink()
+            for segment in self.segments:
+                segment.unlink(missing_ok=True)
+            (self.temp_dir / OWNER_MARKER).unlink(missing_ok=True)
 
             # 删除临时目录（如果为空）
             if self.temp_dir.exists() and not any(self.temp_dir.iterdir()):
@@ -348,5 +721,7 @@ class TimelapseGenerator:
         return self.frame_count
 
     def get_duration(self) -> float:
-        """获取视频时长（秒）"""
-        return self.frame_count / self.fps
+        """获取视频时长（秒，含交叉淡化插帧）"""
+        if self.frame_count == 0:
+            return 0.0
+        return ((self.frame_count - 1) * self.interpolation_factor() + 1) / self.fps
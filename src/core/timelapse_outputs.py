@@ -0,0 +1,242 @@
+"""
+多路延时视频输出管理
+
+一次解码可以同时输出多路延时视频（星轨累积、银河原始帧、彗星尾迹）。
+各路共享：
+- 降采样：每帧只缩放一次到视频分辨率（缓存在帧金字塔中），所有输出复用同一份快照
+- 帧准备线程池：拉伸 + JPEG 编码在同一个有界线程池中进行
+- 拉伸查找表：16-bit → 8-bit 查找表按拉伸范围跨帧、跨输出缓存
+最后各路视频并发编码，并记录每一路的编码吞吐量。
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .pyramid import ImagePyramid
+from .timelapse_generator import TimelapseGenerator
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class TimelapseOutputs:
+    """多路延时视频输出管理器"""
+
+    # 帧来源：
+    #   trail  - 星轨累积，由 StackingEngine 用与成片相同的算子喂入
+    #   frame  - 原始帧（银河延时），由 add_frame 喂入
+    #   comet  - 彗星尾迹，管理器在视频分辨率上维护衰减累加器
+    SOURCES = ("trail", "frame", "comet")
+
+    def __init__(
+        self,
+        fps: int = 25,
+        resolution: Optional[Tuple[int, int]] = None,
+        quality: str = "high",
+        codec: str = "h264",
+        workers: int = 2,
+        max_pending: int = 4,
+        target_duration: Optional[float] = None,
+        expected_frames: Optional[int] = None,
+        interpolate: bool = False,
+        comet_fade: float = 0.97,
+        temp_budget_mb: float = 0,
+    ):
+        """
+        Args:
+            fps: 帧率
+            resolution: 视频分辨率 (width, height)；None 表示按第一帧自动计算
+            quality: 视频画质 ('high', 'medium', 'low')
+            codec: 视频编码 ('h264', 'h265')
+            workers: 共享的帧准备线程数
+            max_pending: 每一路最多排队的帧数
+            target_duration: 目标视频时长（秒），见 TimelapseGenerator
+            expected_frames: 预计输入张数
+            interpolate: 帧数不足时是否插入交叉淡化帧
+            comet_fade: 彗星输出的衰减因子（0.0-1.0）
+            temp_budget_mb: 所有输出合计的临时帧磁盘预算（MB），按路数平均分配，0 表示不限制
+        """
+        self.fps = fps
+        self.resolution = resolution
+        self.quality = quality
+        self.codec = codec
+        self.max_pending = max_pending
+        self.target_duration = target_duration
+        self.expected_frames = expected_frames
+        self.interpolate = interpolate
+        self.comet_fade = comet_fade
+        self.temp_budget_mb = temp_budget_mb
+
+        self.streams: Dict[str, TimelapseGenerator] = {}
+        self.sources: Dict[str, str] = {}
+        self._comet_results: Dict[str, Optional[np.ndarray]] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(int(workers), 1), thread_name_prefix="sst-timelapse"
+        )
+
+    def __len__(self) -> int:
+        return len(self.streams)
+
+    def add_stream(self, name: str, output_path: Path, source: str = "frame") -> TimelapseGenerator:
+        """
+        添加一路输出
+
+        Args:
+            name: 输出名称（用于日志和结果字典）
+            output_path: 视频路径
+            source: 帧来源 ('trail', 'frame', 'comet')
+
+        Returns:
+            该路的 TimelapseGenerator；'trail' 来源需要交给 StackingEngine
+        """
+        if source not in self.SOURCES:
+            raise ValueError(f"不支持的延时帧来源: {source}")
+        if name in self.streams:
+            raise ValueError(f"延时输出名称重复: {name}")
+
+        generator = TimelapseGenerator(
+            output_path=output_path,
+            fps=self.fps,
+            resolution=self.resolution,
+            quality=self.quality,
+            codec=self.codec,
+            max_pending=self.max_pending,
+            target_duration=self.target_duration,
+            expected_frames=self.expected_frames,
+            interpolate=self.interpolate,
+            executor=self._executor,
+        )
+        self.streams[name] = generator
+        self.sources[name] = source
+        if self.temp_budget_mb:
+            share = int(self.temp_budget_mb * 1024 * 1024 / len(self.streams))
+            for stream in self.streams.values():
+                stream.temp_budget_bytes = share
+        if source == "comet":
+            self._comet_results[name] = None
+        return generator
+
+    def _names(self, source: str) -> List[str]:
+        return [name for name, src in self.sources.items() if src == source]
+
+    def _resolve(self, shape: Tuple[int, ...]) -> Tuple[int, int]:
+        """确定共享的视频分辨率并同步到每一路，保证各路命中同一份金字塔缓存"""
+        if self.resolution is None:
+            first = next(iter(self.streams.values()))
+            self.resolution = first.target_resolution(shape)
+            for generator in self.streams.values():
+                generator.resolution = self.resolution
+        return self.resolution
+
+    def needs_frame(self, state: int) -> bool:
+        """
+        第 state 个堆栈状态是否需要缩放：累加型输出每帧都要，原始帧输出只在被抽中时需要
+
+        按堆栈状态序号（成功加入的帧数）而不是文件序号判断：
+        失败的帧不调用 add_frame，不占用生成器的状态序号。
+        """
+        if self._names("trail") or self._names("comet"):
+            return True
+        return any(self.streams[name].wants_state(state) for name in self._names("frame"))
+
+    def warm(self, state: int, pyramid: ImagePyramid) -> None:
+        """
+        预取线程中调用：把帧缩放到视频分辨率并缓存在金字塔中（所有输出共用一份）
+
+        可直接作为 FramePipeline 的 prepare 回调（FramePipeline 传入的正是状态序号）。
+        """
+        if self.streams and self.needs_frame(state):
+            pyramid.resize_to(*self._resolve(pyramid.shape))
+
+    def add_frame(self, image: np.ndarray, pyramid: Optional[ImagePyramid] = None) -> None:
+        """
+        提交一张输入帧：原始帧输出和彗星输出共用同一份降采样快照
+
+        星轨累积输出由 StackingEngine.add_image 喂入，这里不处理。
+
+        Args:
+            image: 16-bit 输入图像 (H, W, 3)
+            pyramid: 该帧共享的图像金字塔（可选）
+        """
+        frame_names = [name for name in self._names("frame") if self.streams[name].take_state()]
+        comet_names = self._names("comet")
+        if not frame_names and not comet_names:
+            return
+
+        self._resolve(image.shape)
+        small = self.streams[(frame_names or comet_names)[0]].snapshot(image, pyramid)
+
+        for name in frame_names:
+            self.streams[name].submit(small)
+
+        for name in comet_names:
+            generator = self.streams[name]
+            previous = self._comet_results[name]
+            if previous is None:
+                current = small.astype(np.float32)
+            else:
+                # 与 StackingEngine 的彗星算子一致；每次生成新数组，已提交的快照不会被改写
+                current = previous * self.comet_fade + small.astype(np.float32) * (1 - self.comet_fade)
+            self._comet_results[name] = current
+            if generator.take_state():
+                generator.submit(current)
+
+    def finish(self, cleanup: bool = True, stop_event=None) -> Dict[str, bool]:
+        """
+        等待所有帧写完，然后并发编码各路视频
+
+        并发编码时把 CPU 核数平均分给各路 ffmpeg，避免线程超额订阅。
+
+        Args:
+            cleanup: 是否删除临时帧文件
+            stop_event: threading.Event，置位后中断所有编码
+
+        Returns:
+            {输出名称: 是否成功}
+        """
+        for generator in self.streams.values():
+            generator.flush()
+        self._executor.shutdown(wait=True)
+        if not self.streams:
+            return {}
+
+        if len(self.streams) > 1:
+            per_stream = max((os.cpu_count() or 1) // len(self.streams), 1)
+            for generator in self.streams.values():
+                if generator.threads == 0:
+                    generator.threads = per_stream
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(self.streams), thread_name_prefix="sst-encode") as pool:
+            futures = {
+                name: pool.submit(generator.generate_video, cleanup=cleanup, stop_event=stop_event)
+                for name, generator in self.streams.items()
+            }
+            results = {name: future.result() for name, future in futures.items()}
+
+        logger.info(f"{len(self.streams)} 路延时视频编码完成，总耗时 {time.perf_counter() - start:.1f}s")
+        for line in self.throughput_lines():
+            logger.info(f"  {line}")
+        return results
+
+    def throughput_lines(self) -> List[str]:
+        """每一路的编码吞吐量"""
+        lines = []
+        for name, generator in self.streams.items():
+            seconds = generator.encode_seconds
+            rate = generator.encode_frames / seconds if seconds > 0 else 0.0
+            lines.append(
+                f"{name:<10}: {generator.encode_frames} 帧  {seconds:.1f}s  {rate:.1f} 帧/s"
+            )
+        return lines
+
+    def cleanup(self) -> None:
+        """取消或出错时释放线程池并删除所有临时帧"""
+        self._executor.shutdown(wait=True)
+        for generator in self.streams.values():
+            generator.cleanup_temp_files()
@@ -0,0 +1,367 @@
+"""
+视频编码后端模块
+
+延时视频的编码器：
+- FFmpegEncoder：通过管道把原始 BGR 帧送入本地 ffmpeg 子进程，使用 x264/x265，
+  按画质设置选择 CRF 和预设，多线程编码，速度和文件大小都明显优于 mp4v
+- OpenCVEncoder：OpenCV VideoWriter (mp4v)，未安装 ffmpeg 时的回退方案
+
+两者接口一致：write() 逐帧写入 BGR uint8 图像，close() 完成编码，abort() 中止并删除半成品。
+concat_segments() 把分段编码的中间片段拼接成一个视频。
+"""
+
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import FrozenSet, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+# 画质设置 → (CRF, x264/x265 预设)；CRF 越小画质越高、文件越大
+QUALITY_PRESETS = {
+    "high": (18, "slow"),
+    "medium": (23, "medium"),
+    "low": (28, "veryfast"),
+}
+
+# 编码格式 → ffmpeg 编码器
+CODECS = {
+    "h264": "libx264",
+    "h265": "libx265",
+}
+
+
+def find_ffmpeg() -> Optional[str]:
+    """
+    查找可用的 ffmpeg 可执行文件
+
+    依次尝试 PATH 和 imageio-ffmpeg（可选依赖，自带静态编译的 ffmpeg）。
+
+    Returns:
+        ffmpeg 路径；均不可用时返回 None
+    """
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def ffmpeg_encoders(ffmpeg_path: str) -> Optional[FrozenSet[str]]:
+    """
+    本地 ffmpeg 编译时包含的视频编码器（按可执行文件缓存）
+
+    部分发行版/静态编译的 ffmpeg 不带 libx265（甚至 libx264）。
+
+    Returns:
+        编码器名称集合；查询失败时返回 None（视为都可用）
+    """
+    try:
+        completed = subprocess.run(
+            [ffmpeg_path, "-hide_banner", "-encoders"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"无法查询 ffmpeg 支持的编码器: {e}")
+        return None
+    if completed.returncode != 0:
+        return None
+    names = set()
+    for line in completed.stdout.decode("utf-8", errors="replace").splitlines():
+        # 形如 " V....D libx264   libx264 H.264 / AVC ..."
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].startswith("V"):
+            names.add(parts[1])
+    return frozenset(names)
+
+
+class FFmpegEncoder:
+    """ffmpeg 管道编码器"""
+
+    def __init__(
+        self,
+        output_path: Path,
+        fps: int,
+        resolution: Tuple[int, int],
+        quality: str = "high",
+        codec: str = "h264",
+        threads: int = 0,
+        ffmpeg_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            output_path: 输出视频路径
+            fps: 帧率
+            resolution: (宽, 高)，必须为偶数
+            quality: 画质 ('high', 'medium', 'low')
+            codec: 编码格式 ('h264', 'h265')
+            threads: 编码线程数，0 表示由编码器按 CPU 核数自动选择
+            ffmpeg_path: ffmpeg 可执行文件路径（默认自动查找）
+        """
+        if quality not in QUALITY_PRESETS:
+            raise ValueError(f"不支持的画质设置: {quality}")
+        if codec not in CODECS:
+            raise ValueError(f"不支持的编码格式: {codec}")
+
+        self.output_path = Path(output_path)
+        self.resolution = resolution
+        self.ffmpeg_path = ffmpeg_path or find_ffmpeg()
+        if self.ffmpeg_path is None:
+            raise RuntimeError("未找到 ffmpeg")
+
+        crf, preset = QUALITY_PRESETS[quality]
+        width, height = resolution
+        self.command = [
+            self.ffmpeg_path, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            "-c:v", CODECS[codec], "-preset", preset, "-crf", str(crf),
+            "-pix_fmt", "yuv420p", "-threads", str(int(threads)),
+            "-movflags", "+faststart",
+        ]
+        if codec == "h265":
+            self.command += ["-tag:v", "hvc1"]  # QuickTime / iOS 需要 hvc1 标记
+        self.command.append(str(self.output_path))
+        self.description = f"ffmpeg {CODECS[codec]} crf={crf} preset={preset}"
+
+        # stderr 写入临时文件而不是管道，避免缓冲区写满导致子进程阻塞
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr
+        )
+
+    def write(self, frame: np.ndarray) -> None:
+        """写入一帧 BGR uint8 图像 (H, W, 3)"""
+        if frame.shape[1::-1] != tuple(self.resolution):
+            frame = cv2.resize(frame, tuple(self.resolution), interpolation=cv2.INTER_AREA)
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).tobytes())
+        except (BrokenPipeError, OSError) as e:
+            raise RuntimeError(f"ffmpeg 编码中断: {self._error_output() or e}") from e
+
+    def close(self) -> bool:
+        """结束输入并等待编码完成"""
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = self._process.wait()
+        if returncode != 0:
+            logger.error(f"ffmpeg 退出码 {returncode}: {self._error_output()}")
+            # 失败时 ffmpeg 可能已写出不完整的文件头，删除半成品
+            self.output_path.unlink(missing_ok=True)
+        self._stderr.close()
+        return returncode == 0
+
+    def abort(self) -> None:
+        """中止编码并删除半成品文件"""
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.kill()
+        self._process.wait()
+        self._stderr.close()
+        if self.output_path.exists():
+            self.output_path.unlink()
+
+    def _error_output(self) -> str:
+        self._stderr.seek(0)
+        return self._stderr.read().decode("utf-8", errors="replace").strip()
+
+
+class OpenCVEncoder:
+    """OpenCV VideoWriter (mp4v) 编码器"""
+
+    def __init__(self, output_path: Path, fps: int, resolution: Tuple[int, int]):
+        """
+        Args:
+            output_path: 输出视频路径
+            fps: 帧率
+            resolution: (宽, 高)
+        """
+        self.output_path = Path(output_path)
+        self.resolution = resolution
+        self.description = "OpenCV mp4v"
+        self._temp_path = None
+
+        # Windows 上 OpenCV 无法处理中文路径，需要先写入临时文件
+        if platform.system() == "Windows":
+            temp_fd, self._temp_path = tempfile.mkstemp(suffix=".mp4")
+            os.close(temp_fd)  # 关闭文件描述符，让 OpenCV 可以写入
+            target = self._temp_path
+            logger.info(f"Windows: 使用临时路径 {self._temp_path}")
+        else:
+            target = str(self.output_path)
+
+        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        self._writer = cv2.VideoWriter(target, fourcc, fps, resolution)
+        if not self._writer.isOpened():
+            logger.error(f"无法打开视频编码器, 路径: {target}")
+            logger.error(f"编码器: mp4v, FPS: {fps}, 分辨率: {resolution}")
+            self._remove_temp()
+            raise RuntimeError("无法打开视频编码器")
+
+    def write(self, frame: np.ndarray) -> None:
+        """写入一帧 BGR uint8 图像 (H, W, 3)"""
+        self._writer.write(frame)
+
+    def close(self) -> bool:
+        """释放编码器；Windows 下把临时文件移动到最终位置"""
+        self._writer.release()
+        if self._temp_path is None:
+            return True
+
+        try:
+            temp_size = os.path.getsize(self._temp_path)
+            logger.info(f"临时视频文件大小: {temp_size} 字节")
+            if temp_size == 0:
+                logger.error("临时视频文件为 0 字节，编码可能失败")
+                return False
+            shutil.move(self._temp_path, str(self.output_path))
+            logger.info(f"视频已移动到: {self.output_path}")
+            self._temp_path = None
+            return True
+        finally:
+            self._remove_temp()
+
+    def abort(self) -> None:
+        """中止编码并删除半成品文件"""
+        self._writer.release()
+        self._remove_temp()
+        if self.output_path.exists():
+            self.output_path.unlink()
+
+    def _remove_temp(self) -> None:
+        if self._temp_path and os.path.exists(self._temp_path):
+            try:
+                os.remove(self._temp_path)
+                logger.debug(f"已清理临时视频文件: {self._temp_path}")
+            except OSError as e:
+                logger.warning(f"清理临时视频文件失败: {e}")
+        self._temp_path = None
+
+
+def create_encoder(
+    output_path: Path,
+    fps: int,
+    resolution: Tuple[int, int],
+    quality: str = "high",
+    codec: str = "h264",
+    threads: int = 0,
+):
+    """
+    创建视频编码器：优先 ffmpeg，不可用或启动失败时回退到 OpenCV
+
+    本地 ffmpeg 不带所选编码器（常见于 libx265）时依次改用 CODECS 中可用的编码格式，
+    都不可用时回退到 OpenCV。
+
+    Args:
+        output_path: 输出视频路径
+        fps: 帧率
+        resolution: (宽, 高)
+        quality: 画质 ('high', 'medium', 'low')，仅 ffmpeg 生效
+        codec: 编码格式 ('h264', 'h265')，仅 ffmpeg 生效
+        threads: 编码线程数，0 表示自动
+
+    Returns:
+        FFmpegEncoder 或 OpenCVEncoder
+    """
+    ffmpeg_path = find_ffmpeg()
+    if ffmpeg_path is None:
+        logger.info("未找到 ffmpeg，使用 OpenCV mp4v 编码（画质设置不生效）")
+        return OpenCVEncoder(output_path, fps, resolution)
+
+    encoders = ffmpeg_encoders(ffmpeg_path)
+    if encoders is not None and codec in CODECS and CODECS[codec] not in encoders:
+        fallback = next((name for name, encoder in CODECS.items() if encoder in encoders), None)
+        if fallback is None:
+            logger.warning(f"本地 ffmpeg 不支持 {'/'.join(CODECS.values())}，改用 OpenCV 编码")
+            return OpenCVEncoder(output_path, fps, resolution)
+        logger.warning(f"本地 ffmpeg 不支持 {CODECS[codec]}，改用 {CODECS[fallback]}")
+        codec = fallback
+
+    try:
+        return FFmpegEncoder(
+            output_path, fps, resolution,
+            quality=quality, codec=codec, threads=threads, ffmpeg_path=ffmpeg_path,
+        )
+    except OSError as e:
+        logger.warning(f"启动 ffmpeg 失败（{e}），改用 OpenCV 编码")
+    return OpenCVEncoder(output_path, fps, resolution)
+
+
+def concat_segments(
+    segments: List[Path], output_path: Path, fps: int, resolution: Tuple[int, int]
+) -> bool:
+    """
+    把按顺序编码的中间片段拼接成一个视频
+
+    有 ffmpeg 时用 concat 分离器直接复制码流（不重新编码、不损失画质）；
+    否则用 OpenCV 逐帧读出片段再写入 mp4v（回退方案）。
+
+    Args:
+        segments: 片段路径（编码参数必须一致）
+        output_path: 输出视频路径
+        fps: 帧率
+        resolution: (宽, 高)
+
+    Returns:
+        是否成功
+    """
+    output_path = Path(output_path)
+    ffmpeg_path = find_ffmpeg()
+    if ffmpeg_path is not None:
+        list_path = Path(segments[0]).parent / "segments.txt"
+        # concat 列表中的路径需要转义单引号
+        lines = ["file '{}'".format(str(Path(seg).resolve()).replace("'", "'\\''")) for seg in segments]
+        list_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        try:
+            completed = subprocess.run(
+                [
+                    ffmpeg_path, "-y", "-loglevel", "error",
+                    "-f", "concat", "-safe", "0", "-i", str(list_path),
+                    "-c", "copy", "-movflags", "+faststart", str(output_path),
+                ],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+        finally:
+            list_path.unlink(missing_ok=True)
+        if completed.returncode != 0:
+            logger.error(f"拼接片段失败: {completed.stderr.decode('utf-8', errors='replace').strip()}")
+            if output_path.exists():
+                output_path.unlink()
+            return False
+        return True
+
+    encoder = OpenCVEncoder(output_path, fps, resolution)
+    try:
+        for segment in segments:
+            capture = cv2.VideoCapture(str(segment))
+            try:
+                while True:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    encoder.write(frame)
+            finally:
+                capture.release()
+    except Exception:
+        encoder.abort()
+        raise
+    return encoder.close()
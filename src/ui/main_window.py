@@ -23,8 +23,11 @@ import numpy as np
 
 from core.raw_processor import RawProcessor
 from core.cancellation import ProcessingCancelledError
+from core.frame_pipeline import FramePipeline
+from core.pyramid import ImagePyramid
 from core.stacking_engine import StackingEngine, StackMode
 from utils.logger import setup_logger
+from utils import profiling
 from utils.settings import get_settings
 from utils.file_naming import FileNamingService
 from ui.dialogs import AboutDialog, PreferencesDialog
@@ -38,7 +41,7 @@ logger = setup_logger(__name__)
 class PreviewThread(QThread):
     """单文件预览线程 —— 避免 RAW 解码阻塞主线程（C6）"""
 
-    preview_ready = pyqtSignal(np.ndarray, object)  # (image, file_path)
+    preview_ready = pyqtSignal(np.ndarray, object, object)  # (image, file_path, pyramid)
     preview_error = pyqtSignal(str, object)          # (error_msg, file_path)
 
     def __init__(self, file_path: Path, raw_params: dict, rotation: int = 0):
@@ -55,7 +58,10 @@ class PreviewThread(QThread):
                 self.file_path, apply_exif_rotation=True,
                 rotation=self.rotation, **self.raw_params
             )
-            self.preview_ready.emit(img, self.file_path)
+            # 在子线程中预先计算预览尺寸的降采样，主线程只做拉伸和显示
+            pyramid = ImagePyramid(img)
+            pyramid.fit(get_settings().get_preview_max_size())
+            self.preview_ready.emit(img, self.file_path, pyramid)
         except Exception as e:
             self.preview_error.emit(str(e), self.file_path)
 
@@ -65,15 +71,24 @@ class SaveThread(QThread):
 
     save_finished = pyqtSignal(bool, str)  # (success, filename)
 
-    def __init__(self, image: np.ndarray, output_path: Path):
+    def __init__(self, image: np.ndarray, output_path: Path, pyramid: Optional[ImagePyramid] = None):
         super().__init__()
         self.image = image
         self.output_path = output_path
+        self.pyramid = pyramid  # 预览时已算好的降采样层，供 TIFF 子层和预览图复用
 
     def run(self):
         try:
             from core.exporter import ImageExporter
-            success = ImageExporter().save_auto(self.image, self.output_path)
+            kwargs = {}
+            if self.output_path.suffix.lower() in (".tif", ".tiff"):
+                settings = get_settings()
+                kwargs["compression"] = settings.get_tiff_compression()
+                kwargs["pyramid_levels"] = settings.get_tiff_pyramid_levels()
+                kwargs["pyramid"] = self.pyramid
+                if settings.get_preview_sidecar():
+                    kwargs["preview_path"] = ImageExporter.preview_path_for(self.output_path)
+            success = ImageExporter().save_auto(self.image, self.output_path, **kwargs)
             self.save_finished.emit(success, self.output_path.name)
         except Exception as e:
             logger.error(f"SaveThread 保存失败: {e}")
@@ -110,6 +125,7 @@ class ProcessThread(QThread):
         rotation: int = 0,
         mask_path: Optional[Path] = None,
         fg_mode: "StackMode" = None,
+        enable_alignment: bool = False,
     ):
         super().__init__()
         self.file_paths = file_paths
@@ -128,6 +144,7 @@ class ProcessThread(QThread):
         self.rotation = rotation
         self.mask_path = mask_path
         self.fg_mode = fg_mode
+        self.enable_alignment = enable_alignment
         self._stop_event = Event()  # 使用线程安全的 Event 替代布尔标志
 
     def run(self):
@@ -136,6 +153,8 @@ class ProcessThread(QThread):
         from utils.logger import setup_logger, enable_file_logging
 
         logger = setup_logger("ProcessThread")
+        timelapse_outputs = None
+        videos_done = False
 
         try:
             processor = RawProcessor()
@@ -155,6 +174,10 @@ class ProcessThread(QThread):
             log_file_path = enable_file_logging(output_dir)
             logger.info(f"输出目录: {output_dir}")
 
+            # 阶段剖析（设置中开启或 SST_PROFILE=1 时），结束后报告写在日志文件旁边；
+            # 未开启时流水线仍用自己的剖析器汇总阶段耗时
+            profiler = profiling.activate() if get_settings().get_profile_report() else None
+
             # 如果启用延时视频，生成输出路径
             timelapse_output_path = None
             if self.enable_timelapse:
@@ -167,17 +190,28 @@ class ProcessThread(QThread):
                 )
                 timelapse_output_path = output_dir / video_filename
 
-            # 如果启用银河延时视频，创建生成器
-            milkyway_timelapse_generator = None
-            milkyway_timelapse_path = None
+            # 延时视频输出（星轨 / 银河）：共享降采样和帧准备线程池，最后并发编码
+            from core.timelapse_outputs import TimelapseOutputs
+            timelapse_outputs = TimelapseOutputs(
+                fps=self.video_fps,
+                quality=get_settings().get_video_quality(),
+                codec=get_settings().get_video_codec(),
+                target_duration=get_settings().get_video_duration(),
+                expected_frames=len(self.file_paths),
+                interpolate=get_settings().get_video_interpolate(),
+                temp_budget_mb=get_settings().get_timelapse_temp_budget(),
+            )
+            video_paths = {}
+            trail_generator = None
+            if timelapse_output_path is not None:
+                video_paths["startrail"] = timelapse_output_path
+                trail_generator = timelapse_outputs.add_stream(
+                    "startrail", timelapse_output_path, source="trail"
+                )
             if self.enable_simple_timelapse:
-                from core.timelapse_generator import TimelapseGenerator
                 milkyway_video_filename = f"MilkyWayTimelapse_{self.file_paths[0].stem}-{self.file_paths[-1].stem}_{self.video_fps}FPS.mp4"
-                milkyway_timelapse_path = output_dir / milkyway_video_filename
-                milkyway_timelapse_generator = TimelapseGenerator(
-                    output_path=milkyway_timelapse_path,
-                    fps=self.video_fps,
-                )
+                video_paths["milkyway"] = output_dir / milkyway_video_filename
+                timelapse_outputs.add_stream("milkyway", video_paths["milkyway"], source="frame")
 
             # 加载蒙版（如有）
             sky_mask = None
@@ -199,11 +233,9 @@ class ProcessThread(QThread):
                 enable_gap_filling=self.enable_gap_filling,
                 gap_fill_method=self.gap_fill_method,
                 gap_size=self.gap_size,
-                enable_timelapse=self.enable_timelapse,
-                timelapse_output_path=timelapse_output_path,
-                video_fps=self.video_fps,
                 sky_mask=sky_mask,
                 fg_mode=self.fg_mode if self.fg_mode is not None else StackMode.AVERAGE,
+                timelapse_generator=trail_generator,
             )
 
             # 如果是彗星模式，设置衰减因子
@@ -230,6 +262,7 @@ class ProcessThread(QThread):
             if self.enable_gap_filling:
                 self.log_message.emit(f"填充方法: {self.gap_fill_method}, 间隔大小: {self.gap_size}")
             self.log_message.emit(f"去卫星划痕: {'启用 (Hough 直线检测)' if self.enable_satellite_removal else '禁用'}")
+            self.log_message.emit(f"图像对齐: {'启用 (相位相关)' if self.enable_alignment else '禁用'}")
             self.log_message.emit(f"星轨延时: {'启用 (4K ' + str(self.video_fps) + 'FPS)' if self.enable_timelapse else '禁用'}")
             self.log_message.emit(f"银河延时: {'启用 (4K ' + str(self.video_fps) + 'FPS)' if self.enable_simple_timelapse else '禁用'}")
             self.log_message.emit("=" * 60)
@@ -257,15 +290,36 @@ class ProcessThread(QThread):
                 from core.satellite_filter import SatelliteFilter
                 sat_filter = SatelliteFilter()
 
+            # 帧配准（修正三脚架漂移），在预取线程中估计和变换
+            registrar = None
+            if self.enable_alignment:
+                from core.registration import FrameRegistrar
+                registrar = FrameRegistrar(cache_tag=f"rotation={self.rotation}")
+
             # 若蒙版加载时已处理第一张图，缓存以避免重复 I/O
             _cached_first_img = first_img if sky_mask is not None and first_img is not None else None
 
-            for i, path in enumerate(self.file_paths):
+            def _load(index, path):
+                if index == 0 and _cached_first_img is not None:
+                    return _cached_first_img
+                return processor.process(path, rotation=self.rotation, **self.raw_params)
+
+            # 解码 + 划痕检测在工作线程中预取，与堆栈重叠执行；
+            # 延时视频所需的降采样也在预取线程中完成，结果缓存在每帧的金字塔中，各路输出共用
+            pipeline = FramePipeline(
+                self.file_paths, _load, detector=sat_filter,
+                prepare=timelapse_outputs.warm if timelapse_outputs else None,
+                profiler=profiler,
+                registrar=registrar,
+            )
+
+            last_done = time.time()
+            for frame in pipeline:
                 if self._stop_event.is_set():
                     logger.warning("用户取消处理")
                     break
 
-                file_start = time.time()
+                i, path = frame.index, frame.path
 
                 try:
                     # 读取并处理 RAW 文件
@@ -273,29 +327,28 @@ class ProcessThread(QThread):
                     logger.info(log_msg)
                     self.log_message.emit(log_msg)
 
-                    if i == 0 and _cached_first_img is not None:
-                        img = _cached_first_img
-                    else:
-                        img = processor.process(path, rotation=self.rotation, **self.raw_params)
-
-                    # 如果启用银河延时视频，添加此帧
-                    if milkyway_timelapse_generator:
-                        milkyway_timelapse_generator.add_frame(img)
-
-                    # 划痕检测（如果启用）
-                    satellite_mask = None
-                    if sat_filter is not None:
-                        satellite_mask = sat_filter.detect_streaks(img)
-                        if satellite_mask.any():
-                            satellite_removed_count += 1
-                            log_msg = f"[{i+1:3d}/{total}] 🛸 检测到划痕，已遮罩 {satellite_mask.sum():,} 像素"
-                            logger.info(log_msg)
-                            self.log_message.emit(log_msg)
+                    if frame.error is not None:
+                        raise frame.error
+                    img = frame.image
+
+                    # 如果启用银河延时视频，添加此帧（复用预取阶段构建的金字塔）
+                    if timelapse_outputs:
+                        with pipeline.timed("timelapse"):
+                            timelapse_outputs.add_frame(img, pyramid=frame.pyramid)
+
+                    # 划痕检测结果（如果启用）
+                    satellite_mask = frame.streaks
+                    if satellite_mask is not None and satellite_mask.any():
+                        satellite_removed_count += 1
+                        log_msg = f"[{i+1:3d}/{total}] 🛸 检测到划痕，已遮罩 {satellite_mask.sum():,} 像素"
+                        logger.info(log_msg)
+                        self.log_message.emit(log_msg)
 
                     # 添加到堆栈（传入遮罩）
-                    engine.add_image(img, satellite_mask=satellite_mask)
+                    with pipeline.timed("stack"):
+                        engine.add_image(img, satellite_mask=satellite_mask, pyramid=frame.pyramid)
 
-                    file_duration = time.time() - file_start
+                    file_duration = time.time() - last_done
                     log_msg = f"[{i+1:3d}/{total}] 完成: {path.name} ({file_duration:.2f}秒)"
                     logger.info(log_msg)
                     self.log_message.emit(log_msg)
@@ -306,6 +359,9 @@ class ProcessThread(QThread):
                     self.log_message.emit(log_msg)
                     failed_files.append((path.name, str(e)))  # 记录失败的文件和错误信息
                     # 继续处理下一张
+                finally:
+                    frame.image = frame.pyramid = None  # 尽早释放预取帧内存
+                    last_done = time.time()
 
                 # 发送进度
                 self.progress.emit(i + 1, total)
@@ -331,8 +387,14 @@ class ProcessThread(QThread):
                 # 每处理 3 张图片更新一次预览（不应用填充，加快速度）
                 if ((i + 1) % 3 == 0 or i == total - 1) and engine.count > 0:
                     logger.info(f"更新预览 ({i+1}/{total})")
-                    preview = engine.get_result(apply_gap_filling=False)
-                    self.preview_update.emit(preview)
+                    with pipeline.timed("preview"):
+                        preview = engine.get_result(apply_gap_filling=False)
+                        self.preview_update.emit(preview)
+
+            if registrar is not None:
+                registrar.close()
+                if registrar.unreliable:
+                    self.log_message.emit(f"⚠️  {registrar.unreliable} 张对齐不可靠，保持原样")
 
             success_count = total - len(failed_files)
             if success_count == 0:
@@ -349,6 +411,10 @@ class ProcessThread(QThread):
                         f"🛸 共检测到划痕帧: {satellite_removed_count}/{total} 张"
                     )
                 self.log_message.emit(f"平均速度: {total_duration/total:.2f} 秒/张")
+                self.log_message.emit("阶段耗时:")
+                for line in pipeline.summary_lines():
+                    self.log_message.emit(f"  {line}")
+                    logger.info(f"阶段耗时 {line}")
 
                 logger.info(f"-" * 60)
                 logger.info(f"✅ 堆栈完成!")
@@ -375,61 +441,33 @@ class ProcessThread(QThread):
                     self.log_message.emit(f"间隔填充完成，耗时: {gap_duration:.2f} 秒")
                     logger.info(f"间隔填充完成，耗时: {gap_duration:.2f} 秒")
 
-                # 生成星轨延时视频（如果启用，且未取消）
-                if self.enable_timelapse and not self._stop_event.is_set():
+                # 并发编码星轨 / 银河延时视频（如果启用，且未取消）
+                if timelapse_outputs and not self._stop_event.is_set():
+                    labels = {"startrail": "星轨延时视频", "milkyway": "银河延时视频"}
                     self.log_message.emit("-" * 60)
-                    self.log_message.emit("正在生成星轨延时视频...")
+                    self.log_message.emit(f"正在生成延时视频（{len(timelapse_outputs)} 路并发编码）...")
                     logger.info(f"-" * 60)
-                    logger.info(f"正在生成星轨延时视频...")
-                    self.status_message.emit("正在生成星轨延时...")
+                    logger.info(f"正在生成延时视频（{len(timelapse_outputs)} 路并发编码）...")
+                    self.status_message.emit("正在生成延时视频...")
                     timelapse_start = time.time()
 
-                    success = engine.finalize_timelapse(cleanup=True, stop_event=self._stop_event)
+                    video_results = timelapse_outputs.finish(cleanup=True, stop_event=self._stop_event)
+                    videos_done = True
                     if self._stop_event.is_set():
-                        raise ProcessingCancelledError("用户取消了星轨延时生成")
-
-                    if success:
-                        timelapse_duration = time.time() - timelapse_start
-                        self.log_message.emit(f"✅ 星轨延时视频生成完成，耗时: {timelapse_duration:.2f} 秒")
-                        self.log_message.emit(f"视频保存至: {timelapse_output_path.name}")
-                        logger.info(f"星轨延时视频生成完成，耗时: {timelapse_duration:.2f} 秒")
-                        logger.info(f"视频保存至: {timelapse_output_path}")
-                        # 发送视频路径信号
-                        self.timelapse_generated.emit(str(timelapse_output_path))
-                    else:
-                        self.log_message.emit("❌ 星轨延时视频生成失败")
-                        logger.error("星轨延时视频生成失败")
-
-                # 生成银河延时视频（如果启用，且未取消）
-                if self.enable_simple_timelapse and milkyway_timelapse_generator and not self._stop_event.is_set():
-                    self.log_message.emit("-" * 60)
-                    self.log_message.emit("正在生成银河延时视频...")
-                    logger.info(f"-" * 60)
-                    logger.info(f"正在生成银河延时视频...")
-                    self.status_message.emit("正在生成银河延时...")
-                    milkyway_timelapse_start = time.time()
-
-                    try:
-                        success = milkyway_timelapse_generator.generate_video(cleanup=True, stop_event=self._stop_event)
-                        if self._stop_event.is_set():
-                            raise ProcessingCancelledError("用户取消了银河延时生成")
-
-                        if success:
-                            milkyway_timelapse_duration = time.time() - milkyway_timelapse_start
-                            self.log_message.emit(f"✅ 银河延时视频生成完成，耗时: {milkyway_timelapse_duration:.2f} 秒")
-                            self.log_message.emit(f"视频保存至: {milkyway_timelapse_path.name}")
-                            logger.info(f"银河延时视频生成完成，耗时: {milkyway_timelapse_duration:.2f} 秒")
-                            logger.info(f"视频保存至: {milkyway_timelapse_path}")
+                        raise ProcessingCancelledError("用户取消了延时视频生成")
+
+                    timelapse_duration = time.time() - timelapse_start
+                    self.log_message.emit(f"延时视频生成完成，耗时: {timelapse_duration:.2f} 秒")
+                    for name, line in zip(timelapse_outputs.streams, timelapse_outputs.throughput_lines()):
+                        if video_results[name]:
+                            self.log_message.emit(f"✅ {labels[name]}: {video_paths[name].name}")
+                            self.log_message.emit(f"    {line}")
+                            logger.info(f"{labels[name]}保存至: {video_paths[name]}")
                             # 发送视频路径信号
-                            self.timelapse_generated.emit(str(milkyway_timelapse_path))
+                            self.timelapse_generated.emit(str(video_paths[name]))
                         else:
-                            self.log_message.emit("❌ 银河延时视频生成失败")
-                            logger.error("银河延时视频生成失败")
-                    except ProcessingCancelledError:
-                        raise
-                    except Exception as e:
-                        self.log_message.emit(f"❌ 银河延时视频生成失败: {str(e)}")
-                        logger.error(f"银河延时视频生成失败: {e}")
+                            self.log_message.emit(f"❌ {labels[name]}生成失败")
+                            logger.error(f"{labels[name]}生成失败")
 
                 # 显示失败文件汇总
                 if failed_files:
@@ -462,6 +500,15 @@ class ProcessThread(QThread):
             traceback.print_exc()
             self.error.emit(str(e))
         finally:
+            # 取消或出错时 finish 没有执行，临时帧留在输出目录旁边，在这里删除
+            if timelapse_outputs is not None and not videos_done:
+                timelapse_outputs.cleanup()
+            profiler = profiling.deactivate()
+            if profiler is not None:
+                try:
+                    profiling.write_report_next_to_log(profiler)
+                except OSError as e:
+                    logger.warning(f"性能报告保存失败: {e}")
             if self._stop_event.is_set():
                 self.cancelled.emit()
 
@@ -628,12 +675,12 @@ class MainWindow(QMainWindow):
         self._preview_thread.finished.connect(self._prune_old_preview_threads)
         self._preview_thread.start()
 
-    def _on_preview_ready(self, img: np.ndarray, file_path: Path):
+    def _on_preview_ready(self, img: np.ndarray, file_path: Path, pyramid=None):
         """预览线程完成回调"""
         if file_path != self._current_preview_file:
             return
         mask = None
-        self.preview_panel.update_preview(img, mask=mask)
+        self.preview_panel.update_preview(img, mask=mask, pyramid=pyramid)
         self.preview_panel.set_status_file(file_path.name)
         logger.info(f"预览文件: {file_path.name}")
 
@@ -713,6 +760,7 @@ class MainWindow(QMainWindow):
             rotation=self.file_list_panel.get_rotation(),
             mask_path=None,
             fg_mode=None,
+            enable_alignment=get_settings().get_default_alignment(),
         )
 
         # 连接信号
@@ -748,7 +796,9 @@ class MainWindow(QMainWindow):
         if self.process_thread:
             self.process_thread.deleteLater()  # 转交 Qt 管理生命周期，避免 GC 提前销毁
         self.process_thread = None
-        self.preview_panel.update_preview(result)
+        # 预览与保存共享同一金字塔：预览算好的降采样层直接用于 TIFF 子层和预览图
+        pyramid = ImagePyramid(result)
+        self.preview_panel.update_preview(result, pyramid=pyramid)
 
         # 确定输出目录和文件路径
         output_dir = self.file_list_panel.get_output_dir()
@@ -767,7 +817,7 @@ class MainWindow(QMainWindow):
         self.control_panel.update_status("正在保存 TIFF...")
 
         # 后台保存，保存期间保持按钮禁用
-        self._save_thread = SaveThread(self.result_image, tiff_path)
+        self._save_thread = SaveThread(self.result_image, tiff_path, pyramid=pyramid)
         self._save_thread.save_finished.connect(self._on_save_finished)
         self._save_thread.start()
 
@@ -777,6 +827,10 @@ class MainWindow(QMainWindow):
 
         if success:
             self.preview_panel.append_log(f"✅ TIFF 保存成功: {filename}")
+            from core.exporter import ImageExporter
+            preview_path = ImageExporter.preview_path_for(output_dir / filename)
+            if preview_path.exists():
+                self.preview_panel.append_log(f"预览图: {preview_path.name}")
         else:
             self.preview_panel.append_log("❌ TIFF 保存失败")
 
@@ -4,13 +4,14 @@ SOURCE / OUTPUT / ROTATION 三节，零 Emoji，极简专业
 """
 import os
 from pathlib import Path
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QListWidget, QFileDialog,
     QMenu, QMessageBox, QButtonGroup, QSizePolicy, QFrame,
 )
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QPixmap, QFont
 from i18n.translator import Translator
 from ui.styles import (
@@ -25,6 +26,12 @@ from ui.styles import (
 )
 from utils.settings import get_settings
 from core.raw_processor import RawProcessor
+from core.exif_scanner import FrameInfo, format_exposure
+from core.metadata_service import MetadataService, get_metadata_service, summarize
+from core.frame_quality import FrameScore, QualityScorer
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
 
 
 def _hairline():
@@ -35,6 +42,63 @@ def _hairline():
     return sep
 
 
+# 仍在运行的后台线程（元数据 / 质量预检；QThread 对象在线程结束前不能被回收）
+_running_threads: set = set()
+
+
+class MetadataThread(QThread):
+    """元数据读取线程 —— 大目录首次扫描文件头不阻塞界面，之后走元数据索引"""
+
+    metadata_ready = pyqtSignal(list, list)  # (files, frames)
+
+    def __init__(self, files: List[Path], service: MetadataService):
+        super().__init__()
+        self.files = list(files)
+        self.service = service
+
+    def run(self):
+        frames = self.service.get_many(self.files)
+        self.service.save()
+        self.metadata_ready.emit(self.files, frames)
+
+
+class QualityThread(QThread):
+    """帧质量预检线程 —— 缩略图解码和评估在后台并行进行"""
+
+    quality_ready = pyqtSignal(list, list)  # (files, scores)
+
+    def __init__(self, files: List[Path], scorer: QualityScorer):
+        super().__init__()
+        self.files = list(files)
+        self.scorer = scorer
+
+    def run(self):
+        try:
+            scores = self.scorer.evaluate(self.files)
+        except Exception as e:
+            logger.error(f"质量预检失败: {e}", exc_info=True)
+            scores = []
+        self.quality_ready.emit(self.files, scores)
+
+
+def _describe_frame(frame: FrameInfo) -> str:
+    """文件列表悬停提示：拍摄时间 · 快门 · ISO · 光圈 · 焦距"""
+    parts = []
+    if frame.captured is not None:
+        parts.append(datetime.fromtimestamp(frame.captured).strftime("%Y-%m-%d %H:%M:%S"))
+    if frame.exposure:
+        parts.append(format_exposure(frame.exposure))
+    if frame.iso:
+        parts.append(f"ISO {frame.iso}")
+    if frame.aperture:
+        parts.append(f"f/{frame.aperture:g}")
+    if frame.focal_length:
+        parts.append(f"{frame.focal_length:g}mm")
+    if frame.camera:
+        parts.append(frame.camera)
+    return "  ·  ".join(parts)
+
+
 class FileListPanel(QWidget):
     """文件列表管理面板（左侧栏）"""
 
@@ -57,6 +121,8 @@ class FileListPanel(QWidget):
         self._output_dir_is_manual: bool = False
         self._rotation: int = 0
         self._mask_path: Optional[Path] = None
+        self._frames: Dict[Path, FrameInfo] = {}
+        self._quality: Dict[Path, FrameScore] = {}
 
         self._init_ui()
 
@@ -134,6 +200,12 @@ class FileListPanel(QWidget):
         self._recent_btn.clicked.connect(self._show_recent_menu)
         self._refresh_recent_menu()
         meta_row.addWidget(self._recent_btn)
+        self._quality_btn = QPushButton("Check Quality")
+        self._quality_btn.setStyleSheet(LINK_BUTTON_STYLE)
+        self._quality_btn.setFixedHeight(22)
+        self._quality_btn.setToolTip("Score every frame on its thumbnail and exclude clouded, lit or dewed frames")
+        self._quality_btn.clicked.connect(self.check_quality)
+        meta_row.addWidget(self._quality_btn)
         meta_row.addStretch()
         self.label_file_count = QLabel("")
         self.label_file_count.setStyleSheet(f"""
@@ -158,6 +230,7 @@ class FileListPanel(QWidget):
         # Selected / Excluded 统计
         self._stat_lbl = QLabel("")
         self._stat_lbl.setStyleSheet(f"font-size: 10px; color: {COLORS['text_muted']}; padding: 3px 14px;")
+        self._stat_lbl.setWordWrap(True)
         root.addWidget(self._stat_lbl)
 
         root.addWidget(_hairline())
@@ -290,7 +363,10 @@ class FileListPanel(QWidget):
 
         self.raw_files = files
         self.excluded_files.clear()
+        self._frames = {}
+        self._quality = {}
         self.refresh_file_list()
+        self._start_metadata_scan()
 
         # 重置旋转
         self._rotation = 0
@@ -335,8 +411,85 @@ class FileListPanel(QWidget):
         for i, fp in enumerate(self.raw_files):
             text = fp.name if i not in self.excluded_files else f"[excluded]  {fp.name}"
             self.file_list.addItem(text)
+            self.file_list.item(i).setToolTip(self._item_tooltip(fp))
+        self._update_stat_label()
+
+    def _item_tooltip(self, fp: Path) -> str:
+        """条目悬停提示：EXIF 摘要 + 质量预检标记"""
+        lines = []
+        frame = self._frames.get(fp)
+        if frame is not None:
+            lines.append(_describe_frame(frame))
+        score = self._quality.get(fp)
+        if score is not None and score.flags:
+            lines.append(score.describe_flags())
+        return "\n".join(line for line in lines if line)
+
+    # ─── 元数据 ───────────────────────────────────────────────────────────────
+    def _start_metadata_scan(self):
+        """后台读取当前文件的元数据；结果回来时文件列表已变化则丢弃"""
+        if not self.raw_files:
+            return
+        thread = MetadataThread(self.raw_files, get_metadata_service())
+        thread.metadata_ready.connect(self._on_metadata_ready)
+        # 模块级持有引用直到线程结束：切换目录或面板销毁时旧线程照常跑完
+        _running_threads.add(thread)
+        thread.finished.connect(lambda: _running_threads.discard(thread))
+        thread.start()
+
+    def _on_metadata_ready(self, files: List[Path], frames: List[FrameInfo]):
+        if files != self.raw_files:
+            return
+        self._frames = dict(zip(files, frames))
+        for i, fp in enumerate(self.raw_files):
+            item = self.file_list.item(i)
+            if item is not None:
+                item.setToolTip(self._item_tooltip(fp))
         self._update_stat_label()
 
+    # ─── 质量预检 ─────────────────────────────────────────────────────────────
+    def check_quality(self):
+        """后台评估所有帧，完成后自动排除离群帧"""
+        if not self.raw_files:
+            return
+        self._quality_btn.setEnabled(False)
+        self._quality_btn.setText("Checking…")
+        thread = QualityThread(self.raw_files, QualityScorer())
+        thread.quality_ready.connect(self._on_quality_ready)
+        _running_threads.add(thread)
+        thread.finished.connect(lambda: _running_threads.discard(thread))
+        thread.start()
+
+    def _on_quality_ready(self, files: List[Path], scores: List[FrameScore]):
+        self._quality_btn.setEnabled(True)
+        self._quality_btn.setText("Check Quality")
+        if files != self.raw_files or not scores:
+            return
+        self._quality = dict(zip(files, scores))
+        self.excluded_files.update(i for i, score in enumerate(scores) if score.rejected)
+        self.refresh_file_list()
+        self.files_selected.emit(self.get_files_to_process())
+
+    def _metadata_summary_text(self) -> str:
+        """已选文件的时间范围、快门、ISO 和序列段数（元数据未就绪时为空）"""
+        frames = [self._frames[f] for f in self.get_files_to_process() if f in self._frames]
+        if not frames:
+            return ""
+        summary = summarize(frames)
+        parts = []
+        if summary["start"] is not None:
+            start = datetime.fromtimestamp(summary["start"])
+            end = datetime.fromtimestamp(summary["end"])
+            fmt = "%H:%M" if (end - start).days < 1 else "%m-%d %H:%M"
+            parts.append(f"{start.strftime(fmt)}–{end.strftime(fmt)}")
+        if summary["exposures"]:
+            parts.append(" / ".join(format_exposure(e) for e in summary["exposures"][:3]))
+        if summary["isos"]:
+            parts.append("ISO " + " / ".join(str(iso) for iso in summary["isos"][:3]))
+        if summary["sequences"] > 1:
+            parts.append(f"{summary['sequences']} sequences")
+        return "   ".join(parts)
+
     def _update_stat_label(self):
         total = len(self.raw_files)
         excl  = len(self.excluded_files)
@@ -348,9 +501,11 @@ class FileListPanel(QWidget):
             self.label_file_count.setText(f"{total} files")
             self.label_file_count.show()
             if excl > 0:
-                self._stat_lbl.setText(f"Selected: {valid}   Excluded: {excl}")
+                text = f"Selected: {valid}   Excluded: {excl}"
             else:
-                self._stat_lbl.setText(f"Selected: {total}")
+                text = f"Selected: {total}"
+            meta = self._metadata_summary_text()
+            self._stat_lbl.setText(f"{text}\n{meta}" if meta else text)
 
     # 兼容旧接口
     def update_file_count_label(self):
@@ -15,6 +15,7 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QPixmap, QImage
 from i18n.translator import Translator
+from core.pyramid import ImagePyramid
 from ui.styles import (
     PREVIEW_AREA_STYLE,
     LOG_TEXT_STYLE,
@@ -166,7 +167,12 @@ class PreviewPanel(QWidget):
         return np.clip((image.astype(np.float32) - v_low) / scale * 255, 0, 255).astype(np.uint8)
 
     # ── 预览更新 ──────────────────────────────────────────────────────────────
-    def update_preview(self, image: np.ndarray, mask: Optional[np.ndarray] = None):
+    def update_preview(
+        self,
+        image: np.ndarray,
+        mask: Optional[np.ndarray] = None,
+        pyramid: Optional[ImagePyramid] = None,
+    ):
         import cv2
         settings = get_settings()
         max_size = settings.get_preview_max_size()
@@ -174,12 +180,10 @@ class PreviewPanel(QWidget):
         h, w = image.shape[:2]
         self._current_image_shape = (h, w)
 
-        if max(h, w) > max_size:
-            scale = max_size / max(h, w)
-            image_small = cv2.resize(image, (int(w * scale), int(h * scale)),
-                                     interpolation=cv2.INTER_AREA)
-        else:
-            image_small = image
+        # 优先复用该帧已有的金字塔（预览线程/处理线程已算好的降采样层）
+        if pyramid is None:
+            pyramid = ImagePyramid(image)
+        image_small = pyramid.fit(max_size)
 
         if image_small.dtype == np.uint16:
             img_8 = self._stretch_for_preview(image_small, settings)
@@ -0,0 +1,195 @@
+"""
+文件结果索引模块
+
+把按文件计算的小结果（EXIF、帧质量评分等）持久化到 JSON：
+- 条目按绝对路径记录，附带文件修改时间和大小，文件变化后自动失效
+- 命中的条目移到末尾，保存时超出上限则丢弃最久未访问的条目
+- 原子替换写入；文件损坏或版本不符时从空索引开始
+- 保存时在锁文件保护下与磁盘上的条目合并，sst batch 的多个工作进程
+  共用同一个索引时不会互相覆盖对方新增的条目
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+@contextmanager
+def _file_lock(path: Path, timeout: float = 10.0, stale: float = 60.0):
+    """
+    以独占方式创建锁文件实现的跨进程互斥
+
+    Args:
+        path: 锁文件路径
+        timeout: 最长等待秒数，超时抛出 TimeoutError（OSError 的子类）
+        stale: 锁文件超过该秒数未释放时视为持有进程已退出，直接接管
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - path.stat().st_mtime > stale:
+                    path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"等待锁超时: {path.name}")
+            time.sleep(0.02)
+    try:
+        yield
+    finally:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FileIndex:
+    """按 路径 + 修改时间 + 大小 失效的 JSON 结果索引（线程安全）"""
+
+    def __init__(self, path: Path, version: int = 1, max_entries: int = 200_000):
+        """
+        初始化索引
+
+        Args:
+            path: 索引文件路径（首次使用时才读取）
+            version: 结果格式版本，与文件中记录的不符时整个索引作废
+            max_entries: 最多保留的条目数
+        """
+        self.path = Path(path)
+        self.version = version
+        self.max_entries = max_entries
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._changed: Set[str] = set()  # 本进程写入过、保存时优先于磁盘的条目
+        self._cleared = False
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict]:
+        """读取磁盘上的条目（不存在、损坏或版本不符时为空）"""
+        if not self.path.exists():
+            return {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") == self.version:
+                return data.get("entries", {})
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"索引无法读取，将重新建立: {self.path.name} ({e})")
+        return {}
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def _merge(self, on_disk: Dict[str, Dict]) -> Dict[str, Dict]:
+        """
+        合并其他进程在本进程读取之后写入的条目
+
+        磁盘上独有的条目排在前面（本进程没访问过，视为较旧）；
+        两边都有的条目按本进程的访问顺序排列，本进程没改过的取磁盘上的版本。
+        """
+        merged = {key: value for key, value in on_disk.items() if key not in self._entries}
+        for key, value in self._entries.items():
+            merged[key] = value if key in self._changed else on_disk.get(key, value)
+        return merged
+
+    def _write(self, payload: str) -> None:
+        """经由唯一的临时文件原子替换写入"""
+        tmp = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=self.path.parent,
+                prefix=self.path.name + ".", suffix=".tmp", delete=False,
+            ) as fh:
+                tmp = fh.name
+                fh.write(payload)
+            os.replace(tmp, self.path)
+        except OSError:
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def lookup(self, key: str, stat: os.stat_result) -> Optional[Dict]:
+        """
+        查找条目
+
+        Args:
+            key: 文件绝对路径
+            stat: 文件当前的 os.stat 结果
+
+        Returns:
+            修改时间和大小都未变时返回记录的数据，否则 None
+        """
+        with self._lock:
+            entries = self._load()
+            cached = entries.get(key)
+            if cached is None or cached.get("mtime") != stat.st_mtime or cached.get("size") != stat.st_size:
+                return None
+            # 移到末尾，淘汰时最后才轮到；访问顺序变化也需要保存
+            if next(reversed(entries)) != key:
+                entries[key] = entries.pop(key)
+                self._dirty = True
+            return cached["data"]
+
+    def store(self, key: str, stat: os.stat_result, data: Dict) -> None:
+        """记录（覆盖）一个文件的结果"""
+        with self._lock:
+            entries = self._load()
+            entries.pop(key, None)
+            entries[key] = {"mtime": stat.st_mtime, "size": stat.st_size, "data": data}
+            self._changed.add(key)
+            self._dirty = True
+
+    def clear(self) -> None:
+        """清空索引（下次保存时写出空索引）"""
+        with self._lock:
+            self._entries = {}
+            self._changed.clear()
+            self._cleared = True
+            self._dirty = True
+
+    def save(self) -> bool:
+        """
+        写回磁盘（没有新条目且访问顺序未变时不写）
+
+        Returns:
+            是否成功（无需写入也视为成功）
+        """
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return True
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with _file_lock(self.path.with_name(self.path.name + ".lock")):
+                    entries = self._entries if self._cleared else self._merge(self._read())
+                    overflow = len(entries) - self.max_entries
+                    if overflow > 0:
+                        # dict 保持插入顺序，最前面的是最久未访问的
+                        for key in list(entries)[:overflow]:
+                            del entries[key]
+                    self._write(json.dumps(
+                        {"version": self.version, "entries": entries},
+                        ensure_ascii=False, separators=(",", ":"),
+                    ))
+            except OSError as e:
+                logger.warning(f"索引保存失败: {self.path.name} ({e})")
+                return False
+            self._entries = entries
+            self._changed.clear()
+            self._cleared = False
+            self._dirty = False
+            return True
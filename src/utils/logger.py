@@ -7,6 +7,7 @@
 import logging
 import sys
 from pathlib import Path
+from typing import Optional
 from datetime import datetime
 
 # 全局变量：当前的文件处理器
@@ -64,11 +65,26 @@ def enable_file_logging(log_dir: Path) -> Path:
     return log_file
 
 
-def get_log_file_path() -> Path:
+def get_log_file_path() -> Optional[Path]:
     """获取当前日志文件路径"""
     return _log_file_path
 
 
+def get_log_companion_path(suffix: str) -> Optional[Path]:
+    """
+    获取与当前日志文件同名、放在同一目录下的附属文件路径
+
+    Args:
+        suffix: 追加到日志文件名（不含扩展名）之后的后缀，如 "_profile.txt"
+
+    Returns:
+        附属文件路径；未启用文件日志时返回 None
+    """
+    if _log_file_path is None:
+        return None
+    return _log_file_path.with_name(f"{_log_file_path.stem}{suffix}")
+
+
 def setup_logger(
     name: str = "SuperStarTrail",
     level: int = logging.INFO,
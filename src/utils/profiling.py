@@ -0,0 +1,296 @@
+"""
+性能剖析模块
+
+轻量的阶段计时与计数，用于定位处理瓶颈（解码、划痕检测、堆栈、延时视频、预览……）：
+- StageProfiler：线程安全地记录每个阶段每次的耗时和计数器，输出累计、平均和分位数
+- 核心模块通过 stage("名称") / count("名称") 打点；没有激活的剖析器时只做一次全局变量判断
+- 报告写在日志文件旁边（<日志名>_profile.txt / _profile.json）
+- FunctionProfiler：可选的 cProfile / pyinstrument 函数级剖析
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .logger import get_log_companion_path, setup_logger
+
+logger = setup_logger(__name__)
+
+# 报告中的分位数
+PERCENTILES = (50, 90, 99)
+
+
+class StageProfiler:
+    """阶段耗时与计数器的汇总器（可在多个线程中同时记录）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+        self._counters: Dict[str, int] = {}
+        self.started = time.perf_counter()
+
+    def record(self, stage: str, seconds: float) -> None:
+        """记录某个阶段的一次耗时"""
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def timed(self, stage: str):
+        """计时上下文"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def count(self, name: str, n: int = 1) -> None:
+        """累加计数器（如跳过的帧数、检测到划痕的帧数）"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def totals(self) -> Dict[str, float]:
+        """各阶段累计耗时"""
+        with self._lock:
+            return {stage: float(sum(samples)) for stage, samples in self._samples.items()}
+
+    def counts(self) -> Dict[str, int]:
+        """各阶段的记录次数"""
+        with self._lock:
+            return {stage: len(samples) for stage, samples in self._samples.items()}
+
+    def counters(self) -> Dict[str, int]:
+        """计数器快照"""
+        with self._lock:
+            return dict(self._counters)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        各阶段统计
+
+        Returns:
+            {阶段: {"count", "total", "mean", "p50", "p90", "p99", "max"}}，时间单位为秒
+        """
+        with self._lock:
+            samples = {stage: np.asarray(values) for stage, values in self._samples.items()}
+
+        result = {}
+        for stage, values in samples.items():
+            entry = {
+                "count": int(values.size),
+                "total": float(values.sum()),
+                "mean": float(values.mean()),
+                "max": float(values.max()),
+            }
+            for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                entry[f"p{q}"] = float(value)
+            result[stage] = entry
+        return result
+
+    def summary_lines(
+        self, labels: Optional[Dict[str, str]] = None, only_labeled: bool = False
+    ) -> List[str]:
+        """
+        各阶段累计耗时汇总（按耗时降序）
+
+        Args:
+            labels: 阶段显示名
+            only_labeled: 只列出 labels 中的阶段（细分阶段留给完整报告）
+        """
+        labels = labels or {}
+        lines = []
+        counts = self.counts()
+        for stage, total in sorted(self.totals().items(), key=lambda kv: -kv[1]):
+            if only_labeled and stage not in labels:
+                continue
+            count = max(counts.get(stage, 1), 1)
+            label = labels.get(stage, stage)
+            lines.append(f"{label:<6}: 累计 {total:.2f}s  平均 {total / count * 1000:.0f}ms/帧")
+        return lines
+
+    def report_lines(self) -> List[str]:
+        """带分位数的阶段报告（按累计耗时降序，时间单位 ms），末尾附计数器"""
+        stats = self.stats()
+        wall = time.perf_counter() - self.started
+
+        lines = [f"总耗时 {wall:.2f}s"]
+        if stats:
+            width = max(max(len(stage) for stage in stats), 5)
+            quantiles = "".join(f"{f'p{q}':>9}" for q in PERCENTILES)
+            lines.append(
+                f"{'stage':<{width}}{'n':>7}{'total_s':>10}{'share':>8}{'mean':>9}{quantiles}{'max':>9}"
+            )
+            for stage, entry in sorted(stats.items(), key=lambda kv: -kv[1]["total"]):
+                share = entry["total"] / wall * 100 if wall > 0 else 0.0
+                quantiles = "".join(f"{entry[f'p{q}'] * 1000:>9.1f}" for q in PERCENTILES)
+                lines.append(
+                    f"{stage:<{width}}{entry['count']:>7}{entry['total']:>10.2f}{share:>7.1f}%"
+                    f"{entry['mean'] * 1000:>9.1f}{quantiles}{entry['max'] * 1000:>9.1f}"
+                )
+        for name, value in sorted(self.counters().items()):
+            lines.append(f"计数 {name}: {value}")
+        return lines
+
+    def to_dict(self) -> Dict:
+        """JSON 可序列化的报告"""
+        return {
+            "wall_seconds": time.perf_counter() - self.started,
+            "stages": self.stats(),
+            "counters": self.counters(),
+        }
+
+    def write_report(self, stem: Path) -> Tuple[Path, Path]:
+        """
+        写出文本和 JSON 两份报告
+
+        Args:
+            stem: 报告路径（不含扩展名），如 <日志名>_profile
+
+        Returns:
+            (文本报告路径, JSON 报告路径)
+        """
+        stem = Path(stem)
+        stem.parent.mkdir(parents=True, exist_ok=True)
+        text_path = stem.with_name(f"{stem.name}.txt")
+        json_path = stem.with_name(f"{stem.name}.json")
+        text_path.write_text("\n".join(self.report_lines()) + "\n", encoding="utf-8")
+        json_path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+        return text_path, json_path
+
+
+class FunctionProfiler:
+    """函数级剖析（cProfile 或 pyinstrument），结果写到文件供离线分析"""
+
+    KINDS = ("cprofile", "pyinstrument")
+
+    def __init__(self, kind: str = "cprofile"):
+        """
+        Args:
+            kind: 'cprofile' 或 'pyinstrument'；pyinstrument 未安装时回退到 cProfile
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"不支持的剖析器: {kind}")
+        if kind == "pyinstrument":
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                logger.warning("未安装 pyinstrument，改用 cProfile")
+                kind = "cprofile"
+        self.kind = kind
+        self._profiler = None
+
+    def start(self) -> None:
+        if self.kind == "pyinstrument":
+            from pyinstrument import Profiler
+
+            self._profiler = Profiler()
+            self._profiler.start()
+        else:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self) -> None:
+        if self._profiler is None:
+            return
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def dump(self, stem: Path) -> Optional[Path]:
+        """
+        写出剖析结果：cProfile 为 .prof（pstats / snakeviz 可读），pyinstrument 为 .html
+
+        Args:
+            stem: 输出路径（不含扩展名）
+
+        Returns:
+            输出文件路径；未启动时返回 None
+        """
+        if self._profiler is None:
+            return None
+        stem = Path(stem)
+        if self.kind == "pyinstrument":
+            path = stem.with_name(f"{stem.name}.html")
+            path.write_text(self._profiler.output_html(), encoding="utf-8")
+        else:
+            path = stem.with_name(f"{stem.name}.prof")
+            self._profiler.dump_stats(str(path))
+        return path
+
+
+# 当前激活的剖析器（None 表示不记录）
+_active: Optional[StageProfiler] = None
+
+
+def activate(profiler: Optional[StageProfiler] = None) -> StageProfiler:
+    """激活全局剖析器，之后核心模块的 stage()/count() 打点开始记录"""
+    global _active
+    _active = profiler or StageProfiler()
+    return _active
+
+
+def deactivate() -> Optional[StageProfiler]:
+    """停止记录，返回之前激活的剖析器"""
+    global _active
+    profiler, _active = _active, None
+    return profiler
+
+
+def get_profiler() -> Optional[StageProfiler]:
+    """当前激活的剖析器；未激活时返回 None"""
+    return _active
+
+
+@contextmanager
+def stage(name: str):
+    """为一个阶段计时；未激活剖析器时不做任何事"""
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(name, time.perf_counter() - start)
+
+
+def record(name: str, seconds: float) -> None:
+    """记录一次已测得的耗时；未激活剖析器时不做任何事"""
+    profiler = _active
+    if profiler is not None:
+        profiler.record(name, seconds)
+
+
+def count(name: str, n: int = 1) -> None:
+    """累加计数器；未激活剖析器时不做任何事"""
+    profiler = _active
+    if profiler is not None:
+        profiler.count(name, n)
+
+
+def report_stem(suffix: str = "_profile") -> Optional[Path]:
+    """日志文件旁边的报告路径（不含扩展名）；未启用文件日志时返回 None"""
+    return get_log_companion_path(suffix)
+
+
+def write_report_next_to_log(profiler: StageProfiler) -> Optional[Tuple[Path, Path]]:
+    """
+    把报告写到日志文件旁边
+
+    Returns:
+        (文本报告路径, JSON 报告路径)；未启用文件日志时返回 None
+    """
+    stem = report_stem()
+    if stem is None:
+        return None
+    paths = profiler.write_report(stem)
+    logger.info(f"性能报告已保存: {paths[0]}")
+    return paths
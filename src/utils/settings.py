@@ -5,9 +5,10 @@
 """
 
 import json
+import os
 from copy import deepcopy
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 APP_VERSION = "1.0.2"
 
@@ -22,6 +23,7 @@ class Settings:
             "auto_save_preview": False,
             "language": "zh_CN",
             "recent_dirs": [],
+            "profile_report": False,  # 在日志旁边写出阶段耗时报告（环境变量 SST_PROFILE=1 也可开启）
         },
         # RAW 处理设置
         "raw": {
@@ -50,10 +52,17 @@ class Settings:
         # 输出设置
         "output": {
             "image_format": "TIFF",  # TIFF, PNG, JPEG
+            "tiff_compression": "deflate",  # none, lzw, deflate, zstd
+            "tiff_pyramid_levels": 0,  # SubIFD 多分辨率子层数，0 表示不写（与 CLI 一致，按需开启）
+            "preview_sidecar": False,  # 同时输出 JPEG 预览图（按需开启）
             "video_format": "MP4",  # MP4, MOV
             "video_fps": 25,
             "video_resolution": [3840, 2160],  # 4K
-            "video_quality": "high",  # high, medium, low
+            "video_quality": "high",  # high, medium, low（ffmpeg CRF 18/23/28）
+            "video_codec": "h264",  # h264, h265（需要 ffmpeg）
+            "video_duration": 0,  # 延时视频目标时长（秒），0 表示每张输入输出一帧
+            "video_interpolate": False,  # 帧数不足目标时长时插入交叉淡化帧
+            "timelapse_temp_budget_mb": 4096,  # 延时临时帧磁盘预算，超出时分段编码；0 表示不限制
             "auto_timelapse": False,
         },
     }
@@ -143,6 +152,12 @@ class Settings:
         """获取曝光补偿"""
         return self.get("raw", "exposure_compensation", 0.0)
 
+    def get_profile_report(self) -> bool:
+        """是否记录阶段耗时并在日志旁边写出性能报告（相当于 CLI 的 --profile）"""
+        if os.environ.get("SST_PROFILE", "") not in ("", "0"):
+            return True
+        return self.get("general", "profile_report", False)
+
     def get_language(self) -> str:
         """获取语言设置"""
         return self.get("general", "language", "zh_CN")
@@ -187,6 +202,39 @@ class Settings:
         self.set("general", "recent_dirs", recent[:10])
         self.save_settings()
 
+    def get_tiff_compression(self) -> str:
+        """获取 TIFF 压缩方式"""
+        return self.get("output", "tiff_compression", "deflate")
+
+    def get_video_quality(self) -> str:
+        """获取延时视频画质"""
+        return self.get("output", "video_quality", "high")
+
+    def get_video_codec(self) -> str:
+        """获取延时视频编码"""
+        return self.get("output", "video_codec", "h264")
+
+    def get_video_duration(self) -> Optional[float]:
+        """获取延时视频目标时长（秒），未设置时返回 None"""
+        duration = self.get("output", "video_duration", 0)
+        return float(duration) if duration else None
+
+    def get_video_interpolate(self) -> bool:
+        """是否在帧数不足时插入交叉淡化帧"""
+        return self.get("output", "video_interpolate", False)
+
+    def get_timelapse_temp_budget(self) -> float:
+        """获取延时临时帧磁盘预算（MB）"""
+        return self.get("output", "timelapse_temp_budget_mb", 4096)
+
+    def get_tiff_pyramid_levels(self) -> int:
+        """获取 TIFF 多分辨率子层数"""
+        return self.get("output", "tiff_pyramid_levels", 0)
+
+    def get_preview_sidecar(self) -> bool:
+        """是否输出 JPEG 预览图"""
+        return self.get("output", "preview_sidecar", False)
+
     def get_video_resolution(self) -> tuple:
         """获取视频分辨率"""
         res = self.get("output", "video_resolution", [3840, 2160])
@@ -0,0 +1,208 @@
+"""
+批量处理测试
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import tifffile
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.batch import (
+    BatchJob,
+    BatchRunner,
+    discover_sequences,
+    estimate_job_memory_mb,
+    select_sequence_files,
+)
+from core.exif_scanner import FrameInfo
+
+
+def _touch(directory: Path, *names: str) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        (directory / name).write_bytes(b"")
+
+
+class TestDiscovery(unittest.TestCase):
+    """序列发现测试"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_raw_preferred_over_same_name_jpg(self):
+        """同名 RAW+JPG 默认保留 RAW，prefer_jpg 时保留 JPG"""
+        files = [Path("A.NEF"), Path("A.jpg"), Path("B.jpg"), Path("C.tif")]
+
+        selected, pairs = select_sequence_files(files)
+        self.assertEqual([f.name for f in selected], ["A.NEF", "B.jpg", "C.tif"])
+        self.assertEqual(pairs, 1)
+
+        selected, _ = select_sequence_files(files, prefer_jpg=True)
+        self.assertEqual([f.name for f in selected], ["A.jpg", "B.jpg", "C.tif"])
+
+    def test_one_sequence_per_folder(self):
+        """每个含足够图片的目录一个序列，跳过输出目录和过短的序列"""
+        _touch(self.root / "2024-05-01", "a.tif", "b.tif")
+        _touch(self.root / "2024-05-02" / "cam1", "a.tif", "b.tif", "c.tif")
+        _touch(self.root / "single", "a.tif")
+        _touch(self.root / "2024-05-01" / "SuperStarTrail", "old.tif", "older.tif")
+        output_root = self.root / "SuperStarTrail_batch"
+        _touch(output_root, "x.tif", "y.tif")
+
+        jobs = discover_sequences(self.root, output_root)
+
+        self.assertEqual([job.name for job in jobs], ["2024-05-01", "2024-05-02_cam1"])
+        self.assertEqual(len(jobs[1].files), 3)
+        self.assertEqual(jobs[1].output, output_root / "2024-05-02_cam1")
+
+    def test_gap_split_within_folder(self):
+        """split='gap' 时按拍摄时间在目录内拆分"""
+        _touch(self.root / "night", *[f"{i}.tif" for i in range(6)])
+        times = {f"{i}.tif": t for i, t in enumerate([0, 20, 40, 7200, 7220, 7240])}
+
+        def scan(paths, _workers):
+            infos = [FrameInfo(path) for path in paths]
+            for info in infos:
+                info.captured = times[info.path.name]
+            return infos
+
+        with patch("core.batch.scan_files", side_effect=scan):
+            jobs = discover_sequences(self.root, self.root / "out", split="gap", gap_minutes=10)
+
+        self.assertEqual([job.name for job in jobs], ["night_01", "night_02"])
+        self.assertEqual([len(job.files) for job in jobs], [3, 3])
+
+    def test_memory_estimate_grows_with_resolution_and_prefetch(self):
+        """内存估算随分辨率和在途帧数增长"""
+        small = estimate_job_memory_mb((3000, 4000))
+        large = estimate_job_memory_mb((8736, 11648))
+        deeper = estimate_job_memory_mb((3000, 4000), workers=4, prefetch=6)
+        self.assertLess(small, large)
+        self.assertLess(small, deeper)
+
+
+def _job(name: str, memory_mb: float) -> BatchJob:
+    job = BatchJob(name, Path(name), [Path(f"{name}.tif")], Path("out") / name)
+    job.memory_mb = memory_mb
+    return job
+
+
+def _crashing_worker(job, options):
+    """进程池用的工作函数：名为 crash 的任务直接结束自身进程（模拟被系统杀死）"""
+    if job["name"] == "crash":
+        os._exit(1)
+    return {"returncode": 0}
+
+
+class TestBatchRunner(unittest.TestCase):
+    """批量调度测试（用线程池代替进程池）"""
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def _worker(self, job, options):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        if job["name"] == "bad":
+            raise RuntimeError("decoder crashed")
+        return {"returncode": 0, "seconds": 0.05}
+
+    def _runner(self, **kwargs):
+        return BatchRunner(self._worker, {}, executor_factory=lambda n: ThreadPoolExecutor(n), **kwargs)
+
+    def test_memory_budget_limits_concurrency(self):
+        """并发数受内存预算限制"""
+        runner = self._runner(concurrency=4, memory_budget_mb=1000)
+
+        results = runner.run([_job(f"n{i}", 400) for i in range(5)])
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(self.max_active, 2)
+        self.assertEqual(runner.peak_concurrency, 2)
+
+    def test_oversized_job_runs_alone(self):
+        """超出预算的任务单独运行，不会卡住队列"""
+        runner = self._runner(concurrency=4, memory_budget_mb=1000)
+
+        results = runner.run([_job("huge", 5000), _job("a", 100), _job("b", 100)])
+
+        self.assertEqual([r["status"] for r in results], ["ok"] * 3)
+        self.assertEqual(results[0]["name"], "huge")
+
+    def test_failure_recorded_in_summary(self):
+        """单个任务失败不影响其他任务，汇总中记录错误"""
+        with tempfile.TemporaryDirectory() as tmp:
+            summary_path = Path(tmp) / "summary.json"
+            runner = self._runner(concurrency=2, memory_budget_mb=1000, summary_path=summary_path)
+
+            runner.run([_job("good", 100), _job("bad", 100)])
+
+            summary = json.loads(summary_path.read_text(encoding="utf-8"))
+        self.assertEqual((summary["succeeded"], summary["failed"]), (1, 1))
+        bad = next(job for job in summary["jobs"] if job["name"] == "bad")
+        self.assertEqual(bad["status"], "failed")
+        self.assertIn("decoder crashed", bad["error"])
+
+    def test_worker_process_crash_does_not_abort_batch(self):
+        """工作进程崩溃只让当时运行的任务失败，重建进程池后其余任务照常完成"""
+        runner = BatchRunner(_crashing_worker, {}, concurrency=1, memory_budget_mb=1000)
+
+        results = runner.run([_job("a", 100), _job("crash", 100), _job("b", 100), _job("c", 100)])
+
+        status = {result["name"]: result["status"] for result in results}
+        self.assertEqual(status, {"a": "ok", "crash": "failed", "b": "ok", "c": "ok"})
+        self.assertEqual(runner.summary()["failed"], 1)
+
+
+class TestBatchCommand(unittest.TestCase):
+    """sst batch 端到端测试"""
+
+    def test_batch_stacks_every_folder(self):
+        """每个子目录输出一张星轨图，并写出汇总"""
+        import cli
+
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for night in ("n1", "n2"):
+                (root / night).mkdir()
+                for i in range(3):
+                    image = rng.integers(0, 65535, (32, 48, 3), dtype=np.uint16)
+                    tifffile.imwrite(str(root / night / f"IMG_{i}.tif"), image, photometric="rgb")
+
+            args = cli.build_parser().parse_args(["batch", str(root), "--jobs", "2"])
+            with redirect_stdout(StringIO()):
+                code = cli.cmd_batch(args)
+
+            summary = json.loads((root / "SuperStarTrail_batch" / "batch_summary.json").read_text(encoding="utf-8"))
+            self.assertEqual(code, 0)
+            self.assertEqual(sorted(job["name"] for job in summary["jobs"]), ["n1", "n2"])
+            for job in summary["jobs"]:
+                self.assertIn("IMG_0-2_Lighten.tif", job["outputs"])
+
+
+if __name__ == "__main__":
+    unittest.main()
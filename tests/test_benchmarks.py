@@ -0,0 +1,83 @@
+"""
+基准测试套件（benchmarks/）测试
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+
+import run as bench
+from core.raw_processor import RawProcessor
+from synthetic import parse_size, render_frame, write_sequence
+
+
+class TestSyntheticData(unittest.TestCase):
+    """合成星轨序列测试"""
+
+    def test_frames_are_deterministic(self):
+        """相同参数生成完全相同的像素，不同帧的星星位置不同"""
+        first = render_frame((300, 400), 1, seed=7)
+
+        np.testing.assert_array_equal(first, render_frame((300, 400), 1, seed=7))
+        self.assertFalse(np.array_equal(first, render_frame((300, 400), 2, seed=7)))
+        self.assertEqual(first.dtype, np.uint16)
+
+    def test_parse_size(self):
+        """支持预设名称和 高x宽"""
+        self.assertEqual(parse_size("24"), ("24mp", (4000, 6000)))
+        self.assertEqual(parse_size("300x400"), ("300x400", (300, 400)))
+        with self.assertRaises(ValueError):
+            parse_size("huge")
+
+    def test_dng_decodes_through_raw_processor(self):
+        """生成的 DNG 可以走 RAW 解码路径"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = write_sequence(Path(tmpdir), (200, 300), 1)
+
+            image = RawProcessor().process(paths["dng"][0])
+
+        self.assertEqual(image.shape, (200, 300, 3))
+        self.assertEqual(image.dtype, np.uint16)
+
+
+class TestBenchmarkReport(unittest.TestCase):
+    """结果记录与对比测试"""
+
+    def test_in_process_run_reports_throughput(self):
+        """结果包含耗时、吞吐量和峰值内存"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            report = bench.run_benchmarks(
+                ["200x300"], ["stack"], frames=2, data_dir=Path(tmpdir),
+                isolate=False, variants=["lighten"], log=lambda _msg: None,
+            )
+
+        self.assertEqual(report["schema"], bench.SCHEMA_VERSION)
+        record = report["results"][0]
+        self.assertEqual(
+            (record["stage"], record["variant"], record["frames"]), ("stack", "lighten", 2)
+        )
+        self.assertGreater(record["megapixels_per_s"], 0)
+        self.assertIn("peak_rss_mb", record)
+
+    def test_compare_flags_regressions_over_threshold(self):
+        """耗时增幅超过阈值的用例被列为退化"""
+        def report(seconds):
+            return {"results": [
+                {"size": "12mp", "stage": "stack", "variant": "lighten", "seconds": seconds[0]},
+                {"size": "12mp", "stage": "export", "variant": "jpeg", "seconds": seconds[1]},
+            ]}
+
+        regressions = bench.compare(report([1.5, 1.05]), report([1.0, 1.0]), threshold=0.1)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("lighten", regressions[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
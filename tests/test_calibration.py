@@ -0,0 +1,181 @@
+"""
+暗场/平场校准测试
+"""
+
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import tifffile
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.calibration import (
+    Calibrator,
+    DarkFrameSubtractor,
+    MasterLibrary,
+    build_master,
+    flat_gain,
+)
+
+
+class TestMasterFrames(unittest.TestCase):
+    """主帧合成测试"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.frames = {
+            Path(f"dark_{i}.tif"): rng.integers(90, 110, (20, 30, 3), dtype=np.uint16) for i in range(5)
+        }
+        # 一张暗场被宇宙射线击中
+        next(iter(self.frames.values()))[5, 5] = 60000
+
+    def test_median_rejects_outliers(self):
+        master = build_master(list(self.frames), self.frames.__getitem__, method="median", band_rows=7)
+
+        expected = np.median(np.stack(list(self.frames.values())), axis=0)
+        np.testing.assert_array_equal(master, expected)
+        self.assertLess(master[5, 5].max(), 200)
+
+    def test_mean_streams_one_accumulator(self):
+        master = build_master(list(self.frames), self.frames.__getitem__, method="mean")
+
+        expected = np.mean(np.stack(list(self.frames.values())).astype(np.float64), axis=0)
+        np.testing.assert_allclose(master, expected, rtol=1e-6)
+
+    def test_size_mismatch_raises(self):
+        self.frames[Path("odd.tif")] = np.zeros((10, 10, 3), np.uint16)
+        with self.assertRaises(ValueError):
+            build_master(list(self.frames), self.frames.__getitem__)
+
+    def test_flat_gain_undoes_vignetting(self):
+        yy, xx = np.mgrid[0:40, 0:60]
+        vignette = 1.0 - 0.5 * (((yy - 20) / 20.0) ** 2 + ((xx - 30) / 30.0) ** 2) / 2
+        flat = np.dstack([vignette * 30000] * 3).astype(np.float32)
+        flat[0, 0] = 0  # 无效像素
+
+        gain = flat_gain(flat)
+
+        corrected = flat * gain
+        valid = flat > 0
+        self.assertLess(np.ptp(corrected[valid]), 30000 * 0.01)
+        np.testing.assert_array_equal(gain[0, 0], [1.0, 1.0, 1.0])
+
+
+class TestCalibrator(unittest.TestCase):
+    """逐帧校准测试"""
+
+    def test_applied_in_place_with_saturation(self):
+        dark = np.full((4, 6, 3), 100, np.float32)
+        gain = np.full((4, 6, 3), 2.0, np.float32)
+        image = np.full((4, 6, 3), 1000, np.uint16)
+        image[0, 0] = 50
+        image[1, 1] = 65000
+
+        result = Calibrator(dark, gain).apply(image)
+
+        self.assertIs(result, image)
+        self.assertEqual(result[2, 2, 0], 1800)
+        self.assertEqual(result[0, 0, 0], 0)
+        self.assertEqual(result[1, 1, 0], 65535)
+
+    def test_readonly_view_is_copied(self):
+        """rot90 等非连续视图先复制，原图不变"""
+        base = np.full((6, 4, 3), 500, np.uint16)
+        view = np.rot90(base)
+
+        result = Calibrator(dark=np.full((4, 6, 3), 100, np.uint16)).apply(view)
+
+        self.assertEqual(result[0, 0, 0], 400)
+        self.assertEqual(base[0, 0, 0], 500)
+
+    def test_shape_mismatch_raises(self):
+        with self.assertRaises(ValueError):
+            Calibrator(dark=np.zeros((4, 6, 3), np.uint16)).apply(np.zeros((6, 4, 3), np.uint16))
+
+    def test_dark_frame_subtractor_keeps_input(self):
+        image = np.full((2, 2, 3), 300, np.uint16)
+        subtractor = DarkFrameSubtractor(np.full((2, 2, 3), 500.0))
+
+        result = subtractor.subtract(image)
+
+        self.assertEqual(result.dtype, np.uint16)
+        np.testing.assert_array_equal(result, 0)
+        np.testing.assert_array_equal(image, 300)
+
+
+class TestMasterLibrary(unittest.TestCase):
+    """主帧缓存测试"""
+
+    def test_master_cached_until_sources_change(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            darks = []
+            for i in range(3):
+                path = root / f"dark_{i}.tif"
+                tifffile.imwrite(str(path), np.full((8, 8, 3), 100 + i, np.uint16), photometric="rgb")
+                darks.append(path)
+            loads = []
+
+            def loader(path):
+                loads.append(path)
+                return tifffile.imread(str(path))
+
+            library = MasterLibrary(cache_dir=root / "cache")
+            first = library.master("dark", darks, loader)
+            second = library.master("dark", darks, loader)
+            self.assertEqual(len(loads), 3)
+            self.assertEqual(library.cached, 1)
+            self.assertEqual(first.dtype, np.uint16)
+            np.testing.assert_array_equal(first, second)
+
+            library.master("dark", darks, loader, tag="rotation=90")
+            self.assertEqual(len(loads), 6)
+
+            tifffile.imwrite(str(darks[0]), np.full((8, 8, 3), 500, np.uint16), photometric="rgb")
+            library.master("dark", darks, loader)
+            self.assertEqual(len(loads), 9)
+
+
+class TestCalibrationCommand(unittest.TestCase):
+    """sst stack --dark/--flat 端到端测试"""
+
+    def test_stack_with_dark_and_flat(self):
+        import cli
+
+        rng = np.random.default_rng(1)
+        pattern = rng.integers(0, 2000, (24, 32, 3), dtype=np.uint16)  # 固定的热噪声图样
+        vignette = np.linspace(0.5, 1.0, 32, dtype=np.float32)[None, :, None]
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            for name in ("lights", "darks", "flats"):
+                (root / name).mkdir()
+            for i in range(3):
+                light = (np.full((24, 32, 3), 10000, np.float32) * vignette + pattern).astype(np.uint16)
+                tifffile.imwrite(str(root / "lights" / f"IMG_{i}.tif"), light, photometric="rgb")
+                tifffile.imwrite(str(root / "darks" / f"DARK_{i}.tif"), pattern, photometric="rgb")
+                flat = (np.full((24, 32, 3), 40000, np.float32) * vignette).astype(np.uint16)
+                tifffile.imwrite(str(root / "flats" / f"FLAT_{i}.tif"), flat, photometric="rgb")
+
+            args = cli.build_parser().parse_args([
+                "stack", str(root / "lights"), "-o", str(root / "out"), "--float32",
+                "--dark", str(root / "darks"), "--flat", str(root / "flats"),
+            ])
+            with patch("core.calibration.Path.home", return_value=root):
+                with redirect_stdout(StringIO()) as out:
+                    code = cli.cmd_stack(args)
+
+            self.assertEqual(code, 0, out.getvalue())
+            self.assertIn("暗场 3 张", out.getvalue())
+            result = tifffile.imread(str(next((root / "out").glob("*.tif"))))
+        # 减去热噪声、除去暗角后整幅均匀
+        self.assertLess(np.ptp(result) / result.mean(), 0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
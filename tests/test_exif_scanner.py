@@ -0,0 +1,178 @@
+"""
+EXIF 快速扫描测试
+"""
+
+import struct
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.exif_scanner import (
+    FrameInfo,
+    group_sequences,
+    pick_sequence,
+    scan_file,
+    scan_files,
+)
+
+
+def _exif(taken: str, exposure: float = 20.0, iso: int = 3200) -> Image.Exif:
+    exif = Image.Exif()
+    exif[0x010F] = "NIKON CORPORATION"
+    exif[0x0110] = "NIKON Z 6_2"
+    ifd = exif.get_ifd(0x8769)
+    ifd[0x9003] = taken
+    ifd[0x9291] = "50"
+    ifd[0x829A] = exposure
+    ifd[0x8827] = iso
+    ifd[0xA431] = "6012345"
+    return exif
+
+
+def _frame(name: str, captured: float, exposure: float = 20.0) -> FrameInfo:
+    info = FrameInfo(Path(name))
+    info.captured = captured
+    info.exposure = exposure
+    return info
+
+
+class TestScanFile(unittest.TestCase):
+    """文件头解析测试"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _check(self, info: FrameInfo):
+        expected = datetime(2024, 5, 1, 22, 0, 5).timestamp() + 0.5
+        self.assertAlmostEqual(info.captured, expected)
+        self.assertEqual(info.exposure, 20.0)
+        self.assertEqual(info.iso, 3200)
+        self.assertEqual(info.camera, "NIKON Z 6_2")
+        self.assertEqual(info.serial, "6012345")
+
+    def test_jpeg_app1(self):
+        """JPEG：从 APP1 Exif 段读取"""
+        path = self.root / "a.jpg"
+        Image.new("RGB", (8, 8)).save(path, exif=_exif("2024:05:01 22:00:05"))
+        self._check(scan_file(path))
+
+    def test_tiff_structured_raw(self):
+        """TIFF 结构的 RAW：直接解析 IFD0 → Exif IFD，文件其余部分不读取"""
+        blob = _exif("2024:05:01 22:00:05").tobytes()
+        path = self.root / "a.nef"
+        with open(path, "wb") as fh:
+            fh.write(blob[6:] if blob.startswith(b"Exif") else blob)
+            fh.truncate(8 * 1024 * 1024)
+        self._check(scan_file(path))
+
+    def test_raf_embedded_jpeg(self):
+        """RAF：文件头偏移 84 指向的内嵌 JPEG"""
+        jpeg_path = self.root / "embedded.jpg"
+        Image.new("RGB", (8, 8)).save(jpeg_path, exif=_exif("2024:05:01 22:00:05"))
+        header = b"FUJIFILMCCD-RAW 0201FF383501".ljust(84, b"\x00") + struct.pack(">II", 100, 0)
+        path = self.root / "a.raf"
+        path.write_bytes(header.ljust(100, b"\x00") + jpeg_path.read_bytes())
+        self._check(scan_file(path))
+
+    def test_cr3_cmt_boxes(self):
+        """CR3：moov → Canon uuid → CMT1 / CMT2"""
+        exif = _exif("2024:05:01 22:00:05")
+        ifd0 = Image.Exif()
+        ifd0[0x010F] = "Canon"
+        ifd0[0x0110] = "Canon EOS R5"
+        exif_ifd = Image.Exif()
+        for tag, value in exif.get_ifd(0x8769).items():
+            exif_ifd[tag] = value
+
+        def box(kind: bytes, payload: bytes) -> bytes:
+            return struct.pack(">I", len(payload) + 8) + kind + payload
+
+        def tiff(data: Image.Exif) -> bytes:
+            blob = data.tobytes()
+            return blob[6:] if blob.startswith(b"Exif") else blob
+
+        uuid = bytes.fromhex("85c0b687820f11e08111f4ce462b6a48")
+        canon = box(b"uuid", uuid + box(b"CMT1", tiff(ifd0)) + box(b"CMT2", tiff(exif_ifd)))
+        path = self.root / "a.cr3"
+        path.write_bytes(box(b"ftyp", b"crx \x00\x00\x00\x01") + box(b"moov", canon))
+
+        info = scan_file(path)
+
+        self.assertEqual(info.camera, "Canon EOS R5")
+        self.assertEqual(info.exposure, 20.0)
+        self.assertIsNotNone(info.captured)
+
+    def test_missing_exif_falls_back_to_mtime(self):
+        """没有 EXIF 的文件用修改时间；损坏文件不抛异常"""
+        plain = self.root / "plain.png"
+        Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8)).save(plain)
+        broken = self.root / "broken.nef"
+        broken.write_bytes(b"II*\x00\xff\xff\xff\x7f")
+
+        infos = scan_files([plain, broken], workers=2)
+
+        self.assertIsNone(infos[0].captured)
+        self.assertEqual(infos[0].time, plain.stat().st_mtime)
+        self.assertIsNone(infos[1].captured)
+
+    def test_round_trip_dict(self):
+        """to_dict / from_dict 可还原"""
+        info = _frame("x.nef", 1000.0)
+        info.iso = 800
+        restored = FrameInfo.from_dict(info.to_dict())
+        self.assertEqual(restored.to_dict(), info.to_dict())
+
+
+class TestGrouping(unittest.TestCase):
+    """序列分组测试"""
+
+    def test_split_by_interval_gap(self):
+        """空档远大于拍摄节奏处拆开，段内按时间排序"""
+        frames = [_frame(f"{i}.nef", 21.0 * i) for i in range(10)]
+        frames += [_frame(f"b{i}.nef", 3600 + 21.0 * i) for i in range(5)]
+
+        sequences = group_sequences(list(reversed(frames)))
+
+        self.assertEqual([len(s) for s in sequences], [10, 5])
+        self.assertEqual(sequences[0].paths[0].name, "0.nef")
+        self.assertAlmostEqual(sequences[0].interval, 21.0)
+
+    def test_exposure_change_splits_test_shots(self):
+        """试拍/平场曝光不同，即使时间相邻也拆开"""
+        frames = [_frame(f"{i}.nef", 21.0 * i) for i in range(5)]
+        frames += [_frame("flat1.nef", 106.0, 1 / 100), _frame("flat2.nef", 108.0, 1 / 100)]
+
+        self.assertEqual([len(s) for s in group_sequences(frames)], [5, 2])
+        self.assertEqual([len(s) for s in group_sequences(frames, split_on_exposure=False)], [7])
+
+    def test_explicit_gap(self):
+        """显式间隔覆盖自动间隔"""
+        frames = [_frame(f"{i}.nef", 100.0 * i, exposure=1.0) for i in range(4)]
+        self.assertEqual(len(group_sequences(frames, gap_seconds=50)), 4)
+        self.assertEqual(len(group_sequences(frames, gap_seconds=200)), 1)
+
+    def test_pick_sequence(self):
+        """按序号或最长选择序列"""
+        frames = [_frame(f"a{i}.nef", 21.0 * i) for i in range(3)]
+        frames += [_frame(f"b{i}.nef", 10000 + 21.0 * i) for i in range(5)]
+        sequences = group_sequences(frames)
+
+        self.assertEqual(pick_sequence(sequences, "longest")[0], 2)
+        self.assertEqual(len(pick_sequence(sequences, "1")[1]), 3)
+        with self.assertRaises(ValueError):
+            pick_sequence(sequences, "3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,7 @@ ImageExporter 测试
 import unittest
 import numpy as np
 import sys
+from PIL import Image
 from pathlib import Path
 import tempfile
 import shutil
@@ -58,6 +59,137 @@ class TestImageExporter(unittest.TestCase):
 
         np.testing.assert_array_equal(stretched, img)
 
+    def test_stretch_limits_match_percentile(self):
+        """直方图百分位数与 np.percentile 相差不超过一个灰度级"""
+        # 取值范围较窄，保证相邻灰度级都有像素，np.percentile 的插值误差小于 1
+        img = np.random.randint(0, 4096, (128, 128, 3), dtype=np.uint16)
+
+        low_val, high_val = ImageExporter.stretch_limits(img, 1.0, 99.5)
+
+        self.assertLessEqual(abs(low_val - np.percentile(img, 1.0)), 1.0)
+        self.assertLessEqual(abs(high_val - np.percentile(img, 99.5)), 1.0)
+
+    def test_save_tiff_tiled_compressed_roundtrip(self):
+        """分块压缩写出的 TIFF 应无损读回"""
+        import tifffile
+
+        output_path = self.temp_dir / "test_deflate.tif"
+
+        success = ImageExporter.save_tiff(
+            self.test_image_16bit,
+            output_path,
+            compression="deflate",
+            apply_stretch=False,
+        )
+
+        self.assertTrue(success)
+        with tifffile.TiffFile(str(output_path)) as tif:
+            self.assertTrue(tif.pages[0].is_tiled)
+            np.testing.assert_array_equal(tif.asarray(), self.test_image_16bit)
+
+    def test_save_tiff_stream_matches_in_memory_save(self):
+        """流式写出（不规则行带高度）应与整图写出内容一致"""
+        import tifffile
+
+        img = np.random.randint(0, 65535, (600, 300, 3), dtype=np.uint16)
+        heights = [100, 7, 300, 193]
+        bands = (img[sum(heights[:i]):sum(heights[:i + 1])] for i in range(len(heights)))
+        stretch = ImageExporter.stretch_limits_from_bands(
+            img[y:y + 64] for y in range(0, img.shape[0], 64)
+        )
+        stream_path = self.temp_dir / "stream.tif"
+        whole_path = self.temp_dir / "whole.tif"
+
+        self.assertTrue(ImageExporter.save_tiff_stream(bands, stream_path, img.shape, stretch=stretch))
+        self.assertTrue(ImageExporter.save_tiff(img, whole_path))
+
+        with tifffile.TiffFile(str(stream_path)) as tif:
+            self.assertTrue(tif.is_bigtiff)
+            np.testing.assert_array_equal(tif.asarray(), tifffile.imread(str(whole_path)))
+
+    def test_save_tiff_stream_rejects_short_input(self):
+        """行带总行数不足时应返回 False"""
+        img = np.zeros((100, 100, 3), dtype=np.uint16)
+
+        success = ImageExporter.save_tiff_stream(
+            iter([img[:50]]), self.temp_dir / "short.tif", img.shape
+        )
+
+        self.assertFalse(success)
+
+    def test_save_tiff_with_pyramid_and_preview(self):
+        """多分辨率子层写入 SubIFD，并生成 JPEG 预览图"""
+        import tifffile
+
+        img = np.random.randint(0, 65535, (512, 768, 3), dtype=np.uint16)
+        output_path = self.temp_dir / "pyramid.tif"
+        preview_path = ImageExporter.preview_path_for(output_path)
+
+        success = ImageExporter.save_tiff(
+            img, output_path, pyramid_levels=3, preview_path=preview_path, preview_size=200
+        )
+
+        self.assertTrue(success)
+        self.assertEqual(preview_path.name, "pyramid_preview.jpg")
+        with tifffile.TiffFile(str(output_path)) as tif:
+            self.assertEqual(len(tif.pages), 1)
+            levels = [level.shape[:2] for level in tif.series[0].levels]
+        self.assertEqual(levels, [(512, 768), (256, 384), (128, 192), (64, 96)])
+        with Image.open(preview_path) as preview:
+            self.assertEqual(preview.size, (200, 133))
+
+    def test_save_tiff_linear_keeps_float_precision(self):
+        """32-bit 线性输出不拉伸、不裁剪，保留累加器的小数和超范围值"""
+        import tifffile
+
+        accumulator = np.random.uniform(0, 70000, (300, 200, 3)).astype(np.float32)
+        output_path = self.temp_dir / "linear.tif"
+
+        success = ImageExporter.save_tiff_linear(accumulator, output_path, band_rows=64)
+
+        self.assertTrue(success)
+        data = tifffile.imread(str(output_path))
+        self.assertEqual(data.dtype, np.float32)
+        np.testing.assert_allclose(data * 65535.0, accumulator, rtol=1e-6)
+        self.assertGreater(data.max(), 1.0)
+
+    def test_save_tiff_32bit_is_linear(self):
+        """bits=32 输出线性数据，不应用拉伸"""
+        import tifffile
+
+        output_path = self.temp_dir / "test_32bit.tif"
+
+        success = ImageExporter.save_tiff(self.test_image_16bit, output_path, bits=32)
+
+        self.assertTrue(success)
+        np.testing.assert_allclose(
+            tifffile.imread(str(output_path)) * 65535.0, self.test_image_16bit, rtol=1e-6
+        )
+
+    def test_save_tiff_32bit_with_pyramid_and_preview(self):
+        """bits=32 也写出子层和预览图，主图和子层仍为未拉伸的线性数据"""
+        import tifffile
+
+        accumulator = np.random.uniform(0, 70000, (256, 384, 3)).astype(np.float32)
+        output_path = self.temp_dir / "linear_pyramid.tif"
+        preview_path = ImageExporter.preview_path_for(output_path)
+
+        success = ImageExporter.save_tiff(
+            accumulator, output_path, bits=32, pyramid_levels=2,
+            preview_path=preview_path, preview_size=120,
+        )
+
+        self.assertTrue(success)
+        with tifffile.TiffFile(str(output_path)) as tif:
+            levels = tif.series[0].levels
+            shapes = [level.shape[:2] for level in levels]
+            self.assertEqual(shapes, [(256, 384), (128, 192), (64, 96)])
+            self.assertEqual(levels[1].dtype, np.float32)
+            data = levels[0].asarray()
+        np.testing.assert_allclose(data * 65535.0, accumulator, rtol=1e-6)
+        with Image.open(preview_path) as preview:
+            self.assertEqual(preview.size, (120, 80))
+
     def test_save_tiff_16bit(self):
         """测试保存 16-bit TIFF"""
         output_path = self.temp_dir / "test_16bit.tif"
@@ -0,0 +1,133 @@
+"""
+文件结果索引测试
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from utils.file_index import FileIndex
+
+
+def _store_and_save(index_path: str, worker: int, count: int) -> bool:
+    """在独立进程中写入一批条目并保存（模拟 sst batch 的工作进程）"""
+    index = FileIndex(Path(index_path))
+    stat = os.stat(index_path + ".src")
+    for i in range(count):
+        index.store(f"/w{worker}/{i}", stat, {"worker": worker})
+        if i % 5 == 4:
+            if not index.save():
+                return False
+    return index.save()
+
+
+class TestFileIndex(unittest.TestCase):
+    """保存、合并与访问顺序测试"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+        self.path = self.root / "index.json"
+        source = self.root / "index.json.src"
+        source.write_bytes(b"x")
+        self.stat = source.stat()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _entries(self):
+        return json.loads(self.path.read_text(encoding="utf-8"))["entries"]
+
+    def test_savers_keep_each_others_entries(self):
+        """两个实例先后保存，后保存的不会丢掉先保存的条目"""
+        first, second = FileIndex(self.path), FileIndex(self.path)
+        first.store("/a", self.stat, {"v": 1})
+        second.store("/b", self.stat, {"v": 2})
+        self.assertTrue(first.save())
+        self.assertTrue(second.save())
+
+        self.assertEqual(sorted(self._entries()), ["/a", "/b"])
+        self.assertEqual(FileIndex(self.path).lookup("/a", self.stat), {"v": 1})
+
+    def test_own_changes_win_untouched_take_disk_version(self):
+        """本进程写入的条目覆盖磁盘；只读过的条目采用其他进程的新结果"""
+        seed = FileIndex(self.path)
+        seed.store("/a", self.stat, {"v": 0})
+        seed.store("/b", self.stat, {"v": 0})
+        seed.save()
+
+        first, second = FileIndex(self.path), FileIndex(self.path)
+        first.lookup("/a", self.stat)
+        first.store("/b", self.stat, {"v": 1})
+        second.store("/a", self.stat, {"v": 2})
+        second.store("/b", self.stat, {"v": 2})
+        second.save()
+        first.save()
+
+        entries = self._entries()
+        self.assertEqual(entries["/a"]["data"], {"v": 2})
+        self.assertEqual(entries["/b"]["data"], {"v": 1})
+
+    def test_concurrent_processes(self):
+        """多个进程同时保存同一个索引，所有条目都保留"""
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(
+                _store_and_save, [str(self.path)] * 4, range(4), [20] * 4
+            ))
+
+        self.assertTrue(all(results))
+        self.assertEqual(len(self._entries()), 80)
+        leftovers = sorted(p.name for p in self.root.iterdir())
+        self.assertEqual(leftovers, ["index.json", "index.json.src"])  # 无残留的临时文件和锁
+
+    def test_hit_reorder_is_saved(self):
+        """命中导致访问顺序变化时需要保存，顺序不变时不写文件"""
+        index = FileIndex(self.path)
+        index.store("/a", self.stat, {})
+        index.store("/b", self.stat, {})
+        index.save()
+
+        reader = FileIndex(self.path)
+        reader.lookup("/a", self.stat)
+        self.assertTrue(reader.save())
+        self.assertEqual(list(self._entries()), ["/b", "/a"])
+
+        mtime = self.path.stat().st_mtime_ns
+        reader.lookup("/a", self.stat)
+        reader.save()
+        self.assertEqual(self.path.stat().st_mtime_ns, mtime)
+
+    def test_clear_discards_disk_entries(self):
+        """clear 之后保存写出空索引，不与磁盘合并"""
+        index = FileIndex(self.path)
+        index.store("/a", self.stat, {})
+        index.save()
+
+        other = FileIndex(self.path)
+        other.clear()
+        other.store("/b", self.stat, {})
+        other.save()
+        self.assertEqual(list(self._entries()), ["/b"])
+
+    def test_stale_lock_taken_over(self):
+        """持有进程已退出留下的锁文件不会让保存一直失败"""
+        lock = self.path.with_name(self.path.name + ".lock")
+        lock.touch()
+        old = time.time() - 3600
+        os.utime(lock, (old, old))
+
+        index = FileIndex(self.path)
+        index.store("/a", self.stat, {})
+        self.assertTrue(index.save())
+        self.assertFalse(lock.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,11 +11,15 @@ from unittest.mock import patch
 
 os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
 
+from PIL import Image
 from PyQt5.QtWidgets import QApplication, QMessageBox
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
+from core.frame_quality import QualityScorer
+from core.metadata_service import MetadataService
 from i18n.translator import Translator
+from ui.panels import file_list_panel
 from ui.panels.file_list_panel import FileListPanel
 
 
@@ -37,9 +41,25 @@ class TestFileListPanel(unittest.TestCase):
     def setUp(self):
         self.temp_dir = tempfile.TemporaryDirectory()
         self.folder = Path(self.temp_dir.name)
+        # 元数据索引写到临时目录，不碰用户目录
+        self.index_dir = tempfile.TemporaryDirectory()
+        self.metadata_service = MetadataService(Path(self.index_dir.name) / "index.json")
+        service_patcher = patch(
+            "ui.panels.file_list_panel.get_metadata_service", return_value=self.metadata_service
+        )
+        service_patcher.start()
+        self.addCleanup(service_patcher.stop)
 
     def tearDown(self):
+        self._wait_metadata()
         self.temp_dir.cleanup()
+        self.index_dir.cleanup()
+
+    def _wait_metadata(self):
+        """等后台元数据线程结束，并把它们的信号派发到面板"""
+        for thread in list(file_list_panel._running_threads):
+            thread.wait()
+        self.app.processEvents()
 
     def _create_files(self, *names: str):
         for name in names:
@@ -110,6 +130,51 @@ class TestFileListPanel(unittest.TestCase):
             ["a.CR3", "b.tiff", "c.jpg"],
         )
 
+    def test_stat_label_shows_metadata_summary(self):
+        """后台读取元数据后，统计标签显示时间范围/快门/ISO，条目带悬停提示"""
+        for i in range(3):
+            exif = Image.Exif()
+            ifd = exif.get_ifd(0x8769)
+            ifd[0x9003] = f"2024:05:01 22:00:{i * 21:02d}"
+            ifd[0x829A] = 20.0
+            ifd[0x8827] = 3200
+            Image.new("RGB", (8, 8)).save(self.folder / f"IMG_{i}.jpg", exif=exif)
+
+        with patch("ui.panels.file_list_panel.get_settings", return_value=_FakeSettings()):
+            panel = self._make_panel()
+            panel._load_folder(str(self.folder))
+            self._wait_metadata()
+
+        text = panel._stat_lbl.text()
+        self.assertIn("Selected: 3", text)
+        self.assertIn("22:00–22:01", text)
+        self.assertIn("20s", text)
+        self.assertIn("ISO 3200", text)
+        self.assertIn("ISO 3200", panel.file_list.item(0).toolTip())
+        self.assertEqual(self.metadata_service.misses, 3)
+
+    def test_check_quality_excludes_outliers(self):
+        """质量预检完成后自动排除离群帧，并在悬停提示中说明原因"""
+        for i in range(6):
+            Image.new("RGB", (64, 48), (90, 90, 90) if i == 3 else (20, 20, 20)).save(self.folder / f"IMG_{i}.jpg")
+        scorer = QualityScorer(Path(self.index_dir.name) / "quality.json", detect_streaks=False)
+
+        with patch("ui.panels.file_list_panel.get_settings", return_value=_FakeSettings()), patch(
+            "ui.panels.file_list_panel.QualityScorer", return_value=scorer
+        ):
+            panel = self._make_panel()
+            panel._load_folder(str(self.folder))
+            selected = []
+            panel.files_selected.connect(selected.append)
+            panel.check_quality()
+            self._wait_metadata()
+
+        self.assertEqual(panel.excluded_files, {3})
+        self.assertEqual(len(selected[-1]), 5)
+        self.assertIn("[excluded]", panel.file_list.item(3).text())
+        self.assertIn("天空过亮", panel.file_list.item(3).toolTip())
+        self.assertTrue(panel._quality_btn.isEnabled())
+
     def test_rotation_change_does_not_emit_first_file_preview(self):
         """旋转改变时不应强制把预览切回第一张"""
         with patch("ui.panels.file_list_panel.get_settings", return_value=_FakeSettings()):
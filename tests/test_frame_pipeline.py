@@ -0,0 +1,133 @@
+"""
+FramePipeline 测试
+"""
+
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.frame_pipeline import FramePipeline
+
+
+class _RecordingDetector:
+    """记录调用顺序的假检测器"""
+
+    def __init__(self, stateful: bool):
+        self.is_stateful = stateful
+        self.seen = []
+
+    def detect_streaks(self, image, pyramid=None):
+        self.seen.append(int(image[0, 0, 0]))
+        return None
+
+
+def _slow_loader(index, _path):
+    # 越靠前的帧解码越慢，检验交付顺序不受完成顺序影响
+    time.sleep(0.01 * (5 - index))
+    return np.full((4, 4, 3), index, dtype=np.uint16)
+
+
+class TestFramePipeline(unittest.TestCase):
+    """FramePipeline 行为测试"""
+
+    def setUp(self):
+        self.paths = [Path(f"frame_{i}.tif") for i in range(6)]
+
+    def test_frames_delivered_in_order(self):
+        """多线程解码时结果仍按文件顺序交付"""
+        pipeline = FramePipeline(self.paths, _slow_loader, workers=4, prefetch=4)
+
+        indices = [frame.index for frame in pipeline]
+
+        self.assertEqual(indices, list(range(6)))
+        self.assertIn("decode", pipeline.stage_totals)
+
+    def test_loader_error_is_reported_per_frame(self):
+        """单帧解码失败不影响其他帧"""
+        def loader(index, path):
+            if index == 2:
+                raise ValueError("bad file")
+            return np.zeros((4, 4, 3), dtype=np.uint16)
+
+        frames = list(FramePipeline(self.paths, loader))
+
+        self.assertIsInstance(frames[2].error, ValueError)
+        self.assertTrue(all(frame.error is None for i, frame in enumerate(frames) if i != 2))
+
+    def test_stateful_detector_runs_in_frame_order(self):
+        """有状态检测器按帧顺序串行执行"""
+        detector = _RecordingDetector(stateful=True)
+
+        list(FramePipeline(self.paths, _slow_loader, detector=detector, workers=4, prefetch=4))
+
+        self.assertEqual(detector.seen, list(range(6)))
+
+    def test_prepare_runs_in_worker_for_each_frame(self):
+        """prepare 回调在工作线程中对每帧金字塔执行，耗时计入统计"""
+        prepared = []
+
+        pipeline = FramePipeline(
+            self.paths, _slow_loader, workers=2,
+            prepare=lambda index, pyramid: prepared.append((index, pyramid.resize_to(2, 2))),
+        )
+        frames = list(pipeline)
+
+        self.assertEqual(sorted(index for index, _ in prepared), list(range(len(self.paths))))
+        self.assertIs(frames[0].pyramid.resize_to(2, 2), frames[0].pyramid.resize_to(2, 2))
+        self.assertIn("prepare", pipeline.stage_totals)
+
+    def test_prepare_state_skips_failed_frames(self):
+        """prepare 收到的状态序号不计失败帧，与延时输出实际抽中的状态一致"""
+        from core.timelapse_outputs import TimelapseOutputs
+
+        def loader(index, path):
+            if index == 2:
+                raise ValueError("bad file")
+            return _slow_loader(index, path)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = TimelapseOutputs(resolution=(2, 2), fps=1, target_duration=3, expected_frames=6)
+            generator = outputs.add_stream("milkyway", Path(tmp) / "mw.mp4", source="frame")
+            predicted = {}
+
+            def prepare(state, pyramid):
+                predicted[int(pyramid.image[0, 0, 0])] = (state, outputs.needs_frame(state))
+                outputs.warm(state, pyramid)
+
+            taken = {}
+            for frame in FramePipeline(self.paths, loader, workers=4, prefetch=4, prepare=prepare):
+                if frame.error is not None:
+                    continue
+                before = generator.frame_count
+                outputs.add_frame(frame.image, pyramid=frame.pyramid)
+                generator.flush()
+                taken[frame.index] = generator.frame_count > before
+            outputs.cleanup()
+
+        self.assertEqual(sorted(predicted), [0, 1, 3, 4, 5])
+        self.assertEqual([predicted[i][0] for i in (0, 1, 3, 4, 5)], [0, 1, 2, 3, 4])
+        self.assertEqual({i: needed for i, (_, needed) in predicted.items()}, taken)
+        self.assertEqual(taken, {0: False, 1: True, 3: False, 4: True, 5: False})
+
+    def test_early_exit_stops_prefetching(self):
+        """提前退出迭代时不再解码剩余帧"""
+        loaded = []
+
+        def loader(index, path):
+            loaded.append(index)
+            return np.zeros((4, 4, 3), dtype=np.uint16)
+
+        for frame in FramePipeline(self.paths, loader, workers=1, prefetch=2):
+            break
+
+        self.assertLess(len(loaded), len(self.paths))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+帧质量评估测试
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.frame_quality import FrameScore, QualityScorer, flag_outliers, measure
+
+_RNG = np.random.default_rng(7)
+_STARS = [(int(_RNG.integers(10, 630)), int(_RNG.integers(10, 470)), float(_RNG.uniform(60, 200))) for _ in range(200)]
+
+
+def _sky(seed: int, sky: float = 20.0, blur: float = 1.0, keep: float = 1.0, streak: bool = False) -> np.ndarray:
+    """合成星空缩略图：噪声背景 + 高斯星点"""
+    rng = np.random.default_rng(seed)
+    image = np.full((480, 640), sky, np.float32) + rng.normal(0, 2, (480, 640)).astype(np.float32)
+    stars = np.zeros_like(image)
+    for x, y, amplitude in _STARS[:int(len(_STARS) * keep)]:
+        stars[y, x] = amplitude
+    image += cv2.GaussianBlur(stars, (0, 0), blur) * (2 * np.pi * blur ** 2)
+    if streak:
+        cv2.line(image, (0, 60), (630, 420), 200, 3)
+    gray = np.clip(image, 0, 255).astype(np.uint8)
+    return np.dstack([gray] * 3)
+
+
+def _score(name: str, sky: float, stars: int, fwhm: float, streaks: int = 0) -> FrameScore:
+    score = FrameScore(Path(name))
+    score.sky, score.stars, score.fwhm, score.streaks = sky, stars, fwhm, streaks
+    return score
+
+
+class TestMeasure(unittest.TestCase):
+    """单帧指标测试"""
+
+    def test_clouds_raise_sky_and_hide_stars(self):
+        clear = measure(_sky(0))
+        cloudy = measure(_sky(1, sky=70, keep=0.3))
+
+        self.assertAlmostEqual(clear["sky"], 20, delta=1)
+        self.assertGreater(cloudy["sky"], 60)
+        self.assertGreater(clear["stars"], 150)
+        self.assertLess(cloudy["stars"], clear["stars"] * 0.5)
+
+    def test_blur_increases_fwhm(self):
+        sharp = measure(_sky(0))
+        soft = measure(_sky(1, blur=2.5))
+        self.assertGreater(soft["fwhm"], sharp["fwhm"] * 1.5)
+
+    def test_streak_counted_once(self):
+        """划痕的平顶不会被当成大量星点"""
+        from core.satellite_filter import SatelliteFilter
+
+        clear = measure(_sky(0))
+        streaked = measure(_sky(0, streak=True), SatelliteFilter(min_streak_fraction=0.3))
+
+        self.assertEqual(streaked["streaks"], 1)
+        self.assertLess(abs(streaked["stars"] - clear["stars"]), 20)
+
+
+class TestFlagOutliers(unittest.TestCase):
+    """离群判断测试"""
+
+    def _sequence(self):
+        return [_score(f"{i}.jpg", 20 + i % 3, 300 + i % 5, 2.1 + 0.02 * (i % 4)) for i in range(12)]
+
+    def test_outliers_rejected_with_reasons(self):
+        scores = self._sequence()
+        scores[3] = _score("cloud.jpg", 65, 90, 2.1)
+        scores[7] = _score("dew.jpg", 21, 280, 4.5)
+        scores[9] = _score("planes.jpg", 21, 300, 2.1, streaks=3)
+
+        rejected = flag_outliers(scores)
+
+        self.assertEqual(rejected, 2)
+        self.assertEqual(scores[3].flags, ["bright_sky", "few_stars"])
+        self.assertEqual(scores[7].flags, ["soft_stars"])
+        self.assertEqual(scores[9].flags, ["streaks"])
+        self.assertFalse(scores[9].rejected)
+
+    def test_stable_sequence_untouched(self):
+        scores = self._sequence()
+        self.assertEqual(flag_outliers(scores), 0)
+        self.assertTrue(all(not score.flags for score in scores))
+
+    def test_short_sequence_only_flags_unreadable(self):
+        scores = [_score("a.jpg", 20, 300, 2.0), _score("b.jpg", 90, 10, 6.0), FrameScore(Path("c.jpg"))]
+        self.assertEqual(flag_outliers(scores), 1)
+        self.assertEqual(scores[1].flags, [])
+        self.assertEqual(scores[2].flags, ["unreadable"])
+
+
+class TestQualityScorer(unittest.TestCase):
+    """并行评估与缓存测试"""
+
+    def test_scores_cached_between_runs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            paths = []
+            for i in range(6):
+                path = root / f"IMG_{i}.jpg"
+                image = _sky(i, sky=70, keep=0.3) if i == 2 else _sky(i)
+                Image.fromarray(image).save(path, quality=95)
+                paths.append(path)
+            index = root / "quality.json"
+
+            first = QualityScorer(index, workers=3)
+            scores = first.evaluate(paths)
+            self.assertEqual(first.misses, 6)
+            self.assertEqual([s.path.name for s in scores if s.rejected], ["IMG_2.jpg"])
+
+            second = QualityScorer(index, workers=3)
+            with patch("core.frame_quality.measure", side_effect=AssertionError("不应重新评估")):
+                cached = second.evaluate(paths)
+            self.assertEqual((second.hits, second.misses), (6, 0))
+            self.assertEqual([s.to_dict() for s in cached], [s.to_dict() for s in scores])
+
+
+if __name__ == "__main__":
+    unittest.main()
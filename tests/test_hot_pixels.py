@@ -0,0 +1,239 @@
+"""
+热像素检测与修正测试
+"""
+
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import tifffile
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.exif_scanner import FrameInfo
+from core.hot_pixels import HotPixelMap, cache_path, detect_hot_pixels
+from core.metadata_service import MetadataService
+
+HOT = [(10, 12), (30, 40), (30, 41), (31, 40), (31, 41)]  # 单个热像素 + 去马赛克扩散成的 2x2
+
+
+def _sequence(n: int = 8, shape=(64, 80)):
+    """噪声背景 + 逐帧移动的星点 + 固定热像素 + 固定的大块亮区"""
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(n):
+        image = rng.normal(2000, 50, shape + (3,)).clip(0, 65535).astype(np.uint16)
+        for y, x in HOT:
+            image[y, x] = 30000
+        for k in range(6):
+            y, x = 5 + 9 * k, (7 * k + 3 * i) % shape[1]
+            image[y, x] = 40000  # 星点每帧移动 3 像素
+        image[50:56, 60:66] = 20000  # 地景中的灯光
+        frames.append(image)
+    return frames
+
+
+class TestDetection(unittest.TestCase):
+    """检测测试"""
+
+    def test_finds_fixed_pixels_only(self):
+        hot_map = detect_hot_pixels(iter(_sequence()))
+
+        self.assertEqual(sorted(zip(hot_map.ys.tolist(), hot_map.xs.tolist())), sorted(HOT))
+        self.assertEqual(hot_map.shape, (64, 80))
+
+    def test_too_few_frames_gives_empty_map(self):
+        hot_map = detect_hot_pixels(_sequence(2))
+        self.assertEqual(len(hot_map), 0)
+        self.assertFalse(hot_map)
+
+
+class TestCorrection(unittest.TestCase):
+    """修正测试"""
+
+    def setUp(self):
+        ys, xs = zip(*HOT)
+        self.hot_map = HotPixelMap(ys, xs, (64, 80))
+
+    def test_hot_pixels_replaced_by_neighbours(self):
+        image = _sequence(1)[0]
+        before = image.copy()
+
+        result = self.hot_map.apply(image)
+
+        self.assertIs(result, image)
+        for y, x in HOT:
+            self.assertLess(abs(int(result[y, x, 0]) - 2000), 300)
+        untouched = np.ones((64, 80), bool)
+        untouched[tuple(zip(*HOT))] = False
+        np.testing.assert_array_equal(result[untouched], before[untouched])
+
+    def test_pixels_at_edges(self):
+        hot_map = HotPixelMap([0, 63], [0, 79], (64, 80))
+        image = np.full((64, 80, 3), 100, np.uint16)
+        image[0, 0] = image[63, 79] = 60000
+
+        hot_map.apply(image)
+
+        np.testing.assert_array_equal(image, 100)
+
+    def test_shape_mismatch_raises(self):
+        with self.assertRaises(ValueError):
+            self.hot_map.apply(np.zeros((80, 64, 3), np.uint16))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "map.npz"
+            self.assertTrue(self.hot_map.save(path))
+            loaded = HotPixelMap.load(path)
+            self.assertIsNone(HotPixelMap.load(Path(tmp) / "missing.npz"))
+
+        np.testing.assert_array_equal(loaded.ys, self.hot_map.ys)
+        np.testing.assert_array_equal(loaded.xs, self.hot_map.xs)
+        self.assertEqual(loaded.shape, (64, 80))
+
+    def test_save_leaves_no_temp_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "map.npz"
+            self.assertTrue(self.hot_map.save(path))
+            self.assertTrue(self.hot_map.save(path))
+            self.assertEqual([p.name for p in Path(tmp).iterdir()], ["map.npz"])
+
+    def test_corrupt_file_ignored(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "map.npz"
+            path.write_bytes(b"PK\x03\x04" + b"\0" * 64)  # 写到一半的 zip
+            self.assertIsNone(HotPixelMap.load(path))
+            path.write_bytes(b"not a zip")
+            self.assertIsNone(HotPixelMap.load(path))
+
+    def test_cache_path_needs_serial(self):
+        self.assertIsNone(cache_path("NIKON Z 6_2", None, (6048, 4024)))
+        path = cache_path("NIKON Z 6_2", "6012345", (6048, 4024), 90, cache_dir=Path("/cache"))
+        self.assertEqual(path, Path("/cache/NIKON_Z_6_2_6012345_6048x4024_o0_r90.npz"))
+
+    def test_cache_path_distinguishes_orientation(self):
+        landscape = cache_path("Z6", "1", (6048, 4024), cache_dir=Path("/cache"))
+        portrait = cache_path("Z6", "1", (4024, 6048), cache_dir=Path("/cache"))
+        flipped = cache_path("Z6", "1", (6048, 4024), cache_dir=Path("/cache"), orientation=3)
+        self.assertEqual(len({landscape, portrait, flipped}), 3)
+
+
+class TestHotPixelCommand(unittest.TestCase):
+    """sst stack --hot-pixels 端到端测试"""
+
+    def test_lighten_result_free_of_hot_pixels(self):
+        import cli
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "lights").mkdir()
+            for i, image in enumerate(_sequence()):
+                tifffile.imwrite(str(root / "lights" / f"IMG_{i}.tif"), image, photometric="rgb")
+
+            args = cli.build_parser().parse_args([
+                "stack", str(root / "lights"), "-o", str(root / "out"), "--float32", "--hot-pixels",
+            ])
+            with redirect_stdout(StringIO()) as out:
+                code = cli.cmd_stack(args)
+
+            self.assertEqual(code, 0, out.getvalue())
+            self.assertIn("5 个", out.getvalue())
+            result = tifffile.imread(str(next((root / "out").glob("*.tif"))))
+        for y, x in HOT:
+            self.assertLess(result[y, x, 0], 5000)
+
+
+def _frame_info(path):
+    """带机身序列号的元数据（TIFF 测试文件本身没有 EXIF）"""
+    info = FrameInfo(Path(path))
+    info.make, info.model, info.serial = "TEST", "CAM", "42"
+    return info
+
+
+class TestHotPixelCache(unittest.TestCase):
+    """按机身缓存的热像素图"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.home = Path(self._tmp.name)
+        patches = [
+            mock.patch.object(Path, "home", return_value=self.home),
+            mock.patch.object(MetadataService, "get", side_effect=_frame_info),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self._tmp.cleanup)
+
+    def _build(self, frames):
+        import cli
+
+        files = [self.home / f"IMG_{i}.tif" for i in range(len(frames))]
+        decode = dict(zip(files, frames)).__getitem__
+        args = SimpleNamespace(hot_pixels="auto", rotation=0, workers=2)
+        with redirect_stdout(StringIO()):
+            hot_map, text = cli._build_hot_pixel_map(args, decode, files)
+        return hot_map, text
+
+    def test_cached_map_reused(self):
+        first, _ = self._build(_sequence())
+        second, text = self._build(_sequence())
+        self.assertIn("缓存", text)
+        np.testing.assert_array_equal(second.ys, first.ys)
+
+    def test_rotated_frames_not_given_landscape_map(self):
+        self._build(_sequence())
+        portrait = [np.ascontiguousarray(np.rot90(frame)) for frame in _sequence()]
+        hot_map, text = self._build(portrait)
+
+        self.assertNotIn("缓存", text)
+        self.assertEqual(hot_map.shape, (80, 64))
+        hot_map.apply(portrait[0])  # 形状一致，不抛 ValueError
+        _, text = self._build(portrait)
+        self.assertIn("缓存", text)
+
+    def test_mismatched_cache_file_redetected(self):
+        frames = _sequence()
+        cache_dir = self.home / ".superstartrail" / "hot_pixels"
+        path = cache_path("TEST CAM", "42", (80, 64), cache_dir=cache_dir)
+        HotPixelMap(np.array([1]), np.array([1]), (80, 64)).save(path)
+
+        hot_map, text = self._build(frames)
+        self.assertNotIn("缓存", text)
+        self.assertEqual(hot_map.shape, (64, 80))
+        self.assertEqual(len(hot_map), len(HOT))
+
+    def test_dark_calibration_does_not_empty_cached_map(self):
+        import cli
+
+        (self.home / "lights").mkdir()
+        (self.home / "darks").mkdir()
+        for i, image in enumerate(_sequence()):
+            tifffile.imwrite(str(self.home / "lights" / f"IMG_{i}.tif"), image, photometric="rgb")
+            dark = np.full_like(image, 2000)
+            for y, x in HOT:
+                dark[y, x] = 30000
+            tifffile.imwrite(str(self.home / "darks" / f"DARK_{i}.tif"), dark, photometric="rgb")
+
+        args = cli.build_parser().parse_args([
+            "stack", str(self.home / "lights"), "-o", str(self.home / "out"), "--float32",
+            "--hot-pixels", "--dark", str(self.home / "darks"),
+        ])
+        with redirect_stdout(StringIO()) as out:
+            code = cli.cmd_stack(args)
+
+        self.assertEqual(code, 0, out.getvalue())
+        cached = list((self.home / ".superstartrail" / "hot_pixels").glob("*.npz"))
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(len(HotPixelMap.load(cached[0])), len(HOT))
+
+
+if __name__ == "__main__":
+    unittest.main()
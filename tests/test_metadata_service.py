@@ -0,0 +1,128 @@
+"""
+元数据服务测试
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.exif_scanner import FrameInfo
+from core.metadata_service import MetadataService, summarize
+
+
+def _write_jpeg(path: Path, taken: str, exposure: float = 20.0, iso: int = 3200) -> None:
+    exif = Image.Exif()
+    exif[0x0110] = "NIKON Z 6_2"
+    ifd = exif.get_ifd(0x8769)
+    ifd[0x9003] = taken
+    ifd[0x829A] = exposure
+    ifd[0x8827] = iso
+    Image.new("RGB", (8, 8)).save(path, exif=exif)
+
+
+class TestMetadataService(unittest.TestCase):
+    """索引命中与失效测试"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+        self.index = self.root / "index" / "metadata.json"
+        self.files = []
+        for i in range(4):
+            path = self.root / f"DSC_{i}.jpg"
+            _write_jpeg(path, f"2024:05:01 22:00:{i * 21:02d}")
+            self.files.append(path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_second_lookup_served_from_index(self):
+        """保存后的索引被新实例复用，不再读取文件头"""
+        first = MetadataService(self.index)
+        frames = first.get_many(self.files)
+        self.assertTrue(first.save())
+        self.assertEqual((first.hits, first.misses), (0, 4))
+
+        second = MetadataService(self.index)
+        with patch("core.metadata_service.scan_file", side_effect=AssertionError("不应读取文件")):
+            cached = second.get_many(self.files)
+
+        self.assertEqual((second.hits, second.misses), (4, 0))
+        self.assertEqual([f.to_dict() for f in cached], [f.to_dict() for f in frames])
+        self.assertEqual(cached[0].exposure, 20.0)
+        self.assertEqual(cached[0].iso, 3200)
+
+    def test_modified_file_is_rescanned(self):
+        """修改时间或大小变化的文件重新扫描"""
+        service = MetadataService(self.index)
+        service.get_many(self.files)
+
+        _write_jpeg(self.files[1], "2024:05:01 23:00:00", exposure=30.0)
+        stat = self.files[1].stat()
+        os.utime(self.files[1], (stat.st_atime, stat.st_mtime + 10))
+        frames = service.get_many(self.files)
+
+        self.assertEqual((service.hits, service.misses), (3, 5))
+        self.assertEqual(frames[1].exposure, 30.0)
+
+    def test_save_trims_least_recently_used(self):
+        """超出条目上限时丢弃最久未访问的条目；无新条目时不写文件"""
+        service = MetadataService(self.index, max_entries=2)
+        service.get_many(self.files[:3])
+        service.get(self.files[0])
+        service.save()
+
+        entries = json.loads(self.index.read_text(encoding="utf-8"))["entries"]
+        self.assertEqual(
+            sorted(Path(key).name for key in entries), ["DSC_0.jpg", "DSC_2.jpg"]
+        )
+
+        mtime = self.index.stat().st_mtime_ns
+        service.get(self.files[0])
+        service.save()
+        self.assertEqual(self.index.stat().st_mtime_ns, mtime)
+
+    def test_corrupt_index_is_rebuilt(self):
+        """索引损坏时从空索引开始"""
+        self.index.parent.mkdir(parents=True)
+        self.index.write_text("{not json", encoding="utf-8")
+
+        service = MetadataService(self.index)
+        frames = service.get_many(self.files)
+
+        self.assertEqual(service.misses, 4)
+        self.assertIsNotNone(frames[0].captured)
+        self.assertTrue(service.save())
+        self.assertIn("entries", json.loads(self.index.read_text(encoding="utf-8")))
+
+
+class TestSummarize(unittest.TestCase):
+    """汇总测试"""
+
+    def test_summary_fields(self):
+        frames = []
+        for i, (t, exposure) in enumerate([(0, 20.0), (21, 20.0), (42, 20.0), (7200, 0.01)]):
+            frame = FrameInfo(Path(f"{i}.jpg"))
+            frame.captured, frame.exposure, frame.iso, frame.size = 1_700_000_000 + t, exposure, 3200, 10
+            frames.append(frame)
+
+        summary = summarize(frames)
+
+        self.assertEqual(summary["count"], 4)
+        self.assertAlmostEqual(summary["end"] - summary["start"], 7200.01, places=3)
+        self.assertEqual(summary["exposures"], [0.01, 20.0])
+        self.assertEqual(summary["isos"], [3200])
+        self.assertEqual(summary["sequences"], 2)
+        self.assertEqual(summary["total_bytes"], 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+ProcessThread 测试
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import tifffile
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.stacking_engine import StackMode
+from ui.main_window import ProcessThread
+
+
+def _write_frames(root: Path, count: int):
+    files = []
+    for i in range(count):
+        path = root / f"IMG_{i}.tif"
+        tifffile.imwrite(str(path), np.full((32, 48, 3), 1000 * (i + 1), np.uint16), photometric="rgb")
+        files.append(path)
+    return files
+
+
+class TestProcessThread(unittest.TestCase):
+    """处理线程测试（直接在当前线程调用 run）"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def _run(self, root: Path) -> Path:
+        root.mkdir()
+        output = root / "out"
+        thread = ProcessThread(_write_frames(root, 3), StackMode.LIGHTEN, raw_params={}, output_dir=output)
+        results = []
+        thread.finished.connect(results.append)
+        thread.run()
+        self.assertEqual(len(results), 1)
+        return output
+
+    def test_profile_report_only_when_enabled(self):
+        """未开启时不写性能报告；开启后写在日志文件旁边"""
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch("utils.settings.Settings.get_profile_report", return_value=False):
+                output = self._run(Path(tmp) / "off")
+            self.assertEqual(list(output.glob("*_profile.*")), [])
+
+            with patch("utils.settings.Settings.get_profile_report", return_value=True):
+                output = self._run(Path(tmp) / "on")
+            self.assertEqual(sorted(p.suffix for p in output.glob("*_profile.*")), [".json", ".txt"])
+
+    def test_cancel_mid_stack_removes_timelapse_frames(self):
+        """堆栈中途取消时删除延时视频的临时帧目录"""
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            files = _write_frames(root, 6)
+            output = root / "out"
+
+            thread = ProcessThread(
+                files, StackMode.LIGHTEN, raw_params={},
+                enable_simple_timelapse=True, output_dir=output,
+            )
+            seen = []
+
+            def on_progress(done, _total):
+                seen.append(sorted(p.name for p in output.iterdir() if p.is_dir()))
+                if done == 3:
+                    thread.stop()
+
+            cancelled = []
+            thread.progress.connect(on_progress)
+            thread.cancelled.connect(lambda: cancelled.append(True))
+            thread.run()
+
+            self.assertTrue(cancelled)
+            self.assertTrue(any(name.endswith("_frames") for name in seen[0]))
+            leftovers = [p.name for p in output.iterdir() if p.is_dir()]
+        self.assertEqual(leftovers, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
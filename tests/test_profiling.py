@@ -0,0 +1,126 @@
+"""
+性能剖析模块测试
+"""
+
+import json
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.frame_pipeline import FramePipeline
+from utils import logger as logger_module
+from utils import profiling
+from utils.profiling import FunctionProfiler, StageProfiler
+
+
+class TestStageProfiler(unittest.TestCase):
+    """StageProfiler 统计与报告测试"""
+
+    def tearDown(self):
+        profiling.deactivate()
+
+    def test_percentiles_and_totals(self):
+        """分位数、累计和次数与样本一致"""
+        profiler = StageProfiler()
+        for ms in range(1, 101):
+            profiler.record("decode", ms / 1000)
+
+        stats = profiler.stats()["decode"]
+
+        self.assertEqual(stats["count"], 100)
+        self.assertAlmostEqual(stats["total"], 5.05)
+        self.assertAlmostEqual(stats["p50"], 0.0505)
+        self.assertAlmostEqual(stats["p90"], 0.0901)
+        self.assertAlmostEqual(stats["max"], 0.1)
+
+    def test_records_from_many_threads(self):
+        """多个线程同时记录不丢样本"""
+        profiler = StageProfiler()
+
+        def worker():
+            for _ in range(500):
+                profiler.record("stack", 0.001)
+                profiler.count("frames")
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(profiler.counts()["stack"], 2000)
+        self.assertEqual(profiler.counters()["frames"], 2000)
+
+    def test_module_helpers_are_noops_when_inactive(self):
+        """未激活时 stage()/count() 不记录；激活后记录到全局剖析器"""
+        with profiling.stage("decode.raw"):
+            pass
+        profiling.count("skipped")
+        self.assertIsNone(profiling.get_profiler())
+
+        profiler = profiling.activate()
+        with profiling.stage("decode.raw"):
+            pass
+        profiling.count("skipped", 2)
+
+        self.assertEqual(profiler.counts(), {"decode.raw": 1})
+        self.assertEqual(profiler.counters(), {"skipped": 2})
+        self.assertIs(profiling.deactivate(), profiler)
+
+    def test_report_written_next_to_log(self):
+        """报告写在日志文件旁边，JSON 包含各阶段分位数和计数器"""
+        with tempfile.TemporaryDirectory() as tmp:
+            previous = logger_module._log_file_path
+            logger_module._log_file_path = Path(tmp) / "SuperStarTrail_20240101_000000.log"
+            try:
+                profiler = StageProfiler()
+                profiler.record("stack", 0.2)
+                profiler.count("satellite.streak_frames")
+                text_path, json_path = profiling.write_report_next_to_log(profiler)
+            finally:
+                logger_module._log_file_path = previous
+
+            self.assertEqual(text_path.name, "SuperStarTrail_20240101_000000_profile.txt")
+            self.assertIn("stack", text_path.read_text(encoding="utf-8"))
+            report = json.loads(json_path.read_text(encoding="utf-8"))
+            self.assertEqual(report["stages"]["stack"]["count"], 1)
+            self.assertIn("p99", report["stages"]["stack"])
+            self.assertEqual(report["counters"], {"satellite.streak_frames": 1})
+
+    def test_pipeline_shares_profiler_but_summarises_own_stages(self):
+        """流水线记录到共享剖析器，但汇总只列出流水线自己的阶段"""
+        profiler = StageProfiler()
+        profiler.record("decode.raw", 0.01)
+        paths = [Path(f"frame_{i}.tif") for i in range(3)]
+        pipeline = FramePipeline(
+            paths, lambda index, path: np.zeros((4, 4, 3), dtype=np.uint16), profiler=profiler
+        )
+
+        list(pipeline)
+
+        self.assertEqual(profiler.counts()["decode"], 3)
+        self.assertFalse(any("decode.raw" in line for line in pipeline.summary_lines()))
+
+    def test_function_profiler_dumps_pstats(self):
+        """cProfile 结果可由 pstats 读取"""
+        import pstats
+
+        function_profiler = FunctionProfiler("cprofile")
+        function_profiler.start()
+        sum(range(1000))
+        function_profiler.stop()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = function_profiler.dump(Path(tmp) / "run_profile")
+            self.assertEqual(path.suffix, ".prof")
+            pstats.Stats(str(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
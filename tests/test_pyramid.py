@@ -0,0 +1,66 @@
+"""
+ImagePyramid 测试
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.pyramid import ImagePyramid
+
+
+class TestImagePyramid(unittest.TestCase):
+    """ImagePyramid 行为测试"""
+
+    def setUp(self):
+        self.image = np.random.randint(0, 65535, (64, 96, 3), dtype=np.uint16)
+
+    def test_levels_are_cached_and_halved(self):
+        """每层尺寸减半，重复访问返回同一对象"""
+        pyramid = ImagePyramid(self.image)
+
+        quarter = pyramid.level(4)
+
+        self.assertEqual(quarter.shape, (16, 24, 3))
+        self.assertEqual(quarter.dtype, np.uint16)
+        self.assertIs(pyramid.level(4), quarter)
+        self.assertIs(pyramid.level(1), self.image)
+
+    def test_invalid_factor_raises(self):
+        """非 2 的幂的倍数应报错"""
+        with self.assertRaises(ValueError):
+            ImagePyramid(self.image).level(3)
+
+    def test_luminance8_is_uint8_gray(self):
+        """亮度层为 uint8 单通道"""
+        lum = ImagePyramid(self.image).luminance8(4)
+
+        self.assertEqual(lum.shape, (16, 24))
+        self.assertEqual(lum.dtype, np.uint8)
+
+    def test_fit_keeps_aspect_ratio(self):
+        """fit 应保持比例，小图直接返回原图"""
+        pyramid = ImagePyramid(self.image)
+
+        self.assertEqual(pyramid.fit(48).shape, (32, 48, 3))
+        self.assertIs(pyramid.fit(200), self.image)
+
+    def test_resize_to_exact_size(self):
+        """resize_to 输出精确尺寸"""
+        resized = ImagePyramid(self.image).resize_to(30, 20)
+
+        self.assertEqual(resized.shape, (20, 30, 3))
+
+    def test_resize_to_is_cached(self):
+        """同一尺寸的缩放结果被缓存复用"""
+        pyramid = ImagePyramid(self.image)
+
+        self.assertIs(pyramid.resize_to(30, 20), pyramid.resize_to(30, 20))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+帧配准测试
+"""
+
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.frame_pipeline import FramePipeline
+from core.pyramid import ImagePyramid
+from core.registration import FrameRegistrar, Transform
+
+
+def _scene(h: int = 600, w: int = 900) -> np.ndarray:
+    """合成夜景：平坦天空 + 多尺度纹理的地景"""
+    rng = np.random.default_rng(0)
+    texture = sum(
+        cv2.GaussianBlur(rng.random((h, w)).astype(np.float32), (0, 0), sigma) * sigma
+        for sigma in (2, 8, 24)
+    )
+    texture = (texture - texture.min()) / (texture.max() - texture.min())
+    yy, xx = np.mgrid[0:h, 0:w]
+    image = np.full((h, w), 0.1, np.float32)
+    ground = yy > h * 0.6 + 30 * np.sin(xx / 90.0)
+    image[ground] = 0.3 + 0.6 * texture[ground]
+    return (np.dstack([image] * 3) * 60000).astype(np.uint16)
+
+
+def _moved(image: np.ndarray, transform: Transform) -> np.ndarray:
+    h, w = image.shape[:2]
+    return cv2.warpAffine(image, transform.matrix(image.shape), (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+
+class TestFrameRegistrar(unittest.TestCase):
+    """估计与变换测试"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+        self.reference = _scene()
+        self.paths = []
+        for i in range(3):
+            path = self.root / f"IMG_{i}.tif"
+            path.write_bytes(bytes([i]))
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _registrar(self, mode: str = "translation") -> FrameRegistrar:
+        registrar = FrameRegistrar(mode, index_path=self.root / "index.json")
+        self.addCleanup(registrar.close)
+        return registrar
+
+    def test_translation_recovered_and_undone(self):
+        registrar = self._registrar()
+        image, transform = registrar.align(0, self.paths[0], ImagePyramid(self.reference))
+        self.assertIs(image, self.reference)
+        self.assertTrue(transform.is_identity)
+
+        moved = _moved(self.reference, Transform(9.5, -6.0))
+        aligned, transform = registrar.align(1, self.paths[1], ImagePyramid(moved))
+
+        # 在 1/4 层估计，合成图很小，允许 1/4 层上约 0.25 像素的误差
+        self.assertAlmostEqual(transform.dx, 9.5, delta=1.0)
+        self.assertAlmostEqual(transform.dy, -6.0, delta=1.0)
+        inner = (slice(40, -40), slice(40, -40))
+        before = np.abs(moved[inner].astype(float) - self.reference[inner]).mean()
+        after = np.abs(aligned[inner].astype(float) - self.reference[inner]).mean()
+        self.assertLess(after, before * 0.2)
+
+    def test_rigid_estimates_rotation(self):
+        registrar = self._registrar("rigid")
+        registrar.align(0, self.paths[0], ImagePyramid(self.reference))
+
+        transform = registrar.estimate(ImagePyramid(_moved(self.reference, Transform(3.0, 2.0, 0.4))))
+
+        self.assertAlmostEqual(transform.angle, 0.4, delta=0.08)
+        self.assertAlmostEqual(transform.dx, 3.0, delta=1.0)
+        self.assertAlmostEqual(transform.dy, 2.0, delta=1.0)
+
+    def test_band_warp_matches_single_warp(self):
+        """分块并行变换与整幅 warpAffine 结果一致（允许定点坐标的舍入差）"""
+        registrar = self._registrar()
+        transform = Transform(4.25, -3.5, 0.2)
+        h, w = self.reference.shape[:2]
+        expected = cv2.warpAffine(
+            self.reference, transform.matrix(self.reference.shape), (w, h),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE,
+        )
+        np.testing.assert_allclose(registrar.warp(self.reference, transform), expected, atol=4)
+
+    def test_featureless_frame_left_untouched(self):
+        """无结构的帧相关峰很低，不做变换"""
+        registrar = self._registrar()
+        registrar.align(0, self.paths[0], ImagePyramid(self.reference))
+        noise = np.random.default_rng(1).integers(0, 65535, self.reference.shape, dtype=np.uint16)
+
+        image, transform = registrar.align(1, self.paths[1], ImagePyramid(noise))
+
+        self.assertFalse(transform.reliable)
+        self.assertIs(image, noise)
+        self.assertEqual(registrar.unreliable, 1)
+
+    def test_transforms_cached_per_reference(self):
+        moved = _moved(self.reference, Transform(5.0, 5.0))
+        first = self._registrar()
+        first.align(0, self.paths[0], ImagePyramid(self.reference))
+        _, expected = first.align(1, self.paths[1], ImagePyramid(moved))
+        first.close()
+
+        second = self._registrar()
+        second.align(0, self.paths[0], ImagePyramid(self.reference))
+        # 缓存命中时不再估计：传入无关图像也得到缓存的变换
+        _, cached = second.align(1, self.paths[1], ImagePyramid(self.reference))
+        self.assertEqual(second.cache_hits, 1)
+        self.assertEqual(cached.to_dict(), expected.to_dict())
+
+        third = self._registrar()
+        third.align(0, self.paths[2], ImagePyramid(self.reference))
+        third.align(1, self.paths[1], ImagePyramid(moved))
+        self.assertEqual(third.cache_hits, 0)
+
+    def test_next_frame_becomes_reference_when_first_fails(self):
+        registrar = self._registrar()
+        results = {}
+
+        def align_second():
+            results["second"] = registrar.align(1, self.paths[1], ImagePyramid(self.reference))
+
+        worker = threading.Thread(target=align_second)
+        worker.start()
+        registrar.skip(0)
+        worker.join(timeout=5)
+
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(registrar.reference_path, self.paths[1])
+
+
+class TestPipelineAlignment(unittest.TestCase):
+    """流水线集成测试"""
+
+    def test_pipeline_delivers_aligned_frames(self):
+        reference = _scene()
+        shifts = [Transform(), Transform(6.0, 0.0), Transform(-4.0, 5.0), Transform(2.0, -3.0)]
+        frames = [_moved(reference, shift) for shift in shifts]
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i in range(len(frames)):
+                path = Path(tmp) / f"IMG_{i}.tif"
+                path.write_bytes(bytes([i]))
+                paths.append(path)
+            registrar = FrameRegistrar(index_path=Path(tmp) / "index.json")
+            pipeline = FramePipeline(paths, lambda i, _p: frames[i], workers=3, registrar=registrar)
+
+            delivered = [(frame.index, frame.transform, frame.image) for frame in pipeline]
+            registrar.close()
+
+        self.assertEqual([index for index, _, _ in delivered], [0, 1, 2, 3])
+        inner = (slice(40, -40), slice(40, -40))
+        for (index, transform, image), shift in zip(delivered, shifts):
+            self.assertAlmostEqual(transform.dx, shift.dx, delta=1.0)
+            self.assertAlmostEqual(transform.dy, shift.dy, delta=1.0)
+            self.assertLess(np.abs(image[inner].astype(float) - reference[inner]).mean(), 300)
+        self.assertIn("align", pipeline.stage_totals)
+
+
+if __name__ == "__main__":
+    unittest.main()
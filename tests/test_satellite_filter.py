@@ -0,0 +1,195 @@
+"""
+SatelliteFilter / StreakMask 测试
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.satellite_filter import SatelliteFilter, StreakMask
+
+
+def _make_streak_frame(seed: int = 0) -> np.ndarray:
+    """生成带一条对角线划痕的暗背景帧"""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 3000, (800, 1200, 3), dtype=np.uint16)
+    cv2.line(img, (50, 50), (1100, 700), (60000, 60000, 60000), 6)
+    return img
+
+
+def _fine_streak(width: int, angle: float, shape=(400, 600), half_length: float = 180.0):
+    """
+    细化层（1/4 分辨率 8-bit）上的合成划痕：到中心线垂直距离小于 width/2 的像素为亮线
+
+    Returns:
+        (signal, 真实端点 (x1, y1, x2, y2))
+    """
+    rng = np.random.default_rng(width)
+    signal = rng.normal(30, 3, shape).clip(0, 255).astype(np.uint8)
+    cy, cx = shape[0] / 2.0, shape[1] / 2.0
+    t = np.deg2rad(angle)
+    d = np.array([np.cos(t), np.sin(t)])
+    yy, xx = np.mgrid[0:shape[0], 0:shape[1]]
+    along = (xx - cx) * d[0] + (yy - cy) * d[1]
+    across = -(xx - cx) * d[1] + (yy - cy) * d[0]
+    signal[(np.abs(across) < width / 2.0) & (np.abs(along) <= half_length)] = 200
+    ends = (cx - half_length * d[0], cy - half_length * d[1], cx + half_length * d[0], cy + half_length * d[1])
+    return signal, ends
+
+
+class TestStreakMask(unittest.TestCase):
+    """StreakMask 行为测试"""
+
+    def test_empty_mask_has_no_tiles(self):
+        """无划痕时不产生任何图块"""
+        mask = StreakMask((512, 512))
+
+        self.assertFalse(mask.any())
+        self.assertEqual(mask.sum(), 0)
+        self.assertEqual(list(mask.tiles()), [])
+
+    def test_tiles_match_single_tile_rasterization(self):
+        """分块栅格化结果应与整图单块栅格化一致"""
+        segment = (10, 20, 900, 600, 24)
+        tiled = StreakMask((700, 1000), [segment], tile_size=128)
+        whole = StreakMask((700, 1000), [segment], tile_size=1024)
+
+        np.testing.assert_array_equal(tiled.to_dense(), whole.to_dense())
+        self.assertEqual(tiled.sum(), whole.sum())
+        self.assertTrue(whole.to_dense()[310, 455])  # 线段中点
+
+    def test_tiles_cover_only_part_of_frame(self):
+        """单条划痕只触及少量图块"""
+        mask = StreakMask((4000, 6000), [(0, 2000, 5999, 2100, 24)])
+
+        touched = sum(sub.size for _, _, sub in mask.tiles())
+
+        self.assertLess(touched, 4000 * 6000 * 0.1)
+
+    def test_scaled_mask_covers_downscaled_streak(self):
+        """缩小后的遮罩应覆盖原划痕缩小后的位置"""
+        mask = StreakMask((1000, 1500), [(100, 100, 1400, 900, 12)])
+
+        small = mask.scaled((250, 375)).to_dense()
+        expected = cv2.resize(mask.to_dense().astype(np.uint8), (375, 250), interpolation=cv2.INTER_AREA) > 0
+
+        self.assertEqual(small.shape, (250, 375))
+        self.assertTrue(small[expected].all())
+
+
+class TestSatelliteFilter(unittest.TestCase):
+    """SatelliteFilter 检测测试"""
+
+    def test_detects_long_streak(self):
+        """长直亮线应被检测并覆盖划痕像素"""
+        img = _make_streak_frame()
+
+        streaks = SatelliteFilter().detect_streaks(img)
+
+        self.assertTrue(streaks.any())
+        dense = streaks.to_dense()
+        self.assertTrue(dense[375, 575])  # 线段中点附近
+        self.assertFalse(dense[700, 100])
+
+    def test_dark_frame_has_no_streaks(self):
+        """纯噪声帧不应检测到划痕"""
+        rng = np.random.default_rng(1)
+        img = rng.integers(0, 3000, (800, 1200, 3), dtype=np.uint16)
+
+        self.assertFalse(SatelliteFilter().detect_streaks(img).any())
+
+    def test_invalid_mode_raises(self):
+        """不支持的检测模式应报错"""
+        with self.assertRaises(ValueError):
+            SatelliteFilter(mode="magic")
+
+    def test_refine_measures_streak_width(self):
+        """
+        细化按窄带内的行占比测出线宽，端点贴合真实划痕
+
+        实测值 = 线宽 + 两侧各 1 像素余量；双线性重采样可能再多算每侧 1 行，但不会偏窄。
+        """
+        sat_filter = SatelliteFilter()
+        for width in (1, 3, 7, 13):
+            for angle in (0.0, 30.0, 70.0):
+                with self.subTest(width=width, angle=angle):
+                    signal, ends = _fine_streak(width, angle)
+                    # 霍夫粗检测的候选线：端点偏几个像素、角度略偏
+                    candidate = (ends[0] + 4, ends[1] + 3, ends[2] - 5, ends[3] + 2)
+
+                    refined = sat_filter._refine_segment(signal, candidate)
+
+                    self.assertIsNotNone(refined)
+                    self.assertGreaterEqual(refined[4], width + 2)
+                    self.assertLessEqual(refined[4], width + 4)
+                    np.testing.assert_allclose(refined[:4], ends, atol=1.0)
+
+    def test_refine_rejects_scattered_stars(self):
+        """候选线经过的只是零散星点时细化返回 None"""
+        rng = np.random.default_rng(3)
+        signal = rng.normal(30, 3, (400, 600)).clip(0, 255).astype(np.uint8)
+        ys, xs = rng.integers(0, 400, 300), rng.integers(0, 600, 300)
+        signal[ys, xs] = 220
+
+        self.assertIsNone(SatelliteFilter()._refine_segment(signal, (50.0, 200.0, 550.0, 200.0)))
+
+    def test_dedupe_merges_overlapping_segments(self):
+        """同一条划痕的重叠线段只保留最长的一条，平行但分开的划痕和交叉划痕都保留"""
+        main = (50.0, 200.0, 550.0, 200.0, 7.0)
+        overlapping = [
+            (120.0, 202.0, 400.0, 201.0, 5.0),  # 落在主线线宽带内的一段
+            (45.0, 197.0, 553.0, 198.0, 6.0),  # 略长出端点（容差内）
+        ]
+        parallel = (50.0, 240.0, 550.0, 240.0, 7.0)  # 间隔 40 像素的另一条
+        crossing = (300.0, 20.0, 320.0, 380.0, 5.0)
+
+        kept = SatelliteFilter._dedupe([overlapping[0], parallel, main, crossing, overlapping[1]])
+
+        self.assertEqual(len(kept), 3)
+        self.assertIn(parallel, kept)
+        self.assertIn(crossing, kept)
+        # 重叠的一组只剩最长的一条（包括它的线宽）
+        survivor = [seg for seg in kept if seg not in (parallel, crossing)]
+        self.assertEqual(survivor, [overlapping[1]])
+
+    def test_refined_duplicates_collapse_to_one_streak(self):
+        """同一条划痕的多条霍夫候选细化后去重为一条"""
+        sat_filter = SatelliteFilter()
+        signal, ends = _fine_streak(5, 20.0)
+        candidates = [
+            (ends[0] + dx, ends[1] + dy, ends[2] - dx, ends[3] + dy)
+            for dx, dy in ((0, 0), (30, 2), (60, -2), (5, 1))
+        ]
+
+        refined = [seg for seg in (sat_filter._refine_segment(signal, c) for c in candidates) if seg]
+        kept = SatelliteFilter._dedupe(refined)
+
+        self.assertEqual(len(refined), 4)
+        self.assertEqual(len(kept), 1)
+        self.assertTrue(7 <= kept[0][4] <= 9)
+
+    def test_temporal_mode_detects_only_new_streak(self):
+        """temporal 模式下只有新出现划痕的帧被标记"""
+        rng = np.random.default_rng(2)
+        background = rng.integers(0, 3000, (800, 1200, 3)).astype(np.int64)
+        background[:, :600] += 20000  # 模拟明亮的银河区域
+        frames = [
+            np.clip(background + rng.integers(0, 500, background.shape), 0, 65535).astype(np.uint16)
+            for _ in range(4)
+        ]
+        cv2.line(frames[3], (50, 50), (1100, 700), (26000, 26000, 26000), 5)
+
+        sat_filter = SatelliteFilter(mode="temporal")
+        detected = [sat_filter.detect_streaks(frame).any() for frame in frames]
+
+        self.assertTrue(sat_filter.is_stateful)
+        self.assertEqual(detected[1:], [False, False, True])
+
+
+if __name__ == "__main__":
+    unittest.main()
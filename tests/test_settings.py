@@ -9,6 +9,7 @@ from pathlib import Path
 import json
 import tempfile
 import shutil
+from unittest.mock import patch
 
 # 添加 src 到路径
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
@@ -50,6 +51,18 @@ class TestSettings(unittest.TestCase):
         # 间隔大小
         self.assertEqual(self.settings.get_gap_size(), 3)
 
+        # TIFF 子层和 JPEG 预览图默认不写（与 CLI 一致）
+        self.assertEqual(self.settings.get_tiff_pyramid_levels(), 0)
+        self.assertFalse(self.settings.get_preview_sidecar())
+
+    def test_pyramid_and_preview_opt_in(self):
+        """TIFF 子层和预览图可在设置中开启"""
+        self.settings.set("output", "tiff_pyramid_levels", 3)
+        self.settings.set("output", "preview_sidecar", True)
+
+        self.assertEqual(self.settings.get_tiff_pyramid_levels(), 3)
+        self.assertTrue(self.settings.get_preview_sidecar())
+
     def test_set_language(self):
         """测试设置语言"""
         self.settings.set_language("en_US")
@@ -128,6 +141,17 @@ class TestSettings(unittest.TestCase):
         # 应该使用默认值
         self.assertEqual(settings.get_language(), "zh_CN")
 
+    def test_profile_report_opt_in(self):
+        """性能报告默认关闭，可在设置或环境变量中开启"""
+        with patch.dict("os.environ", {"SST_PROFILE": ""}):
+            self.assertFalse(self.settings.get_profile_report())
+            self.settings.set("general", "profile_report", True)
+            self.assertTrue(self.settings.get_profile_report())
+
+        self.settings.set("general", "profile_report", False)
+        with patch.dict("os.environ", {"SST_PROFILE": "1"}):
+            self.assertTrue(self.settings.get_profile_report())
+
     def test_preview_settings(self):
         """测试预览设置"""
         # 获取预览设置
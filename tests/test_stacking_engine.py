@@ -5,6 +5,7 @@
 import unittest
 import numpy as np
 import sys
+import tempfile
 from threading import Event
 from pathlib import Path
 
@@ -12,6 +13,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from core.cancellation import ProcessingCancelledError
+from core.satellite_filter import StreakMask
 from core.stacking_engine import StackingEngine, StackMode
 
 
@@ -111,6 +113,107 @@ class TestStackingEngine(unittest.TestCase):
         result = engine.get_result()
         np.testing.assert_array_equal(result, frame1)
 
+    def test_sparse_streak_mask_matches_dense_mask(self):
+        """稀疏划痕遮罩与等价的稠密遮罩应得到相同结果"""
+        streaks = StreakMask((100, 100), [(0, 10, 99, 90, 6)], tile_size=32)
+        dense = streaks.to_dense()
+
+        sparse_engine = StackingEngine(StackMode.LIGHTEN)
+        dense_engine = StackingEngine(StackMode.LIGHTEN)
+        for img in self.test_images:
+            sparse_engine.add_image(img, satellite_mask=streaks)
+            dense_engine.add_image(img, satellite_mask=dense)
+
+        np.testing.assert_array_equal(sparse_engine.get_result(), dense_engine.get_result())
+        self.assertTrue((sparse_engine.get_result()[dense] == 0).all())
+
+    def test_result_bands_match_get_result_with_gap_filling(self):
+        """逐行带生成（含局部间隔填充）应与整图结果一致"""
+        engine = StackingEngine(StackMode.LIGHTEN, enable_gap_filling=True, gap_size=2)
+        for img in self.test_images:
+            engine.add_image(img)
+
+        bands = list(engine.iter_result_bands(band_rows=16))
+
+        self.assertEqual(len(bands), 7)
+        np.testing.assert_array_equal(np.concatenate(bands), engine.get_result())
+
+    def test_result_bands_blend_dual_track(self):
+        """双轨模式下逐行带融合应与整图融合一致"""
+        sky_mask = np.zeros((100, 100), dtype=np.float32)
+        sky_mask[:40] = 1.0
+        sky_mask[40:60] = 0.5
+        engine = StackingEngine(StackMode.LIGHTEN, sky_mask=sky_mask)
+        for img in self.test_images:
+            engine.add_image(img)
+
+        bands = list(engine.iter_result_bands(band_rows=33))
+
+        np.testing.assert_array_equal(np.concatenate(bands), engine.get_result())
+
+    def test_dual_track_matches_blend_of_single_tracks(self):
+        """单累加器双轨与两条独立轨道按蒙版融合的结果一致，只为羽化像素保存地景轨道"""
+        sky_mask = np.zeros((100, 100), dtype=np.float32)
+        sky_mask[:70] = 1.0
+        sky_mask[45:55, :50] = np.linspace(0.1, 0.9, 10, dtype=np.float32)[:, np.newaxis]
+        streaks = StreakMask((100, 100), [(0, 30, 99, 60, 4)], tile_size=32)
+
+        engine = StackingEngine(StackMode.LIGHTEN, sky_mask=sky_mask, fg_mode=StackMode.AVERAGE)
+        sky_track = StackingEngine(StackMode.LIGHTEN)
+        fg_track = StackingEngine(StackMode.AVERAGE)
+        for i, img in enumerate(self.test_images):
+            satellite_mask = streaks if i == 2 else None
+            for target in (engine, sky_track, fg_track):
+                target.add_image(img, satellite_mask=satellite_mask)
+
+        alpha = sky_mask[:, :, np.newaxis]
+        expected = sky_track.result * alpha + fg_track.result * (1.0 - alpha)
+        np.testing.assert_allclose(np.concatenate(list(engine.iter_linear_bands(band_rows=30))), expected, atol=0.01)
+        np.testing.assert_array_equal(engine.get_result(), np.clip(expected, 0, 65535).astype(np.uint16))
+        self.assertEqual(engine.fg_edge.shape, (500, 3))
+
+    def test_linear_bands_are_accumulator_views(self):
+        """单轨线性行带直接引用 float32 累加器，保留平均值的小数部分"""
+        engine = StackingEngine(StackMode.AVERAGE)
+        engine.add_image(np.full((10, 10, 3), 1, dtype=np.uint16))
+        engine.add_image(np.full((10, 10, 3), 2, dtype=np.uint16))
+
+        bands = list(engine.iter_linear_bands(band_rows=4))
+
+        self.assertEqual(bands[0].dtype, np.float32)
+        self.assertTrue(np.shares_memory(bands[0], engine.result))
+        np.testing.assert_array_equal(np.concatenate(bands), np.full((10, 10, 3), 1.5))
+
+    def test_timelapse_uses_downscaled_accumulator(self):
+        """延时视频累加器在视频分辨率下用同一算子更新，并遵守划痕遮罩"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            engine = StackingEngine(
+                StackMode.LIGHTEN,
+                enable_timelapse=True,
+                timelapse_output_path=Path(tmpdir) / "trail.mp4",
+            )
+            engine.timelapse_generator.resolution = (50, 50)
+            masked = np.zeros((100, 100), dtype=bool)
+            masked[:10, :10] = True
+
+            for index, img in enumerate(self.test_images):
+                engine.add_image(img, satellite_mask=masked if index else None)
+            engine.timelapse_generator.flush()
+
+            expected = np.max(
+                [img.reshape(50, 2, 50, 2, 3).mean(axis=(1, 3)) for img in self.test_images], axis=0
+            )
+            self.assertEqual(engine.timelapse_result.shape, (50, 50, 3))
+            # uint16 缩放会取整，允许 1 个灰度级误差
+            np.testing.assert_allclose(engine.timelapse_result[10:], expected[10:], atol=1)
+            np.testing.assert_allclose(
+                engine.timelapse_result[:5, :5],
+                self.test_images[0].reshape(50, 2, 50, 2, 3).mean(axis=(1, 3))[:5, :5],
+                atol=1,
+            )
+            self.assertEqual(engine.timelapse_generator.frame_count, 5)
+            engine.timelapse_generator.cleanup_temp_files()
+
     def test_get_result_can_be_cancelled_before_gap_filling(self):
         """gap filling 前若已取消，应抛出取消异常而不是继续处理"""
         engine = StackingEngine(StackMode.LIGHTEN, enable_gap_filling=True)
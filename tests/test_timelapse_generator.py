@@ -2,18 +2,21 @@
 TimelapseGenerator 测试
 """
 
+import os
+import socket
+import subprocess
 import sys
 import tempfile
 import unittest
 from pathlib import Path
 from threading import Event
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import numpy as np
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from core.timelapse_generator import TimelapseGenerator
+from core.timelapse_generator import OWNER_MARKER, TimelapseGenerator, reclaim_orphaned_frame_dirs
 
 
 class _FakeVideoWriter:
@@ -70,3 +73,188 @@ class TestTimelapseGenerator(unittest.TestCase):
             self.assertFalse(success)
             self.assertFalse(output_path.exists())
             self.assertFalse(temp_dir.exists())
+
+    def test_frames_prepared_in_workers_keep_order(self):
+        """工作线程写出的帧按提交顺序命名和记录，排队数不超过上限"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            generator = TimelapseGenerator(
+                output_path=Path(tmpdir) / "out.mp4",
+                resolution=(64, 48),
+                workers=3,
+                max_pending=2,
+            )
+
+            accumulator = np.zeros((96, 128, 3), dtype=np.float32)
+            for value in range(6):
+                accumulator[:] = value * 10000.0
+                accumulator[0, 0] = 70000.0  # 超出 uint16 范围的累加值应被裁剪
+                generator.add_frame(accumulator)
+                self.assertLessEqual(len(generator._pending), 2)
+            generator.flush()
+
+            self.assertEqual(generator.frame_count, 6)
+            self.assertEqual(
+                [path.name for path in generator.frame_paths],
+                [f"frame_{index:05d}.jpg" for index in range(6)],
+            )
+            generator.cleanup_temp_files()
+
+    def test_target_duration_samples_every_kth_state(self):
+        """目标时长小于输入张数时按间隔抽帧，最后一个状态总会输出，跳过的状态不写盘"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            generator = TimelapseGenerator(
+                output_path=Path(tmpdir) / "out.mp4",
+                fps=10,
+                resolution=(32, 24),
+                target_duration=1.0,
+                expected_frames=31,
+            )
+            self.assertEqual(generator.stride, 3)
+
+            written = []
+            original = generator.snapshot
+
+            def _snapshot(image, pyramid=None):
+                written.append(int(image[0, 0, 0]))
+                return original(image, pyramid)
+
+            with patch.object(generator, "snapshot", side_effect=_snapshot):
+                for value in range(31):
+                    generator.add_frame(np.full((48, 64, 3), value, dtype=np.float32))
+            generator.flush()
+
+            self.assertEqual(written, [2, 5, 8, 11, 14, 17, 20, 23, 26, 29, 30])
+            self.assertEqual(generator.frame_count, 11)
+            self.assertEqual(len(list(generator.temp_dir.glob("*.jpg"))), 11)
+            generator.cleanup_temp_files()
+
+    def test_interpolation_inserts_crossfade_frames(self):
+        """帧数不足目标时长时，编码阶段在相邻帧之间插入交叉淡化帧"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            generator = TimelapseGenerator(
+                output_path=Path(tmpdir) / "out.mp4",
+                fps=10,
+                resolution=(32, 24),
+                target_duration=1.0,
+                expected_frames=4,
+                interpolate=True,
+            )
+            for value in (0, 60, 120, 180):
+                generator.add_frame(np.full((24, 32, 3), value * 256.0, dtype=np.float32))
+            generator.flush()
+
+            self.assertEqual(generator.stride, 1)
+            self.assertEqual(generator.interpolation_factor(), 3)
+            self.assertAlmostEqual(generator.get_duration(), 1.0)
+
+            frames = []
+            encoder = MagicMock()
+            encoder.write.side_effect = lambda frame: frames.append(int(frame[0, 0, 0]))
+            encoder.close.side_effect = lambda: generator.output_path.write_bytes(b"mp4") > 0
+            with patch("core.timelapse_generator.create_encoder", return_value=encoder):
+                self.assertTrue(generator.generate_video(cleanup=True))
+
+            self.assertEqual(len(frames), 10)
+            self.assertEqual(frames, sorted(frames))  # 淡化帧亮度在相邻真实帧之间单调过渡
+
+    def test_temp_budget_spills_segments_and_concatenates(self):
+        """超出临时磁盘预算时分段编码并删除帧，结束时拼接所有片段"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            generator = TimelapseGenerator(
+                output_path=Path(tmpdir) / "out.mp4",
+                resolution=(32, 24),
+                workers=1,
+                max_pending=1,
+                temp_budget_mb=1500 / 1024 / 1024,  # 约两帧 JPEG
+            )
+
+            written = []
+
+            def _encoder(output_path, *_args, **_kwargs):
+                encoder = MagicMock()
+                encoder.write.side_effect = lambda frame: written.append(Path(output_path).name)
+                encoder.close.side_effect = lambda: Path(output_path).write_bytes(b"seg") > 0
+                return encoder
+
+            def _concat(segments, output_path, *_args):
+                self.assertTrue(all(segment.exists() for segment in segments))
+                Path(output_path).write_bytes(b"mp4")
+                return True
+
+            rng = np.random.default_rng(0)
+            with patch("core.timelapse_generator.create_encoder", side_effect=_encoder), patch(
+                "core.timelapse_generator.concat_segments", side_effect=_concat
+            ) as concat:
+                for _ in range(7):
+                    generator.add_frame(rng.uniform(0, 65535, (24, 32, 3)).astype(np.float32))
+                    on_disk = list(generator.temp_dir.glob("frame_*.jpg"))
+                    self.assertLessEqual(sum(path.stat().st_size for path in on_disk), 1500 + 2000)
+
+                self.assertGreater(len(generator.segments), 1)
+                self.assertTrue(generator.generate_video(cleanup=True))
+
+            self.assertEqual(len(written), 7)
+            self.assertEqual(generator.frame_count, 7)
+            self.assertEqual(len(concat.call_args[0][0]), len(generator.segments))
+            self.assertFalse(generator.temp_dir.exists())
+
+    def test_segment_encode_time_counted_once(self):
+        """分段编码时每个片段的编码时间只计一次，最后再加上拼接时间"""
+        clock = [0.0]
+        fake_time = MagicMock()
+        fake_time.perf_counter.side_effect = lambda: clock[0]
+
+        def _encoder(output_path, *_args, **_kwargs):
+            encoder = MagicMock()
+            encoder.write.side_effect = lambda frame: clock.__setitem__(0, clock[0] + 1.0)
+            encoder.close.side_effect = lambda: Path(output_path).write_bytes(b"seg") > 0
+            return encoder
+
+        def _concat(segments, output_path, *_args):
+            clock[0] += 0.5
+            Path(output_path).write_bytes(b"mp4")
+            return True
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            generator = TimelapseGenerator(
+                output_path=Path(tmpdir) / "out.mp4",
+                resolution=(32, 24),
+                workers=1,
+                max_pending=1,
+                temp_budget_mb=1500 / 1024 / 1024,
+            )
+            rng = np.random.default_rng(0)
+            with patch("core.timelapse_generator.create_encoder", side_effect=_encoder), patch(
+                "core.timelapse_generator.concat_segments", side_effect=_concat
+            ), patch("core.timelapse_generator.time", fake_time):
+                for _ in range(7):
+                    generator.add_frame(rng.uniform(0, 65535, (24, 32, 3)).astype(np.float32))
+                self.assertTrue(generator.generate_video(cleanup=True))
+
+            self.assertGreater(len(generator.segments), 1)
+            self.assertEqual(generator.encode_frames, 7)
+            self.assertAlmostEqual(generator.encode_seconds, 7.5)
+
+    def test_orphaned_frame_dirs_are_reclaimed(self):
+        """属主进程已退出的临时帧目录被回收，其余目录保留"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            root = Path(tmpdir)
+            finished = subprocess.Popen([sys.executable, "-c", "pass"])
+            finished.wait()
+
+            owners = {
+                "dead_frames": f"{socket.gethostname()} {finished.pid}",
+                "alive_frames": f"{socket.gethostname()} {os.getpid()}",
+                "remote_frames": f"other-host {finished.pid}",
+            }
+            for name, owner in owners.items():
+                (root / name).mkdir()
+                (root / name / "frame_00000.jpg").touch()
+                (root / name / OWNER_MARKER).write_text(owner, encoding="utf-8")
+            (root / "unmarked_frames").mkdir()
+
+            self.assertEqual(reclaim_orphaned_frame_dirs(root), 1)
+            self.assertFalse((root / "dead_frames").exists())
+            for name in ("alive_frames", "remote_frames", "unmarked_frames"):
+                self.assertTrue((root / name).exists())
+
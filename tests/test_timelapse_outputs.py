@@ -0,0 +1,106 @@
+"""
+TimelapseOutputs 测试
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.pyramid import ImagePyramid
+from core.stacking_engine import StackingEngine, StackMode
+from core.timelapse_outputs import TimelapseOutputs
+
+
+class TestTimelapseOutputs(unittest.TestCase):
+    """多路延时输出测试"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _frames(self, count=4):
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 40000, (96, 128, 3), dtype=np.uint16) for _ in range(count)]
+
+    def test_streams_share_one_downscale(self):
+        """各路输出共用同一份降采样，每帧只缩放一次"""
+        outputs = TimelapseOutputs(resolution=(32, 24))
+        trail = outputs.add_stream("startrail", self.root / "trail.mp4", source="trail")
+        outputs.add_stream("milkyway", self.root / "mw.mp4", source="frame")
+        outputs.add_stream("comet", self.root / "comet.mp4", source="comet")
+        engine = StackingEngine(StackMode.LIGHTEN, timelapse_generator=trail)
+
+        frames = self._frames()
+        with patch("core.pyramid.cv2.resize", wraps=cv2.resize) as resize:
+            ImagePyramid(frames[0]).resize_to(32, 24)
+            single = resize.call_count
+            resize.reset_mock()
+
+            for index, image in enumerate(frames):
+                pyramid = ImagePyramid(image)
+                outputs.warm(index, pyramid)
+                outputs.add_frame(image, pyramid=pyramid)
+                engine.add_image(image, pyramid=pyramid)
+
+        self.assertEqual(resize.call_count, single * len(frames))
+        for generator in outputs.streams.values():
+            generator.flush()
+            self.assertEqual(generator.frame_count, 4)
+        outputs.cleanup()
+
+    def test_comet_stream_matches_engine_operator(self):
+        """彗星输出的累加器与 StackingEngine 的彗星算子一致"""
+        outputs = TimelapseOutputs(resolution=(128, 96), comet_fade=0.9)
+        outputs.add_stream("comet", self.root / "comet.mp4", source="comet")
+        engine = StackingEngine(StackMode.COMET)
+        engine.set_comet_fade_factor(0.9)
+
+        for image in self._frames():
+            outputs.add_frame(image)
+            engine.add_image(image)
+
+        np.testing.assert_allclose(outputs._comet_results["comet"], engine.result, rtol=1e-5)
+        outputs.cleanup()
+
+    def test_finish_encodes_every_stream_and_reports_throughput(self):
+        """finish 编码所有输出并给出每一路的吞吐量"""
+        outputs = TimelapseOutputs(resolution=(32, 24))
+        outputs.add_stream("milkyway", self.root / "mw.mp4", source="frame")
+        outputs.add_stream("comet", self.root / "comet.mp4", source="comet")
+        for image in self._frames():
+            outputs.add_frame(image)
+
+        def _encoder(output_path, *_args, **_kwargs):
+            encoder = MagicMock()
+            encoder.close.side_effect = lambda: Path(output_path).write_bytes(b"mp4") > 0
+            return encoder
+
+        with patch("core.timelapse_generator.create_encoder", side_effect=_encoder):
+            results = outputs.finish(cleanup=True)
+
+        self.assertEqual(results, {"milkyway": True, "comet": True})
+        lines = outputs.throughput_lines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(all("4 帧" in line for line in lines))
+        self.assertFalse(any(generator.temp_dir.exists() for generator in outputs.streams.values()))
+
+    def test_invalid_source_raises(self):
+        """不支持的帧来源应报错"""
+        outputs = TimelapseOutputs()
+        with self.assertRaises(ValueError):
+            outputs.add_stream("x", self.root / "x.mp4", source="magic")
+        outputs.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+视频编码后端测试
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core import video_encoder
+from core.video_encoder import (
+    FFmpegEncoder, OpenCVEncoder, concat_segments, create_encoder, ffmpeg_encoders, find_ffmpeg,
+)
+
+
+class TestVideoEncoder(unittest.TestCase):
+    """编码器选择与参数测试"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output_path = Path(self.tmpdir.name) / "out.mp4"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _command_for(self, **kwargs):
+        with patch.object(video_encoder.subprocess, "Popen", MagicMock()) as popen:
+            encoder = FFmpegEncoder(
+                self.output_path, 25, (64, 32), ffmpeg_path="ffmpeg", **kwargs
+            )
+        encoder._stderr.close()
+        return popen.call_args[0][0]
+
+    def test_quality_maps_to_crf(self):
+        """画质设置决定 CRF 和预设"""
+        high = self._command_for(quality="high")
+        low = self._command_for(quality="low")
+
+        self.assertEqual(high[high.index("-crf") + 1], "18")
+        self.assertEqual(low[low.index("-crf") + 1], "28")
+        self.assertEqual(high[high.index("-s") + 1], "64x32")
+        self.assertEqual(high[-1], str(self.output_path))
+
+    def test_h265_uses_x265_with_hvc1_tag(self):
+        """h265 使用 libx265 并加 hvc1 标记"""
+        command = self._command_for(codec="h265", threads=4)
+
+        self.assertIn("libx265", command)
+        self.assertIn("hvc1", command)
+        self.assertEqual(command[command.index("-threads") + 1], "4")
+
+    def test_invalid_quality_raises(self):
+        """不支持的画质设置应报错"""
+        with self.assertRaises(ValueError):
+            FFmpegEncoder(self.output_path, 25, (64, 32), quality="best", ffmpeg_path="ffmpeg")
+
+    def test_falls_back_to_opencv_without_ffmpeg(self):
+        """找不到 ffmpeg 时回退到 OpenCV 编码器"""
+        writer = MagicMock()
+        writer.isOpened.return_value = True
+        with patch.object(video_encoder, "find_ffmpeg", return_value=None), patch.object(
+            video_encoder.cv2, "VideoWriter", return_value=writer
+        ):
+            encoder = create_encoder(self.output_path, 25, (64, 32))
+
+        self.assertIsInstance(encoder, OpenCVEncoder)
+
+    def test_failed_close_removes_partial_output(self):
+        """ffmpeg 非零退出时删除半成品并返回失败"""
+        process = MagicMock()
+        process.wait.return_value = 1
+        with patch.object(video_encoder.subprocess, "Popen", return_value=process):
+            encoder = FFmpegEncoder(self.output_path, 25, (64, 32), ffmpeg_path="ffmpeg")
+        self.output_path.write_bytes(b"moov")
+
+        self.assertFalse(encoder.close())
+        self.assertFalse(self.output_path.exists())
+
+    def test_parses_available_encoders(self):
+        """从 ffmpeg -encoders 输出中解析视频编码器"""
+        listing = (
+            b"Encoders:\n V..... = Video\n A..... = Audio\n ------\n"
+            b" V....D libx264              libx264 H.264 / AVC\n"
+            b" V....D mpeg4                MPEG-4 part 2\n"
+            b" A....D aac                  AAC (Advanced Audio Coding)\n"
+        )
+        completed = MagicMock(returncode=0, stdout=listing)
+        with patch.object(video_encoder.subprocess, "run", return_value=completed):
+            encoders = ffmpeg_encoders("/opt/test/ffmpeg")
+
+        self.assertIn("libx264", encoders)
+        self.assertIn("mpeg4", encoders)
+        self.assertNotIn("aac", encoders)
+
+    def test_missing_x265_falls_back_to_x264(self):
+        """本地 ffmpeg 不带 libx265 时改用 libx264，都没有时回退到 OpenCV"""
+        writer = MagicMock()
+        writer.isOpened.return_value = True
+        with patch.object(video_encoder, "find_ffmpeg", return_value="ffmpeg"), patch.object(
+            video_encoder, "ffmpeg_encoders", return_value=frozenset({"libx264"})
+        ), patch.object(video_encoder.subprocess, "Popen", MagicMock()) as popen:
+            encoder = create_encoder(self.output_path, 25, (64, 32), codec="h265")
+        encoder._stderr.close()
+        self.assertIn("libx264", popen.call_args[0][0])
+        self.assertNotIn("hvc1", popen.call_args[0][0])
+
+        with patch.object(video_encoder, "find_ffmpeg", return_value="ffmpeg"), patch.object(
+            video_encoder, "ffmpeg_encoders", return_value=frozenset()
+        ), patch.object(video_encoder.cv2, "VideoWriter", return_value=writer):
+            encoder = create_encoder(self.output_path, 25, (64, 32), codec="h265")
+        self.assertIsInstance(encoder, OpenCVEncoder)
+
+    @unittest.skipIf(find_ffmpeg() is None, "未安装 ffmpeg")
+    def test_ffmpeg_encodes_frames(self):
+        """ffmpeg 实际编码生成非空文件"""
+        encoder = FFmpegEncoder(self.output_path, 25, (64, 32), quality="low")
+        for value in range(10):
+            encoder.write(np.full((32, 64, 3), value * 20, dtype=np.uint8))
+
+        self.assertTrue(encoder.close())
+        self.assertGreater(self.output_path.stat().st_size, 0)
+
+    def test_concat_segments_without_ffmpeg(self):
+        """无 ffmpeg 时逐帧读出片段拼接，帧数为各片段之和"""
+        segments = []
+        for index, count in enumerate((3, 4)):
+            segment = Path(self.tmpdir.name) / f"segment_{index:03d}.mp4"
+            encoder = OpenCVEncoder(segment, 25, (64, 32))
+            for value in range(count):
+                encoder.write(np.full((32, 64, 3), value * 40, dtype=np.uint8))
+            self.assertTrue(encoder.close())
+            segments.append(segment)
+
+        with patch.object(video_encoder, "find_ffmpeg", return_value=None):
+            self.assertTrue(concat_segments(segments, self.output_path, 25, (64, 32)))
+
+        capture = video_encoder.cv2.VideoCapture(str(self.output_path))
+        frames = int(capture.get(video_encoder.cv2.CAP_PROP_FRAME_COUNT))
+        capture.release()
+        self.assertEqual(frames, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
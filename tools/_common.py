@@ -0,0 +1,34 @@
+"""
+手动验证脚本的公共部分
+
+- 把 src/ 加入模块搜索路径
+- 从命令行参数或 SST_TEST_DIR 环境变量获取测试图片目录（不再写死个人路径）
+
+需要可重复的耗时数据时请使用 benchmarks/run.py（合成数据，输出 JSON）。
+"""
+
+import os
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+
+def test_dir_from_args() -> Path:
+    """
+    测试图片目录：优先取第一个命令行参数，其次取 SST_TEST_DIR 环境变量
+
+    两者都没有或目录不存在时打印用法并退出。
+    """
+    value = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("SST_TEST_DIR")
+    if not value:
+        print(f"用法: python {Path(sys.argv[0]).name} <图片目录>（或设置 SST_TEST_DIR 环境变量）")
+        print("提示: 没有真实素材时可用 benchmarks/run.py 生成合成星轨序列")
+        sys.exit(2)
+    test_dir = Path(value).expanduser()
+    if not test_dir.is_dir():
+        print(f"错误: 目录不存在 - {test_dir}")
+        sys.exit(2)
+    return test_dir
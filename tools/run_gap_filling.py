@@ -4,6 +4,7 @@
 
 from pathlib import Path
 import numpy as np
+from _common import test_dir_from_args
 from core.raw_processor import RawProcessor
 from core.stacking_engine import StackingEngine, StackMode
 from core.exporter import ImageExporter
@@ -13,7 +14,7 @@ from utils.logger import setup_logger
 logger = setup_logger("TestGapFilling")
 
 # 测试数据目录
-test_dir = Path("/Users/jameszhenyu/Desktop/Mark Ma")
+test_dir = test_dir_from_args()
 
 # 获取前 10 张图片测试
 processor = RawProcessor()
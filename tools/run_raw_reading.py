@@ -6,13 +6,12 @@
 import sys
 from pathlib import Path
 
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+from _common import test_dir_from_args
 
 from core.raw_processor import RawProcessor
 
-def test_read_nef():
+def test_read_nef(test_dir: Path):
     """测试读取 NEF 文件"""
-    test_dir = Path("/Users/jameszhenyu/Desktop/Mark Ma")
 
     processor = RawProcessor()
 
@@ -67,5 +66,5 @@ def test_read_nef():
         return False
 
 if __name__ == "__main__":
-    success = test_read_nef()
+    success = test_read_nef(test_dir_from_args())
     sys.exit(0 if success else 1)
@@ -7,15 +7,14 @@ import sys
 from pathlib import Path
 import time
 
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+from _common import test_dir_from_args
 
 from core.raw_processor import RawProcessor
 from core.stacking_engine import StackingEngine, StackMode
 from core.exporter import ImageExporter
 
-def test_stacking(num_images=10):
+def test_stacking(test_dir: Path, num_images=10):
     """测试星轨合成"""
-    test_dir = Path("/Users/jameszhenyu/Desktop/Mark Ma")
     output_path = Path("test_star_trail.tiff")
 
     print(f"=== SuperStarTrail 星轨合成测试 ===\n")
@@ -81,7 +80,7 @@ def test_stacking(num_images=10):
 
 if __name__ == "__main__":
     # 先测试 10 张
-    success = test_stacking(num_images=10)
+    success = test_stacking(test_dir_from_args(), num_images=10)
 
     if success:
         print("=" * 60)
@@ -3,6 +3,7 @@
 """
 import numpy as np
 from pathlib import Path
+import _common  # noqa: F401  加入 src/ 搜索路径
 from core.exporter import ImageExporter
 
 # 创建一个模拟的暗图像（大部分像素值很低）
@@ -6,14 +6,14 @@
 
 from pathlib import Path
 import sys
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+from _common import test_dir_from_args
 
 from core.raw_processor import RawProcessor
 from core.stacking_engine import StackingEngine, StackMode
 import time
 
 # 找到测试文件
-test_dir = Path("/Users/jameszhenyu/PycharmProjects/SuperStarTrail/startrail-test/star-test")
+test_dir = test_dir_from_args()
 raw_files = sorted(list(test_dir.glob("*.NEF")))[:5]  # 使用前 5 张
 
 if not raw_files: